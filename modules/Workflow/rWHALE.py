@@ -45,7 +45,7 @@
 # Jinyan Zhao
 # Sina Naeimi
 
-import sys, os, json
+import sys, os, json, time
 import argparse
 from pathlib import Path
 
@@ -55,11 +55,139 @@ import whale.main as whale
 from whale.main import log_msg, log_div
 from sWHALE import runSWhale
 import importlib
-    
+
+
+class AssetQueue:
+    """
+    Work queue shared by the MPI ranks.
+
+    The queue is a counter stored on rank 0 and advanced with an atomic
+    fetch-and-add, so every rank pulls the next asset as soon as it is free.
+    Without MPI the queue simply returns the assets in order.
+    """
+
+    def __init__(self, num_assets, comm=None):
+
+        self.num_assets = num_assets
+        self.comm = comm
+        self.win = None
+        self.count = 0
+
+        if comm is not None:
+            from mpi4py import MPI
+            import numpy as np
+
+            self.MPI = MPI
+            itemsize = MPI.INT64_T.Get_size()
+            if comm.Get_rank() == 0:
+                self.win = MPI.Win.Allocate(itemsize, itemsize, comm=comm)
+                self.win.Lock(0)
+                self.win.Put(np.zeros(1, dtype='int64'), 0)
+                self.win.Unlock(0)
+            else:
+                self.win = MPI.Win.Allocate(0, itemsize, comm=comm)
+            self.one = np.ones(1, dtype='int64')
+            self.next_count = np.zeros(1, dtype='int64')
+            comm.Barrier()
+
+    def get_next(self):
+        """
+        Returns the index of the next asset or None if the queue is empty.
+        """
+
+        if self.win is None:
+            count = self.count
+            self.count = self.count + 1
+        else:
+            self.win.Lock(0)
+            self.win.Fetch_and_op(self.one, self.next_count, 0, 0, self.MPI.SUM)
+            self.win.Unlock(0)
+            count = int(self.next_count[0])
+
+        if count < self.num_assets:
+            return count
+        else:
+            return None
+
+    def free(self):
+
+        if self.win is not None:
+            self.comm.Barrier()
+            self.win.Free()
+            self.win = None
+
+
+def get_asset_costs(asst_data, cost_key):
+    """
+    Reads the cost hint (e.g., NumberOfStories) of each asset from its AIM.
+    Assets without the hint get a unit cost.
+    """
+
+    costs = []
+    for asst in asst_data:
+        try:
+            with open(asst['file'], 'r', encoding="utf-8") as f:
+                GI = json.load(f)['GeneralInformation']
+            costs.append(float(GI.get(cost_key, 1.0)))
+        except (OSError, KeyError, TypeError, ValueError):
+            costs.append(1.0)
+
+    return costs
+
+
+def get_asset_order(asst_data, cost_key, procID, comm):
+    """
+    Returns the order of the assets in the work queue: largest cost first if
+    a cost key is provided, the original order otherwise.
+    """
+
+    if cost_key is None:
+        return list(range(len(asst_data)))
+
+    if procID == 0:
+        costs = get_asset_costs(asst_data, cost_key)
+        order = sorted(range(len(asst_data)), key=lambda i: -costs[i])
+    else:
+        order = None
+
+    if comm is not None:
+        order = comm.bcast(order, root=0)
+
+    return order
+
+
+def log_utilization(asset_type, num_run, busy_time, wall_time, procID, comm):
+    """
+    Writes the utilization of the ranks in the log.
+    """
+
+    if wall_time > 0.0:
+        utilization = busy_time / wall_time
+    else:
+        utilization = 0.0
+
+    log_msg(f'{asset_type}: rank {procID} ran {num_run} assets, busy '
+            f'{busy_time:.1f} s of {wall_time:.1f} s '
+            f'({100.0*utilization:.1f}% utilization)')
+
+    if comm is not None:
+        stats = comm.gather((num_run, busy_time, wall_time), root=0)
+
+        if procID == 0:
+            log_msg(f'{asset_type}: utilization of the ranks', 
+                    prepend_blank_space=False)
+            for rank, (rank_run, rank_busy, rank_wall) in enumerate(stats):
+                rank_util = rank_busy / rank_wall if rank_wall > 0.0 else 0.0
+                log_msg(f'\trank {rank}: {rank_run} assets, {rank_busy:.1f} s '
+                        f'busy, {100.0*rank_util:.1f}%', 
+                        prepend_timestamp=False, prepend_blank_space=False)
+
+
 def main(run_type, input_file, app_registry,
          force_cleanup, bldg_id_filter, reference_dir,
          working_dir, app_dir, log_file, site_response,
-         parallelType, mpiExec, numPROC):
+         parallelType, mpiExec, numPROC, scheduler='dynamic',
+         cost_key=None, run_in_process=False, stream_aggregation=False):
 
     #
     # check if running in a parallel mpi job
@@ -123,7 +251,8 @@ def main(run_type, input_file, app_registry,
     whale.set_options({
         "LogFile": log_file_path,
         "LogShowMS": False,
-        "PrintLog": True
+        "PrintLog": True,
+        "RunInProcess": run_in_process
         })
         
     log_msg('\nrWHALE workflow\n', prepend_timestamp=False, prepend_blank_space=False)
@@ -214,39 +343,77 @@ def main(run_type, input_file, app_registry,
             
         # The workflow app sequence
         WF_app_sequence = ['Event', 'Modeling', 'EDP', 'Simulation']        
-        # For each asset
-        for asst in asst_data:
 
-            if count % numP == procID:
-                
-                log_msg('', prepend_timestamp=False)
-                log_div(prepend_blank_space=False)
-                log_msg(f"{asset_type} id {asst['id']} in file {asst['file']}")
-                log_div()
-
-                # Run sWhale
-                runSWhale(
-                    inputs = None, 
-                    WF = WF, 
-                    assetID = asst['id'], 
-                    assetAIM = asst['file'], 
-                    prep_app_sequence = preprocess_app_sequence,  
-                    WF_app_sequence = WF_app_sequence, 
-                    asset_type = run_asset_type, 
-                    copy_resources = True, 
-                    force_cleanup = force_cleanup)
-
-            count = count + 1
+        def run_asset(asst):
+
+            log_msg('', prepend_timestamp=False)
+            log_div(prepend_blank_space=False)
+            log_msg(f"{asset_type} id {asst['id']} in file {asst['file']}")
+            log_div()
+
+            # Run sWhale
+            runSWhale(
+                inputs = None, 
+                WF = WF, 
+                assetID = asst['id'], 
+                assetAIM = asst['file'], 
+                prep_app_sequence = preprocess_app_sequence,  
+                WF_app_sequence = WF_app_sequence, 
+                asset_type = run_asset_type, 
+                copy_resources = True, 
+                force_cleanup = force_cleanup)
+
+        num_run = 0
+        busy_time = 0.0
+        wall_start = time.time()
+
+        if scheduler == 'dynamic':
+
+            # ranks pull the assets from a shared queue until it is empty
+            asset_order = get_asset_order(asst_data, cost_key, procID,
+                                          comm if doParallel else None)
+            asset_queue = AssetQueue(len(asst_data), 
+                                     comm if doParallel else None)
+
+            asset_i = asset_queue.get_next()
+            while asset_i is not None:
+                asset_start = time.time()
+                run_asset(asst_data[asset_order[asset_i]])
+                busy_time += time.time() - asset_start
+                num_run += 1
+                asset_i = asset_queue.get_next()
+
+            asset_queue.free()
+
+        else:
+
+            # For each asset
+            for asst in asst_data:
+
+                if count % numP == procID:
+
+                    asset_start = time.time()
+                    run_asset(asst)
+                    busy_time += time.time() - asset_start
+                    num_run += 1
+
+                count = count + 1
 
         # wait for every process to finish
         if doParallel == True:
             comm.Barrier()
+
+        # the wall time includes the wait for the slowest rank
+        log_utilization(asset_type, num_run, busy_time, 
+                        time.time() - wall_start, procID, 
+                        comm if doParallel else None)
                 
         # aggregate results
         if asset_type == 'Buildings' or asset_type == 'TransportationNetwork'\
         or asset_type == 'WaterDistributionNetwork':
 
-            WF.aggregate_results(asst_data = asst_data, asset_type = asset_type)
+            WF.aggregate_results(asst_data = asst_data, asset_type = asset_type,
+                                 streaming = stream_aggregation)
             
         elif asset_type == 'WaterNetworkPipelines' :
         
@@ -345,6 +512,22 @@ if __name__ == '__main__':
     workflowArgParser.add_argument("-n", "--numP",
         default='8',
         help="If parallel, how many jobs to start with mpiexec option") 
+    workflowArgParser.add_argument("--scheduler",
+        default='dynamic',
+        help="How assets are assigned to the processes in parRUN: "
+             "options dynamic (shared work queue), static (round robin)")
+    workflowArgParser.add_argument("--runInProcess",
+        action="store_true",
+        help="Run the Python applications in the workflow process instead "
+             "of starting a new interpreter for each of them.")
+    workflowArgParser.add_argument("--streamAggregation",
+        action="store_true",
+        help="Collect the realizations of the results in a columnar HDF5 "
+             "store instead of one JSON file per realization.")
+    workflowArgParser.add_argument("--costKey",
+        default=None,
+        help="GeneralInformation attribute used as a cost hint to run the "
+             "largest assets first, e.g. NumberOfStories")
 
     #Parsing the command line arguments
     wfArgs = workflowArgParser.parse_args()
@@ -374,4 +557,8 @@ if __name__ == '__main__':
          site_response = wfArgs.siteResponse,
          parallelType = wfArgs.parallelType,
          mpiExec = wfArgs.mpiexec,
-         numPROC = numPROC)
+         numPROC = numPROC,
+         scheduler = wfArgs.scheduler,
+         cost_key = wfArgs.costKey,
+         run_in_process = wfArgs.runInProcess,
+         stream_aggregation = wfArgs.streamAggregation)
@@ -107,6 +107,7 @@ class Options(object):
 
         self._log_show_ms = False
         self._print_log = False
+        self._run_in_process = False
 
         self.reset_log_strings()
 
@@ -164,6 +165,14 @@ class Options(object):
     def print_log(self, value):
         self._print_log = str2bool(value)
 
+    @property
+    def run_in_process(self):
+        return self._run_in_process
+
+    @run_in_process.setter
+    def run_in_process(self, value):
+        self._run_in_process = str2bool(value)
+
     def reset_log_strings(self):
 
         if self._log_show_ms:
@@ -191,6 +200,8 @@ def set_options(config_options):
                 options.log_file = value
             elif key == "PrintLog":
                 options.print_log = value
+            elif key == "RunInProcess":
+                options.run_in_process = value
 
 
 
@@ -317,71 +328,238 @@ def create_command(command_list, enforced_python=None):
 
     return command
 
-def run_command(command):
-    """
-    Short description
+# compiled Python applications that are run in the workflow process
+in_process_apps = {}
 
-    Long description
+def get_python_app(command_list):
+    """
+    Returns the path to the Python script if the command runs a script with
+    the interpreter of the workflow, None otherwise.
 
     Parameters
     ----------
     command_list: array of unicode strings
-        Explain...
+        The command split into the executable and its arguments.
 
     """
 
-    # If it is a python script, we do not run it, but rather import the main
-    # function. This ensures that the script is run using the same python
-    # interpreter that this script uses and it is also faster because we do not
-    # need to run multiple python interpreters simultaneously.
-    Frank_trusts_this_approach = False
-    if command[:6] == 'python' and Frank_trusts_this_approach:
+    if len(command_list) < 2:
+        return None
+
+    python_exe = command_list[0]
+
+    if not os.path.basename(python_exe).lower().startswith('python'):
+        return None
+
+    # scripts that prescribe another interpreter keep their own process
+    if ((python_exe not in ['python', 'python3']) and
+        (os.path.realpath(python_exe) != os.path.realpath(sys.executable))):
+        return None
+
+    script_path = command_list[1]
+
+    if not (script_path.endswith('.py') and os.path.isfile(script_path)):
+        return None
+
+    return os.path.abspath(script_path)
+
+def run_python_app(script_path, arg_list):
+    """
+    Run a Python application in the workflow process
+
+    The script is compiled once and executed as __main__ for every call, so
+    the modules it imports (numpy, pandas, pelicun, etc.) are only loaded
+    once per workflow process. The arguments, working directory, import
+    path and environment variables are set for the call and restored
+    afterwards. sys.modules is restored from a snapshot as well: modules
+    replaced by the application are put back and every module it imported
+    is removed, except for the installed packages (standard library and
+    site-packages). This way the modules of the applications (including
+    the shared helpers in sibling or common directories) are loaded fresh
+    for every call, with no module-level state left by an earlier call or
+    name clashes with the modules of other applications.
+
+    Parameters
+    ----------
+    script_path: string
+        Absolute path to the Python script.
+    arg_list: array of unicode strings
+        Command line arguments of the script.
+
+    Returns
+    -------
+    result: string
+        Everything the application printed to stdout and stderr.
+    returncode: int
+        Exit code of the application.
+
+    """
+
+    import builtins
+    import io
+    import traceback
+    from contextlib import redirect_stdout, redirect_stderr
+
+    if script_path not in in_process_apps:
+        with open(script_path, 'r', encoding="utf-8") as f:
+            in_process_apps[script_path] = compile(f.read(), script_path, 'exec')
+
+    app_code = in_process_apps[script_path]
+    app_dir = os.path.dirname(script_path)
 
-        import importlib # only import this when it's needed
+    # save the state that the application may change
+    orig_argv = list(sys.argv)
+    orig_cwd = os.getcwd()
+    orig_path = list(sys.path)
+    orig_environ = dict(os.environ)
+    orig_modules = dict(sys.modules)
 
-        command_list = command.split()[1:]
-        #py_args = command_list[1:]
+    sys.argv = [script_path, ] + list(arg_list)
+    sys.path.insert(0, app_dir)
 
-        # get the dir and file name
-        py_script_dir, py_script_file = os.path.split(command_list[0][1:-1])
+    app_output = io.StringIO()
+    returncode = 0
 
-        # add the dir to the path
-        sys.path.insert(0, py_script_dir)
+    try:
+        with redirect_stdout(app_output), redirect_stderr(app_output):
+            try:
+                exec(app_code, {'__name__': '__main__',
+                                '__file__': script_path,
+                                '__builtins__': builtins})
+
+            except SystemExit as e:
+                if e.code is None:
+                    returncode = 0
+                elif isinstance(e.code, int):
+                    returncode = e.code
+                else:
+                    print(e.code)
+                    returncode = 1
+
+            except Exception:
+                traceback.print_exc()
+                returncode = 1
+
+    finally:
+        sys.argv = orig_argv
+        os.chdir(orig_cwd)
+        sys.path[:] = orig_path
+
+        for key in set(os.environ.keys()) - set(orig_environ.keys()):
+            del os.environ[key]
+        for key, value in orig_environ.items():
+            if os.environ.get(key, None) != value:
+                os.environ[key] = value
+
+        install_dirs = get_install_dirs()
+        for module_name in list(sys.modules.keys()):
+            if module_name in orig_modules:
+                continue
+            if not is_installed_module(sys.modules[module_name], install_dirs):
+                del sys.modules[module_name]
+        for module_name, module in orig_modules.items():
+            if sys.modules.get(module_name, None) is not module:
+                sys.modules[module_name] = module
+
+    return app_output.getvalue(), returncode
 
-        # import the file
-        py_script = importlib.__import__(
-            py_script_file[:-3], globals(), locals(), ['main',], 0)
+def get_install_dirs():
+    """
+    Returns the directories of the standard library and site-packages.
+
+    """
 
-        # remove the quotes from the arguments
-        arg_list = [c[1:-1] for c in command_list[1:]]
+    import site
+    import sysconfig
 
-        py_script.main(arg_list)
+    install_dirs = [sysconfig.get_paths()[key] for key in 
+                    ['stdlib', 'platstdlib', 'purelib', 'platlib']]
+    install_dirs += site.getsitepackages() + [site.getusersitepackages(), ]
 
-        return "", ""
+    return [os.path.normcase(os.path.abspath(x)) + os.sep 
+            for x in install_dirs]
 
+def is_installed_module(module, install_dirs):
+    """
+    Returns True if the module is built in or loaded from the standard
+    library or site-packages. These modules do not belong to an application
+    and are kept loaded between in-process runs (extension modules, e.g.,
+    numpy, cannot be loaded twice in a process).
+
+    """
+
+    module_file = getattr(module, '__file__', None)
+
+    if module_file is not None:
+        module_paths = [module_file, ]
     else:
-        
-        # fmk with Shell=True not working on older windows machines, new approach needed for quoted command .. turn into a list
-        command = shlex.split(command)
-              
-        try:
+        # namespace packages have a path but no file
+        module_paths = list(getattr(module, '__path__', []))
 
-            result = subprocess.check_output(command, stderr=subprocess.STDOUT, text=True)
-            returncode = 0
-        except subprocess.CalledProcessError as e:
-            result = e.output
-            returncode = e.returncode
+    module_paths = [os.path.normcase(os.path.abspath(x)) for x in module_paths]
 
-        if returncode != 0:
-            log_error('return code: {}'.format(returncode))
+    return all([any([x.startswith(y) for y in install_dirs]) 
+                for x in module_paths])
 
-        # if platform.system() == 'Windows':
-        #     return result.decode(sys.stdout.encoding), returncode
-        # else:
-        #     #print(result, returncode)
-        #     return str(result), returncode
+def run_command(command):
+    """
+    Run a command of the workflow
+
+    Python applications are run in the workflow process if the RunInProcess
+    option is set; every other command runs in a subprocess.
+
+    Parameters
+    ----------
+    command: unicode string
+        The command as prepared by create_command.
+
+    Returns
+    -------
+    result: string
+        The output of the command.
+    returncode: int
+        Exit code of the command.
+
+    """
+
+    # fmk with Shell=True not working on older windows machines, new approach needed for quoted command .. turn into a list
+    command_list = shlex.split(command)
+
+    # If it is a python script, we do not run it, but rather execute it in
+    # this process. This ensures that the script is run using the same python
+    # interpreter that this script uses and it is also faster because we do not
+    # need to start a new interpreter and import the same packages every time.
+    if options.run_in_process:
+
+        script_path = get_python_app(command_list)
 
-        return result, returncode
+        if script_path is not None:
+
+            result, returncode = run_python_app(script_path, command_list[2:])
+
+            if returncode != 0:
+                log_error('return code: {}'.format(returncode))
+
+            return result, returncode
+
+    try:
+
+        result = subprocess.check_output(command_list, stderr=subprocess.STDOUT, text=True)
+        returncode = 0
+    except subprocess.CalledProcessError as e:
+        result = e.output
+        returncode = e.returncode
+
+    if returncode != 0:
+        log_error('return code: {}'.format(returncode))
+
+    # if platform.system() == 'Windows':
+    #     return result.decode(sys.stdout.encoding), returncode
+    # else:
+    #     #print(result, returncode)
+    #     return str(result), returncode
+
+    return result, returncode
 
 def show_warning(warning_msg):
     warnings.warn(UserWarning(warning_msg))
@@ -498,6 +676,273 @@ def _parse_app_registry(registry_path, app_types, list_available_apps=False):
 
     return app_registry, default_values
 
+def get_r2d_res_dmg(dmg_data_i):
+    """
+    Summary of the damage realizations of an asset for R2D
+
+    Parameters
+    ----------
+    dmg_data_i: DataFrame
+        Damage states with one row per realization.
+
+    """
+
+    r2d_res_dmg = dict()
+    r2d_res_dmg.update({
+        "R2Dres_MostLikelyCriticalDamageState":\
+            dmg_data_i.max(axis = 1).mode().mean()})
+
+    return r2d_res_dmg
+
+def get_r2d_res_dv(dv_data_i, dv_units):
+    """
+    Summary of the repair consequence realizations of an asset for R2D
+
+    Parameters
+    ----------
+    dv_data_i: DataFrame
+        Decision variables with one row per realization.
+    dv_units: dict
+        Units of the decision variables.
+
+    """
+
+    r2d_res_dv = dict()
+    cost_columns = [col for col in dv_data_i.columns if col.startswith('Cost')]
+    if len(cost_columns) !=0:
+        cost_data = dv_data_i[cost_columns].mean()
+        cost_data_std = dv_data_i[cost_columns].std()
+        cost_key = cost_data.idxmax()
+        meanKey = f'R2Dres_mean_RepairCost_{dv_units[cost_key]}'
+        stdKey = f'R2Dres_std_RepairCost_{dv_units[cost_key]}'
+        r2d_res_dv.update({meanKey:cost_data[cost_key],\
+                            stdKey:cost_data_std[cost_key]})
+    time_columns = [col for col in dv_data_i.columns if col.startswith('Time')]
+    if len(time_columns) !=0:
+        time_data = dv_data_i[time_columns].mean()
+        time_data_std = dv_data_i[time_columns].std()
+        time_key = time_data.idxmax()
+        meanKey = f'R2Dres_mean_RepairTime_{dv_units[time_key]}'
+        stdKey = f'R2Dres_std_RepairTime_{dv_units[time_key]}'
+        r2d_res_dv.update({meanKey:time_data[time_key],\
+                            stdKey:time_data_std[time_key]})
+
+    return r2d_res_dv
+
+def update_nested_dict(target, source):
+    """
+    Recursively merges source into target.
+
+    """
+
+    for key, value in source.items():
+        if isinstance(value, dict) and isinstance(target.get(key, None), dict):
+            update_nested_dict(target[key], value)
+        else:
+            target[key] = value
+
+    return target
+
+class RealizationStore(object):
+    """
+    Appendable columnar store for the realizations of regional results.
+
+    Every output type (e.g., Demand, Damage, Loss) is a group of four
+    chunked, resizable HDF5 datasets holding one row per non-empty value:
+    asset (index into the assets table), field (index into the fields table
+    of the group), rlz (realization id) and value. Rows are buffered and
+    written one chunk at a time, so the memory use does not grow with the
+    number of assets.
+
+    Parameters
+    ----------
+    file_path: string
+        Path to the HDF5 file. An existing file is overwritten.
+    chunk_size: int
+        Number of rows per chunk and write.
+    compression: string
+        HDF5 compression filter of the datasets.
+
+    """
+
+    columns = {'asset': np.int32, 'field': np.int32,
+               'rlz': np.int32, 'value': np.float64}
+
+    def __init__(self, file_path, chunk_size=2**16, compression='gzip'):
+
+        import h5py
+
+        self.file = h5py.File(file_path, 'w')
+        self.chunk_size = chunk_size
+        self.compression = compression
+
+        self.assets = {}
+        self.fields = {}
+        self.buffers = {}
+        self.buffer_sizes = {}
+
+    def get_asset_index(self, asset_id):
+
+        return self.assets.setdefault(str(asset_id), len(self.assets))
+
+    def append(self, out_type, asset_id, data):
+        """
+        Add the realizations of an asset.
+
+        Parameters
+        ----------
+        out_type: string
+            Output type, e.g., Demand.
+        asset_id: string
+            Id of the asset.
+        data: DataFrame
+            One row per realization (the index is the realization id) and
+            one column per field. Missing values are not stored.
+
+        """
+
+        asset_index = self.get_asset_index(asset_id)
+
+        fields = self.fields.setdefault(out_type, {})
+        field_index = np.array([fields.setdefault(str(col), len(fields))
+                                for col in data.columns], dtype=np.int32)
+
+        values = data.to_numpy(dtype=np.float64)
+        rlz_pos, col_pos = np.nonzero(~np.isnan(values))
+
+        self.append_rows(out_type, {
+            'asset': np.full(len(rlz_pos), asset_index, dtype=np.int32),
+            'field': field_index[col_pos],
+            'rlz': data.index.to_numpy().astype(np.int32)[rlz_pos],
+            'value': values[rlz_pos, col_pos]})
+
+    def append_rows(self, out_type, rows):
+
+        buffer = self.buffers.setdefault(out_type,
+                                         {col: [] for col in self.columns})
+        for col in self.columns:
+            buffer[col].append(rows[col])
+
+        self.buffer_sizes[out_type] = (self.buffer_sizes.get(out_type, 0) +
+                                       len(rows['value']))
+
+        if self.buffer_sizes[out_type] >= self.chunk_size:
+            self.flush(out_type)
+
+    def flush(self, out_type):
+        """
+        Write the buffered rows of an output type to the file.
+
+        """
+
+        if self.buffer_sizes.get(out_type, 0) == 0:
+            return
+
+        if out_type not in self.file:
+            grp = self.file.create_group(out_type)
+            for col, col_type in self.columns.items():
+                grp.create_dataset(col, shape=(0,), maxshape=(None,),
+                                   dtype=col_type, chunks=(self.chunk_size,),
+                                   compression=self.compression)
+
+        grp = self.file[out_type]
+        for col in self.columns:
+            col_data = np.concatenate(self.buffers[out_type][col])
+            dset = grp[col]
+            i_start = dset.shape[0]
+            dset.resize((i_start + len(col_data),))
+            dset[i_start:] = col_data
+            self.buffers[out_type][col] = []
+
+        self.buffer_sizes[out_type] = 0
+
+    def close(self):
+        """
+        Write the remaining rows and the asset and field tables.
+
+        """
+
+        import h5py
+
+        for out_type in list(self.buffers.keys()):
+            self.flush(out_type)
+
+        self.file.create_dataset('assets', data=list(self.assets.keys()),
+                                 dtype=h5py.string_dtype())
+        for out_type, fields in self.fields.items():
+            if out_type in self.file:
+                self.file[out_type].create_dataset('fields',
+                    data=list(fields.keys()), dtype=h5py.string_dtype())
+
+        self.file.close()
+
+    @staticmethod
+    def merge(shard_paths, file_path, chunk_size=2**16, compression='gzip'):
+        """
+        Merge stores (e.g., the shards of MPI ranks) into a single store.
+
+        The rows are copied chunk by chunk and the asset and field indices
+        are remapped to the tables of the merged store.
+
+        """
+
+        import h5py
+
+        store = RealizationStore(file_path, chunk_size, compression)
+
+        for shard_path in shard_paths:
+            with h5py.File(shard_path, 'r') as shard:
+
+                asset_map = np.array(
+                    [store.get_asset_index(asset_id) for asset_id in 
+                     shard['assets'].asstr()[()]], dtype=np.int32)
+
+                for out_type in shard.keys():
+                    if out_type == 'assets':
+                        continue
+
+                    grp = shard[out_type]
+                    fields = store.fields.setdefault(out_type, {})
+                    field_map = np.array(
+                        [fields.setdefault(field, len(fields)) for field in 
+                         grp['fields'].asstr()[()]], dtype=np.int32)
+
+                    num_rows = grp['value'].shape[0]
+                    for i_start in range(0, num_rows, chunk_size):
+                        rows = {col: grp[col][i_start:i_start+chunk_size]
+                                for col in store.columns}
+                        rows['asset'] = asset_map[rows['asset']]
+                        rows['field'] = field_map[rows['field']]
+                        store.append_rows(out_type, rows)
+
+        store.close()
+
+    @staticmethod
+    def read(file_path, out_type, asset_ids=None):
+        """
+        Load the realizations of an output type in a long DataFrame with
+        asset, field, rlz and value columns.
+
+        """
+
+        import h5py
+
+        with h5py.File(file_path, 'r') as f:
+            assets = f['assets'].asstr()[()]
+            grp = f[out_type]
+            fields = grp['fields'].asstr()[()]
+
+            data = pd.DataFrame({col: grp[col][()] 
+                                 for col in RealizationStore.columns})
+
+        data['asset'] = assets[data['asset'].to_numpy()]
+        data['field'] = fields[data['field'].to_numpy()]
+
+        if asset_ids is not None:
+            data = data[data['asset'].isin([str(x) for x in asset_ids])]
+
+        return data
+
 class WorkFlowInputError(Exception):
     def __init__(self, value):
         self.value = value
@@ -719,6 +1164,8 @@ class Workflow(object):
         self.input_file = input_file
         self.app_registry_file = app_registry
         self.modifiedRun = False # ADAM to fix
+        # asset types collected by aggregate_results_streaming in this run
+        self.streamed_asset_types = set()
         self.parType = parType;
         self.mpiExec = mpiExec
         self.numProc = numProc 
@@ -2571,7 +3018,7 @@ class Workflow(object):
 
         #out_types = ['IM', 'BIM', 'EDP', 'DM', 'DV', 'every_realization'], 
         out_types = ['AIM', 'EDP', 'DMG', 'DV', 'every_realization'], 
-        headers = None):
+        headers = None, streaming = False):
         """
         Short description
 
@@ -2579,6 +3026,10 @@ class Workflow(object):
 
         Parameters
         ----------
+        streaming: bool
+            If True, the realizations of Pelicun3 results are collected in a
+            columnar store instead of one JSON file per realization. See
+            aggregate_results_streaming.
         """
 
         log_msg('Collecting '+asset_type+' damage and loss results')
@@ -2607,7 +3058,14 @@ class Workflow(object):
         # FMK - bug fix adding check on DL, not in siteResponse input file
         #
         
-        if 'DL' in self.workflow_apps and self.workflow_apps['DL'][asset_type].name == 'Pelicun3':
+        if ('DL' in self.workflow_apps and 
+            self.workflow_apps['DL'][asset_type].name == 'Pelicun3' and streaming):
+
+            self.aggregate_results_streaming(asst_data, asset_type, out_types,
+                                             R2D_res_out_types, run_path)
+            self.streamed_asset_types.add(asset_type)
+
+        elif 'DL' in self.workflow_apps and self.workflow_apps['DL'][asset_type].name == 'Pelicun3':
             initialize_dicts = True
             for a_i, asst in enumerate(asst_data):
 
@@ -2782,18 +3240,7 @@ class Workflow(object):
                             rlzn_pointer[rlz_i][asset_id].update(
                                 {'Damage':dmg_output[rlz_i]})
                         if 'DM' in R2D_res_out_types:
-                            # use forward fill in case of multiple modes
-                            meanValues = dmg_data_i.mode().ffill().mean()
-                            stdValues = dmg_data_i.std()
-                            r2d_res_dmg = dict()
-                            # for key in dmg_data_i.columns:
-                            #     meanKey = f'R2Dres_mode_{key}'
-                            #     stdKey = f'R2Dres_std_{key}'
-                            #     r2d_res_dmg.update({meanKey:meanValues[key],\
-                            #                         stdKey:stdValues[key]})
-                            r2d_res_dmg.update({
-                                "R2Dres_MostLikelyCriticalDamageState":\
-                                    dmg_data_i.max(axis = 1).mode().mean()})
+                            r2d_res_dmg = get_r2d_res_dmg(dmg_data_i)
                             r2d_res_i =  deter_pointer[asset_id].get('R2Dres', {})
                             r2d_res_i.update(r2d_res_dmg)
                             deter_pointer[asset_id].update({
@@ -2851,26 +3298,7 @@ class Workflow(object):
                             })
                         
                         if 'DV' in R2D_res_out_types:
-                            r2d_res_dv = dict()
-                            cost_columns = [col for col in dv_data_i.columns if col.startswith('Cost')]
-                            if len(cost_columns) !=0:
-                                cost_data = dv_data_i[cost_columns].mean()
-                                cost_data_std = dv_data_i[cost_columns].std()
-                                cost_key = cost_data.idxmax()
-                                meanKey = f'R2Dres_mean_RepairCost_{dv_units[cost_key]}'
-                                stdKey = f'R2Dres_std_RepairCost_{dv_units[cost_key]}'
-                                r2d_res_dv.update({meanKey:cost_data[cost_key],\
-                                                    stdKey:cost_data_std[cost_key]})
-                            time_columns = [col for col in dv_data_i.columns if col.startswith('Time')]
-                            if len(time_columns) !=0:
-                                time_data = dv_data_i[time_columns].mean()
-                                time_data_std = dv_data_i[time_columns].std()
-                                time_key = time_data.idxmax()
-                                meanKey = f'R2Dres_mean_RepairTime_{dv_units[time_key]}'
-                                stdKey = f'R2Dres_std_RepairTime_{dv_units[time_key]}'
-                                r2d_res_dv.update({meanKey:time_data[time_key],\
-                                                    stdKey:time_data_std[time_key]})
-
+                            r2d_res_dv = get_r2d_res_dv(dv_data_i, dv_units)
                             r2d_res_i =  deter_pointer[asset_id].get('R2Dres', {})
                             r2d_res_i.update(r2d_res_dv)
                             deter_pointer[asset_id].update({
@@ -3059,6 +3487,209 @@ class Workflow(object):
         log_msg('Damage and loss results collected successfully.', prepend_timestamp=False)
         log_div()
 
+    def aggregate_results_streaming(self, asst_data, asset_type, out_types,
+        R2D_res_out_types, run_path):
+        """
+        Collect Pelicun3 results without keeping the realizations in memory
+
+        The output files of every asset are read once. The realizations are
+        appended to a RealizationStore ({asset_type}_realizations.hdf5 with
+        Demand, Damage and Loss groups) and the R2Dres summary is computed
+        from each asset's data before it is discarded. The deterministic data
+        is saved to {asset_type}_det.json as in the JSON mode.
+
+        In a parallel run every rank collects its own shard of the assets;
+        rank 0 merges the shards at the end.
+
+        Parameters
+        ----------
+        asst_data: list
+            Assets with id and AIM file path.
+        asset_type: string
+            Type of the assets.
+        out_types: list
+            Output types to collect: EDP, DMG and DV are supported.
+        R2D_res_out_types: list
+            Outputs requested in the R2D summary.
+        run_path: string
+            Directory of the asset type in the results.
+
+        """
+
+        main_dir = Path(run_path)
+
+        if self.doParallel:
+            numP = self.numP
+            procID = self.procID
+            store_path = main_dir/f"{asset_type}_realizations_{procID}.hdf5"
+        else:
+            numP = 1
+            procID = 0
+            store_path = main_dir/f"{asset_type}_realizations.hdf5"
+
+        store = RealizationStore(store_path)
+
+        deterministic = {asset_type: {}}
+        hierarchy_depth = 0
+
+        for a_i, asst in enumerate(asst_data):
+
+            if a_i % numP != procID:
+                continue
+
+            bldg_dir = Path(os.path.dirname(asst['file'])).resolve()
+            assetTypeHierarchy = [bldg_dir.name]
+            hier_dir = bldg_dir
+            while hier_dir.parent.name != 'Results':
+                hier_dir = bldg_dir.parent
+                assetTypeHierarchy = [hier_dir.name] + assetTypeHierarchy
+            hierarchy_depth = len(assetTypeHierarchy)
+
+            asset_id = asst['id']
+            asset_dir = bldg_dir/asset_id
+
+            # list the outputs of the asset only once
+            asset_files = set(os.listdir(asset_dir))
+
+            # always get the AIM info
+            if f"{asset_id}-AIM_ap.json" in asset_files:
+                AIM_file = asset_dir / f"{asset_id}-AIM_ap.json"
+
+            elif f"{asset_id}-AIM.json" in asset_files:
+                AIM_file = asset_dir / f"{asset_id}-AIM.json"
+
+            else:
+                # skip this asset if there is no AIM file available
+                show_warning(
+                    f"Couldn't find AIM file for {assetTypeHierarchy[-1]} {asset_id}")
+                continue
+
+            with open(AIM_file, 'r', encoding="utf-8") as f:
+                AIM_data_i = json.load(f)
+
+            # Create the asset type hierarchy in deterministic
+            deter_pointer = deterministic
+            for assetTypeIter in assetTypeHierarchy:
+                deter_pointer = deter_pointer.setdefault(assetTypeIter, {})
+
+            # Currently, all GI data is deterministic                
+            deter_pointer.update({asset_id: {
+                'GeneralInformation': AIM_data_i['GeneralInformation'],
+                'R2Dres': {}}})
+            r2d_res_i = deter_pointer[asset_id]['R2Dres']
+
+            if 'EDP' in out_types:
+
+                if 'DEM_sample.json' not in asset_files:
+                    show_warning(
+                        f"Couldn't find EDP file for {assetTypeHierarchy[-1]} {asset_id}")
+
+                else:
+                    with open(asset_dir/'DEM_sample.json', 'r', encoding="utf-8") as f:
+                        edp_data_i = json.load(f)
+
+                    # remove the ONE demand
+                    edp_data_i.pop('ONE-0-1')
+
+                    # extract EDP unit info
+                    edp_units = edp_data_i.pop('Units')
+
+                    edp_data_i = pd.DataFrame(edp_data_i)
+                    edp_data_i.index = edp_data_i.index.astype(int)
+
+                    store.append('Demand', asset_id, edp_data_i)
+
+                    deter_pointer[asset_id].update({
+                        "Demand": {"Units": edp_units}})
+
+            if 'DMG' in out_types:
+
+                if 'DMG_grp.json' not in asset_files:
+                    show_warning(
+                        f"Couldn't find DMG file for {assetTypeHierarchy[-1]} {asset_id}")
+
+                else:
+                    with open(asset_dir/'DMG_grp.json', 'r', encoding="utf-8") as f:
+                        dmg_data_i = json.load(f)
+
+                    # remove damage unit info                        
+                    del dmg_data_i['Units']
+
+                    dmg_data_i = pd.DataFrame(dmg_data_i)
+                    dmg_data_i.index = dmg_data_i.index.astype(int)
+
+                    store.append('Damage', asset_id, dmg_data_i)
+
+                    if 'DM' in R2D_res_out_types:
+                        r2d_res_i.update(get_r2d_res_dmg(dmg_data_i))
+
+            if 'DV' in out_types:
+
+                if 'DV_repair_grp.json' not in asset_files:
+                    show_warning(
+                        f"Couldn't find DV file for {assetTypeHierarchy[-1]} {asset_id}")
+
+                else:
+                    with open(asset_dir/'DV_repair_grp.json', 'r', encoding="utf-8") as f:
+                        dv_data_i = json.load(f)
+
+                    # extract DV unit info
+                    dv_units = dv_data_i.pop('Units')
+
+                    dv_data_i = pd.DataFrame(dv_data_i)
+                    dv_data_i.index = dv_data_i.index.astype(int)
+
+                    store.append('Loss', asset_id, dv_data_i)
+
+                    deter_pointer[asset_id].update({
+                        "Loss": {"Units": dv_units}})
+
+                    if 'DV' in R2D_res_out_types:
+                        r2d_res_i.update(get_r2d_res_dv(dv_data_i, dv_units))
+
+        store.close()
+
+        if self.doParallel:
+
+            # save the shard of this rank and let rank 0 merge them
+            with open(main_dir/f"{asset_type}_det_{procID}.json", 'w', encoding="utf-8") as f:
+                json.dump({'HierarchyDepth': hierarchy_depth,
+                           'Deterministic': deterministic}, f)
+
+            self.comm.Barrier()
+
+            if procID != 0:
+                return
+
+            deterministic = {asset_type: {}}
+            shard_paths = []
+            for rank in range(numP):
+                det_shard_path = main_dir/f"{asset_type}_det_{rank}.json"
+                with open(det_shard_path, 'r', encoding="utf-8") as f:
+                    det_shard = json.load(f)
+                hierarchy_depth = max(hierarchy_depth, det_shard['HierarchyDepth'])
+                update_nested_dict(deterministic, det_shard['Deterministic'])
+                os.remove(det_shard_path)
+
+                shard_paths.append(main_dir/f"{asset_type}_realizations_{rank}.hdf5")
+
+            RealizationStore.merge(shard_paths, 
+                                   main_dir/f"{asset_type}_realizations.hdf5")
+            for shard_path in shard_paths:
+                os.remove(shard_path)
+
+        # This is also ugly but necessary for backward compatibility so that 
+        # file structure created from apps other than GeoJSON_TO_ASSET can be
+        # dealt with
+        if hierarchy_depth == 1:
+            if asset_type == "Buildings":
+                deterministic = {"Buildings":{"Building":deterministic["Buildings"]}}
+            else:
+                deterministic = {asset_type: deterministic}
+
+        with open(main_dir/f"{asset_type}_det.json", 'w', encoding="utf-8") as f:
+            json.dump(deterministic, f, indent=2)
+
     def compile_r2d_results_geojson(self, asset_files):
         run_path = self.run_dir
         with open(self.input_file, 'r', encoding="utf-8") as f:
@@ -3141,6 +3772,12 @@ class Workflow(object):
                 with open(determine_file, 'r', encoding="utf-8") as f:
                     determ_i = json.load(f)
                 deterministic.update(determ_i)
+                # the realizations of streaming aggregation stay in the 
+                # {asset_type}_realizations.hdf5 store; decided by this run 
+                # as the asset directory can have {asset_type}_{rlz}.json 
+                # files of earlier runs
+                if asset_type in self.streamed_asset_types:
+                    continue
                 for rlz_i in range(sample_size):
                     rlz_i_file = asset_dir/f"{asset_type}_{rlz_i}.json"
                     with open(rlz_i_file, 'r', encoding="utf-8") as f:
@@ -3151,6 +3788,8 @@ class Workflow(object):
             with open (determine_file, 'w', encoding="utf-8") as f:
                 json.dump(deterministic, f, indent=2)
             for rlz_i, rlz_data in realizations.items():
+                if len(rlz_data) == 0:
+                    continue
                 with open(self.run_dir/f"Results_{rlz_i}.json", 'w', encoding="utf-8") as f:
                     json.dump(rlz_data, f, indent=2)
         else:
@@ -43,6 +43,8 @@ import numpy as np
 from pathlib import Path
 from scipy.integrate import cumtrapz
 from scipy.interpolate import interp1d
+from scipy.linalg import expm
+from scipy.signal import lfilter, lfiltic
 from scipy.stats.mstats import gmean
 import pandas as pd
 this_dir = Path(os.path.dirname(os.path.abspath(__file__))).resolve()
@@ -315,43 +317,42 @@ class IntensityMeasureComputer:
             periods = np.array(periods)
         num_periods = len(periods)
 
-        for cur_hist_name, cur_hist in self.time_hist_dict.items():
+        # circular frequency
+        omega = (2*np.pi)/periods
+
+        # group the records by the time step of the analysis
+        hist_names = list(self.time_hist_dict.keys())
+        hist_groups = dict()
+        for cur_hist_name in hist_names:
+            cur_hist = self.time_hist_dict[cur_hist_name]
             dt = cur_hist[1]
-            ground_acc = cur_hist[2]
-            num_steps = len(ground_acc)
-            # discritize
-            dt_disc = 0.005
-            num_steps_disc = int(np.floor(num_steps*dt/dt_disc))
-            f = interp1d([dt*x for x in range(num_steps)], ground_acc, bounds_error=False, fill_value=(ground_acc[0], ground_acc[-1]))
-            tmp_time = [dt_disc*x for x in range(num_steps_disc)]
-            ground_acc = f(tmp_time)
-            # circular frequency, damping, and stiffness terms
-            omega = (2*np.pi)/periods
-            cval = damping*2*omega
-            kval = ((2*np.pi)/periods)**2
-            # Newmark-Beta
-            accel = np.zeros([num_steps_disc, num_periods])
-            vel = np.zeros([num_steps_disc, num_periods])
-            disp = np.zeros([num_steps_disc, num_periods])
-            a_t = np.zeros([num_steps_disc, num_periods])
-            accel[0, :] =(-ground_acc[0] - (cval * vel[0, :])) - (kval * disp[0, :])
-            for j in range(1, num_steps_disc):
-                delta_acc = ground_acc[j]-ground_acc[j-1]
-                delta_d2u = (-delta_acc-dt_disc*cval*accel[j-1,:]-dt_disc*kval*(vel[j-1,:]+0.5*dt_disc*accel[j-1,:]))/ \
-                    (1.0+0.5*dt_disc*cval+0.25*dt_disc**2*kval)
-                delta_du = dt_disc*accel[j-1,:]+0.5*dt_disc*delta_d2u
-                delta_u = dt_disc*vel[j-1,:]+0.5*dt_disc**2*accel[j-1,:]+0.25*dt_disc**2*delta_d2u
-                accel[j,:] = delta_d2u+accel[j-1,:]
-                vel[j,:] = delta_du+vel[j-1,:]
-                disp[j,:] = delta_u+disp[j-1,:]
-                a_t[j, :] = ground_acc[j] + accel[j, :]
+            # records with larger time steps are sub-divided (linear 
+            # interpolation) to catch the peaks of short-period oscillators
+            num_sub_steps = max(1, int(np.ceil(dt/0.005 - 1e-9)))
+            dt_disc = dt/num_sub_steps
+            ground_acc = np.array(cur_hist[2], dtype=float)
+            if num_sub_steps > 1:
+                num_steps = len(ground_acc)
+                ground_acc = np.interp(np.arange((num_steps-1)*num_sub_steps+1)/num_sub_steps,
+                                       np.arange(num_steps), ground_acc)
+            hist_groups.setdefault(dt_disc, []).append((cur_hist_name, ground_acc))
+
+        for dt_disc, cur_group in hist_groups.items():
+            # batch of records (zero padded to the longest one)
+            num_steps = max([len(x[1]) for x in cur_group]) + 1
+            ground_acc = np.zeros([len(cur_group), num_steps])
+            for i, (_, cur_acc) in enumerate(cur_group):
+                ground_acc[i, :len(cur_acc)] = cur_acc
+            peak_disp, peak_vel, peak_acc = compute_sdof_peaks(
+                ground_acc, [len(x[1]) for x in cur_group], periods, damping, dt_disc)
             # collect data
-            self.disp_spectrum.update({cur_hist_name: np.ndarray.tolist(unit_factor_psd*np.max(np.fabs(disp), axis=0))})
-            self.vel_spectrum.update({cur_hist_name: np.ndarray.tolist(unit_factor_vspec*np.max(np.fabs(vel), axis=0))})
-            self.acc_spectrum.update({cur_hist_name: np.ndarray.tolist(unit_factor_aspec*np.max(np.fabs(a_t), axis=0)/100.0/self.g)})
-            self.psv.update({cur_hist_name: np.ndarray.tolist(unit_factor_psv*omega*np.max(np.fabs(disp), axis=0))})
-            self.psa.update({cur_hist_name: np.ndarray.tolist(unit_factor_psa*omega**2*np.max(np.fabs(disp), axis=0)/100.0/self.g)})
-            self.periods.update({cur_hist_name: periods.tolist()})
+            for i, (cur_hist_name, _) in enumerate(cur_group):
+                self.disp_spectrum.update({cur_hist_name: np.ndarray.tolist(unit_factor_psd*peak_disp[i])})
+                self.vel_spectrum.update({cur_hist_name: np.ndarray.tolist(unit_factor_vspec*peak_vel[i])})
+                self.acc_spectrum.update({cur_hist_name: np.ndarray.tolist(unit_factor_aspec*peak_acc[i]/100.0/self.g)})
+                self.psv.update({cur_hist_name: np.ndarray.tolist(unit_factor_psv*omega*peak_disp[i])})
+                self.psa.update({cur_hist_name: np.ndarray.tolist(unit_factor_psa*omega**2*peak_disp[i]/100.0/self.g)})
+                self.periods.update({cur_hist_name: periods.tolist()})
 
     def compute_peak_ground_responses(self, im_units=dict()):
 
@@ -446,6 +447,102 @@ class IntensityMeasureComputer:
                 f = interp1d(cur_periods, cur_psa)
                 self.saratio.update({cur_hist_name: f(T1)/gmean(f(period_list))*unit_factor})               
 
+def get_sdof_filter(period, damping, dt):
+
+    # Exact discrete-time solution of an SDOF oscillator under a piecewise 
+    # linear ground acceleration (i.e., the Nigam-Jennings recursion):
+    # x[j] = A x[j-1] + B0 ag[j-1] + B1 ag[j], with x = [disp, vel]
+    omega = 2*np.pi/period
+    F = np.array([[0.0, 1.0], [-omega**2, -2*damping*omega]])
+    G = np.array([0.0, -1.0])
+    # augmented state [x, ag, d(ag)/dt] for the matrix exponential
+    M = np.zeros([4, 4])
+    M[:2, :2] = F
+    M[:2, 2] = G
+    M[2, 3] = 1.0
+    E = expm(M*dt)
+    A = E[:2, :2]
+    B1 = E[:2, 3]/dt
+    B0 = E[:2, 2] - B1
+    # return
+    return A, B0, B1
+
+
+def compute_sdof_peaks(ground_acc, num_steps, periods, damping, dt, block_size=2**20):
+
+    # peak relative displacement, relative velocity, and absolute acceleration
+    # of the oscillators (periods) under every record (rows of ground_acc);
+    # num_steps is the number of valid steps of each record, and ground_acc
+    # needs at least one (zero) padded step after the longest record
+    num_records, num_steps_max = ground_acc.shape
+    num_periods = len(periods)
+    peak_disp = np.zeros([num_records, num_periods])
+    peak_vel = np.zeros([num_records, num_periods])
+    peak_acc = np.zeros([num_records, num_periods])
+    if num_steps_max < 3:
+        return peak_disp, peak_vel, peak_acc
+    # filter coefficients of all periods
+    coefs = []
+    for period in periods:
+        A, B0, B1 = get_sdof_filter(period, damping, dt)
+        # the recursion of the displacement as an IIR filter:
+        # u[j] = tr(A) u[j-1] - det(A) u[j-2] + b0 ag[j] + b1 ag[j-1] + b2 ag[j-2]
+        a_coef = np.array([1.0, -np.trace(A), np.linalg.det(A)])
+        b_coef = np.array([B1[0],
+                           B0[0]-A[1, 1]*B1[0]+A[0, 1]*B1[1],
+                           -A[1, 1]*B0[0]+A[0, 1]*B0[1]])
+        # initial filter states from u[1], ag[1], and ag[0]
+        zi_basis = np.array([lfiltic(b_coef, a_coef, [1.0, 0.0], [0.0, 0.0]),
+                             lfiltic(b_coef, a_coef, [0.0, 0.0], [1.0, 0.0]),
+                             lfiltic(b_coef, a_coef, [0.0, 0.0], [0.0, 1.0])])
+        coefs.append((A, B0, B1, a_coef, b_coef, zi_basis))
+    # records are processed in blocks small enough to stay in cache
+    num_rows = max(1, min(num_records, block_size//(8*num_steps_max)))
+    for i_start in range(0, num_records, num_rows):
+        i_end = min(i_start+num_rows, num_records)
+        acc_0 = np.ascontiguousarray(ground_acc[i_start:i_end, :-1])
+        acc_1 = np.ascontiguousarray(ground_acc[i_start:i_end, 1:])
+        # mask of the padded steps (if any)
+        block_steps = np.array(num_steps[i_start:i_end])
+        valid = None
+        if np.min(block_steps) < num_steps_max-1:
+            valid = (np.arange(num_steps_max-1)[np.newaxis, :] < 
+                     block_steps[:, np.newaxis]).astype(float)
+        disp = np.zeros([i_end-i_start, num_steps_max])
+        vel = np.zeros([i_end-i_start, num_steps_max-1])
+        tmp = np.zeros([i_end-i_start, num_steps_max-1])
+        for k, period in enumerate(periods):
+            omega = 2*np.pi/period
+            A, B0, B1, a_coef, b_coef, zi_basis = coefs[k]
+            # the oscillator is at rest at the first step, and the filter 
+            # starts at the third step
+            disp[:, 1] = B0[0]*acc_0[:, 0] + B1[0]*acc_0[:, 1]
+            zi = np.column_stack([disp[:, 1], acc_0[:, 1], acc_0[:, 0]]) @ zi_basis
+            disp[:, 2:], _ = lfilter(b_coef, a_coef, acc_1[:, 1:], axis=1, zi=zi)
+            # the velocity from the first row of the recursion
+            np.multiply(disp[:, 1:], 1.0/A[0, 1], out=vel)
+            np.multiply(disp[:, :-1], -A[0, 0]/A[0, 1], out=tmp)
+            vel += tmp
+            np.multiply(acc_0, -B0[0]/A[0, 1], out=tmp)
+            vel += tmp
+            np.multiply(acc_1, -B1[0]/A[0, 1], out=tmp)
+            vel += tmp
+            if valid is None:
+                tmp[:] = disp[:, :-1]
+            else:
+                vel *= valid
+                np.multiply(disp[:, :-1], valid, out=tmp)
+            peak_disp[i_start:i_end, k] = np.maximum(tmp.max(axis=1), -tmp.min(axis=1))
+            peak_vel[i_start:i_end, k] = np.maximum(vel.max(axis=1), -vel.min(axis=1))
+            # absolute acceleration from the equation of motion
+            tmp *= omega**2
+            vel *= 2*damping*omega
+            tmp += vel
+            peak_acc[i_start:i_end, k] = np.maximum(tmp.max(axis=1), -tmp.min(axis=1))
+    # return
+    return peak_disp, peak_vel, peak_acc
+
+
 def load_records(event_file, ampScaled):
 
     event_data = event_file.get('Events', None)
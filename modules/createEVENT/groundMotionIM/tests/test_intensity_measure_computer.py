@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+# the module needs scipy.integrate.cumtrapz (scipy < 1.14)
+IntensityMeasureComputer = pytest.importorskip('IntensityMeasureComputer', exc_type=ImportError)
+
+
+def make_records(num_records=3, num_steps=1200, seed=0):
+    rng = np.random.default_rng(seed)
+    return [np.convolve(rng.standard_normal(num_steps - 150*i), np.ones(5)/5, 'same')*100.0
+            for i in range(num_records)]
+
+
+def get_batch(records):
+    ground_acc = np.zeros([len(records), max([len(x) for x in records]) + 1])
+    for i, cur_acc in enumerate(records):
+        ground_acc[i, :len(cur_acc)] = cur_acc
+    return ground_acc, [len(x) for x in records]
+
+
+def sdof_peaks_loop(ground_acc, periods, damping, dt):
+    # the recursion of every period stepped one time step at a time
+    peaks = np.zeros([3, len(periods)])
+    for k, period in enumerate(periods):
+        omega = 2*np.pi/period
+        A, B0, B1 = IntensityMeasureComputer.get_sdof_filter(period, damping, dt)
+        x = np.zeros(2)
+        for j in range(1, len(ground_acc)):
+            x = A @ x + B0*ground_acc[j-1] + B1*ground_acc[j]
+            acc = omega**2*x[0] + 2*damping*omega*x[1]
+            peaks[:, k] = np.maximum(peaks[:, k], np.abs([x[0], x[1], acc]))
+    return peaks
+
+
+def newmark_peaks_loop(ground_acc, periods, damping, dt):
+    # average acceleration Newmark loop of the previous implementation
+    c = damping*2*2*np.pi/periods
+    k = (2*np.pi/periods)**2
+    u = np.zeros(len(periods))
+    v = np.zeros(len(periods))
+    a = -ground_acc[0] - c*v - k*u
+    peaks = np.zeros([3, len(periods)])
+    for j in range(1, len(ground_acc)):
+        delta_ag = ground_acc[j] - ground_acc[j-1]
+        delta_a = (-delta_ag - dt*c*a - dt*k*(v + 0.5*dt*a))/(1 + 0.5*dt*c + 0.25*dt**2*k)
+        delta_v = dt*a + 0.5*dt*delta_a
+        delta_u = dt*v + 0.5*dt**2*a + 0.25*dt**2*delta_a
+        a = a + delta_a
+        v = v + delta_v
+        u = u + delta_u
+        peaks = np.maximum(peaks, np.abs([u, v, ground_acc[j] + a]))
+    return peaks
+
+
+def test_sdof_peaks_match_step_loop():
+    periods = np.array([0.02, 0.1, 0.5, 2.0])
+    records = make_records()
+    ground_acc, num_steps = get_batch(records)
+    for block_size in [2**20, 1]:
+        peak_disp, peak_vel, peak_acc = IntensityMeasureComputer.compute_sdof_peaks(
+            ground_acc, num_steps, periods, 0.05, 0.005, block_size=block_size)
+        for i, cur_acc in enumerate(records):
+            expected = sdof_peaks_loop(cur_acc, periods, 0.05, 0.005)
+            np.testing.assert_allclose(peak_disp[i], expected[0], rtol=1e-8)
+            np.testing.assert_allclose(peak_vel[i], expected[1], rtol=1e-8)
+            np.testing.assert_allclose(peak_acc[i], expected[2], rtol=1e-8)
+
+
+def test_sdof_peaks_match_newmark_loop():
+    # the methods converge to the same peaks when the step is small 
+    # compared to the period
+    periods = np.array([0.3, 1.0, 3.0])
+    records = make_records()
+    ground_acc, num_steps = get_batch(records)
+    peak_disp, peak_vel, peak_acc = IntensityMeasureComputer.compute_sdof_peaks(
+        ground_acc, num_steps, periods, 0.05, 0.005)
+    for i, cur_acc in enumerate(records):
+        expected = newmark_peaks_loop(cur_acc, periods, 0.05, 0.005)
+        np.testing.assert_allclose(peak_disp[i], expected[0], rtol=1e-2)
+        np.testing.assert_allclose(peak_vel[i], expected[1], rtol=1e-2)
+        np.testing.assert_allclose(peak_acc[i], expected[2], rtol=1e-2)
@@ -34,39 +34,50 @@ except:
 
 # from emukit.multi_fidelity.convert_lists_to_array import convert_x_list_to_array, convert_xy_lists_to_arrays
 
+# surrogate models loaded in this process (key: paths, modification times
+# and sizes of the surrogate json and pickle files)
+surrogate_cache = dict()
+
+
 def main(params_dir,surrogate_dir,json_dir,result_file,input_json):
-    global error_file
 
+    #
+    # predict for the current workdir
+    #
 
-    os_type=sys.platform.lower()
-    run_type ='runninglocal'
+    return run_batch([{'cwd': os.getcwd(), 'params_dir': params_dir, 'result_file': result_file,
+                       'input_json': input_json}], surrogate_dir, json_dir)[0]
+
+
+def get_surrogate(json_dir, surrogate_dir, error_exit):
 
     #
-    # create a log file
+    # load the surrogate once per process
     #
 
-    msg0 = os.path.basename(os.getcwd()) + " : "
-    file_object = open('surrogateLog.log', 'a')
+    # a retrained surrogate written to the same paths is loaded again
+    key = tuple((os.path.abspath(x),) + get_file_stamp(x) for x in [json_dir, surrogate_dir])
+    if key not in surrogate_cache:
+        # drop the older versions of the same surrogate
+        for cached_key in [x for x in surrogate_cache if [y[0] for y in x] == [y[0] for y in key]]:
+            del surrogate_cache[cached_key]
+        surrogate_cache[key] = load_surrogate(json_dir, surrogate_dir, error_exit)
+    return surrogate_cache[key]
 
-    folderName = os.path.basename(os.getcwd())
-    sampNum = folderName.split(".")[-1]
+
+def get_file_stamp(file_path):
 
     #
-    # read json -- current input file
+    # modification time and size of a file, empty if it does not exist
     #
 
-    def error_exit(msg):
-        error_file.write(msg) # local
-        error_file.close()
-        file_object.write(msg0 + msg) # global file
-        file_object.close()
-        print(msg)
-        exit(-1)
+    if not os.path.exists(file_path):
+        return ()
+    file_stat = os.stat(file_path)
+    return (file_stat.st_mtime_ns, file_stat.st_size)
 
-    def error_warning(msg):
-        #error_file.write(msg)
-        file_object.write(msg)
-        #print(msg)
+
+def load_surrogate(json_dir, surrogate_dir, error_exit):
 
     if not os.path.exists(json_dir):
        msg = 'Error in surrogate prediction: File not found -' + json_dir
@@ -79,53 +90,10 @@ def main(params_dir,surrogate_dir,json_dir,result_file,input_json):
             msg = 'invalid json format: ' + json_dir
             error_exit(msg)
 
-    isEEUQ = sur["isEEUQ"]
-
-    if isEEUQ:
-        dakota_path = 'sc_scInput.json'
-    else:
-        dakota_path = input_json
-
-    try:
-        with open(dakota_path) as f: # current input file
-            inp_tmp = json.load(f)
-    except:
-        try:
-            with open('sc_inputRWHALE.json') as f: # current input file
-                inp_tmp = json.load(f)     
-        except:
-            pass      
-
-
-    try:
-        if isEEUQ:
-            inp_fem = inp_tmp["Applications"]["Modeling"]
-        else:
-            inp_fem = inp_tmp["FEM"]
-    except:
-        inp_fem={}
-        print('invalid json format - dakota.json')
-
-    norm_var_thr = inp_fem.get("varThres",0.02)
-    when_inaccurate = inp_fem.get("femOption","continue")
-    do_mf = False
-    myseed = inp_fem.get("gpSeed",None)
-    prediction_option = inp_fem.get("predictionOption", "random")
-    if myseed==None:
-        folderName = os.path.basename(os.path.dirname(os.getcwd()))
-        myseed = int(folderName)*int(1.e7)
-    np.random.seed(int(myseed)+int(sampNum))
-
-    # if no g and rv,
-
-
     #
     # read json -- original input for training surrogate
     #
 
-
-    f.close()
-
     did_stochastic = sur["doStochastic"]
     did_logtransform = sur["doLogtransform"]
     did_normalization = sur["doNormalization"]
@@ -197,7 +165,7 @@ def main(params_dir,surrogate_dir,json_dir,result_file,input_json):
 
             self.set_XY(X, Y)
 
-        def get_stochastic_variance(X, Y, x, ny):
+        def get_stochastic_variance(X, Y, ny):
             #X_unique, X_idx, indices, counts = np.unique(X, axis=0, return_index=True, return_counts=True, return_inverse=True)
             X_unique, dummy, indices, counts = np.unique(X, axis=0, return_index=True, return_counts=True,
                                                          return_inverse=True)
@@ -235,10 +203,6 @@ def main(params_dir,surrogate_dir,json_dir,result_file,input_json):
 
                 norm_var_str = (var_pred.T[0]) / Y_normFact  # if normalization was used..
 
-
-                log_var_pred_x, dum = m_var.predict(x)
-                nugget_var_pred_x = np.exp(log_var_pred_x.T[0]) / Y_normFact
-                
             else:
                 X_unique = X
                 Y_mean = Y
@@ -263,17 +227,131 @@ def main(params_dir,surrogate_dir,json_dir,result_file,input_json):
 
                 norm_var_str = (var_pred.T[0]) / Y_normFact  # if normalization was used..
 
-                log_var_pred_x, dum = m_var.predict(x)
-                nugget_var_pred_x = np.exp(log_var_pred_x.T[0]) / Y_normFact
+            # the nugget at the prediction points is computed from m_var when predicting
+            return X_unique, Y_mean, norm_var_str, counts, m_var, Y_normFact, np.var(Y_mean)
+
+    if kernel == 'Radial Basis':
+        kr = GPy.kern.RBF(input_dim=nrv_sur, ARD=True)
+    elif kernel == 'Exponential':
+        kr = GPy.kern.Exponential(input_dim=nrv_sur, ARD=True)
+    elif kernel == 'Matern 3/2':
+        kr = GPy.kern.Matern32(input_dim=nrv_sur, ARD=True)
+    elif kernel == 'Matern 5/2':
+        kr = GPy.kern.Matern52(input_dim=nrv_sur, ARD=True)
+
+    if sur['doLinear']:
+        kr = kr + GPy.kern.Linear(input_dim=nrv_sur, ARD=True)
 
-          
-            return X_unique, Y_mean, norm_var_str, counts, nugget_var_pred_x,  np.var(Y_mean)
+    if did_logtransform:
+        Y = np.log(Y)
+
+    kg = kr
+    m_list = list()
+    nugget_var_list = [0] * ng_sur
+    nugget_var_model_list = [None] * ng_sur
+
+    if not did_mf:
+
+        for ny in range(ng_sur):
+
+            if did_stochastic[ny]:
+
+                m_list = m_list + [GPy.models.GPRegression(X, Y[:, ny][np.newaxis].transpose(), kernel=kg.copy(),
+                                                           normalizer=did_normalization)]
+                X_unique, Y_mean, norm_var_str, counts, m_var, nugget_normFact, Y_normFact = get_stochastic_variance(X,
+                                                                                                                     Y[:, ny][
+                                                                                                                         np.newaxis].T,
+                                                                                                                     ny)
+                Y_metadata = {'variance_structure': norm_var_str / counts}
+                m_list[ny].set_XY2(X_unique, Y_mean, Y_metadata=Y_metadata)
+                for key, val in sur["modelInfo"][g_name_sur[ny]].items():
+                    exec('m_list[ny].' + key + '= np.array(val)')
+
+                # nugget_var_list[ny] = Gaussian_noise * (exp(m_var.predict(x)) / nugget_normFact) * Y_normFact
+                nugget_var_model_list[ny] = (m_var, np.array(m_list[ny].Gaussian_noise.parameters) * Y_normFact / nugget_normFact)
+
+            else:
+                m_list = m_list + [
+                    GPy.models.GPRegression(X, Y[:, ny][np.newaxis].transpose(), kernel=kg.copy(), normalizer=True)]
+                for key, val in sur["modelInfo"][g_name_sur[ny]].items():
+                    exec('m_list[ny].' + key + '= np.array(val)')
+
+                Y_normFact = np.var(Y[:, ny])
+                nugget_var_list[ny] = np.squeeze(np.array(m_list[ny].Gaussian_noise.parameters) * np.array(Y_normFact))
+
+    else:
+        with open(surrogate_dir, "rb") as file:
+            m_list = pickle.load(file)
+
+        for ny in range(ng_sur):
+            Y_normFact = np.var(Y[:, ny])
+            nugget_var_list[ny] = m_list[ny].gpy_model["mixed_noise.Gaussian_noise.variance"] * Y_normFact
+
+    return {'sur': sur,
+            'isEEUQ': sur["isEEUQ"],
+            'did_logtransform': did_logtransform,
+            'did_mf': did_mf,
+            'rv_name_sur': rv_name_sur,
+            'nrv_sur': nrv_sur,
+            'g_name_sur': g_name_sur,
+            'constIdx': constIdx,
+            'constVal': constVal,
+            'm_list': m_list,
+            'nugget_var_list': nugget_var_list,
+            'nugget_var_model_list': nugget_var_model_list}
+
+
+def read_inputs(model, params_dir, input_json, error_exit):
+
+    #
+    # read json -- current input file
+    #
+
+    sur = model['sur']
+    isEEUQ = model['isEEUQ']
+    rv_name_sur = model['rv_name_sur']
+    nrv_sur = model['nrv_sur']
+    g_name_sur = model['g_name_sur']
+
+    folderName = os.path.basename(os.getcwd())
+    sampNum = folderName.split(".")[-1]
+
+    if isEEUQ:
+        dakota_path = 'sc_scInput.json'
+    else:
+        dakota_path = input_json
+
+    try:
+        with open(dakota_path) as f: # current input file
+            inp_tmp = json.load(f)
+    except:
+        try:
+            with open('sc_inputRWHALE.json') as f: # current input file
+                inp_tmp = json.load(f)
+        except:
+            pass
+
+
+    try:
+        if isEEUQ:
+            inp_fem = inp_tmp["Applications"]["Modeling"]
+        else:
+            inp_fem = inp_tmp["FEM"]
+    except:
+        inp_fem={}
+        print('invalid json format - dakota.json')
+
+    myseed = inp_fem.get("gpSeed",None)
+    if myseed==None:
+        folderName = os.path.basename(os.path.dirname(os.getcwd()))
+        myseed = int(folderName)*int(1.e7)
 
     # REQUIRED: rv_name, y_var
 
     # Collect also dummy rvs
     id_vec=[]
     rv_name_dummy = []
+    rv_val_dummy = None
 
 
     t_total = time.process_time()
@@ -296,7 +374,7 @@ def main(params_dir,surrogate_dir,json_dir,result_file,input_json):
             if ((name == 'MultipleEvent') or (name == 'eventID')) and isEEUQ:
                 continue
 
-            if not name_values[1].replace('.','',1).replace('e','',1).replace('-','',1).replace('+','',1).isdigit():  
+            if not name_values[1].replace('.','',1).replace('e','',1).replace('-','',1).replace('+','',1).isdigit():
                 # surrogate model does not accept descrete
                 continue
 
@@ -358,11 +436,11 @@ def main(params_dir,surrogate_dir,json_dir,result_file,input_json):
         with open("IMinput.json","w") as f:
             mySurrogateJson = sur["intensityMeasureInfo"]
             json.dump(mySurrogateJson,f)
-        
+
         computeIM = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
                                  'createEVENT', 'groundMotionIM', 'IntensityMeasureComputer.py')
 
-        
+
         pythonEXE = sys.executable
         # compute IMs
 
@@ -407,7 +485,7 @@ def main(params_dir,surrogate_dir,json_dir,result_file,input_json):
                     error_exit(msg)
     # todo: fix for different nys m
 
- 
+
         if len(id_vec+id_vec2) != nrv_sur:
             missing_ids = set([i for i in range(len(rv_name_sur))]) - set(id_vec + id_vec2)
             s = [str(rv_name_sur[id]) for id in missing_ids]
@@ -452,153 +530,97 @@ def main(params_dir,surrogate_dir,json_dir,result_file,input_json):
     for i in range(nrv):
         rv_val[:,id_vec[i]] = rv_tmp[:,i]
 
+    return {'inp_tmp': inp_tmp,
+            'folderName': folderName,
+            'norm_var_thr': inp_fem.get("varThres",0.02),
+            'when_inaccurate': inp_fem.get("femOption","continue"),
+            'prediction_option': inp_fem.get("predictionOption", "random"),
+            'seed': int(myseed)+int(sampNum),
+            'nsamp': nsamp,
+            'nrv': nrv,
+            'rv_val': rv_val,
+            'g_idx': g_idx,
+            'rv_name_dummy': rv_name_dummy,
+            'rv_val_dummy': rv_val_dummy,
+            'first_dummy_found': first_dummy_found}
 
-    if kernel == 'Radial Basis':
-        kr = GPy.kern.RBF(input_dim=nrv_sur, ARD=True)
-    elif kernel == 'Exponential':
-        kr = GPy.kern.Exponential(input_dim=nrv_sur, ARD=True)
-    elif kernel == 'Matern 3/2':
-        kr = GPy.kern.Matern32(input_dim=nrv_sur, ARD=True)
-    elif kernel == 'Matern 5/2':
-        kr = GPy.kern.Matern52(input_dim=nrv_sur, ARD=True)
-
-    if sur['doLinear']:
-        kr = kr + GPy.kern.Linear(input_dim=nrv_sur, ARD=True)
-
-    if did_logtransform:
-        Y = np.log(Y)
-
-    kg = kr
-    m_list = list()
-    nugget_var_list = [0] * ng_sur
-
-    if not did_mf:
-
-        for ny in range(ng_sur):
 
-            if did_stochastic[ny]:
-
-                m_list = m_list + [GPy.models.GPRegression(X, Y[:, ny][np.newaxis].transpose(), kernel=kg.copy(),
-                                                           normalizer=did_normalization)]
-                X_unique, Y_mean, norm_var_str, counts, nugget_var_pred, Y_normFact = get_stochastic_variance(X,
-                                                                                                              Y[:, ny][
-                                                                                                                  np.newaxis].T,
-                                                                                                              rv_val,
-                                                                                                              ny)
-                Y_metadata = {'variance_structure': norm_var_str / counts}
-                m_list[ny].set_XY2(X_unique, Y_mean, Y_metadata=Y_metadata)
-                for key, val in sur["modelInfo"][g_name_sur[ny]].items():
-                    exec('m_list[ny].' + key + '= np.array(val)')
+def predict_surrogate(model, rv_val):
 
-                nugget_var_list[ny] = m_list[ny].Gaussian_noise.parameters * nugget_var_pred * Y_normFact
-
-            else:
-                m_list = m_list + [
-                    GPy.models.GPRegression(X, Y[:, ny][np.newaxis].transpose(), kernel=kg.copy(), normalizer=True)]
-                for key, val in sur["modelInfo"][g_name_sur[ny]].items():
-                    exec('m_list[ny].' + key + '= np.array(val)')
-
-                Y_normFact = np.var(Y[:, ny])
-                nugget_var_list[ny] = np.squeeze(np.array(m_list[ny].Gaussian_noise.parameters) * np.array(Y_normFact))
-
-    else:
-        with open(surrogate_dir, "rb") as file:
-            m_list = pickle.load(file)
-
-        for ny in range(ng_sur):
-            Y_normFact = np.var(Y[:, ny])
-            nugget_var_list[ny] = m_list[ny].gpy_model["mixed_noise.Gaussian_noise.variance"] * Y_normFact
-
-    # if did_stochastic:
-    #
-    #     kg = kr
-    #     m_list = list()
-    #     nugget_var_list = [0]*ng_sur
-    #     for ny in range(ng_sur):
-    #
-    #         m_list = m_list + [GPy.models.GPRegression(X, Y[:, ny][np.newaxis].transpose(), kernel=kg.copy(),normalizer=did_normalization)]
-    #         X_unique, Y_mean, norm_var_str, counts, nugget_var_pred, Y_normFact = get_stochastic_variance(X, Y[:,ny][np.newaxis].T, rv_val,ny)
-    #         Y_metadata = {'variance_structure': norm_var_str / counts}
-    #         m_list[ny].set_XY2(X_unique, Y_mean, Y_metadata=Y_metadata)
-    #         for key, val in sur["modelInfo"][g_name_sur[ny]].items():
-    #             exec('m_list[ny].' + key + '= np.array(val)')
-    #
-    #         nugget_var_list[ny] = m_list[ny].Gaussian_noise.parameters * nugget_var_pred * Y_normFact
     #
+    # GP prediction (noiseless) and nugget variance at all samples at once
     #
-    # elif not did_mf:
-    #     kg = kr
-    #     m_list = list()
-    #     for ny in range(ng_sur):
-    #         m_list = m_list + [GPy.models.GPRegression(X, Y[:, ny][np.newaxis].transpose(), kernel=kg.copy(),normalizer=True)]
-    #         for key, val in sur["modelInfo"][g_name_sur[ny]].items():
-    #             exec('m_list[ny].' + key + '= np.array(val)')
-    #
-    #         Y_normFact = np.var(Y[:, ny])
-    #         nugget_var_list[ny] = m_list[ny].Gaussian_noise.parameters * Y_normFact
-    #
-    # else:
-    #     with open(surrogate_dir, "rb") as file:
-    #         m_list=pickle.load(file)
-    #
-    #     for ny in range(ng_sur):
-    #         Y_normFact = np.var(Y[:, ny])
-    #         nugget_var_list[ny] = m_list[ny].gpy_model["mixed_noise.Gaussian_noise.variance"]* Y_normFact
-
 
-    # to read:::
-    # kern_name='Mat52'
-    #did_logtransform=True
+    m_list = model['m_list']
+    constIdx = model['constIdx']
+    constVal = model['constVal']
+    nsamp = rv_val.shape[0]
 
-    # at ui
+    # read param in file and sort input
+    y_dim = len(m_list)
 
+    y_pred_median_tmp=np.zeros([nsamp, y_dim]) # might be log space
+    y_pred_var_tmp=np.zeros([nsamp, y_dim]) # might be log space
+    y_pred_var_m_tmp=np.zeros([nsamp, y_dim]) # might be log space
+    y_data_var=np.zeros([nsamp, y_dim])
 
-    # f = open(work_dir + '/templatedir/dakota.json')
-    # inp = json.load(f)
-    # f.close()
+    for ny in range(y_dim):
+        y_data_var[:,ny] = np.var(m_list[ny].Y)
+        if ny in constIdx:
+            y_pred_median_tmp[:, ny] = np.ones([nsamp])*constVal[constIdx.index(ny)]
+            y_pred_var_tmp_tmp = np.zeros([nsamp])
+        else:
+            y_pred_median_tmp_tmp, y_pred_var_tmp_tmp = predict(m_list[ny], rv_val, model['did_mf']) ## noiseless
+            y_pred_median_tmp[:, ny] = np.squeeze(y_pred_median_tmp_tmp)
+            y_pred_var_tmp_tmp = np.squeeze(y_pred_var_tmp_tmp)
+        if model['nugget_var_model_list'][ny] is not None:
+            m_var, nugget_fact = model['nugget_var_model_list'][ny]
+            log_var_pred_x, dum = m_var.predict(rv_val)
+            nugget_var = nugget_fact * np.exp(log_var_pred_x.T[0])
+        else:
+            nugget_var = model['nugget_var_list'][ny]
+        y_pred_var_tmp[:, ny] = y_pred_var_tmp_tmp
+        y_pred_var_m_tmp[:, ny] = y_pred_var_tmp_tmp + np.squeeze(nugget_var)
 
+    return y_pred_median_tmp, y_pred_var_tmp, y_pred_var_m_tmp, y_data_var
 
-    # try:
-    #     f = open(surrogate_dir, 'rb')
-    # except OSError:
-    #     msg = 'Could not open/read surrogate model from: ' + surrogate_dir + '\n'
-    #     print(msg)
-    #     error_file.write(msg)
-    #     error_file.close()
-    #     file_object.write(msg0+msg)
-    #     file_object.close()
-    #     exit(-1)
-    # with f:
-    #     m_list = pickle.load(f)
 
+def write_outputs(model, inputs, prediction, result_file, error_exit, error_warning):
 
+    os_type=sys.platform.lower()
+    run_type ='runninglocal'
 
-    # read param in file and sort input
-    y_dim = len(m_list)
+    isEEUQ = model['isEEUQ']
+    did_logtransform = model['did_logtransform']
+    rv_name_sur = model['rv_name_sur']
+    g_name_sur = model['g_name_sur']
+    inp_tmp = inputs['inp_tmp']
+    norm_var_thr = inputs['norm_var_thr']
+    when_inaccurate = inputs['when_inaccurate']
+    prediction_option = inputs['prediction_option']
+    nsamp = inputs['nsamp']
+    nrv = inputs['nrv']
+    rv_val = inputs['rv_val']
+    g_idx = inputs['g_idx']
+
+    folderName = inputs['folderName']
+    sampNum = os.path.basename(os.getcwd()).split(".")[-1]
+    np.random.seed(inputs['seed'])
+
+    y_pred_median_tmp_all, y_pred_var_tmp, y_pred_var_m_tmp, y_data_var = prediction
+    y_dim = y_pred_median_tmp_all.shape[1]
 
     y_pred_median = np.zeros([nsamp, y_dim])
-    y_pred_var_tmp=np.zeros([nsamp, y_dim]) # might be log space
-    y_pred_var_m_tmp=np.zeros([nsamp, y_dim]) # might be log space
-
     y_pred_var=np.zeros([nsamp, y_dim])
     y_pred_var_m=np.zeros([nsamp, y_dim])
 
-    y_data_var=np.zeros([nsamp, y_dim])
     y_samp = np.zeros([nsamp, y_dim])
     y_q1 = np.zeros([nsamp, y_dim])
     y_q3 = np.zeros([nsamp, y_dim])
     y_q1m = np.zeros([nsamp, y_dim])
     y_q3m = np.zeros([nsamp, y_dim])
     for ny in range(y_dim):
-        y_data_var[:,ny] = np.var(m_list[ny].Y)
-        if ny in constIdx:
-            y_pred_median_tmp, y_pred_var_tmp[ny], y_pred_var_m_tmp[ny] = np.ones([nsamp])*constVal[constIdx.index(ny)], np.zeros([nsamp]), np.zeros([nsamp])
-        else:
-            y_pred_median_tmp, y_pred_var_tmp_tmp = predict(m_list[ny], rv_val, did_mf) ## noiseless
-            y_pred_median_tmp = np.squeeze(y_pred_median_tmp)
-            y_pred_var_tmp_tmp = np.squeeze(y_pred_var_tmp_tmp)
-        y_pred_var_tmp[:, ny] = y_pred_var_tmp_tmp
-        y_pred_var_m_tmp[:, ny] = y_pred_var_tmp_tmp + np.squeeze(nugget_var_list[ny])
+        y_pred_median_tmp = y_pred_median_tmp_all[:, ny]
         y_samp_tmp = np.random.normal(y_pred_median_tmp, np.sqrt(y_pred_var_m_tmp[:, ny]))
 
         if did_logtransform:
@@ -628,7 +650,7 @@ def main(params_dir,surrogate_dir,json_dir,result_file,input_json):
         if np.isnan(y_pred_var[:,ny]).any():
             y_pred_var[:,ny] = np.nan_to_num(y_pred_var[:,ny])
         if np.isnan(y_pred_var_m[:,ny]).any():
-            y_pred_m_var[:,ny] = np.nan_to_num(y_pred_m_var[:,ny])
+            y_pred_var_m[:,ny] = np.nan_to_num(y_pred_var_m[:,ny])
 
 
 
@@ -778,7 +800,7 @@ def main(params_dir,surrogate_dir,json_dir,result_file,input_json):
                 msg2 = msg0+msg1[ns]+'- RUN original model\n'
                 error_warning(msg2)
                 #exit(-1)
-                
+
             elif when_inaccurate == 'giveError':
                 msg2 = msg0+msg1[ns]+'- EXIT\n'
                 error_exit(msg2)
@@ -818,10 +840,10 @@ def main(params_dir,surrogate_dir,json_dir,result_file,input_json):
     #
     # Add dummy RVs
     #
-    if first_dummy_found:
-        rv_name_sur = rv_name_sur + rv_name_dummy
-        rv_val = np.hstack([rv_val, rv_val_dummy ])
-    
+    if inputs['first_dummy_found']:
+        rv_name_sur = rv_name_sur + inputs['rv_name_dummy']
+        rv_val = np.hstack([rv_val, inputs['rv_val_dummy'] ])
+
     g_name_subset = [g_name_sur[i] for i in g_idx]
 
 
@@ -857,8 +879,167 @@ def main(params_dir,surrogate_dir,json_dir,result_file,input_json):
 
             tab_file.write(str(int(sampNum)+ns)+" NO_ID "+ rv_list + " "+ ypred_list + " " + ymedian_list+ " "+ yQ1_list + " "+ yQ3_list +" "+ ypredvar_list + " "+ yQ1m_list + " "+ yQ3m_list +" "+ ypredvarm_list + " \n")
 
-    error_file.close()
-    file_object.close()
+
+def run_batch(requests, surrogate_dir, json_dir):
+
+    #
+    # predict for a batch of workdirs sharing the surrogate: the inputs of all
+    # workdirs are stacked into one prediction and the results are written
+    # back to each workdir. requests: list of dicts with cwd, params_dir,
+    # result_file and input_json. Returns the status (0: success) per request
+    #
+
+    global error_file
+    cwd0 = os.getcwd()
+    status = [-1] * len(requests)
+    contexts = []
+    for ir, req in enumerate(requests):
+        os.chdir(req['cwd'])
+
+        #
+        # create a log file
+        #
+
+        msg0 = os.path.basename(os.getcwd()) + " : "
+        error_file = open('../surrogate.err', "w")
+        file_object = open('surrogateLog.log', 'a')
+
+        def error_exit(msg, error_file=error_file, file_object=file_object, msg0=msg0):
+            error_file.write(msg) # local
+            error_file.close()
+            file_object.write(msg0 + msg) # global file
+            file_object.close()
+            print(msg)
+            exit(-1)
+
+        def error_warning(msg, file_object=file_object):
+            #error_file.write(msg)
+            file_object.write(msg)
+            #print(msg)
+
+        ctx = {'request': req, 'error_file': error_file, 'file_object': file_object,
+               'error_exit': error_exit, 'error_warning': error_warning, 'index': ir}
+        try:
+            json_dir_i = os.path.join(req['cwd'], json_dir)
+            surrogate_dir_i = os.path.join(req['cwd'], surrogate_dir)
+            ctx['model'] = get_surrogate(json_dir_i, surrogate_dir_i, error_exit)
+            ctx['inputs'] = read_inputs(ctx['model'], req['params_dir'], req['input_json'], error_exit)
+            if ctx['inputs'] is not None:
+                contexts.append(ctx)
+            else:
+                status[ir] = 0
+        except SystemExit:
+            pass
+        finally:
+            os.chdir(cwd0)
+
+    # one prediction call per surrogate over the stacked inputs
+    for model_id in set([id(ctx['model']) for ctx in contexts]):
+        cur_contexts = [ctx for ctx in contexts if id(ctx['model']) == model_id]
+        model = cur_contexts[0]['model']
+        rv_val = np.vstack([ctx['inputs']['rv_val'] for ctx in cur_contexts])
+        prediction = predict_surrogate(model, rv_val)
+        i0 = 0
+        for ctx in cur_contexts:
+            nsamp = ctx['inputs']['nsamp']
+            os.chdir(ctx['request']['cwd'])
+            try:
+                write_outputs(model, ctx['inputs'], [x[i0:i0+nsamp] for x in prediction],
+                              ctx['request']['result_file'], ctx['error_exit'], ctx['error_warning'])
+                status[ctx['index']] = 0
+            except SystemExit:
+                pass
+            finally:
+                os.chdir(cwd0)
+            i0 = i0 + nsamp
+
+    for ctx in contexts:
+        ctx['error_file'].close()
+        ctx['file_object'].close()
+
+    return status
+
+
+def serve(address, key_file, idle_timeout=300.0):
+
+    #
+    # prediction server: the surrogates are loaded once and the requests
+    # received together are predicted in one batch. The server exits after
+    # idle_timeout seconds without requests
+    #
+
+    import threading, queue, secrets
+    from multiprocessing.connection import Listener
+
+    os.umask(0o077)
+    authkey = secrets.token_bytes(32)
+    if not sys.platform.lower().startswith('win'):
+        # only one server per address; the lock is released when the server exits
+        import fcntl
+        lock_file = open(address + '.lock', 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return # another server is running
+        # remove the socket left by a server that did not exit cleanly
+        if os.path.exists(address):
+            os.remove(address)
+    try:
+        listener = Listener(address, authkey=authkey)
+    except OSError:
+        # another server is running
+        return
+    with open(key_file, 'wb') as f:
+        f.write(authkey)
+
+    pending = queue.Queue()
+    closing = threading.Event()
+
+    def accept():
+        while not closing.is_set():
+            try:
+                conn = listener.accept()
+                # drop the connections that do not send a request
+                if conn.poll(10.0):
+                    pending.put((conn, conn.recv()))
+                else:
+                    conn.close()
+            except Exception:
+                continue
+
+    threading.Thread(target=accept, daemon=True).start()
+    while True:
+        try:
+            batch = [pending.get(timeout=idle_timeout)]
+        except queue.Empty:
+            break
+        # collect the requests sent at about the same time
+        time.sleep(0.05)
+        while not pending.empty():
+            batch.append(pending.get())
+        groups = dict()
+        for conn, req in batch:
+            groups.setdefault((req['surrogate_dir'], req['json_dir']), []).append((conn, req))
+        for (surrogate_dir, json_dir), cur_batch in groups.items():
+            try:
+                status = run_batch([req for conn, req in cur_batch], surrogate_dir, json_dir)
+            except Exception as ex:
+                print('Error in surrogate prediction server: ' + str(ex))
+                status = [-1] * len(cur_batch)
+            for (conn, req), cur_status in zip(cur_batch, status):
+                try:
+                    conn.send(cur_status)
+                    conn.close()
+                except Exception:
+                    pass
+
+    closing.set()
+    try:
+        os.remove(key_file)
+    except OSError:
+        pass
+    listener.close()
+
 
 def predict(m, X, did_mf):
 
@@ -873,13 +1054,29 @@ def predict(m, X, did_mf):
 
 
 if __name__ == "__main__":
-    error_file = open('../surrogate.err', "w")
     inputArgs = sys.argv
 
+    if len(inputArgs) > 1 and inputArgs[1] == '--serve':
+        # prediction server mode: gpPredict.py --serve address key_file
+        sys.exit(serve(inputArgs[2], inputArgs[3]))
+
+    if len(inputArgs) > 1 and inputArgs[1] == '--batch':
+        # batch mode: gpPredict.py --batch workdirs.txt params.in sur.json input.json [sur.pkl]
+        with open(inputArgs[2], 'r') as f:
+            workdirs = [x.strip() for x in f.readlines() if x.strip()]
+        surrogate_dir = inputArgs[6] if len(inputArgs) > 6 else "dummy"
+        status = run_batch([{'cwd': os.path.abspath(x), 'params_dir': inputArgs[3], 'result_file': "results.out",
+                             'input_json': inputArgs[5]} for x in workdirs], surrogate_dir, inputArgs[4])
+        sys.exit(0 if all([x == 0 for x in status]) else -1)
+
+    error_file = open('../surrogate.err', "w")
+
     if not inputArgs[2].endswith('.json'):
         msg = 'ERROR: surrogate information file (.json) not set'
         error_file.write(msg); exit(-1)
 
+    error_file.close()
+
     # elif not inputArgs[3].endswith('.pkl'):
     #     msg = 'ERROR: surrogate model file (.pkl) not set'
     #     print(msg); error_file.write(msg); exit(-1)
@@ -893,25 +1090,6 @@ if __name__ == "__main__":
     surrogate_dir = 'C:/Users/yisan/Desktop/quoFEMexamples/surrogates/SimGpModel_2_better.pkl'
     result_file = 'results_GP.out'
     '''
-    '''
-    try:
-        opts, args = getopt.getopt(argv)
-    except getopt.GetoptError:
-        print
-        'surrogate_pred.py -i <dir_params.in> -o <dir_SimGpModel.pkl>'
-        sys.exit(2)
-    for opt, arg in opts:
-        if opt == '-h':
-            print
-            'surrogate_pred.py -i <dir_params.in> -o <dir_SimGpModel.pkl>'
-            sys.exit()
-        elif opt in ("-i", "--ifile"):
-            inputfile = arg
-        elif opt in ("-o", "--ofile"):
-            outputfile = arg
-   '''
-
-
 
     params_dir = inputArgs[1]
     surrogate_meta_dir = inputArgs[2]
@@ -926,4 +1104,3 @@ if __name__ == "__main__":
     result_file = "results.out"
 
     sys.exit(main(params_dir,surrogate_dir,surrogate_meta_dir,result_file, input_json))
-
@@ -63,6 +63,12 @@ OPENSHA_IM_GMPE = {"SA": ["Abrahamson, Silva & Kamai (2014)", "Boore, Stewart, S
 				   "PGV": ["Abrahamson, Silva & Kamai (2014)", "Boore, Stewart, Seyhan & Atkinson (2014)", 
 				           "Campbell & Bozorgnia (2014)", "Chiou & Youngs (2014)"]}
 
+# local GMPEs with a batched (all sites x all periods) implementation
+BATCH_IM_GMPE = {"Chiou & Youngs (2014)": ("CY", "chiou_youngs_2013"),
+                 "Abrahamson, Silva & Kamai (2014)": ("ASK", "abrahamson_silva_kamai_2014"),
+                 "Boore, Stewart, Seyhan & Atkinson (2014)": ("BSSA", "boore_etal_2014"),
+                 "Campbell & Bozorgnia (2014)": ("CB", "campbell_bozorgnia_2014")}
+
 IM_GMPE = {"LOCAL": LOCAL_IM_GMPE,
            "OPENSHA": OPENSHA_IM_GMPE}
 
@@ -82,7 +88,6 @@ import collections
 if 'stampede2' not in socket.gethostname():
 	from FetchOpenSHA import *
 	from FetchOpenQuake import get_site_rup_info_oq
-import threading
 import ujson
 
 class IM_Calculator:
@@ -139,6 +144,8 @@ class IM_Calculator:
 				# self.timeGetRuptureInfo += time.process_time_ns() - start
 		self.site_rup_dict = site_rup_dict
 		self.site_info = station_info
+		# stacked site arrays for the batched GMPEs (built on demand)
+		self.site_arrays = None
 
 	def set_im_gmpe(self, im_dict, gmpe_dict, gmpe_weights_dict):
 		# set im and gmpe information
@@ -246,6 +253,20 @@ class IM_Calculator:
 		# return
 		return res
 
+	def get_site_arrays(self):
+		if getattr(self, 'site_arrays', None) is None:
+			self.site_arrays = openSHAGMPE.get_site_arrays(self.site_info)
+		return self.site_arrays
+
+	def get_batch_gmpe(self, gmpe_name):
+		# NGA-West2 GMPEs evaluating all sites and periods in one call
+		if gmpe_name not in BATCH_IM_GMPE:
+			return None
+		gmpe_attr, gmpe_class = BATCH_IM_GMPE[gmpe_name]
+		if getattr(self, gmpe_attr) is None:
+			setattr(self, gmpe_attr, getattr(openSHAGMPE, gmpe_class)())
+		return getattr(self, gmpe_attr)
+
 	def get_im_from_local(self, source_info, gmpe_list, im_type, im_info, gmpe_weights=None):
 		# initiate
 		res_list = []
@@ -298,55 +319,48 @@ class IM_Calculator:
 			if cur_gmpe not in avail_gmpe:
 				print('ComputeIntensityMeasure.get_im_from_local: warning - {} is not available.'.format(cur_gmpe))
 				continue
-			for cur_site in self.site_info:
-				# current site-rupture distance
-				cur_dist = cur_site["rRup"]
-				cur_vs30 = cur_site['vs30']
-				tmpResult = {'Mean': [],
-				             'TotalStdDev': [],
-							 'InterEvStdDev': [],
-							 'IntraEvStdDev': []}
-				if cur_gmpe == 'Bommer, Stafford & Alarcon (2009)':
-					mean, stdDev, interEvStdDev, intraEvStdDev = SignificantDurationModel.bommer_stafford_alarcon_ds_2009(magnitude=eq_magnitude, 
-						distance=cur_dist, vs30=cur_vs30,duration_type=im_type)
-					tmpResult['Mean'].append(float(mean))
-					tmpResult['TotalStdDev'].append(float(stdDev))
-					tmpResult['InterEvStdDev'].append(float(interEvStdDev))
-					tmpResult['IntraEvStdDev'].append(float(intraEvStdDev))
-				elif cur_gmpe == 'Afshari & Stewart (2016)':
-					mean, stdDev, interEvStdDev, intraEvStdDev = SignificantDurationModel.afshari_stewart_ds_2016(magnitude=eq_magnitude, 
-						distance=cur_dist, vs30=cur_vs30, duration_type=im_type)
-					tmpResult['Mean'].append(float(mean))
-					tmpResult['TotalStdDev'].append(float(stdDev))
-					tmpResult['InterEvStdDev'].append(float(interEvStdDev))
-					tmpResult['IntraEvStdDev'].append(float(intraEvStdDev))
-				elif cur_gmpe == 'Chiou & Youngs (2014)':
-					# start = time.process_time_ns()
-					tmpResult = self.CY.get_IM(eq_magnitude, self.site_rup_dict, cur_site, im_info)
-					# self.timeGetIM += time.process_time_ns() - start
-				elif cur_gmpe == 'Abrahamson, Silva & Kamai (2014)':
-					# start = time.process_time_ns()
-					tmpResult = self.ASK.get_IM(eq_magnitude, self.site_rup_dict, cur_site, im_info)
-					# self.timeGetIM += time.process_time_ns() - start
-				elif cur_gmpe == 'Boore, Stewart, Seyhan & Atkinson (2014)':
-					# start = time.process_time_ns()
-					tmpResult = self.BSSA.get_IM(eq_magnitude, self.site_rup_dict, cur_site, im_info)
-					# self.timeGetIM += time.process_time_ns() - start
-				elif cur_gmpe == 'Campbell & Bozorgnia (2014)':
-					# start = time.process_time_ns()
-					tmpResult = self.CB.get_IM(eq_magnitude, self.site_rup_dict, cur_site, im_info)
-					# self.timeGetIM += time.process_time_ns() - start
-				else:
-					print('ComputeIntensityMeasure.get_im_from_local: gmpe_name {} is not supported.'.format(cur_gmpe))
-				# collect sites
-				# gm_collector.append({
-				# 	"Location": {'Latitude':cur_site['lat'], 'Longitude':cur_site['lon']},
-				#              "SiteData": {key: cur_site[key] for key in cur_site if key not in ['lat','lon']},
-				# 			 'ln'+im_type: tmpResult
-				# 			 })
-				gm_collector.append({
-							 'ln'+im_type: tmpResult
-							 })
+			batch_gmpe = self.get_batch_gmpe(cur_gmpe)
+			if batch_gmpe is not None:
+				# start = time.process_time_ns()
+				batchResult = batch_gmpe.get_IM_batch(eq_magnitude, self.site_rup_dict, self.get_site_arrays(), im_info)
+				# self.timeGetIM += time.process_time_ns() - start
+				batchResult = {key: value.tolist() for key, value in batchResult.items()}
+				gm_collector = [{'ln'+im_type: {key: value[j] for key, value in batchResult.items()}}
+								for j in range(len(self.site_info))]
+			else:
+				for cur_site in self.site_info:
+					# current site-rupture distance
+					cur_dist = cur_site["rRup"]
+					cur_vs30 = cur_site['vs30']
+					tmpResult = {'Mean': [],
+					             'TotalStdDev': [],
+								 'InterEvStdDev': [],
+								 'IntraEvStdDev': []}
+					if cur_gmpe == 'Bommer, Stafford & Alarcon (2009)':
+						mean, stdDev, interEvStdDev, intraEvStdDev = SignificantDurationModel.bommer_stafford_alarcon_ds_2009(magnitude=eq_magnitude, 
+							distance=cur_dist, vs30=cur_vs30,duration_type=im_type)
+						tmpResult['Mean'].append(float(mean))
+						tmpResult['TotalStdDev'].append(float(stdDev))
+						tmpResult['InterEvStdDev'].append(float(interEvStdDev))
+						tmpResult['IntraEvStdDev'].append(float(intraEvStdDev))
+					elif cur_gmpe == 'Afshari & Stewart (2016)':
+						mean, stdDev, interEvStdDev, intraEvStdDev = SignificantDurationModel.afshari_stewart_ds_2016(magnitude=eq_magnitude, 
+							distance=cur_dist, vs30=cur_vs30, duration_type=im_type)
+						tmpResult['Mean'].append(float(mean))
+						tmpResult['TotalStdDev'].append(float(stdDev))
+						tmpResult['InterEvStdDev'].append(float(interEvStdDev))
+						tmpResult['IntraEvStdDev'].append(float(intraEvStdDev))
+					else:
+						print('ComputeIntensityMeasure.get_im_from_local: gmpe_name {} is not supported.'.format(cur_gmpe))
+					# collect sites
+					# gm_collector.append({
+					# 	"Location": {'Latitude':cur_site['lat'], 'Longitude':cur_site['lon']},
+					#              "SiteData": {key: cur_site[key] for key in cur_site if key not in ['lat','lon']},
+					# 			 'ln'+im_type: tmpResult
+					# 			 })
+					gm_collector.append({
+								 'ln'+im_type: tmpResult
+								 })
 
 			# Final results
 			cur_res = {'Magnitude': eq_magnitude,
@@ -512,7 +526,7 @@ def get_gmpe_from_im_legency(im_info, gmpe_info, gmpe_weights=None):
 	return gmpe_dict, gmpe_weights_dict
 
 
-def compute_im(scenarios, stations, EqRupture_info, gmpe_info, im_info, generator_info, output_dir, filename='IntensityMeasureMeanStd.hdf5', mth_flag=True):
+def compute_im(scenarios, stations, EqRupture_info, gmpe_info, im_info, generator_info, output_dir, filename='IntensityMeasureMeanStd.hdf5', mth_flag=True, num_workers=None, hdf5_compression=None):
 
 	# Calling OpenSHA to compute median PSA
 	if len(scenarios) < 10:
@@ -574,85 +588,52 @@ def compute_im(scenarios, stations, EqRupture_info, gmpe_info, im_info, generato
 	
 	t_start = time.time()
 	# Loop over scenarios
+	scenario_keys = [int(x) for x in scenarios.keys()]
+	if mth_flag:
+		if num_workers is None:
+			num_workers = os.cpu_count()
+		num_workers = max(1, min(int(num_workers), len(scenario_keys)))
+		if num_workers == 1:
+			mth_flag = False
 	if mth_flag is False:
 		# create a IM calculator
-		im_calculator = IM_Calculator(im_dict=im_dict, gmpe_dict=gmpe_dict, 
-									gmpe_weights_dict=gmpe_weights_dict, site_info=stations)
-		if EqRupture_info['EqRupture']['Type'] in ['ERF']:
-			im_calculator.erf = getERF(EqRupture_info)
-		else:
-			im_calculator.erf = None
-		gmpe_set = set()
-		for _, item in gmpe_dict.items():
-			gmpe_set = gmpe_set.union(set(item))
-		for gmpe in gmpe_set:
-			if gmpe == "Chiou & Youngs (2014)":
-				im_calculator.CY = openSHAGMPE.chiou_youngs_2013()
-			if gmpe == 'Abrahamson, Silva & Kamai (2014)':
-				im_calculator.ASK = openSHAGMPE.abrahamson_silva_kamai_2014()
-			if gmpe == 'Boore, Stewart, Seyhan & Atkinson (2014)':
-				im_calculator.BSSA = openSHAGMPE.boore_etal_2014()
-			if gmpe == 'Campbell & Bozorgnia (2014)':
-				im_calculator.CB = openSHAGMPE.campbell_bozorgnia_2014()
-		# for i in tqdm(range(len(scenarios.keys())), desc=f"Evaluate GMPEs for {len(scenarios.keys())} scenarios"):
-		# Initialize an hdf5 file for IMmeanStd
-		if os.path.exists(filename):
-			os.remove(filename)
-		for i in tqdm(range(len(scenarios.keys())), desc=f"Evaluate GMPEs for {len(scenarios.keys())} scenarios"):
-		# for i, key in enumerate(scenarios.keys()):
-			# print('ComputeIntensityMeasure: Scenario #{}/{}'.format(i+1,len(scenarios)))
-			# Rupture
-			key = int(list(scenarios.keys())[i])
-			source_info = scenarios[key]
-			im_calculator.set_source(source_info)
-			# Computing IM
-			res_list = dict()
-			for cur_im_type in list(im_dict.keys()):
-				im_calculator.set_im_type(cur_im_type)
-				res_list.update({cur_im_type:im_calculator.calculate_im()})
+		im_calculator = get_im_calculator(im_dict, gmpe_dict, gmpe_weights_dict,
+										  stations, EqRupture_info)
+		scenario_res = (compute_im_scenario(im_calculator, scenarios[key], im_dict,
+											im_list, saveInJson) for key in scenario_keys)
+		im_pool = None
+	else:
+		# bounded process pool, each worker keeps its own IM calculator (and 
+		# GMPE objects) for all the scenarios it evaluates
+		from ComputeIntensityMeasureWorker import get_im_worker_pool, compute_im_worker
+		im_pool = get_im_worker_pool(num_workers, im_dict, gmpe_dict, gmpe_weights_dict,
+									 stations, EqRupture_info, im_list, saveInJson)
+		chunk_size = max(1, min(16, len(scenario_keys) // (4 * num_workers)))
+		print('ComputeIntensityMeasure: evaluating GMPEs with {} workers.'.format(num_workers))
+		# imap returns the results in the order of scenario_keys
+		scenario_res = im_pool.imap(compute_im_worker, 
+									[scenarios[key] for key in scenario_keys], chunk_size)
+	# Initialize an hdf5 file for IMmeanStd
+	if os.path.exists(filename):
+		os.remove(filename)
+	im_writer = None
+	try:
+		for i, collectedResult in enumerate(tqdm(scenario_res, total=len(scenario_keys),
+				desc=f"Evaluate GMPEs for {len(scenario_keys)} scenarios")):
 			# Collecting outputs
-			# collectedResult.update({'SourceIndex':source_info['SourceIndex'], 'RuptureIndex':source_info['RuptureIndex']})
 			if saveInJson:
-				collectedResult = collect_multi_im_res(res_list)
-				im_raw.update({key:collectedResult})
+				im_raw.update({scenario_keys[i]:collectedResult})
 			else:
-				collectedResult = collect_multi_im_res_hdf5(res_list, im_list)
-				with h5py.File(filename, 'a') as f:
-					# Add a group named by the scenario index and has four dataset 
-   					# mean, totalSTd, interStd,itrastd
-					grp = f.create_group(str(i))
-					grp.create_dataset("Mean", data=collectedResult['Mean'])
-					grp.create_dataset("InterEvStdDev", data=collectedResult['InterEvStdDev'])
-					grp.create_dataset("IntraEvStdDev", data=collectedResult['IntraEvStdDev'])
-			# if (i % 250 == 0):
-			# 	if saveInJson:
-			# 		print(f"Size of im_raw for {i} scenario is {sys.getsizeof(im_raw)}")
-			# 	else:
-			# 		print(f"Another 250 scenarios computed")
-			
-	if mth_flag:
-		res_dict = {}
-		sub_ths = []
-		num_bins = 200
-		bin_size = int(np.ceil(len(scenarios)/num_bins))
-		ids_list = []
-		scen_list = []
-		for k in range(0, len(scenarios), bin_size):
-			ids_list.append(list(scenarios.keys())[k:k+bin_size])
-			scen_list.append([scenarios[x] for x in list(scenarios.keys())[k:k+bin_size]])
-		#print(ids_list)
-		for i in range(len(ids_list)):
-			th = threading.Thread(target=compute_im_para, args=(ids_list[i], scen_list[i], im_dict, gmpe_dict, gmpe_weights_dict, station_info, res_dict))
-			sub_ths.append(th)
-			th.start()
-
-		for th in sub_ths:
-			th.join()
-
-		# order the res_dict by id
-		res_ordered = collections.OrderedDict(sorted(res_dict.items()))
-		for i, cur_res in res_ordered.items():
-			im_raw.append(cur_res)
+				if im_writer is None:
+					im_writer = IM_MeanStd_Writer(filename, scenario_keys, im_list,
+						collectedResult['Mean'].shape[0], compression=hdf5_compression)
+				im_writer.append(collectedResult)
+	finally:
+		if im_writer is not None:
+			im_writer.close()
+		if im_pool is not None:
+			im_pool.close()
+			im_pool.join()
 
 	print('ComputeIntensityMeasure: mean and standard deviation of intensity measures {0} sec'.format(time.time() - t_start))
 
@@ -663,29 +644,90 @@ def compute_im(scenarios, stations, EqRupture_info, gmpe_info, im_info, generato
 	return filename, im_list
 
 
-def compute_im_para(ids, scenario_infos, im_dict, gmpe_dict, gmpe_weights_dict, station_info, res_dict):
-	
-	for i, id in enumerate(ids):
-		print('ComputeIntensityMeasure: Scenario #{}.'.format(id+1))
-		scenario_info = scenario_infos[i]
-		# create a IM calculator
-		im_calculator = IM_Calculator(im_dict=im_dict, gmpe_dict=gmpe_dict, 
-									gmpe_weights_dict=gmpe_weights_dict, site_info=station_info)
-		# set scenario information
-		im_calculator.set_source(scenario_info)
-		# computing IM
-		res_list = []
-		for cur_im_type in list(im_dict.keys()):
-			im_calculator.set_im_type(cur_im_type)
-			res_list.append(im_calculator.calculate_im())
-		# clean
-		del im_calculator
-		# collect multiple ims
-		res = collect_multi_im_res(res_list)
-		# append res to res_dcit
-		res_dict[id] = res
+class IM_MeanStd_Writer:
+	# Columnar writer of IntensityMeasureMeanStd.hdf5: Mean, InterEvStdDev and
+	# IntraEvStdDev are stored as chunked (scenario x site x IM) datasets, and
+	# ScenarioIndex maps the rows to the scenario keys
+	im_datasets = ['Mean', 'InterEvStdDev', 'IntraEvStdDev']
+
+	def __init__(self, filename, scenario_keys, im_list, num_sites,
+				 compression=None, chunk_bytes=2**20):
+		num_scen = len(scenario_keys)
+		num_im = len(im_list)
+		# scenarios per chunk (and per write batch)
+		self.batch_size = int(max(1, min(num_scen, chunk_bytes // (8*num_sites*num_im))))
+		self.file = h5py.File(filename, 'w')
+		self.file.attrs['IMList'] = [str(x) for x in im_list]
+		self.file.create_dataset('ScenarioIndex', data=np.array(scenario_keys, dtype=np.int64))
+		for cur_name in self.im_datasets:
+			self.file.create_dataset(cur_name, shape=(num_scen, num_sites, num_im),
+				dtype=np.float64, chunks=(self.batch_size, num_sites, num_im),
+				compression=compression)
+		self.buffer = {x: np.zeros((self.batch_size, num_sites, num_im)) for x in self.im_datasets}
+		self.num_buffered = 0
+		self.num_written = 0
+
+	def append(self, collectedResult):
+		for cur_name in self.im_datasets:
+			self.buffer[cur_name][self.num_buffered] = collectedResult[cur_name]
+		self.num_buffered += 1
+		if self.num_buffered == self.batch_size:
+			self.flush()
+
+	def flush(self):
+		if self.num_buffered == 0:
+			return
+		i_start = self.num_written
+		i_end = i_start + self.num_buffered
+		for cur_name in self.im_datasets:
+			self.file[cur_name][i_start:i_end] = self.buffer[cur_name][:self.num_buffered]
+		self.num_written = i_end
+		self.num_buffered = 0
+
+	def close(self):
+		self.flush()
+		self.file.close()
+
+
+def get_im_calculator(im_dict, gmpe_dict, gmpe_weights_dict, stations, EqRupture_info):
+	# create a IM calculator
+	im_calculator = IM_Calculator(im_dict=im_dict, gmpe_dict=gmpe_dict, 
+								gmpe_weights_dict=gmpe_weights_dict, site_info=stations)
+	if EqRupture_info['EqRupture']['Type'] in ['ERF']:
+		im_calculator.erf = getERF(EqRupture_info)
+	else:
+		im_calculator.erf = None
+	gmpe_set = set()
+	for _, item in gmpe_dict.items():
+		gmpe_set = gmpe_set.union(set(item))
+	for gmpe in gmpe_set:
+		if gmpe == "Chiou & Youngs (2014)":
+			im_calculator.CY = openSHAGMPE.chiou_youngs_2013()
+		if gmpe == 'Abrahamson, Silva & Kamai (2014)':
+			im_calculator.ASK = openSHAGMPE.abrahamson_silva_kamai_2014()
+		if gmpe == 'Boore, Stewart, Seyhan & Atkinson (2014)':
+			im_calculator.BSSA = openSHAGMPE.boore_etal_2014()
+		if gmpe == 'Campbell & Bozorgnia (2014)':
+			im_calculator.CB = openSHAGMPE.campbell_bozorgnia_2014()
+	# return
+	return im_calculator
+
+
+def compute_im_scenario(im_calculator, source_info, im_dict, im_list, saveInJson):
+	# Rupture
+	im_calculator.set_source(source_info)
+	# Computing IM
+	res_list = dict()
+	for cur_im_type in list(im_dict.keys()):
+		im_calculator.set_im_type(cur_im_type)
+		res_list.update({cur_im_type:im_calculator.calculate_im()})
+	# Collecting outputs
+	if saveInJson:
+		collectedResult = collect_multi_im_res(res_list)
+	else:
+		collectedResult = collect_multi_im_res_hdf5(res_list, im_list)
 	# return
-	return
+	return collectedResult
 
 
 def export_im(stations, im_list, im_data, eq_data, output_dir, filename, csv_flag,\
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Leland Stanford Junior University
+# Copyright (c) 2018 The Regents of the University of California
+#
+# This file is part of the SimCenter Backend Applications
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# You should have received a copy of the BSD 3-Clause License along with
+# this file. If not, see <http://www.opensource.org/licenses/>.
+#
+# Contributors:
+# Kuanshi Zhong
+# Jinyan Zhao
+#
+# Process-pool workers for ComputeIntensityMeasure.compute_im. The module is
+# kept free of OpenSHA imports so that a spawned worker can start its own JVM
+# before ComputeIntensityMeasure (and FetchOpenSHA) gets imported.
+
+import os
+import sys
+import multiprocessing
+
+# per-process state of an initialized worker
+im_worker = dict()
+
+
+def get_worker_jvm_info(num_workers):
+	# the workers need their own JVM if the parent process started one
+	if 'jpype' not in sys.modules:
+		return None
+	import jpype
+	if not jpype.isJVMStarted():
+		return None
+	import psutil
+	memory_total = psutil.virtual_memory().total/(1024.**3)
+	# the parent JVM keeps its share
+	memory_request = max(1, int(memory_total*0.75/(num_workers+1)))
+	class_path = [os.path.abspath(x) for x in jpype.getClassPath().split(os.pathsep) if x]
+	return {'class_path': class_path, 'memory_request': memory_request}
+
+
+def start_worker_jvm(class_path, memory_request):
+	import jpype
+	from jpype import imports
+	for cur_path in class_path:
+		jpype.addClassPath(cur_path)
+	jpype.startJVM("-Xmx{}G".format(memory_request), convertStrings=False)
+
+
+def init_im_worker(jvm_info, im_dict, gmpe_dict, gmpe_weights_dict, stations,
+				   EqRupture_info, im_list, saveInJson):
+	if jvm_info is not None:
+		start_worker_jvm(**jvm_info)
+	from ComputeIntensityMeasure import get_im_calculator
+	# the calculator (ERF and GMPE objects) is created once per worker
+	im_worker.update({'Calculator': get_im_calculator(im_dict, gmpe_dict, gmpe_weights_dict,
+													  stations, EqRupture_info),
+					  'IMDict': im_dict,
+					  'IMList': im_list,
+					  'SaveInJson': saveInJson})
+
+
+def compute_im_worker(source_info):
+	from ComputeIntensityMeasure import compute_im_scenario
+	return compute_im_scenario(im_worker['Calculator'], source_info, im_worker['IMDict'],
+							   im_worker['IMList'], im_worker['SaveInJson'])
+
+
+def get_im_worker_pool(num_workers, im_dict, gmpe_dict, gmpe_weights_dict, stations,
+					   EqRupture_info, im_list, saveInJson):
+	# spawn (instead of fork) since a forked JVM is not usable
+	ctx = multiprocessing.get_context('spawn')
+	jvm_info = get_worker_jvm_info(num_workers)
+	return ctx.Pool(num_workers, initializer=init_im_worker,
+					initargs=(jvm_info, im_dict, gmpe_dict, gmpe_weights_dict, stations,
+							  EqRupture_info, im_list, saveInJson))
@@ -39,6 +39,7 @@
 #
 
 import json, copy
+from abc import ABC, abstractmethod
 import numpy as np
 import pandas as pd
 import socket
@@ -201,8 +202,10 @@ def create_stations(input_file, output_file, filterIDs, vs30Config, z1Config, z2
                                                             selected_stn.iloc[nan_loc,list(selected_stn.keys()).index(lon_label)].values.tolist())
     if len(nan_loc) and vs30_tag == 0:
         print('CreateStation: Fetch OpenSHA Vs30 map for defined stations.')
-        selected_stn.loc[nan_loc,vs30_label] = get_site_vs30_from_opensha(selected_stn.iloc[nan_loc,list(selected_stn.keys()).index(lat_label)].values.tolist(), 
-                                                                          selected_stn.iloc[nan_loc,list(selected_stn.keys()).index(lon_label)].values.tolist())
+        selected_stn.loc[nan_loc,vs30_label] = get_site_data_opensha(selected_stn.iloc[nan_loc,list(selected_stn.keys()).index(lat_label)].values.tolist(), 
+                                                                     selected_stn.iloc[nan_loc,list(selected_stn.keys()).index(lon_label)].values.tolist(),
+                                                                     'Vs30', get_site_vs30_from_opensha, 
+                                                                     vs30model=vs30Config.get('Vs30Model', 'CGS/Wills VS30 Map (2015)'))
     
     # Get zTR
     if zTR_label in selected_stn.keys():
@@ -284,6 +287,13 @@ def create_stations(input_file, output_file, filterIDs, vs30Config, z1Config, z2
                     if cur_param in ['Longitude', 'Latitude', 'Vs30', 'DepthToRock', 'z1p0', 
                                      'z2p5', 'Model', 'Su_rat', 'Den', 'h/G', 'm', 'h0', 'chi']:
                         user_param_list.pop(user_param_list.index(cur_param))
+    # Fetch z1pt0 and z2pt5 from OpenSHA for all stations at once
+    if z1Config["Type"]=="OpenSHA default model" and z1Config["z1_tag"]==2:
+        z1pt0_opensha = get_site_data_opensha(selected_stn['Latitude'].values.tolist(), selected_stn['Longitude'].values.tolist(),
+                                              'z1pt0', get_site_z1pt0_from_opensha)
+    if z25Config["Type"]=="OpenSHA default model" and z25Config["z25_tag"]==2:
+        z2pt5_opensha = get_site_data_opensha(selected_stn['Latitude'].values.tolist(), selected_stn['Longitude'].values.tolist(),
+                                              'z2pt5', get_site_z2pt5_from_opensha)
     ground_failure_input_keys = set()
     for ind in tqdm(range(selected_stn.shape[0]), desc='Stations'):
         stn = selected_stn.iloc[ind,:]
@@ -324,7 +334,7 @@ def create_stations(input_file, output_file, filterIDs, vs30Config, z1Config, z2
             if z1_tag==1:
                 tmp.update({'z1pt0': get_z1(tmp['Vs30'])})
             elif z1_tag==2:
-                z1pt0 = get_site_z1pt0_from_opensha(tmp['Latitude'], tmp['Longitude'])
+                z1pt0 = z1pt0_opensha[ind]
                 if np.isnan(z1pt0):
                     z1pt0 = get_z1(tmp.get('Vs30'))
                 tmp.update({'z1pt0': z1pt0})
@@ -341,7 +351,7 @@ def create_stations(input_file, output_file, filterIDs, vs30Config, z1Config, z2
             if z25_tag==1:
                 tmp.update({'z2pt5': get_z25(tmp['z1pt0'])})
             elif z25_tag==2:
-                z2pt5 = get_site_z2pt5_from_opensha(tmp['Latitude'], tmp['Longitude'])
+                z2pt5 = z2pt5_opensha[ind]
                 if np.isnan(z2pt5):
                     z2pt5 = get_z25(tmp['z1pt0'])
                 tmp.update({'z2pt5': z2pt5})
@@ -456,6 +466,462 @@ def create_gridded_stations(input_file, output_file, div_lon = 2, div_lat = 2,
     )
 
 
+class SitePropertyCache:
+    """
+    On-disk (SQLite) cache of site properties keyed by the property name and
+    the rounded site coordinates
+    """
+    def __init__(self, cache_file, decimals=5):
+        import sqlite3
+        import os
+        self.cache_file = cache_file
+        self.decimals = decimals
+        os.makedirs(os.path.dirname(os.path.abspath(cache_file)), exist_ok=True)
+        self.conn = sqlite3.connect(cache_file)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS site_property (name TEXT, lat REAL, lon REAL, value TEXT, '
+                          'PRIMARY KEY (name, lat, lon))')
+        self.conn.commit()
+        # in-memory copy of the loaded properties
+        self.loaded = dict()
+
+    def _load(self, name):
+        if name not in self.loaded:
+            self.loaded[name] = {(x[0], x[1]): x[2] for x in self.conn.execute(
+                'SELECT lat, lon, value FROM site_property WHERE name = ?', (name,))}
+        return self.loaded[name]
+
+    def _get_keys(self, lat, lon):
+        return np.round(np.asarray(lat, dtype=float), self.decimals), \
+            np.round(np.asarray(lon, dtype=float), self.decimals)
+
+    def get(self, name, lat, lon):
+        """
+        Input:
+            name: property name
+            lat: list of latitude
+            lon: list of longitude
+        Output:
+            values: list of cached values (None if not cached)
+            missing: indices of the sites not cached
+        """
+        lat_key, lon_key = self._get_keys(lat, lon)
+        cached = self._load(name)
+        values = [None]*len(lat_key)
+        missing = []
+        for i, cur_key in enumerate(zip(lat_key.tolist(), lon_key.tolist())):
+            cur_value = cached.get(cur_key, None)
+            if cur_value is None:
+                missing.append(i)
+            else:
+                values[i] = json.loads(cur_value)
+        # return
+        return values, missing
+
+    def put(self, name, lat, lon, values):
+        lat_key, lon_key = self._get_keys(lat, lon)
+        rows = [(name, x, y, json.dumps(z)) for x, y, z in 
+                zip(lat_key.tolist(), lon_key.tolist(), values)]
+        self.conn.executemany('INSERT OR REPLACE INTO site_property VALUES (?, ?, ?, ?)', rows)
+        self.conn.commit()
+        if name in self.loaded:
+            self.loaded[name].update({(x[1], x[2]): x[3] for x in rows})
+
+
+# on-disk cache of site properties and the loaded site data grids
+site_cache_dir = None
+site_property_cache_file = None
+site_property_cache = None
+site_grid_cache = dict()
+
+
+def get_site_cache_dir():
+    """
+    Get the directory of the on-disk site caches (site_cache_dir, by default 
+    SimCenter/regionalGroundMotion/site in the user cache directory, so the 
+    installed database/site could be read-only)
+    """
+    import os
+    cache_dir = site_cache_dir
+    if cache_dir is None:
+        if os.name == 'nt':
+            user_cache_dir = os.environ.get('LOCALAPPDATA', os.path.expanduser('~'))
+        else:
+            user_cache_dir = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+        cache_dir = os.path.join(user_cache_dir, 'SimCenter', 'regionalGroundMotion', 'site')
+    os.makedirs(cache_dir, exist_ok=True)
+    # return
+    return cache_dir
+
+
+def get_site_property_cache():
+    """
+    Get the on-disk site property cache (site_property_cache_file, by default 
+    site_property_cache.sqlite in the site cache directory)
+    """
+    import os
+    global site_property_cache
+    cache_file = site_property_cache_file
+    if cache_file is None:
+        cache_file = os.path.join(get_site_cache_dir(), 'site_property_cache.sqlite')
+    if site_property_cache is None or site_property_cache.cache_file != cache_file:
+        site_property_cache = SitePropertyCache(cache_file)
+    # return
+    return site_property_cache
+
+
+class SiteDataProvider(ABC):
+    """
+    An abstract base class of the site data providers (e.g., web services) 
+    backed by the on-disk site property cache. Sites missing in the cache are 
+    read from the local file (if any) and then fetched by a bounded pool of 
+    workers with retries, unless the provider is offline. Fetched values are 
+    stored in the cache and returned in the same way as the cached ones; 
+    providers raise in fetch_site on failures (e.g., service errors) so the 
+    sites are retried and not cached.
+    """
+    def __init__(self, name, max_workers=4, max_retries=3, retry_delay=1.0, 
+                 offline=False, local_file=None):
+        self.name = name
+        self.max_workers = max(1, int(max_workers))
+        self.max_retries = max(0, int(max_retries))
+        self.retry_delay = retry_delay
+        self.offline = offline
+        self.local_file = local_file
+        self.local_data = None
+
+    @abstractmethod
+    def fetch_site(self, lat, lon):
+        """
+        Fetch the site data at a single site (None or an empty value if the 
+        site is out of the range of the data)
+        """
+
+    def fetch_site_retry(self, lat, lon):
+        """
+        Fetch the site data with retries (exponential backoff)
+        Output:
+            success: True if the site data is fetched
+            value: fetched site data
+        """
+        import time
+        for i in range(self.max_retries+1):
+            try:
+                return True, self.fetch_site(lat, lon)
+            except Exception as e:
+                if i < self.max_retries:
+                    time.sleep(self.retry_delay*2**i)
+                else:
+                    print('CreateStation: Warning - failed to fetch {} for site {}, {}: {}'.format(self.name, lat, lon, e))
+        return False, None
+
+    def fetch_batch(self, lat, lon):
+        """
+        Fetch the site data at a batch of sites with the bounded worker pool
+        Input:
+            lat: list of latitude
+            lon: list of longitude
+        Output:
+            success: list of flags if the site data is fetched
+            values: list of fetched site data
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            res = list(executor.map(self.fetch_site_retry, lat, lon))
+        return [x[0] for x in res], [x[1] for x in res]
+
+    def load_local_file(self):
+        """
+        Load the local site data file (csv with Latitude, Longitude and a 
+        column named by the provider name, list values as json strings)
+        """
+        if self.local_data is None:
+            self.local_data = dict()
+            if self.local_file:
+                df = pd.read_csv(self.local_file, header=0)
+                if self.name in df.keys():
+                    df = df[df[self.name].notna()]
+                    lat_key, lon_key = get_site_property_cache()._get_keys(df['Latitude'].values, df['Longitude'].values)
+                    for cur_lat, cur_lon, cur_value in zip(lat_key.tolist(), lon_key.tolist(), df[self.name].tolist()):
+                        if isinstance(cur_value, str):
+                            cur_value = json.loads(cur_value)
+                        self.local_data.update({(cur_lat, cur_lon): cur_value})
+        return self.local_data
+
+    def get(self, lat, lon):
+        """
+        Get the site data
+        Input:
+            lat: list of latitude
+            lon: list of longitude
+        Output:
+            values: list of site data (None if not available)
+        """
+        cache = get_site_property_cache()
+        values, missing = cache.get(self.name, lat, lon)
+        if not len(missing):
+            return values
+        lat_miss = [lat[i] for i in missing]
+        lon_miss = [lon[i] for i in missing]
+        # local site data file
+        if self.local_file:
+            local_data = self.load_local_file()
+            lat_key, lon_key = cache._get_keys(lat_miss, lon_miss)
+            success = [x in local_data for x in zip(lat_key.tolist(), lon_key.tolist())]
+            fetched = [local_data.get(x, None) for x in zip(lat_key.tolist(), lon_key.tolist())]
+        else:
+            success = [False]*len(missing)
+            fetched = [None]*len(missing)
+        # fetching the remaining sites
+        remain = [i for i, x in enumerate(success) if not x]
+        if len(remain) and self.offline:
+            print('CreateStation: Warning - {} sites are not available for {} in the offline mode.'.format(len(remain), self.name))
+        elif len(remain):
+            cur_success, cur_fetched = self.fetch_batch([lat_miss[i] for i in remain], [lon_miss[i] for i in remain])
+            for i, x, y in zip(remain, cur_success, cur_fetched):
+                success[i] = x
+                fetched[i] = y
+        # updating the cache and returning values as read from the cache
+        done = [i for i, x in enumerate(success) if x]
+        cache.put(self.name, [lat_miss[i] for i in done], [lon_miss[i] for i in done], 
+                  [fetched[i] for i in done])
+        for i in done:
+            values[missing[i]] = json.loads(json.dumps(fetched[i]))
+        # return
+        return values
+
+
+class NCMGeologyProvider(SiteDataProvider):
+    """
+    Depth to bedrock from the USGS National Crustal Model geologic framework
+    https://earthquake.usgs.gov/nshmp/ncm
+    """
+    def __init__(self, **kwargs):
+        super().__init__('NCM_DepthToRock', **kwargs)
+
+    def fetch_site(self, lat, lon):
+        import requests
+        url_geology = 'https://earthquake.usgs.gov/ws/nshmp/ncm/ws/nshmp/ncm/geologic-framework?location={}%2C{}'.format(lat,lon)
+        r1 = requests.get(url_geology, timeout=60)
+        r1.raise_for_status()
+        cur_res = r1.json()
+        if not cur_res['response']['results'][0]['profiles']:
+            # the current site is out of the available range of NCM (Western US only, 06/2021)
+            return None
+        # get the top bedrock data
+        return abs(cur_res['response']['results'][0]['profiles'][0]['top'])
+
+
+class NCMGeophysicalProvider(SiteDataProvider):
+    """
+    Shear-wave velocity profile from the USGS National Crustal Model geophysical model
+    https://earthquake.usgs.gov/nshmp/ncm
+    """
+    def __init__(self, depth, **kwargs):
+        self.depth = [abs(x) for x in depth]
+        super().__init__('NCM_VsProfile_{}_{}_{}'.format(*self.depth), **kwargs)
+
+    def fetch_site(self, lat, lon):
+        import requests
+        depthMin, depthInc, depthMax = self.depth
+        url_geophys = 'https://earthquake.usgs.gov/ws/nshmp/ncm/ws/nshmp/ncm/geophysical?location={}%2C{}&depths={}%2C{}%2C{}'.format(lat,lon,depthMin,depthInc,depthMax)
+        r1 = requests.get(url_geophys, timeout=60)
+        if r1.status_code >= 500 or r1.status_code == 429:
+            # server errors and rate limiting are transient
+            r1.raise_for_status()
+        cur_res = r1.json()
+        if 400 <= r1.status_code < 500 and cur_res.get('status', None) == 'error':
+            # the service rejects the location as the current site is out of the 
+            # available range of NCM (Western US only, 06/2021)
+            return []
+        if r1.status_code != 200 or cur_res.get('status', None) != 'success':
+            # any other response is not a valid result (raised so it is not cached)
+            raise RuntimeError('NCM geophysical service error ({}): {}'.format(r1.status_code, cur_res.get('response', '')))
+        # get vs30 profile
+        return [abs(x) for x in cur_res['response']['results'][0]['profile']['vs']]
+
+
+class OpenSHAProvider(SiteDataProvider):
+    """
+    Site data from the OpenSHA default site data providers (fetched in a single 
+    batch as the calls go through the JVM)
+    """
+    def __init__(self, name, fetch_fun, **kwargs):
+        super().__init__('OpenSHA_'+name, **kwargs)
+        self.fetch_fun = fetch_fun
+
+    def fetch_site(self, lat, lon):
+        value = self.fetch_fun([lat], [lon])[0]
+        return None if np.isnan(value) else float(value)
+
+    def fetch_batch(self, lat, lon):
+        import time
+        for i in range(self.max_retries+1):
+            try:
+                values = [None if np.isnan(x) else float(x) for x in self.fetch_fun(lat, lon)]
+                return [True]*len(values), values
+            except Exception as e:
+                if i < self.max_retries:
+                    time.sleep(self.retry_delay*2**i)
+                else:
+                    print('CreateStation: Warning - failed to fetch {}: {}'.format(self.name, e))
+        return [False]*len(lat), [None]*len(lat)
+
+
+# configuration of the site data providers and the created providers
+site_data_provider_config = dict()
+site_data_providers = dict()
+
+
+def configure_site_data_providers(config):
+    """
+    Configure the site data providers
+    Input:
+        config: a dict with optional keys of Offline (serving from the cache and
+        the local file only), LocalFile (csv of site data), MaxWorkers, MaxRetries,
+        RetryDelay, CacheDir (directory of the site caches), and CacheFile (site 
+        property cache)
+    """
+    global site_cache_dir, site_property_cache_file
+    site_data_provider_config.clear()
+    site_data_provider_config.update({
+        'offline': config.get('Offline', False),
+        'local_file': config.get('LocalFile', None),
+        'max_workers': config.get('MaxWorkers', 4),
+        'max_retries': config.get('MaxRetries', 3),
+        'retry_delay': config.get('RetryDelay', 1.0)
+    })
+    if config.get('CacheDir', None):
+        site_cache_dir = config['CacheDir']
+    if config.get('CacheFile', None):
+        site_property_cache_file = config['CacheFile']
+    site_data_providers.clear()
+
+
+def get_site_data_provider(provider_class, *args):
+    """
+    Get the site data provider (created once per configuration)
+    """
+    key = (provider_class.__name__,)+tuple(str(x) for x in args)
+    if key not in site_data_providers:
+        site_data_providers[key] = provider_class(*args, **site_data_provider_config)
+    # return
+    return site_data_providers[key]
+
+
+def get_site_grid_source(grid_name):
+    """
+    Get the source file of a gridded site database in database/site (the 
+    pickled grid, or the tar.gz archive of it) and a stamp of its modification 
+    time and size to tell the cached data of a replaced grid
+    """
+    import os
+    site_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'database', 'site')
+    source_file = os.path.join(site_dir, grid_name+'.pkl')
+    if not os.path.exists(source_file):
+        source_file = os.path.join(site_dir, grid_name+'.tar.gz')
+    source_stat = os.stat(source_file)
+    # return
+    return source_file, '{}_{}'.format(source_stat.st_mtime_ns, source_stat.st_size)
+
+
+def save_array_atomic(file_name, data):
+    """
+    Save an array to a .npy file via a temporary file in the same directory, 
+    so concurrent readers never see a partially written file
+    """
+    import os
+    import tempfile
+    fd, tmp_file = tempfile.mkstemp(suffix='.npy.tmp', dir=os.path.dirname(file_name))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, data)
+        os.replace(tmp_file, file_name)
+    except BaseException:
+        os.remove(tmp_file)
+        raise
+
+
+def load_site_grid(grid_name, value_key, min_value=None, default_value=None):
+    """
+    Load a gridded site database (e.g., global_vs30_4km) once as memory-mapped 
+    arrays with a linear RegularGridInterpolator
+    Input:
+        grid_name: name of the database in database/site
+        value_key: key of the gridded values
+        min_value: values below min_value are replaced by default_value
+    Output:
+        interpolator of (lat, lon)
+    """
+    import os
+    import pickle
+    import tarfile
+    from scipy.interpolate import RegularGridInterpolator
+    source_file, source_stamp = get_site_grid_source(grid_name)
+    grid_tag = (grid_name, source_stamp, value_key, min_value, default_value)
+    if grid_tag in site_grid_cache:
+        return site_grid_cache[grid_tag]
+    cache_dir = get_site_cache_dir()
+    value_suffix = '' if min_value is None else '_min{}'.format(min_value)
+    npy_files = [os.path.join(cache_dir, '{}_{}_{}.npy'.format(grid_name, source_stamp, x)) for x in 
+                 ['Latitude', 'Longitude', value_key+value_suffix]]
+    if not all([os.path.exists(x) for x in npy_files]):
+        # convert the pickled grid to arrays that could be memory-mapped
+        if source_file.endswith('.pkl'):
+            with open(source_file, 'rb') as f:
+                grid_data = pickle.load(f)
+        else:
+            with tarfile.open(source_file, 'r:gz') as tar:
+                member = [x for x in tar.getmembers() if os.path.basename(x.name) == grid_name+'.pkl'][0]
+                grid_data = pickle.load(tar.extractfile(member))
+        if min_value is not None:
+            grid_data[value_key][grid_data[value_key]<min_value] = default_value
+        for cur_file, cur_key in zip(npy_files, ['Latitude', 'Longitude', value_key]):
+            save_array_atomic(cur_file, np.asarray(grid_data[cur_key]))
+        del grid_data
+    grid_lat, grid_lon, grid_values = [np.load(x, mmap_mode='r') for x in npy_files]
+    # ascending grid ticks
+    if grid_lat[0] > grid_lat[-1]:
+        grid_lat, grid_values = grid_lat[::-1], grid_values[::-1, :]
+    if grid_lon[0] > grid_lon[-1]:
+        grid_lon, grid_values = grid_lon[::-1], grid_values[:, ::-1]
+    site_grid_cache[grid_tag] = RegularGridInterpolator((np.array(grid_lat), np.array(grid_lon)), 
+        grid_values, method='linear', bounds_error=False, fill_value=None)
+    # return
+    return site_grid_cache[grid_tag]
+
+
+def sample_site_grid(grid_name, value_key, lat, lon, min_value=None, default_value=None):
+    """
+    Interpolate a gridded site database at given latitude and longitude (sites
+    in the on-disk cache are not interpolated again unless the grid is replaced)
+    Input:
+        grid_name: name of the database in database/site
+        value_key: key of the gridded values
+        lat: list of latitude
+        lon: list of longitude
+    Output:
+        values: list of interpolated values
+    """
+    cache = get_site_property_cache()
+    source_file, source_stamp = get_site_grid_source(grid_name)
+    prop_name = '{}:{}:{}'.format(grid_name, source_stamp, value_key)
+    if min_value is not None:
+        prop_name = prop_name + ':{}:{}'.format(min_value, default_value)
+    values, missing = cache.get(prop_name, lat, lon)
+    if len(missing):
+        interp_function = load_site_grid(grid_name, value_key, min_value, default_value)
+        grid_lat, grid_lon = interp_function.grid
+        # nearest extrapolation outside the grid
+        cur_lat = np.clip(np.asarray(lat, dtype=float)[missing], grid_lat[0], grid_lat[-1])
+        cur_lon = np.clip(np.asarray(lon, dtype=float)[missing], grid_lon[0], grid_lon[-1])
+        cur_values = interp_function(np.column_stack([cur_lat, cur_lon])).astype(float).tolist()
+        for i, cur_value in zip(missing, cur_values):
+            values[i] = cur_value
+        cache.put(prop_name, np.asarray(lat)[missing], np.asarray(lon)[missing], cur_values)
+    # return
+    return values
+
+
 def get_vs30_global(lat, lon):
     """
     Interpolate global Vs30 at given latitude and longitude
@@ -465,16 +931,8 @@ def get_vs30_global(lat, lon):
     Output:
         vs30: list of vs30
     """
-    import pickle
-    import os
-    from scipy import interpolate
-    # Loading global Vs30 data
-    cwd = os.path.dirname(os.path.realpath(__file__))
-    with open(cwd+'/database/site/global_vs30_4km.pkl', 'rb') as f:
-        vs30_global = pickle.load(f)
-    # Interpolation function (linear)
-    interpFunc = interpolate.interp2d(vs30_global['Longitude'], vs30_global['Latitude'], vs30_global['Vs30'])
-    vs30 = [float(interpFunc(x, y)) for x,y in zip(lon, lat)]
+    # Interpolation (linear) of global Vs30 data
+    vs30 = sample_site_grid('global_vs30_4km', 'Vs30', lat, lon)
     # return
     return vs30
 
@@ -488,19 +946,10 @@ def get_vs30_thompson(lat, lon):
     Output:
         vs30: list of vs30
     """
-    import pickle
-    import os
-    from scipy import interpolate
-    # Loading Thompson Vs30 data
-    cwd = os.path.dirname(os.path.realpath(__file__))
-    with open(cwd+'/database/site/thompson_vs30_4km.pkl', 'rb') as f:
-        vs30_thompson = pickle.load(f)
-    # Interpolation function (linear)
+    # Interpolation (linear) of Thompson Vs30 data
     # Thompson's map gives zero values for water-covered region and outside CA -> use 760 for default
     print('CreateStation: Warning - approximate 760 m/s for sites not supported by Thompson Vs30 map (water/outside CA).')
-    vs30_thompson['Vs30'][vs30_thompson['Vs30']<0.1] = 760
-    interpFunc = interpolate.interp2d(vs30_thompson['Longitude'], vs30_thompson['Latitude'], vs30_thompson['Vs30'])
-    vs30 = [float(interpFunc(x, y)) for x,y in zip(lon, lat)]
+    vs30 = sample_site_grid('thompson_vs30_4km', 'Vs30', lat, lon, min_value=0.1, default_value=760)
     
     # return
     return vs30
@@ -543,16 +992,8 @@ def get_zTR_global(lat, lon):
     Output:
         zTR: list of zTR
     """
-    import pickle
-    import os
-    from scipy import interpolate
-    # Loading depth to rock data
-    cwd = os.path.dirname(os.path.realpath(__file__))
-    with open(cwd+'/database/site/global_zTR_4km.pkl', 'rb') as f:
-        zTR_global = pickle.load(f)
-    # Interpolation function (linear)
-    interpFunc = interpolate.interp2d(zTR_global['Longitude'], zTR_global['Latitude'], zTR_global['zTR'])
-    zTR = [float(interpFunc(x, y)) for x,y in zip(lon, lat)]
+    # Interpolation (linear) of depth to rock data
+    zTR = sample_site_grid('global_zTR_4km', 'zTR', lat, lon)
     # return
     return zTR
 
@@ -603,25 +1044,18 @@ def get_zTR_ncm(lat, lon):
     Output:
         zTR: list of depth to bedrock
     """
-    import requests
-
     zTR = []
+    provider = get_site_data_provider(NCMGeologyProvider)
 
     # Looping over sites
-    for cur_lat, cur_lon in zip(lat, lon):
-        url_geology = 'https://earthquake.usgs.gov/ws/nshmp/ncm/ws/nshmp/ncm/geologic-framework?location={}%2C{}'.format(cur_lat,cur_lon)
-        # geological data (depth to bedrock)
-        r1 = requests.get(url_geology)
-        cur_res = r1.json()
-        if not cur_res['response']['results'][0]['profiles']:
+    for cur_lat, cur_lon, cur_zTR in zip(lat, lon, provider.get(lat, lon)):
+        if cur_zTR is None:
             # the current site is out of the available range of NCM (Western US only, 06/2021)
             # just append 0.0 to zTR
             print('CreateStation: Warning in NCM API call - could not get the site geological data and approximate 0.0 for zTR for site {}, {}'.format(cur_lat,cur_lon))
             zTR.append(0.0)
-            continue
         else:
-            # get the top bedrock data
-            zTR.append(abs(cur_res['response']['results'][0]['profiles'][0]['top']))
+            zTR.append(cur_zTR)
     # return
     return zTR
 
@@ -637,31 +1071,46 @@ def get_vsp_ncm(lat, lon, depth):
     Output:
         vsp: list of shear-wave velocity profile
     """
-    import requests
-
     vsp = []
-    depthMin, depthInc, depthMax = [abs(x) for x in depth]
+    provider = get_site_data_provider(NCMGeophysicalProvider, depth)
 
     # Looping over sites
-    for cur_lat, cur_lon in zip(lat, lon):
-        url_geophys = 'https://earthquake.usgs.gov/ws/nshmp/ncm/ws/nshmp/ncm/geophysical?location={}%2C{}&depths={}%2C{}%2C{}'.format(cur_lat,cur_lon,depthMin,depthInc,depthMax)
-        r1 = requests.get(url_geophys)
-        cur_res = r1.json()
-        if cur_res['status'] == 'error':
+    for cur_vsp in provider.get(lat, lon):
+        if not cur_vsp:
             # the current site is out of the available range of NCM (Western US only, 06/2021)
-            # just append -1 to zTR
+            # just append an empty profile
             print('CreateStation: Warning in NCM API call - could not get the site geopyhsical data.')
             vsp.append([])
-            continue
         else:
-            # get vs30 profile
-            vsp.append([abs(x) for x in cur_res['response']['results'][0]['profile']['vs']])
+            vsp.append(cur_vsp)
     if len(vsp) == 1:
         vsp = vsp[0]
     # return
     return vsp
 
 
+def get_site_data_opensha(lat, lon, name, fetch_fun, **kwargs):
+    """
+    Fetch site data at given latitude and longitude from OpenSHA
+    Input:
+        lat: list of latitude
+        lon: list of longitude
+        name: name of the site data
+        fetch_fun: function fetching the site data for a list of sites
+        kwargs: options of fetch_fun (e.g., vs30model), which are part of the 
+        provider name so the values of different options are cached separately
+    Output:
+        values: list of site data (nan if not available)
+    """
+    import functools
+    if len(kwargs):
+        name = '_'.join([name]+[str(kwargs[x]) for x in sorted(kwargs)])
+        fetch_fun = functools.partial(fetch_fun, **kwargs)
+    provider = get_site_data_provider(OpenSHAProvider, name, fetch_fun)
+    # return
+    return [np.nan if x is None else x for x in provider.get(lat, lon)]
+
+
 def compute_vs30_from_vsp(depthp, vsp):
     """
     Compute the Vs30 given the depth and Vs profile
@@ -694,7 +1143,9 @@ def get_vs30_ncm(lat, lon):
     depth = [1.0, 1.0, 30.0]
     depthp = np.arange(depth[0], depth[2] + 1.0, depth[1])
     # Getting Vs profile
-    vsp = [get_vsp_ncm([x], [y], depth) for x,y in zip(lat, lon)]
+    vsp = get_vsp_ncm(lat, lon, depth)
+    if len(lat) == 1:
+        vsp = [vsp]
     # Computing Vs30
     vs30 = []
     for cur_vsp in vsp:
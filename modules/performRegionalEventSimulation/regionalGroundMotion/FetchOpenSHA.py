@@ -849,31 +849,43 @@ def get_site_vs30_from_opensha(lat, lon, vs30model='CGS/Wills VS30 Map (2015)'):
     # return
     return vs30
 
-def get_site_z1pt0_from_opensha(lat, lon):
+def get_site_data_from_opensha(lat, lon, data_type):
+
+    # set up site java object
     sites = ArrayList()
-    sites.add(Site(Location(lat, lon)))
+    num_sites = len(lat)
+    for i in range(num_sites):
+        sites.add(Site(Location(lat[i], lon[i])))
+    
     # prepare site data java object
     siteDataProviders = OrderedSiteDataProviderList.createSiteDataProviderDefaults()
     siteData = siteDataProviders.getAllAvailableData(sites)
+
+    # take the first non-nan value of the data type in the provider order
+    values = [np.nan]*num_sites
     for data in siteData:
-        if data.getValue(0).getDataType()=='Depth to Vs = 1.0 km/sec':
-            z1pt0 = float(data.getValue(0).getValue())
-            if not np.isnan(z1pt0):
-                break
-    return z1pt0*1000.0
+        if data.getValue(0).getDataType()!=data_type:
+            continue
+        for i in range(num_sites):
+            if np.isnan(values[i]):
+                values[i] = float(data.getValue(i).getValue())
+        if not any([np.isnan(x) for x in values]):
+            break
+
+    # return
+    return values
+
+def get_site_z1pt0_from_opensha(lat, lon):
+    # lat and lon can be a scalar (single site) or lists of sites (in meter)
+    if np.isscalar(lat):
+        return get_site_data_from_opensha([lat], [lon], 'Depth to Vs = 1.0 km/sec')[0]*1000.0
+    return [x*1000.0 for x in get_site_data_from_opensha(lat, lon, 'Depth to Vs = 1.0 km/sec')]
 
 def get_site_z2pt5_from_opensha(lat, lon):
-    sites = ArrayList()
-    sites.add(Site(Location(lat, lon)))
-    # prepare site data java object
-    siteDataProviders = OrderedSiteDataProviderList.createSiteDataProviderDefaults()
-    siteData = siteDataProviders.getAllAvailableData(sites)
-    for data in siteData:
-        if data.getValue(0).getDataType()=='Depth to Vs = 2.5 km/sec':
-            z2pt5 = float(data.getValue(0).getValue())
-            if not np.isnan(z2pt5):
-                break
-    return z2pt5*1000.0
+    # lat and lon can be a scalar (single site) or lists of sites (in meter)
+    if np.isscalar(lat):
+        return get_site_data_from_opensha([lat], [lon], 'Depth to Vs = 2.5 km/sec')[0]*1000.0
+    return [x*1000.0 for x in get_site_data_from_opensha(lat, lon, 'Depth to Vs = 2.5 km/sec')]
 
 
 
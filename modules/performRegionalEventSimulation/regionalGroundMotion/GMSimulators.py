@@ -58,6 +58,24 @@ IM_CORR_INTRA = {"Jayaram & Baker (2009)": ["SA", "PGA"],
 IM_CORR = {"INTER": IM_CORR_INTER,
 		   "INTRA": IM_CORR_INTRA}
 
+def read_im_mean_std_hdf5(im_raw_path, eq_ids):
+	# read the rows of the selected scenarios from the (scenario x site x IM)
+	# datasets, one chunk of rows at a time
+	im_names = ['Mean', 'InterEvStdDev', 'IntraEvStdDev']
+	im_sampled = dict()
+	with h5py.File(im_raw_path, 'r') as f:
+		scen_row = {int(x): i for i, x in enumerate(f['ScenarioIndex'][()])}
+		rows = np.unique([scen_row[int(i)] for i in eq_ids])
+		block_size = f['Mean'].chunks[0] if f['Mean'].chunks else f['Mean'].shape[0]
+		for cur_block in np.unique(rows // block_size):
+			i_start = cur_block * block_size
+			im_block = {x: f[x][i_start:i_start+block_size] for x in im_names}
+			for cur_row in rows[rows // block_size == cur_block]:
+				im_sampled.update({cur_row: {x: im_block[x][cur_row-i_start] for x in im_names}})
+	# return
+	return {i: im_sampled[scen_row[int(i)]] for i in eq_ids}
+
+
 def simulate_ground_motion(stations, im_raw_path, im_list, scenarios,\
 						   num_simu, correlation_info, im_info, eq_ids):
 
@@ -75,13 +93,7 @@ def simulate_ground_motion(stations, im_raw_path, im_list, scenarios,\
 							  num_simu=num_simu,
 							correlation_info=correlation_info,im_info=im_info)
 	elif im_raw_path.endswith('.hdf5'):
-		with h5py.File(im_raw_path, 'r') as f:
-			for i in eq_ids:
-				sample = dict()
-				sample.update({'Mean': f[str(i)]['Mean'][()]})
-				sample.update({'InterEvStdDev': f[str(i)]['InterEvStdDev'][()]})
-				sample.update({'IntraEvStdDev': f[str(i)]['IntraEvStdDev'][()]})
-				im_sampled.update({i: sample})
+		im_sampled = read_im_mean_std_hdf5(im_raw_path, eq_ids)
 		gm_simulator = GM_Simulator_hdf5(site_info=stations, im_list = im_list,
 								   num_simu=num_simu,
 							correlation_info=correlation_info,im_info=im_info)
@@ -130,17 +142,21 @@ class GM_Simulator:
 		self.set_im_raw(im_raw, im_list)
 		self.cross_check_im_correlation()
 
-	def set_sites(self, site_info):
+	def set_sites(self, site_info, dist_dtype=np.float64):
 		# set sites
 		self.sites = site_info.copy()
 		self.num_sites = len(self.sites)
+		# spatial correlation factors are cached per site set (size-bounded,
+		# see parse_correlation_info)
+		self.corr_factor_cache = CorrelationModel.CorrelationFactorCache()
+		self.dist_dtype = dist_dtype
+		# the dense distance matrix is computed on demand (_compute_distance_matrix)
+		self.stn_dist = None
 		if self.num_sites < 2:
-			self.stn_dist = None
 			print('GM_Simulator: Only one site is defined, spatial correlation models ignored.')
 			return
-		self._compute_distance_matrix()
 
-	def _compute_distance_matrix(self):
+	def _compute_distance_matrix(self, dtype=np.float64):
 
 		# site number check
 		if self.num_sites < 2:
@@ -148,17 +164,9 @@ class GM_Simulator:
 			self.stn_dist = None
 			return
 		# compute the distance matrix
-		tmp = np.zeros((self.num_sites, self.num_sites))
-		for i in range(self.num_sites):
-			loc_i = np.array([self.sites[i]['lat'],
-							  self.sites[i]['lon']])
-			for j in range(self.num_sites):
-				loc_j = np.array([self.sites[j]['lat'],
-								  self.sites[j]['lon']])
-				# Computing station-wise distances
-				tmp[i,j] = CorrelationModel.get_distance_from_lat_lon(loc_i, loc_j)
-		self.stn_dist = tmp
-	
+		self.stn_dist = CorrelationModel.get_distance_matrix(
+			[x['lat'] for x in self.sites], [x['lon'] for x in self.sites], dtype=dtype)
+
 	def set_num_simu(self, num_simu):
 		# set simulation number
 		self.num_simu = num_simu
@@ -207,6 +215,18 @@ class GM_Simulator:
 		# default is no correlation model and uncorrelated motions if generated
 		self.inter_cm = None
 		self.intra_cm = None
+		# spatial correlation sampling: 'Cholesky' (exact dense factor) or
+		# 'LowRank' (opt-in Nystrom approximation for regions too large for
+		# the dense factor, it underestimates the spatial correlation)
+		self.corr_sampling_method = 'Cholesky'
+		self.num_inducing_sites = 2000
+		# memory limit (MB) of the cached spatial correlation factors
+		factor_cache_size = 2048
+		if correlation_info is not None:
+			self.corr_sampling_method = correlation_info.get('SamplingMethod', 'Cholesky')
+			self.num_inducing_sites = int(correlation_info.get('NumInducingSites', 2000))
+			factor_cache_size = float(correlation_info.get('FactorCacheSize', 2048))
+		self.corr_factor_cache.max_bytes = factor_cache_size * 1024 ** 2
 		# parse correlation infomation if any
 		if correlation_info is None:
 			print('GM_Simulator: warning - correlation information not found - results will be uncorrelated motions.')
@@ -343,30 +363,42 @@ class GM_Simulator:
 			residuals = np.random.multivariate_normal(np.zeros(self.num_im), rho, self.num_simu).T
 		# return
 		return residuals
+
+	def get_corr_sampling_method(self):
+		return CorrelationModel.get_correlation_sampling_method(
+			self.corr_sampling_method)
+
 	def compute_intra_event_residual_i(self, cm, im_name_list, num_simu):
+		method = self.get_corr_sampling_method()
+		# spatial factors are computed once and reused by all scenarios (as
+		# long as they fit in the factor cache)
+		cache = self.corr_factor_cache
 		if cm == 'Jayaram & Baker (2009)':
-			rho = np.zeros((self.num_sites, self.num_sites, len(im_name_list)))
-			for i in range(self.num_sites):
-				for j in range(self.num_sites):
-					cur_stn_dist = self.stn_dist[i, j]
-					for k in range(len(im_name_list)):
-						rho[i, j, k] = CorrelationModel.jayaram_baker_correlation_2009(im_name_list[k], cur_stn_dist, 
-																					   flag_clustering = False)
-			# Simulating residuals
+			lat, lon = CorrelationModel.get_station_lat_lon(self.sites)
 			residuals = np.zeros((self.num_sites, len(im_name_list), num_simu))
-			for k in range(self.num_im):
-				residuals[:, k, :] = np.random.multivariate_normal(np.zeros(self.num_sites), rho[:, :, k], num_simu).T
+			for k, cur_im in enumerate(im_name_list):
+				if cur_im.startswith('SA'):
+					T = float(cur_im[3:-1])
+				else:
+					T = 0.0
+				corr_range = CorrelationModel.get_jayaram_baker_range_2009(T, flag_clustering = False)
+				factor = CorrelationModel.get_exponential_correlation_factor(lat, lon, corr_range,
+					method=method, num_inducing=self.num_inducing_sites, cache=cache, dtype=self.dist_dtype)
+				residuals[:, k, :] = CorrelationModel.sample_spatial_residuals(factor, num_simu)
 		elif cm == 'Loth & Baker (2013)':
 			residuals = CorrelationModel.loth_baker_correlation_2013(self.sites,\
-															im_name_list, num_simu)
+															im_name_list, num_simu, method=method,\
+															num_inducing=self.num_inducing_sites, cache=cache)
 		elif cm == 'Markhvida et al. (2017)':
 			num_pc = 19
 			residuals = CorrelationModel.markhvida_ceferino_baker_correlation_2017(\
-				self.sites, im_name_list, num_simu, num_pc)
+				self.sites, im_name_list, num_simu, num_pc, method=method,\
+				num_inducing=self.num_inducing_sites, cache=cache)
 		elif cm == 'Du & Ning (2021)':
 			num_pc = 23
 			residuals = CorrelationModel.du_ning_correlation_2021(self.sites,\
-												im_name_list, num_simu, num_pc)
+												im_name_list, num_simu, num_pc, method=method,\
+												num_inducing=self.num_inducing_sites, cache=cache)
 		else:
 				# TODO: extending this to more inter-event correlation models
 			sys.exit('GM_Simulator.compute_intra_event_residual: currently supporting Jayaram & Baker (2009), Loth & Baker (2013),Markhvida et al. (2017), Du & Ning (2021)')
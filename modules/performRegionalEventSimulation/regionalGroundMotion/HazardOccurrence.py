@@ -41,8 +41,11 @@
 import numpy as np
 import pulp, h5py, sys
 import pandas as pd
-import json, os, itertools, threading, collections, time
+import json, os, itertools, threading, collections, time, hashlib
+from scipy import sparse
+from scipy.optimize import nnls
 from scipy.stats import norm
+from scipy.special import ndtr
 from USGS_API import *
 from tqdm import tqdm
 from sklearn.linear_model import lasso_path
@@ -250,69 +253,116 @@ def calc_hazard_contribution(IMdata, site_config, targetReturnPeriods, hc_data,
     return c_vect
                  
 
-def calc_hazard_curves(IMdata, site_config, im):
-    if im[0:2] == 'SA':
-        period = float(im[2:].replace('P','.'))
-        im_name = 'lnSA'
-        periods = IMdata[list(IMdata.keys())[0]]['Periods']
-        im_ind = np.where(np.array(periods)==period)[0][0]
-    else:
-        im_name = 'lnPGA'
-        im_ind = 0
-    IMRange = np.power(10, np.linspace(-4, 2, 60))
-    exceedRate = np.zeros((len(IMRange), len(site_config)))
-    hc_data = [{'siteID':0,
-                'ReturnPeriod':list(exceedRate),
-                'IM':list(exceedRate)}]*len(site_config)
-    scenario_idx = list(IMdata.keys())
-    for scenario_ind in tqdm(range(len(scenario_idx)), desc="Calculate "\
-                  f"Hazard Curves from {len(scenario_idx)} scenarios"):
-        scenario = IMdata[scenario_idx[scenario_ind]]
-        mar = scenario['MeanAnnualRate']
-        for site_ind in range(len(site_config)):
-            lnIM = scenario['GroundMotions'][site_ind][im_name] 
-            lnIM_mean = lnIM['Mean'][im_ind]
-            lnIM_std = lnIM['TotalStdDev'][im_ind]
-            p_exceed = 1 - norm.cdf(np.log(IMRange), lnIM_mean, lnIM_std)
-            rate_exceed = mar * p_exceed
-            exceedRate[:, site_ind] = exceedRate[:, site_ind] + rate_exceed
+def calc_exceedance_rates(lnIM_mean, lnIM_std, mar, ln_im_level, max_elements=2**24):
+    # mean annual rates of exceeding the im levels: 
+    # sum over scenarios of mar * P(IM > im_level), with lnIM_mean and 
+    # lnIM_std in (scenario x site x im) and the output in (level x site x im)
+    num_scen, num_sites, num_ims = lnIM_mean.shape
+    num_levels = len(ln_im_level)
+    lnIM_mean = lnIM_mean.reshape(num_scen, 1, num_sites*num_ims)
+    lnIM_std = lnIM_std.reshape(num_scen, 1, num_sites*num_ims)
+    ln_im_level = np.asarray(ln_im_level).reshape(1, num_levels, 1)
+    exceedRate = np.zeros(num_levels*num_sites*num_ims)
+    # scenarios are processed in batches to bound the memory
+    batch_size = max(1, max_elements // (num_levels*num_sites*num_ims))
+    for i_start in range(0, num_scen, batch_size):
+        i_end = min(i_start+batch_size, num_scen)
+        # 1 - Phi((ln(x) - mu)/sigma) = Phi((mu - ln(x))/sigma)
+        z = np.subtract(lnIM_mean[i_start:i_end], ln_im_level)
+        z /= lnIM_std[i_start:i_end]
+        ndtr(z, out=z)
+        exceedRate += mar[i_start:i_end] @ z.reshape(i_end-i_start, -1)
+    # return
+    return exceedRate.reshape(num_levels, num_sites, num_ims)
+
+
+def get_hazard_curve_data(exceedRate, IMRange, site_config):
     exceedRate[exceedRate<1e-20] = 1e-20
+    hc_data = []
     for site_ind, site in enumerate(site_config):
-        hc_data[site_ind] = {'SiteID': site['ID'],
+        hc_data.append({'SiteID': site['ID'],
             "ReturnPeriod":list(1/exceedRate[:,site_ind]),
             "IM":list(IMRange)
-        }
+        })
     return hc_data
 
+
+def calc_hazard_curves(IMdata, site_config, im):
+    # im could be one intensity measure or a list of them
+    im_all = im if isinstance(im, list) else [im]
+    scenario_idx = list(IMdata.keys())
+    im_names = []
+    im_inds = []
+    for cur_im in im_all:
+        if cur_im[0:2] == 'SA':
+            period = float(cur_im[2:].replace('P','.'))
+            im_names.append('lnSA')
+            periods = IMdata[scenario_idx[0]]['Periods']
+            im_inds.append(np.where(np.array(periods)==period)[0][0])
+        else:
+            im_names.append('lnPGA')
+            im_inds.append(0)
+    IMRange = np.power(10, np.linspace(-4, 2, 60))
+    num_sites = len(site_config)
+    # (scenario x site x im) arrays of the mean and standard deviation
+    lnIM_mean = np.zeros((len(scenario_idx), num_sites, len(im_all)))
+    lnIM_std = np.zeros((len(scenario_idx), num_sites, len(im_all)))
+    mar = np.zeros(len(scenario_idx))
+    for scenario_ind in range(len(scenario_idx)):
+        scenario = IMdata[scenario_idx[scenario_ind]]
+        mar[scenario_ind] = scenario['MeanAnnualRate']
+        for site_ind in range(num_sites):
+            for k, (im_name, im_ind) in enumerate(zip(im_names, im_inds)):
+                lnIM = scenario['GroundMotions'][site_ind][im_name]
+                lnIM_mean[scenario_ind, site_ind, k] = lnIM['Mean'][im_ind]
+                lnIM_std[scenario_ind, site_ind, k] = lnIM['TotalStdDev'][im_ind]
+    print(f"Calculate Hazard Curves from {len(scenario_idx)} scenarios")
+    exceedRate = calc_exceedance_rates(lnIM_mean, lnIM_std, mar, np.log(IMRange))
+    hc_data = [get_hazard_curve_data(exceedRate[:, :, k], IMRange, site_config) 
+               for k in range(len(im_all))]
+    if isinstance(im, list):
+        return hc_data
+    return hc_data[0]
+
 def calc_hazard_curves_hdf5(IMfile, im_list, site_config, im, scenarios):
-    im_ind = im_list.index(im)
+    # im could be one intensity measure or a list of them
+    im_all = im if isinstance(im, list) else [im]
+    im_inds = [im_list.index(x) for x in im_all]
+    # h5py needs increasing indices
+    im_inds_read = sorted(set(im_inds))
+    im_cols = [im_inds_read.index(x) for x in im_inds]
     IMRange = np.power(10, np.linspace(-4, 2, 60))
-    exceedRate = np.zeros((len(IMRange), len(site_config)))
-    hc_data = [{'siteID':0,
-                'ReturnPeriod':list(exceedRate),
-                'IM':list(exceedRate)}]*len(site_config)
+    ln_im_level = np.log(IMRange)
+    num_sites = len(site_config)
+    exceedRate = np.zeros((len(IMRange), num_sites, len(im_all)))
     scenario_idx = list(scenarios.keys())
     with h5py.File(IMfile, 'r') as IMdata:
-        for scenario_ind in tqdm(range(len(scenario_idx)), desc="Calculate "\
+        scen_row = {int(x): i for i, x in enumerate(IMdata['ScenarioIndex'][()])}
+        rows = np.array([scen_row[int(x)] for x in scenario_idx], dtype=int)
+        mar_all = np.array([scenarios[x]['MeanAnnualRate'] for x in scenario_idx])
+        block_size = IMdata['Mean'].chunks[0] if IMdata['Mean'].chunks else IMdata['Mean'].shape[0]
+        num_blocks = int(np.ceil(IMdata['Mean'].shape[0]/block_size))
+        for cur_block in tqdm(range(num_blocks), desc="Calculate "\
                     f"Hazard Curves from {len(scenario_idx)} scenarios"):
-            scenario_im = IMdata[str(scenario_idx[scenario_ind])]
-            mar = scenarios[scenario_idx[scenario_ind]]['MeanAnnualRate']
-            lnIM_mean = scenario_im['Mean'][:,im_ind]
-            lnIM_interStd = scenario_im['InterEvStdDev'][:,im_ind]
-            lnIM_intraStd = scenario_im['IntraEvStdDev'][:,im_ind]
-            lnIM_std = np.sqrt(lnIM_intraStd**2 + lnIM_interStd**2)
-            for site_ind in range(len(site_config)):
-                p_exceed = 1 - norm.cdf(np.log(IMRange), lnIM_mean[site_ind],\
-                                        lnIM_std[site_ind])
-                rate_exceed = mar * p_exceed
-                exceedRate[:, site_ind] = exceedRate[:, site_ind] + rate_exceed
-    exceedRate[exceedRate<1e-20] = 1e-20
-    for site_ind, site in enumerate(site_config):
-        hc_data[site_ind] = {'SiteID': site['ID'],
-            "ReturnPeriod":list(1/exceedRate[:,site_ind]),
-            "IM":list(IMRange)
-        }
-    return hc_data
+            i_start = cur_block * block_size
+            cur_ind = np.where(rows // block_size == cur_block)[0]
+            if len(cur_ind) == 0:
+                continue
+            # one chunk of scenarios for the ims at a time
+            cur_rows = rows[cur_ind] - i_start
+            block_mean = IMdata['Mean'][i_start:i_start+block_size, :, im_inds_read]
+            block_interStd = IMdata['InterEvStdDev'][i_start:i_start+block_size, :, im_inds_read]
+            block_intraStd = IMdata['IntraEvStdDev'][i_start:i_start+block_size, :, im_inds_read]
+            lnIM_mean = block_mean[cur_rows][:, :, im_cols]
+            lnIM_std = np.sqrt(block_interStd[cur_rows][:, :, im_cols]**2 + \
+                               block_intraStd[cur_rows][:, :, im_cols]**2)
+            exceedRate += calc_exceedance_rates(lnIM_mean, lnIM_std, 
+                                                mar_all[cur_ind], ln_im_level)
+    hc_data = [get_hazard_curve_data(exceedRate[:, :, k], IMRange, site_config) 
+               for k in range(len(im_all))]
+    if isinstance(im, list):
+        return hc_data
+    return hc_data[0]
     
 
 def get_hazard_curves(input_dir=None, 
@@ -362,7 +412,7 @@ def get_im_exceedance_probility(IMfile,
         num_sites = len(im_raw[scenario_idx[0]].get('GroundMotions'))
     elif IMfile.lower().endswith('.hdf5'):
         with h5py.File(IMfile, 'r') as f:
-            num_sites = f[str(scenario_idx[0])]['Mean'].shape[0]
+            num_sites = f['Mean'].shape[1]
     
     im_exceedance_prob = np.zeros((num_sites,num_scen,num_rps))
         
@@ -383,13 +433,14 @@ def get_im_exceedance_probility(IMfile,
                 periodID = im_raw[scenario_idx[0]].get('Periods').index(period)
 
         # start to compute the exceedance probability
+        ln_im_level = np.log(im_level)
         for k in range(num_scen):
             allGM = im_raw[scenario_idx[k]].get('GroundMotions')
-            for i in range(num_sites):
-                curIM = allGM[i].get('ln{}'.format(im_type))
-                curMean = curIM.get('Mean')[periodID]
-                curStd = curIM.get('TotalStdDev')[periodID]
-                im_exceedance_prob[i,k,:] = 1.0-norm.cdf(np.log(im_level[i,:]),loc=curMean,scale=curStd)
+            curMean = np.array([allGM[i].get('ln{}'.format(im_type)).get('Mean')[periodID] 
+                                for i in range(num_sites)])
+            curStd = np.array([allGM[i].get('ln{}'.format(im_type)).get('TotalStdDev')[periodID] 
+                               for i in range(num_sites)])
+            im_exceedance_prob[:,k,:] = ndtr((curMean[:,np.newaxis]-ln_im_level)/curStd[:,np.newaxis])
     elif IMfile.lower().endswith('.hdf5'):
         if im_type == 'PGA':
             im_name = 'PGA'
@@ -405,16 +456,23 @@ def get_im_exceedance_probility(IMfile,
                 format(im_name,im_list))
             return im_exceedance_prob
         im_ind = im_list.index(im_name)
+        ln_im_level = np.log(im_level)
         with h5py.File(IMfile, 'r') as im_raw:
-            for k in range(num_scen):
-                curIM = im_raw[str(scenario_idx[k])]
-                for i in range(num_sites):
-                    curMean = curIM['Mean'][i, im_ind]
-                    curInterStd = curIM['InterEvStdDev'][i, im_ind]
-                    curIntraStd = curIM['IntraEvStdDev'][i, im_ind]
-                    curStd = np.sqrt(curInterStd**2 + curIntraStd**2)
-                    im_exceedance_prob[i,k,:] = 1.0-norm.cdf(
-                        np.log(im_level[i,:]),loc=curMean,scale=curStd)
+            scen_row = {int(x): i for i, x in enumerate(im_raw['ScenarioIndex'][()])}
+            rows = np.array([scen_row[int(x)] for x in scenario_idx], dtype=int)
+            block_size = im_raw['Mean'].chunks[0] if im_raw['Mean'].chunks else im_raw['Mean'].shape[0]
+            # one chunk of scenarios at a time, only the chunks holding the
+            # selected scenarios are read
+            for cur_block in np.unique(rows // block_size):
+                i_start = cur_block * block_size
+                cur_ind = np.where(rows // block_size == cur_block)[0]
+                cur_rows = rows[cur_ind] - i_start
+                # (site x scenario) of the selected scenarios in the chunk
+                curMean = im_raw['Mean'][i_start:i_start+block_size, :, im_ind][cur_rows].T
+                curStd = np.sqrt(im_raw['InterEvStdDev'][i_start:i_start+block_size, :, im_ind][cur_rows].T**2 + \
+                                 im_raw['IntraEvStdDev'][i_start:i_start+block_size, :, im_ind][cur_rows].T**2)
+                for j, k in enumerate(cur_ind):
+                    im_exceedance_prob[:,k,:] = ndtr((curMean[:,j,np.newaxis]-ln_im_level)/curStd[:,j,np.newaxis])
     # return
     return im_exceedance_prob
 
@@ -455,6 +513,23 @@ def get_im_exceedance_probability_gm(im_raw,
     return im_exceedance_prob, occurrence_rate
 
 
+# built occurrence problems for reruns
+occurrence_problem_cache = collections.OrderedDict()
+
+
+def get_occurrence_problem_key(return_periods, im_exceedance_prob, reweight_only, occurence_rate_origin):
+
+    key_hash = hashlib.sha1()
+    key_hash.update(np.asarray(return_periods, dtype=float).tobytes())
+    key_hash.update(np.ascontiguousarray(im_exceedance_prob, dtype=float).tobytes())
+    key_hash.update(str(np.shape(im_exceedance_prob)).encode())
+    key_hash.update(str(bool(reweight_only)).encode())
+    if occurence_rate_origin is not None:
+        key_hash.update(np.asarray(occurence_rate_origin, dtype=float).tobytes())
+    # return
+    return key_hash.hexdigest()
+
+
 def sample_earthquake_occurrence(model_type,
                                  num_target_eqs,
                                  return_periods,
@@ -465,14 +540,27 @@ def sample_earthquake_occurrence(model_type,
 
     # model type
     if model_type == 'Manzour & Davidson (2016)':
-        # create occurrence model
-        om = OccurrenceModel_ManzourDavidson2016(return_periods=return_periods,
-                                                 im_exceedance_probs=im_exceedance_prob,
-                                                 num_scenarios=num_target_eqs,
-                                                 reweight_only=reweight_only,
-                                                 occurence_rate_origin=occurence_rate_origin)
+        # reuse the problem built for the same inputs (e.g., a rerun with 
+        # a different number of target scenarios)
+        if hzo_config is None:
+            hzo_config = {}
+        problem_key = get_occurrence_problem_key(return_periods, im_exceedance_prob,
+                                                 reweight_only, occurence_rate_origin)
+        om = occurrence_problem_cache.get(problem_key, None)
+        if om is None:
+            # create occurrence model
+            om = OccurrenceModel_ManzourDavidson2016(return_periods=return_periods,
+                                                     im_exceedance_probs=im_exceedance_prob,
+                                                     num_scenarios=num_target_eqs,
+                                                     reweight_only=reweight_only,
+                                                     occurence_rate_origin=occurence_rate_origin)
+            if len(occurrence_problem_cache) >= 4:
+                occurrence_problem_cache.pop(next(iter(occurrence_problem_cache)))
+            occurrence_problem_cache[problem_key] = om
+        else:
+            om.set_num_scenarios(num_target_eqs)
         # solve the optimiation
-        om.solve_opt()
+        om.solve_opt(warm_start=hzo_config.get('WarmStart', None))
     elif model_type == 'Wang et al. (2023)':
         # create occurrence model
         om = OccurrenceModel_Wangetal2023(return_periods=return_periods,
@@ -645,29 +733,108 @@ class OccurrenceModel_ManzourDavidson2016:
 
         # objective function
         comb_sites_rps = list(itertools.product(range(self.num_sites),range(self.num_return_periods)))
-        self.prob += pulp.lpSum(self.return_periods[j]*self.e_plus[(i,j)]+self.return_periods[j]*self.e_minus[(i,j)] for (i,j) in comb_sites_rps)
-
-        # constraints
-        for i in range(self.num_sites):
-            for j in range(self.num_return_periods):
-                self.prob += pulp.lpSum(self.P[k]*self.im_exceedance_probs[i,k,j] for k in range(self.num_eqs))+self.e_minus[i,j]-self.e_plus[i,j] == 1.0/self.return_periods[j]
+        self.prob += pulp.LpAffineExpression(
+            [(self.e_plus[i,j], self.return_periods[j]) for (i,j) in comb_sites_rps] + \
+            [(self.e_minus[i,j], self.return_periods[j]) for (i,j) in comb_sites_rps])
+
+        # constraints: the sparse (site-return period x earthquake) matrix of 
+        # exceedance probabilities is assembled once and passed row by row
+        self.exceedance_matrix = sparse.csr_matrix(
+            np.asarray(self.im_exceedance_probs).transpose(0,2,1).reshape(-1, self.num_eqs))
+        self.target_rates = np.tile(1.0/np.array(self.return_periods, dtype=float), self.num_sites)
+        P_vars = np.empty(self.num_eqs, dtype=object)
+        P_vars[:] = [self.P[k] for k in range(self.num_eqs)]
+        indptr = self.exceedance_matrix.indptr
+        for row, (i,j) in enumerate(comb_sites_rps):
+            cols = self.exceedance_matrix.indices[indptr[row]:indptr[row+1]]
+            coefs = self.exceedance_matrix.data[indptr[row]:indptr[row+1]]
+            cur_expr = pulp.LpAffineExpression(
+                list(zip(P_vars[cols], coefs.tolist())) + [(self.e_minus[i,j], 1.0), (self.e_plus[i,j], -1.0)])
+            self.prob.addConstraint(pulp.LpConstraint(cur_expr, pulp.LpConstraintEQ, 
+                rhs=self.target_rates[row]), name='hc-{}-{}'.format(i,j))
 
         if not self.reweight_only:
             for i in range(self.num_eqs):
-                self.prob += self.P[i]-self.Z[i] <= 0
+                self.prob.addConstraint(pulp.LpConstraint(
+                    pulp.LpAffineExpression([(self.P[i], 1.0), (self.Z[i], -1.0)]), 
+                    pulp.LpConstraintLE, rhs=0), name='pz-{}'.format(i))
 
-            self.prob += pulp.lpSum(self.Z[i] for i in range(self.num_eqs)) <= self.num_scenarios
+            self.prob.addConstraint(pulp.LpConstraint(
+                pulp.LpAffineExpression([(self.Z[i], 1.0) for i in range(self.num_eqs)]),
+                pulp.LpConstraintLE, rhs=self.num_scenarios), name='num_scenarios')
 
         return True
 
+    def set_num_scenarios(self, num_scenarios):
+        """
+        set_num_scenarios: update the number of target scenarios of the built problem
+        :param num_scenarios: integer for number of target scenarios
+        """
+        self.num_scenarios = num_scenarios
+        if not self.reweight_only:
+            self.prob.constraints['num_scenarios'].changeRHS(num_scenarios)
+
+    def get_warm_start(self, method='Greedy'):
+        """
+        get_warm_start: initial solution of the optimization problem
+        :param method: 'Greedy' (non-negative least squares of the weighted hazard 
+            curve misfit on the most contributing earthquakes) or 'LP' (the linear 
+            programming relaxation rounded to the target number of scenarios)
+        """
+        lower_bound = np.zeros(self.num_eqs)
+        if self.reweight_only:
+            lower_bound = np.array(self.occurence_rate_origin, dtype=float)
+        weights = np.sqrt(1.0/self.target_rates)
+        if method == 'LP':
+            # relax the binary variables
+            for i in self.Z:
+                self.Z[i].cat = pulp.LpContinuous
+            self.prob.solve(pulp.PULP_CBC_CMD(msg=False))
+            for i in self.Z:
+                self.Z[i].cat = pulp.LpInteger
+            P_relax = np.array([self.P[i].varValue or 0.0 for i in range(self.num_eqs)])
+        else:
+            X_weighted = self.exceedance_matrix.multiply(weights[:,np.newaxis]).toarray()
+            P_relax, _ = nnls(X_weighted, weights*self.target_rates)
+        if self.reweight_only:
+            return np.clip(P_relax, lower_bound, 1.0)
+        # keep the most contributing earthquakes
+        contribution = P_relax*np.asarray(self.exceedance_matrix.sum(axis=0)).flatten()
+        selected = np.argsort(-contribution, kind='stable')[:self.num_scenarios]
+        selected = selected[contribution[selected] > 0]
+        P_init = np.zeros(self.num_eqs)
+        if len(selected) > 0:
+            X_weighted = self.exceedance_matrix[:,selected].multiply(weights[:,np.newaxis]).toarray()
+            P_init[selected], _ = nnls(X_weighted, weights*self.target_rates)
+        return np.clip(P_init, 0.0, 1.0)
+
+    def set_initial_values(self, P_init):
+        """
+        set_initial_values: set a feasible initial solution for warm-starting the solver
+        :param P_init: 1-D array of annual occurrence probability of earthquakes
+        """
+        residual = (self.target_rates - self.exceedance_matrix @ P_init).reshape(
+            self.num_sites, self.num_return_periods)
+        for i in range(self.num_eqs):
+            self.P[i].setInitialValue(P_init[i])
+            if not self.reweight_only:
+                self.Z[i].setInitialValue(int(P_init[i] > 0))
+        for i in range(self.num_sites):
+            for j in range(self.num_return_periods):
+                self.e_minus[i,j].setInitialValue(max(residual[i,j], 0.0))
+                self.e_plus[i,j].setInitialValue(max(-residual[i,j], 0.0))
 
-    def solve_opt(self):
+    def solve_opt(self, warm_start=None):
         """
         target_function: compute the target function to be minimized
         :param X: 2-D array of annual occurrence probability of earthquakes and corresponding binary variables (many values are reduced to zeros)
+        :param warm_start: None, 'Greedy', or 'LP' for the initial solution
         """
         maximum_runtime = 1*60*60 # 1 hours maximum
-        self.prob.solve(pulp.PULP_CBC_CMD(timeLimit=maximum_runtime, gapRel=0.001))
+        if warm_start is not None:
+            self.set_initial_values(self.get_warm_start(warm_start))
+        self.prob.solve(pulp.PULP_CBC_CMD(timeLimit=maximum_runtime, gapRel=0.001, 
+                                          warmStart=(warm_start is not None)))
         print("Status:", pulp.LpStatus[self.prob.status])
 
     def get_selected_earthquake(self):
@@ -99,9 +99,14 @@ def hazard_job(hazard_info):
             event_info['IntensityMeasure'] = im_info
 
         if opensha_flag or hazard_info['Scenario']['EqRupture']['Type'] == 'oqSourceXML':
+            # number of worker processes evaluating the scenarios (1: sequential)
+            num_workers = event_info.get('NumberOfWorkers', 1)
             im_raw_path, im_list = compute_im(scenarios, stations, scenario_info,
                                 event_info.get('GMPE',None), event_info['IntensityMeasure'],
-                                scenario_info['Generator'], output_dir, mth_flag=False)
+                                scenario_info['Generator'], output_dir,
+                                mth_flag=(num_workers is None or num_workers > 1),
+                                num_workers=num_workers,
+                                hdf5_compression=event_info.get('IMFileCompression', None))
             # update the im_info
             event_info['IntensityMeasure'] = im_info
         elif oq_flag:
@@ -100,7 +100,7 @@ if __name__ == '__main__':
         memory_request = int(memory_total*0.75)
         jpype.addClassPath('./lib/OpenSHA-1.5.2.jar')
         jpype.startJVM("-Xmx{}G".format(memory_request), convertStrings=False)
-    from CreateStation import create_stations
+    from CreateStation import create_stations, configure_site_data_providers
     from CreateScenario import load_earthquake_scenarios, create_earthquake_scenarios,\
         create_wind_scenarios
     # if oq_flag:
@@ -151,6 +151,8 @@ if __name__ == '__main__':
         # openSHA database: https://github.com/opensha/opensha/blob/16aaf6892fe2a31b5e497270429b8d899098361a/src/main/java/org/opensha/commons/data/siteData/OrderedSiteDataProviderList.java
     site_info['Z1pt0'].update({'z1_tag':z1_tag})
     site_info['Z2pt5'].update({'z25_tag':z25_tag})
+    # site data providers (cache, offline mode, and concurrent fetching)
+    configure_site_data_providers(site_info.get('SiteDataProvider', {}))
     if site_info['Type'] == 'From_CSV':
         input_file = os.path.join(input_dir,site_info['input_file'])
         output_file = site_info.get('output_file',False)
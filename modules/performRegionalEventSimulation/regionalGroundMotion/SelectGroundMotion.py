@@ -56,6 +56,7 @@ import pandas as pd
 import zipfile
 import csv
 import copy
+from scipy.spatial import cKDTree
 
 
 class GM_Selector:
@@ -119,6 +120,143 @@ class GM_Selector:
         self.sf = sf
 
 
+class GM_BatchSelector:
+
+    def __init__(self, gmdb_im_df=dict(), sf_min=None, sf_max=None, num_candidates=8, 
+                 num_candidates_wide=128, batch_size=65536):
+
+        self.num_candidates = num_candidates
+        self.num_candidates_wide = num_candidates_wide
+        self.batch_size = batch_size
+        self.set_sf_range(sf_min, sf_max)
+        self.set_gmdb_im_df(gmdb_im_df)
+
+    def set_sf_range(self, sf_min, sf_max):
+        if sf_min is None:
+            self.sf_min = 0.0001
+        else:
+            self.sf_min = sf_min
+        if sf_max is None:
+            self.sf_max = 100000.0
+        else:
+            self.sf_max = sf_max
+        self.sf_range = np.linspace(self.sf_min, self.sf_max, 100)
+        # scaling is an additive shift in the log space
+        self.sf_range = self.sf_range[self.sf_range > 0]
+        self.ln_sf_range = np.log(self.sf_range)
+
+    def set_gmdb_im_df(self, gmdb_im_df):
+        self.gmdb_im_df = gmdb_im_df
+        self.num_gm = len(gmdb_im_df['RSN'])
+        tmp_list = list(gmdb_im_df.keys())
+        tmp_list.remove('RSN')
+        self.im_list = tmp_list
+        self.scalable = np.array([not x.startswith('DS') for x in self.im_list])
+        self.num_scalable = int(np.sum(self.scalable))
+        # log-IM table of the records (computed once)
+        self.ln_im_table = np.log(pd.DataFrame(gmdb_im_df)[self.im_list].to_numpy(dtype=float))
+        # the error of a record is split into the distance of scale-invariant 
+        # features (scalable IMs centered by their mean) and the misfit of 
+        # the mean log shift to the scale factors in the range
+        self.gm_features, self.gm_mean = self._get_features(self.ln_im_table)
+        self.gm_tree = cKDTree(self.gm_features, balanced_tree=False, compact_nodes=False)
+
+    def _get_features(self, ln_im):
+        features = ln_im.copy()
+        ln_mean = np.zeros(ln_im.shape[0])
+        if self.num_scalable:
+            ln_mean = np.mean(ln_im[:, self.scalable], axis=1)
+            features[:, self.scalable] -= ln_mean[:, np.newaxis]
+        return features, ln_mean
+
+    def _get_ln_sf(self, shift):
+        # the scale factor closest to the optimal (continuous) log shift
+        if not self.num_scalable:
+            return np.zeros(shift.shape) + self.ln_sf_range[0]
+        idx = np.clip(np.searchsorted(self.ln_sf_range, shift), 1, len(self.ln_sf_range)-1)
+        ln_sf_lo = self.ln_sf_range[idx-1]
+        ln_sf_hi = self.ln_sf_range[np.minimum(idx, len(self.ln_sf_range)-1)]
+        return np.where(np.abs(shift-ln_sf_lo) <= np.abs(shift-ln_sf_hi), ln_sf_lo, ln_sf_hi)
+
+    def _get_errors(self, dist2, shift):
+        ln_sf = self._get_ln_sf(shift)
+        return dist2 + self.num_scalable*(shift-ln_sf)**2, ln_sf
+
+    def _search_candidates(self, cur_features, cur_mean, k):
+        # best of the k nearest records (by features) for every target, and 
+        # the lower bound of the error of any other record
+        dist, cand = self.gm_tree.query(cur_features, k=k)
+        dist = dist.reshape(cur_features.shape[0], k)
+        cand = cand.reshape(cur_features.shape[0], k)
+        err, ln_sf = self._get_errors(dist**2, cur_mean[:, np.newaxis]-self.gm_mean[cand])
+        best = np.argmin(err, axis=1)
+        rows = np.arange(cur_features.shape[0])
+        return cand[rows, best], err[rows, best], ln_sf[rows, best], dist[:, -1]**2
+
+    def _search_all(self, cur_features, cur_mean):
+        # exhaustive search over all records (in chunks of targets to limit 
+        # the size of the #target x #record x #IM difference array)
+        num_rows = max(1, 2**24 // max(self.gm_features.size, 1))
+        loc = np.zeros(cur_features.shape[0], dtype=int)
+        min_err = np.zeros(cur_features.shape[0])
+        min_ln_sf = np.zeros(cur_features.shape[0])
+        for i_start in range(0, cur_features.shape[0], num_rows):
+            i_end = min(i_start+num_rows, cur_features.shape[0])
+            dist2 = np.sum((cur_features[i_start:i_end, np.newaxis, :]-self.gm_features[np.newaxis, :, :])**2, axis=2)
+            err, ln_sf = self._get_errors(dist2, cur_mean[i_start:i_end, np.newaxis]-self.gm_mean[np.newaxis, :])
+            best = np.argmin(err, axis=1)
+            rows = np.arange(i_end-i_start)
+            loc[i_start:i_end] = best
+            min_err[i_start:i_end] = err[rows, best]
+            min_ln_sf[i_start:i_end] = ln_sf[rows, best]
+        return loc, min_err, min_ln_sf
+
+    def select_records(self, target_ln_im):
+        """
+        Selecting the best (record, scale factor) for every target
+        target_ln_im: 2-D array of target log IMs (#target, #IM)
+        Candidates are found by a KD-tree over the scale-invariant features. 
+        The best candidate is optimal if its error does not exceed the feature 
+        distance of the farthest candidate (a lower bound of the error of the 
+        other records). Targets failing the bound (e.g., when the best scale 
+        factors are out of the range) are searched again with twice as many 
+        candidates, starting from num_candidates_wide, and the ones left 
+        unverified when the candidates would cover the database are searched 
+        over all records.
+        """
+        target_ln_im = np.atleast_2d(target_ln_im)
+        num_targets = target_ln_im.shape[0]
+        num_candidates = min(self.num_candidates, self.num_gm)
+        self.loc_tag = np.zeros(num_targets, dtype=int)
+        self.min_err = np.zeros(num_targets)
+        self.sf = np.zeros(num_targets)
+        for i_start in range(0, num_targets, self.batch_size):
+            i_end = min(i_start+self.batch_size, num_targets)
+            cur_features, cur_mean = self._get_features(target_ln_im[i_start:i_end])
+            cur_loc, cur_err, cur_ln_sf, bound = self._search_candidates(cur_features, cur_mean, num_candidates)
+            unverified = np.where(cur_err > bound)[0]
+            # wider searches for the unverified targets
+            k = max(num_candidates, min(self.num_candidates_wide, self.num_gm)//2)
+            while len(unverified) and 2*k < self.num_gm:
+                k = 2*k
+                loc, err, ln_sf, bound = self._search_candidates(cur_features[unverified], cur_mean[unverified], k)
+                cur_loc[unverified] = loc
+                cur_err[unverified] = err
+                cur_ln_sf[unverified] = ln_sf
+                unverified = unverified[err > bound]
+            if len(unverified):
+                loc, err, ln_sf = self._search_all(cur_features[unverified], cur_mean[unverified])
+                cur_loc[unverified] = loc
+                cur_err[unverified] = err
+                cur_ln_sf[unverified] = ln_sf
+            self.loc_tag[i_start:i_end] = cur_loc
+            self.sf[i_start:i_end] = np.exp(cur_ln_sf)
+            self.min_err[i_start:i_end] = np.sqrt(cur_err)
+        self.rsn_tag = np.array(self.gmdb_im_df['RSN'])[self.loc_tag].tolist()
+        # return
+        return self.loc_tag, self.sf, self.min_err
+
+
 def select_ground_motion(im_list, target_ln_im, gmdb_file, sf_max, sf_min,
                          output_dir, output_file, stations, eq_ids):
 
@@ -148,18 +286,27 @@ def select_ground_motion(im_list, target_ln_im, gmdb_file, sf_max, sf_min,
                   "PGD": 36,
                   "DS575H": 151,
                   "DS595H": 152}
-        im_loc_tag = []
         gmdb_im_dict = dict()
         gmdb_im_dict.update({'RSN':gmdb['RecId'].values.tolist()})
+        psa_db_array = psa_db.to_numpy(dtype=float)
         for cur_im in im_list:
             if cur_im.startswith('SA'):
+                # linear interpolation of all records at once
                 cur_period = float(cur_im[3:-1])
-                gmdb_im_dict.update({cur_im:[np.interp(cur_period, T_db, psa_db.iloc[k, :]) for k in range(num_gm)]})
+                k = int(np.clip(np.searchsorted(T_db, cur_period)-1, 0, len(T_db)-2))
+                w = np.clip((cur_period-T_db[k])/(T_db[k+1]-T_db[k]), 0.0, 1.0)
+                gmdb_im_dict.update({cur_im:((1.0-w)*psa_db_array[:, k]+w*psa_db_array[:, k+1]).tolist()})
             else:
-                im_loc_tag.append(im_map.get(cur_im, None))
-                gmdb_im_dict.update({cur_im:[x[0] for x in gmdb.iloc[:, im_loc_tag].values.tolist()]})
+                gmdb_im_dict.update({cur_im:gmdb.iloc[:, im_map.get(cur_im, None)].values.tolist()})
         # ground motion database intensity measure data frame
         gmdb_im_df = pd.DataFrame.from_dict(gmdb_im_dict)
+        # batch ground motion selector
+        gm_selector = GM_BatchSelector(gmdb_im_df=gmdb_im_df, sf_min=sf_min, sf_max=sf_max)
+        rec_ids = gmdb['RecId'].to_numpy()
+        file_h1 = np.array(['RSN'+str(int(x))+'_'+str(y).replace("\\","_").replace("/","_") \
+            for x, y in zip(rec_ids, gmdb['FileNameHorizontal1'])], dtype=object)
+        file_h2 = np.array(['RSN'+str(int(x))+'_'+str(y).replace("\\","_").replace("/","_") \
+            for x, y in zip(rec_ids, gmdb['FileNameHorizontal2'])], dtype=object)
         count = 0
         # Looping over all scenarios
         for cur_target in target_ln_im:
@@ -167,24 +314,13 @@ def select_ground_motion(im_list, target_ln_im, gmdb_file, sf_max, sf_min,
             count = count + 1
             print('-Scenario #'+str(tmp_scen))
             num_stations, num_periods, num_simu = cur_target.shape
-            tmp_id = np.zeros((num_stations, num_simu))
-            tmp_sf = np.zeros((num_stations, num_simu))
-            tmp_min_err = np.zeros((num_stations, num_simu))
-            tmp_filename = []
-            for i in range(num_simu):
-                print('--Realization #'+str(i+1))
-                for j in range(num_stations):
-                    # create a ground motion selector
-                    gm_selector = GM_Selector(gmdb_im_df=gmdb_im_df, num_records=1, sf_min=sf_min, sf_max=sf_max, target_im=cur_target[j,:,i])
-                    # select records
-                    gm_selector.select_records()
-                    # collect results
-                    tmp_min_err[j, i] = gm_selector.min_err
-                    tmp_id[j, i] = int(gmdb['RecId'][gm_selector.loc_tag])
-                    tmp_sf[j, i] = gm_selector.sf
-                    tmp_filename.append('RSN'+str(int(tmp_id[j,i]))+'_'+gmdb['FileNameHorizontal1'][gm_selector.loc_tag].replace("\\","_").replace("/","_"))
-                    tmp_filename.append('RSN'+str(int(tmp_id[j,i]))+'_'+gmdb['FileNameHorizontal2'][gm_selector.loc_tag].replace("\\","_").replace("/","_"))
-                    #print('---Station #'+str(j+1))
+            # all stations and realizations (realization-major) at once
+            loc_tag, cur_sf, cur_err = gm_selector.select_records(
+                cur_target.transpose(2, 0, 1).reshape(-1, num_periods))
+            tmp_id = rec_ids[loc_tag].reshape(num_simu, num_stations).T.astype(float)
+            tmp_sf = cur_sf.reshape(num_simu, num_stations).T
+            tmp_min_err = cur_err.reshape(num_simu, num_stations).T
+            tmp_filename = np.column_stack([file_h1[loc_tag], file_h2[loc_tag]]).flatten().tolist()
             # Collecting results in one scenario
             gm_id.append(tmp_id)
             sf_data.append(tmp_sf)
@@ -41,7 +41,13 @@
 import os
 import numpy as np
 import pandas as pd
-from scipy.interpolate import interp1d, interp2d
+from scipy.interpolate import interp1d, interp2d, RegularGridInterpolator
+from scipy.linalg import solve_triangular
+from scipy import sparse
+
+# largest error of the correlation between two sites that the 'LowRank'
+# factor may have before a warning is printed
+LOW_RANK_CORRELATION_TOLERANCE = 0.05
 
 def baker_jayaram_correlation_2008(im1, im2, flag_orth = False):
     """
@@ -214,6 +220,21 @@ def jayaram_baker_correlation_2009(im, h, flag_clustering = False):
     except ValueError:
         print('CorrelationModel.jayaram_baker_correlation_2009: error - cannot handle {}'.format(im))
 
+    b = get_jayaram_baker_range_2009(T, flag_clustering)
+    rho = np.exp(-3.0 * h / b)
+    return rho
+
+
+def get_jayaram_baker_range_2009(T, flag_clustering = False):
+    """
+    Range of the exponential intra-event correlation in Jayaram and Baker (2009)
+    Input:
+        T: Sa period (0.0 for PGA)
+        flag_clustering: the geologic condition of the soil varies widely over
+                         the region (default: false)
+    Output:
+        b: correlation range (km)
+    """
     if T >= 1.0:
         b = 22.0 + 3.7 * T
     else:
@@ -221,8 +242,7 @@ def jayaram_baker_correlation_2009(im, h, flag_clustering = False):
             b = 8.5 + 17.2 * T
         else:
             b = 40.7 - 15.0 * T
-    rho = np.exp(-3.0 * h / b)
-    return rho
+    return b
 
 
 def load_loth_baker_correlation_2013(datapath):
@@ -278,7 +298,8 @@ def compute_rho_loth_baker_correlation_2013(T1, T2, h, B1, B2, B3):
     return rho
 
 
-def loth_baker_correlation_2013(stations, im_name_list, num_simu):
+def loth_baker_correlation_2013(stations, im_name_list, num_simu, method='Cholesky',
+                                num_inducing=2000, cache=None):
     """
     Simulating intra-event residuals
     Reference:
@@ -288,6 +309,9 @@ def loth_baker_correlation_2013(stations, im_name_list, num_simu):
         stations: stations coordinates
         im_name_list: simulated intensity measure names
         num_simu: number of realizations
+        method: 'Cholesky' or 'LowRank' (see get_spatial_correlation_factor)
+        num_inducing: number of inducing sites for 'LowRank'
+        cache: dict to keep the spatial factors between calls (optional)
     Output:
         residuals: intra-event residuals
     Note:
@@ -305,40 +329,50 @@ def loth_baker_correlation_2013(stations, im_name_list, num_simu):
             print('CorrelationModel.loth_baker_correlation_2013: error - cannot handle {}'.format(cur_im))
     # Loading modeling coefficients
     B1, B2, B3 = load_loth_baker_correlation_2013(os.path.dirname(__file__) + '/data/')
-    # Computing distance matrix
-    num_stations = len(stations)
-    stn_dist = np.zeros((num_stations, num_stations))
-    for i in range(num_stations):
-        loc_i = np.array([stations[i]['Latitude'],
-                          stations[i]['Longitude']])
-        for j in range(num_stations):
-            loc_j = np.array([stations[j]['Latitude'],
-                              stations[j]['Longitude']])
-            stn_dist[i, j] = get_distance_from_lat_lon(loc_i, loc_j)
-    # Creating a covariance matrices for each of the principal components
+    # Station coordinates
+    lat, lon = get_station_lat_lon(stations)
+    num_stations = len(lat)
     num_periods = len(periods)
-    covMatrix = np.zeros((num_stations * num_periods, num_stations * num_periods))
-    for i in range(num_periods):
-        for j in range(num_periods):
-            covMatrix[num_stations * i:num_stations * (i + 1), num_stations * j:num_stations * (j + 1)] = \
-                compute_rho_loth_baker_correlation_2013(periods[i], periods[j], stn_dist, B1, B2, B3)
-
-    mu = np.zeros(num_stations * num_periods)
-    residuals_raw = np.random.multivariate_normal(mu, covMatrix, num_simu)
-    # reorder residual_raw [[period1],[period2],...,[]]-->[[site1],[site2],...,[]]
-    residuals_reorder = []
-    for i in range(num_simu):
-        tmp = []
-        for j in range(num_stations):
-            for k in range(num_periods):
-                tmp.append(residuals_raw[i,j+k*num_stations])
-        residuals_reorder.append(tmp)
-    residuals_reorder = np.array(residuals_reorder)
-    residuals = residuals_reorder.reshape(num_simu, num_stations, num_periods).swapaxes(0,1).swapaxes(1,2)
+    # The covariance is a linear model of coregionalization:
+    # C = B1 x exp(-3h/20) + B2 x exp(-3h/70) + B3 x (h == 0)
+    # so each term is simulated as L_site @ Z @ L_B^T with the spatial
+    # factors computed once (and cached) for the station set
+    site_factors = [get_exponential_correlation_factor(lat, lon, 20.0, method=method,
+                        num_inducing=num_inducing, cache=cache),
+                    get_exponential_correlation_factor(lat, lon, 70.0, method=method,
+                        num_inducing=num_inducing, cache=cache),
+                    get_nugget_correlation_factor(lat, lon, cache=cache)]
+    residuals = np.zeros((num_stations, num_periods, num_simu))
+    for B, site_factor in zip([B1, B2, B3], site_factors):
+        b = interp_loth_baker_coregionalization_2013(B, periods)
+        L_B = get_psd_factor(b)
+        Z = sample_spatial_residuals(site_factor, num_periods * num_simu)
+        residuals += np.einsum('pq,nqs->nps', L_B,
+                               Z.reshape(num_stations, num_periods, num_simu))
     # return
     return residuals
 
 
+def interp_loth_baker_coregionalization_2013(B, periods):
+    """
+    Interpolating a Loth and Baker (2013) coregionalization matrix at the
+    simulated periods (periods out of the tabulated range are given the
+    boundary value)
+    Input:
+        B: coregionalization matrix from load_loth_baker_correlation_2013
+        periods: list of Sa periods
+    Output:
+        b: coregionalization matrix of the simulated periods
+    """
+    model_periods = B['Period (s)'].to_numpy(dtype=float)
+    interp_fun = RegularGridInterpolator((model_periods, model_periods),
+                                         B.iloc[:, 1:].to_numpy(dtype=float))
+    T = np.clip(np.asarray(periods, dtype=float), model_periods.min(), model_periods.max())
+    T1, T2 = np.meshgrid(T, T, indexing='ij')
+    b = interp_fun(np.column_stack([T2.ravel(), T1.ravel()])).reshape(T1.shape)
+    return b
+
+
 def load_markhvida_ceferino_baker_correlation_2017(datapath):
     """
     Loading the three matrices in the Markhivida et al. correaltion model (2017)
@@ -362,7 +396,8 @@ def load_markhvida_ceferino_baker_correlation_2017(datapath):
     return MCB_model, MCB_pca, MCB_var
 
 
-def markhvida_ceferino_baker_correlation_2017(stations, im_name_list, num_simu, num_pc=19):
+def markhvida_ceferino_baker_correlation_2017(stations, im_name_list, num_simu, num_pc=19,
+        method='Cholesky', num_inducing=2000, cache=None):
     """
     Simulating intra-event residuals
     Reference:
@@ -374,6 +409,9 @@ def markhvida_ceferino_baker_correlation_2017(stations, im_name_list, num_simu,
         im_name_list: simulated intensity measure names
         num_simu: number of realizations
         num_pc: number of principle components
+        method: 'Cholesky' or 'LowRank' (see get_spatial_correlation_factor)
+        num_inducing: number of inducing sites for 'LowRank'
+        cache: dict to keep the spatial factors between calls (optional)
     Output:
         residuals: intra-event residuals
     Note:
@@ -406,36 +444,20 @@ def markhvida_ceferino_baker_correlation_2017(stations, im_name_list, num_simu,
     a2 = a2[a2.keys()[1:]]
     model_periods = MCB_pca['Period (s)']
     model_coef = MCB_pca.iloc[:, 1:num_pc + 1]
-    # Computing distance matrix
-    num_stations = len(stations)
-    stn_dist = np.zeros((num_stations, num_stations))
-    for i in range(num_stations):
-        loc_i = np.array([stations[i]['lat'],
-                          stations[i]['lon']])
-        for j in range(num_stations):
-            loc_j = np.array([stations[j]['lat'],
-                              stations[j]['lon']])
-            stn_dist[i, j] = get_distance_from_lat_lon(loc_i, loc_j)
+    # Station coordinates
+    lat, lon = get_station_lat_lon(stations)
+    num_stations = len(lat)
     # Scaling variance if less than 19 principal components are used
     c0 = c0 / MCB_var.iloc[0, num_pc - 1]
     c1 = c1 / MCB_var.iloc[0, num_pc - 1]
     c2 = c2 / MCB_var.iloc[0, num_pc - 1]
-    # Creating a covariance matrices for each of the principal components
-    covMatrix = np.zeros((num_stations, num_stations, num_pc))
-    for i in range(num_pc):
-        if c1.iloc[0, i] == 0:
-            # nug
-            covMatrix[:, :, i] = np.eye(num_stations) * c0.iloc[0, i]
-        else:
-            # iso nest
-            covMatrix[:, :, i] = c0.iloc[0, i] * (stn_dist == 0)+ \
-                                 c1.iloc[0, i] * np.exp(-3.0 * stn_dist / a1.iloc[0, i]) + \
-                                 c2.iloc[0, i] * np.exp(-3.0 * stn_dist / a2.iloc[0, i])
-    # Simulating residuals
+    # Simulating residuals of each principal component (nugget + two
+    # nested exponential structures)
     residuals_pca = np.zeros((num_stations, num_simu, num_pc))
-    mu = np.zeros(num_stations)
     for i in range(num_pc):
-        residuals_pca[:, :, i] = np.random.multivariate_normal(mu, covMatrix[:, :, i], num_simu).T
+        residuals_pca[:, :, i] = simulate_nested_exponential_residuals(lat, lon,
+            c0.iloc[0, i], c1.iloc[0, i], a1.iloc[0, i], c2.iloc[0, i], a2.iloc[0, i],
+            num_simu, method=method, num_inducing=num_inducing, cache=cache)
     # Interpolating model_coef by periods
     interp_fun = interp1d(model_periods, model_coef, axis = 0)
     model_Tmax = 5.0
@@ -487,7 +509,8 @@ def load_du_ning_correlation_2021(datapath):
     return DN_model, DN_pca, DN_var
 
 
-def du_ning_correlation_2021(stations, im_name_list, num_simu, num_pc=23):
+def du_ning_correlation_2021(stations, im_name_list, num_simu, num_pc=23,
+        method='Cholesky', num_inducing=2000, cache=None):
     """
     Simulating intra-event residuals
     Reference:
@@ -499,6 +522,9 @@ def du_ning_correlation_2021(stations, im_name_list, num_simu, num_pc=23):
         im_name_list: simulated intensity measure names
         num_simu: number of realizations
         num_pc: number of principle components
+        method: 'Cholesky' or 'LowRank' (see get_spatial_correlation_factor)
+        num_inducing: number of inducing sites for 'LowRank'
+        cache: dict to keep the spatial factors between calls (optional)
     Output:
         residuals: intra-event residuals
     Note:
@@ -532,36 +558,20 @@ def du_ning_correlation_2021(stations, im_name_list, num_simu, num_pc=23):
     model_periods = [float(x) for x in model_periods if x not in model_ims_list]+ \
         [x for x in model_periods if x in model_ims_list]
     model_coef = DN_pca.iloc[:, 1:num_pc + 1]
-    # Computing distance matrix
-    num_stations = len(stations)
-    stn_dist = np.zeros((num_stations, num_stations))
-    for i in range(num_stations):
-        loc_i = np.array([stations[i]['lat'],
-                          stations[i]['lon']])
-        for j in range(num_stations):
-            loc_j = np.array([stations[j]['lat'],
-                              stations[j]['lon']])
-            stn_dist[i, j] = get_distance_from_lat_lon(loc_i, loc_j)
+    # Station coordinates
+    lat, lon = get_station_lat_lon(stations)
+    num_stations = len(lat)
     # Scaling variance if less than 23 principal components are used
     c1 = c1 / DN_var.iloc[0, num_pc - 1]
     a1 = a1 / DN_var.iloc[0, num_pc - 1]
     a2 = a2 / DN_var.iloc[0, num_pc - 1]
-    # Creating a covariance matrices for each of the principal components
-    covMatrix = np.zeros((num_stations, num_stations, num_pc))
-    for i in range(num_pc):
-        if a1.iloc[0, i] == 0:
-            # nug
-            covMatrix[:, :, i] = np.eye(num_stations) * c1.iloc[0, i]
-        else:
-            # iso nest
-            covMatrix[:, :, i] = c1.iloc[0, i] * (stn_dist == 0) + \
-                                 a1.iloc[0, i] * np.exp(-3.0 * stn_dist / b1.iloc[0, i]) + \
-                                 a2.iloc[0, i] * np.exp(-3.0 * stn_dist / b2.iloc[0, i])
-    # Simulating residuals
+    # Simulating residuals of each principal component (nugget + two
+    # nested exponential structures)
     residuals_pca = np.zeros((num_stations, num_simu, num_pc))
-    mu = np.zeros(num_stations)
     for i in range(num_pc):
-        residuals_pca[:, :, i] = np.random.multivariate_normal(mu, covMatrix[:, :, i], num_simu).T
+        residuals_pca[:, :, i] = simulate_nested_exponential_residuals(lat, lon,
+            c1.iloc[0, i], a1.iloc[0, i], b1.iloc[0, i], a2.iloc[0, i], b2.iloc[0, i],
+            num_simu, method=method, num_inducing=num_inducing, cache=cache)
     # Interpolating model_coef by periods
     pseudo_periods = [x for x in model_periods if type(x)==float]+ \
         [ims_map[x] for x in model_periods if type(x)==str]
@@ -694,4 +704,305 @@ def get_distance_from_lat_lon(site_loc1, site_loc2):
     dlon = lon2 - lon1
     dist = 2.0*earth_radius_avg*np.arcsin(np.sqrt(np.sin(0.5*dlat)**2+np.cos(lat1)*np.cos(lat2)*np.sin(0.5*dlon)**2))
     # return
-    return dist
\ No newline at end of file
+    return dist
+
+
+def get_distance_matrix(lat1, lon1, lat2=None, lon2=None, dtype=np.float64,
+                        block_size=1024):
+    """
+    Computing the haversine distance matrix between two sets of sites
+    Input:
+        lat1, lon1: latitudes and longitudes of the 1st set of sites
+        lat2, lon2: latitudes and longitudes of the 2nd set of sites
+                    (default: the 1st set)
+        dtype: data type of the output matrix (e.g., np.float32 to halve
+               the memory of large regions)
+        block_size: number of rows evaluated in one broadcast
+    Output:
+        dist: distance matrix (km) of shape (len(lat1), len(lat2))
+    """
+    lat1 = np.asarray(lat1, dtype=np.float64).ravel()
+    lon1 = np.asarray(lon1, dtype=np.float64).ravel()
+    if lat2 is None:
+        lat2, lon2 = lat1, lon1
+    else:
+        lat2 = np.asarray(lat2, dtype=np.float64).ravel()
+        lon2 = np.asarray(lon2, dtype=np.float64).ravel()
+    dist = np.empty((len(lat1), len(lat2)), dtype=dtype)
+    for i in range(0, len(lat1), block_size):
+        dist[i:i + block_size, :] = get_distance_from_lat_lon(
+            (lat1[i:i + block_size, None], lon1[i:i + block_size, None]),
+            (lat2[None, :], lon2[None, :]))
+    # return
+    return dist
+
+
+def get_station_lat_lon(stations):
+    """
+    Getting the latitudes and longitudes of the stations
+    Input:
+        stations: list of stations with 'lat'/'lon' or 'Latitude'/'Longitude'
+    Output:
+        lat, lon: arrays of station latitudes and longitudes
+    """
+    if len(stations) and 'lat' in stations[0]:
+        lat = np.array([x['lat'] for x in stations], dtype=float)
+        lon = np.array([x['lon'] for x in stations], dtype=float)
+    else:
+        lat = np.array([x['Latitude'] for x in stations], dtype=float)
+        lon = np.array([x['Longitude'] for x in stations], dtype=float)
+    return lat, lon
+
+
+def get_correlation_sampling_method(method):
+    """
+    Resolving the spatial correlation sampling method
+    Input:
+        method: 'Cholesky' or 'LowRank'
+    Output:
+        method: 'Cholesky' or 'LowRank' (unsupported methods use the exact
+                'Cholesky' factor)
+    """
+    if method not in ['Cholesky', 'LowRank']:
+        print('CorrelationModel.get_correlation_sampling_method: warning - {} is not supported, using Cholesky.'.format(method))
+        return 'Cholesky'
+    return method
+
+
+def get_psd_factor(mat):
+    """
+    Factorizing a symmetric positive semi-definite matrix as mat = L @ L.T
+    (Cholesky, falling back to the eigen-decomposition with the tiny
+    negative eigen values clipped for singular matrices, e.g., co-located
+    sites)
+    """
+    try:
+        return np.linalg.cholesky(mat)
+    except np.linalg.LinAlgError:
+        w, v = np.linalg.eigh(mat)
+        return v * np.sqrt(np.clip(w, 0.0, None))
+
+
+def get_spatial_correlation_factor(lat, lon, corr_fun, method='Cholesky',
+                                   num_inducing=2000, dtype=np.float64,
+                                   tolerance=LOW_RANK_CORRELATION_TOLERANCE):
+    """
+    Factorizing the spatial correlation matrix of a set of sites once so
+    that any number of realizations is drawn by one matrix product
+    Input:
+        lat, lon: latitudes and longitudes of the sites
+        corr_fun: correlation as a function of the site distance (km),
+                  evaluated on numpy arrays
+        method: 'Cholesky' - exact dense factor, O(N^2) memory
+                'LowRank' - Nystrom approximation on num_inducing sites
+                            plus a diagonal correction that keeps the unit
+                            variance, O(N*num_inducing) memory. This is an
+                            approximation, not an equivalent of 'Cholesky':
+                            the correlation that the inducing sites do not
+                            capture is moved into uncorrelated noise, so the
+                            site-to-site correlations are underestimated
+        num_inducing: number of inducing sites for 'LowRank'
+        dtype: data type of the distances and of the factor
+        tolerance: largest correlation error of the 'LowRank' factor (see
+                   check_low_rank_correlation_factor) before a warning
+    Output:
+        factor: (L, d, loc_index) so that rho ~= L @ L.T + diag(d**2), d is
+                None for the exact factor, the diagonal correction is drawn
+                per unique location (loc_index) so that co-located sites
+                stay fully correlated
+    """
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    num_sites = len(lat)
+    if method == 'Cholesky' or num_sites <= num_inducing:
+        rho = corr_fun(get_distance_matrix(lat, lon, dtype=dtype))
+        return get_psd_factor(rho), None, None
+    # inducing sites (unique locations, fixed seed for repeatable factors)
+    _, unique_ind, loc_index = np.unique(np.column_stack([lat, lon]), axis=0,
+                                         return_index=True, return_inverse=True)
+    if len(unique_ind) > num_inducing:
+        unique_ind = np.sort(np.random.default_rng(0).choice(unique_ind, num_inducing,
+                                                             replace=False))
+    rho_mm = corr_fun(get_distance_matrix(lat[unique_ind], lon[unique_ind]))
+    L_mm = get_psd_factor(rho_mm + 1e-10 * np.eye(len(unique_ind)))
+    L = np.empty((num_sites, len(unique_ind)), dtype=dtype)
+    block_size = 4096
+    for i in range(0, num_sites, block_size):
+        rho_nm = corr_fun(get_distance_matrix(lat[i:i + block_size], lon[i:i + block_size],
+                                              lat[unique_ind], lon[unique_ind]))
+        L[i:i + block_size, :] = solve_triangular(L_mm, rho_nm.T, lower=True).T
+    d = np.sqrt(np.clip(corr_fun(np.zeros(num_sites)) - np.sum(L * L, axis=1), 0.0, None))
+    factor = (L, d.astype(dtype), np.asarray(loc_index).ravel())
+    max_error, lost_variance = check_low_rank_correlation_factor(lat, lon, corr_fun, factor)
+    if max_error > tolerance:
+        print('CorrelationModel.get_spatial_correlation_factor: warning - the LowRank factor '
+              'with {} inducing sites misses the correlation between sites by up to {:.3f} '
+              '(tolerance {}) and leaves {:.1%} of the variance uncorrelated, increase '
+              'NumInducingSites or use Cholesky.'.format(
+              L.shape[1], max_error, tolerance, lost_variance))
+    return factor
+
+
+def check_low_rank_correlation_factor(lat, lon, corr_fun, factor, num_rows=500,
+                                      block_size=100):
+    """
+    Reconstruction error of a 'LowRank' spatial correlation factor against
+    the exact correlation, evaluated on the full rows of a random sample of
+    sites (so that the close site pairs, where the error is largest, are
+    included)
+    Input:
+        lat, lon: latitudes and longitudes of the sites
+        corr_fun: correlation as a function of the site distance (km)
+        factor: (L, d, loc_index) from get_spatial_correlation_factor
+        num_rows: number of sampled sites
+        block_size: number of rows evaluated in one broadcast
+    Output:
+        max_error: largest absolute correlation error of the sampled rows
+        lost_variance: mean fraction of the site variance that the diagonal
+                       correction draws as uncorrelated noise
+    """
+    L, d, loc_index = factor
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    num_sites = len(lat)
+    rows = np.arange(num_sites)
+    if num_sites > num_rows:
+        rows = np.sort(np.random.default_rng(0).choice(num_sites, num_rows, replace=False))
+    max_error = 0.0
+    for i in range(0, len(rows), block_size):
+        cur_rows = rows[i:i + block_size]
+        rho = corr_fun(get_distance_matrix(lat[cur_rows], lon[cur_rows], lat, lon))
+        rho_approx = L[cur_rows] @ L.T
+        same_loc = loc_index[cur_rows][:, None] == loc_index[None, :]
+        rho_approx = rho_approx + np.where(same_loc, d[cur_rows][:, None] * d[None, :], 0.0)
+        max_error = max(max_error, float(np.max(np.abs(rho - rho_approx))))
+    lost_variance = np.mean(d ** 2 / corr_fun(np.zeros(num_sites)))
+    return max_error, float(lost_variance)
+
+
+def get_factor_nbytes(factor):
+    """
+    Memory size (bytes) of a spatial correlation factor (L, d, loc_index)
+    """
+    nbytes = 0
+    for x in factor:
+        if x is None:
+            continue
+        if sparse.issparse(x):
+            nbytes += x.data.nbytes + x.indices.nbytes + x.indptr.nbytes
+        else:
+            nbytes += np.asarray(x).nbytes
+    return nbytes
+
+
+class CorrelationFactorCache:
+    """
+    Size-bounded cache of the spatial correlation factors of a site set
+    (used as the cache of the *_correlation_factor functions). Factors are
+    added while their total size stays within max_bytes and the ones that
+    do not fit are recomputed when used. Nothing is evicted: the factors
+    are used in the same order (e.g., by period) in every scenario, so an
+    LRU eviction would drop each factor right before it is used again.
+    """
+    def __init__(self, max_bytes=2 * 1024 ** 3):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.factors = dict()
+
+    def __contains__(self, key):
+        return key in self.factors
+
+    def __getitem__(self, key):
+        return self.factors[key]
+
+    def __setitem__(self, key, factor):
+        nbytes = get_factor_nbytes(factor)
+        if key in self.factors:
+            self.nbytes -= get_factor_nbytes(self.factors.pop(key))
+        if self.nbytes + nbytes <= self.max_bytes:
+            self.factors[key] = factor
+            self.nbytes += nbytes
+
+    def __len__(self):
+        return len(self.factors)
+
+
+def get_exponential_correlation_factor(lat, lon, corr_range, method='Cholesky',
+                                       num_inducing=2000, cache=None, dtype=np.float64):
+    """
+    Factorizing the exponential correlation exp(-3h/corr_range) of a set of
+    sites (see get_spatial_correlation_factor), cached by the range
+    """
+    key = ('Exponential', float(corr_range), method, num_inducing, np.dtype(dtype).str)
+    if cache is not None and key in cache:
+        return cache[key]
+    factor = get_spatial_correlation_factor(lat, lon,
+        lambda h: np.exp(-3.0 * h / corr_range), method=method,
+        num_inducing=num_inducing, dtype=dtype)
+    if cache is not None:
+        cache[key] = factor
+    return factor
+
+
+def get_nugget_correlation_factor(lat, lon, cache=None):
+    """
+    Factorizing the nugget correlation (h == 0) of a set of sites exactly,
+    co-located sites share the same standard normal variable
+    Output:
+        factor: (L, None, None) where L is a sparse
+                (num_sites x num_locations) indicator matrix
+    """
+    key = ('Nugget',)
+    if cache is not None and key in cache:
+        return cache[key]
+    _, inverse = np.unique(np.column_stack([lat, lon]), axis=0, return_inverse=True)
+    inverse = np.asarray(inverse).ravel()
+    L = sparse.csr_matrix((np.ones(len(inverse)), (np.arange(len(inverse)), inverse)),
+                          shape=(len(inverse), inverse.max() + 1))
+    factor = (L, None, None)
+    if cache is not None:
+        cache[key] = factor
+    return factor
+
+
+def sample_spatial_residuals(factor, num_simu):
+    """
+    Drawing spatially correlated standard normal residuals
+    Input:
+        factor: (L, d, loc_index) from get_spatial_correlation_factor
+        num_simu: number of realizations
+    Output:
+        residuals: (num_sites, num_simu)
+    """
+    L, d, loc_index = factor
+    residuals = np.asarray(L @ np.random.standard_normal((L.shape[1], num_simu)))
+    if d is not None:
+        residuals = residuals + d[:, None] * np.random.standard_normal(
+            (loc_index.max() + 1, num_simu))[loc_index, :]
+    return residuals
+
+
+def simulate_nested_exponential_residuals(lat, lon, nugget, sill1, range1, sill2, range2,
+                                          num_simu, method='Cholesky', num_inducing=2000,
+                                          cache=None):
+    """
+    Simulating residuals with the covariance
+    nugget * (h == 0) + sill1 * exp(-3h/range1) + sill2 * exp(-3h/range2)
+    as a sum of independent fields (a pure nugget, i.e., sill1 = 0, gives
+    uncorrelated residuals)
+    Output:
+        residuals: (num_sites, num_simu)
+    """
+    num_sites = len(lat)
+    if sill1 == 0:
+        return np.sqrt(nugget) * np.random.standard_normal((num_sites, num_simu))
+    residuals = np.zeros((num_sites, num_simu))
+    if nugget > 0:
+        residuals += np.sqrt(nugget) * sample_spatial_residuals(
+            get_nugget_correlation_factor(lat, lon, cache=cache), num_simu)
+    for sill, corr_range in [(sill1, range1), (sill2, range2)]:
+        if sill > 0:
+            residuals += np.sqrt(sill) * sample_spatial_residuals(
+                get_exponential_correlation_factor(lat, lon, corr_range, method=method,
+                    num_inducing=num_inducing, cache=cache), num_simu)
+    return residuals
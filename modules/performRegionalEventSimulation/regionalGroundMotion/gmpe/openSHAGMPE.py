@@ -43,6 +43,58 @@ import pandas as pd
 import os
 import time
 import sys
+
+SITE_ARRAY_KEYS = ['rJB', 'rRup', 'rX', 'vs30', 'z1pt0', 'z2pt5']
+
+def get_site_arrays(site_info):
+    """
+    Stack the site list (one dict per site) into column vectors of shape
+    (num_sites, 1) so that they broadcast against the (1, num_periods)
+    coefficient matrices in the batched GMPE calls.
+    z1pt0 and z2pt5 are converted from m to km as in get_IM.
+    """
+    site_arrays = {}
+    for key in SITE_ARRAY_KEYS:
+        site_arrays[key] = np.array([x.get(key, np.nan) for x in site_info],
+                                    dtype=float).reshape(-1, 1)
+    site_arrays['z1pt0'] = site_arrays['z1pt0'] / 1000.0
+    site_arrays['z2pt5'] = site_arrays['z2pt5'] / 1000.0
+    site_arrays['vsInferred'] = np.array([bool(x.get('vsInferred', False))
+                                          for x in site_info]).reshape(-1, 1)
+    return site_arrays
+
+def get_im_periods(im_info):
+    if 'SA' in im_info['Type']:
+        cur_T = im_info.get('Periods', None)
+    elif im_info['Type'] == 'PGA':
+        cur_T = ['PGA']
+    elif im_info['Type'] == 'PGV':
+        cur_T = ['PGV']
+    else:
+        print(f'The IM type {im_info["Type"]} is not supported')
+        cur_T = []
+    return cur_T
+
+def get_coeff_matrix(coeff, supportedImt, imt_list, gmpe_name):
+    """
+    Collect the coefficients of all the requested periods into arrays of
+    shape (1, num_periods), keyed by the coefficient name.
+    """
+    for imt in imt_list:
+        if imt not in supportedImt:
+            sys.exit(f"The imt {imt} is not supported by {gmpe_name}")
+    return {key: np.array([values[imt] for imt in imt_list],
+                          dtype=float).reshape(1, -1)
+            for key, values in coeff.items()}
+
+def get_batch_result(calc_res, num_sites):
+    # calc_res: mean, stdDev, InterEvStdDev, IntraEvStdDev
+    shape = (num_sites, calc_res[0].shape[1])
+    return {'Mean': np.broadcast_to(calc_res[0], shape),
+            'TotalStdDev': np.broadcast_to(calc_res[1], shape),
+            'InterEvStdDev': np.broadcast_to(calc_res[2], shape),
+            'IntraEvStdDev': np.broadcast_to(calc_res[3], shape)}
+
 ############### Chiou and Young (2014)
 class chiou_youngs_2013():
     timeSetImt = 0
@@ -66,6 +118,7 @@ class chiou_youngs_2013():
         self.A = np.power(571, 4)
         self.B = np.power(1360, 4) + self.A
         self.CRBsq = self.CRB * self.CRB
+        self.coeffMatrixCache = {}
         
     def setIMT(self, imt):
         if imt not in self.supportedImt:
@@ -272,6 +325,75 @@ class chiou_youngs_2013():
         #     siteSpec = station_info['SiteList']
         # for i in range(len(site_list)):
 
+    # Batched evaluation: site arrays are (num_sites, 1) and the coefficient
+    # matrix is (1, num_periods), results are (num_sites, num_periods)
+    def getCoeffMatrix(self, imt_list):
+        key = tuple(imt_list)
+        if key not in self.coeffMatrixCache:
+            self.coeffMatrixCache[key] = get_coeff_matrix(self.coeff, 
+                self.supportedImt, imt_list, "Chiou and Young (2014)")
+        return self.coeffMatrixCache[key]
+
+    def calcSArefBatch(self, C, Mw, rJB, rRup, rX, dip, zTop, style):
+        r1 = C["c1"] + self.C2 * (Mw - 6.0) + ((self.C2 - C["c3"]) / C["cn"]) * np.log(1.0 + np.exp(C["cn"] * (C["cM"] - Mw)))
+        r2 = self.C4 * np.log(rRup + C["c5"] * np.cosh(C["c6"] * np.maximum(Mw - C["cHM"], 0.0)))
+        gamma = (C["cgamma1"] + C["cgamma2"] / np.cosh(np.maximum(Mw - C["cgamma3"], 0.0)))
+        r3 = self.dC4 * np.log(np.sqrt(rRup * rRup + self.CRBsq)) + rRup * gamma
+        coshM = np.cosh(2 * max(Mw - 4.5, 0))
+        cosDelta = np.cos(dip * np.pi/180.0)
+        deltaZtop = zTop - self.calcMwZtop(style, Mw)
+        r4 = (C["c7"] + C["c7b"] / coshM) * deltaZtop + (self.C11 + C["c11b"] / coshM) * cosDelta * cosDelta
+        if style == "REVERSE":
+            r4 = r4 + C["c1a"] + C["c1c"] / coshM
+        elif style == "NORMAL":
+            r4 = r4 + C["c1b"] + C["c1d"] / coshM
+        r5 = np.where(rX >= 0.0, C["c9"] * cosDelta * (C["c9a"] + (1.0 - C["c9a"]) * np.tanh(rX / C["c9b"])) * (1 - np.sqrt(rJB * rJB + zTop * zTop) / (rRup + 1.0)), 0.0)
+        return np.exp(r1 + r2 + r3 + r4 + r5)
+
+    def calcBatch(self, C, Mw, rJB, rRup, rX, dip, zTop, vs30, vsInf, z1p0, style):
+        """
+        Batched version of calc: all sites and all periods in one broadcast.
+        rJB, rRup, rX, vs30, vsInf and z1p0 are (num_sites, 1) arrays and C
+        is the coefficient matrix returned by getCoeffMatrix.
+        """
+        saRef = self.calcSArefBatch(C, Mw, rJB, rRup, rX, dip, zTop, style)
+        exp1 = np.exp(C["phi3"] * (np.minimum(vs30, 1130.0) - 360.0))
+        exp2 = np.exp(C["phi3"] * (1130.0 - 360.0))
+        soilNonLin = C["phi2"] * (exp1 - exp2)
+        # mean
+        sl = C["phi1"] * np.minimum(np.log(vs30 / 1130.0), 0.0)
+        snl = soilNonLin * np.log((saRef + C["phi4"]) / C["phi4"])
+        dZ1 = np.where(np.isnan(z1p0), 0.0, 1000.0 * (z1p0 - self.calcZ1ref(vs30)))
+        rkdepth = C["phi5"] * (1.0 - np.exp(-dZ1 / self.PHI6))
+        mean = np.log(saRef) + sl + snl + rkdepth
+        # aleatory uncertainty
+        NL0 = soilNonLin * saRef / (saRef + C["phi4"])
+        NL0sq = (1 + NL0) * (1 + NL0)
+        mTest = min(max(Mw, 5.0), 6.5) - 5.0
+        tau = C["tau1"] + (C["tau2"] - C["tau1"]) / 1.5 * mTest
+        tauSq = tau * tau * NL0sq
+        sigmaNL0 = C["sigma1"] + (C["sigma2"] - C["sigma1"]) / 1.5 * mTest
+        vsTerm = np.where(vsInf, C["sigma3"], 0.7)
+        sigmaNL0 = sigmaNL0 * np.sqrt(vsTerm + NL0sq)
+        phiSq = sigmaNL0 * sigmaNL0
+        stdDev = np.sqrt(tauSq + phiSq)
+        return mean, stdDev, np.sqrt(tauSq), np.sqrt(phiSq)
+
+    def get_IM_batch(self, Mw, site_rup_dict, site_arrays, im_info):
+        """
+        Evaluate all sites and periods at once, site_arrays is the output
+        of get_site_arrays. Returns (num_sites, num_periods) arrays.
+        """
+        style = self.getFaultFromRake(site_rup_dict["aveRake"])
+        cur_T = get_im_periods(im_info)
+        start = time.process_time_ns()
+        C = self.getCoeffMatrix(cur_T)
+        self.timeSetImt += time.process_time_ns() - start
+        start = time.process_time_ns()
+        res = self.calcBatch(C, Mw, site_arrays["rJB"], site_arrays["rRup"], site_arrays["rX"], site_rup_dict["dip"], site_rup_dict["zTop"], site_arrays["vs30"], site_arrays["vsInferred"], site_arrays["z1pt0"], style)
+        self.timeCalc += time.process_time_ns() - start
+        return get_batch_result(res, site_arrays["vs30"].shape[0])
+
 ############## Abrahamson, Silva, and Kamai (2014)
 class abrahamson_silva_kamai_2014():
     timeSetImt = 0
@@ -301,6 +423,7 @@ class abrahamson_silva_kamai_2014():
         self.H2 = 1.5
         self.H3 = -0.75
         self.PHI_AMP_SQ = 0.16
+        self.coeffMatrixCache = {}
 
     def setIMT(self, imt):
         if imt not in self.supportedImt:
@@ -520,6 +643,127 @@ class abrahamson_silva_kamai_2014():
                 'IntraEvStdDev': IntraEvStdDevList}
         return saResult
 
+    # Batched evaluation: site arrays are (num_sites, 1) and the coefficient
+    # matrix is (1, num_periods), results are (num_sites, num_periods)
+    def getCoeffMatrix(self, imt_list):
+        key = tuple(imt_list)
+        if key not in self.coeffMatrixCache:
+            C = get_coeff_matrix(self.coeff, self.supportedImt, imt_list,
+                                 "Abrahamson, Silva, and Kamai (2014)")
+            # period dependent V1 -- Equation 9
+            imt_tmp = getattr(self, 'imt', None)
+            v1 = []
+            for imt in imt_list:
+                self.imt = imt
+                v1.append(self.getV1())
+            self.imt = imt_tmp
+            C["v1"] = np.array(v1, dtype=float).reshape(1, -1)
+            self.coeffMatrixCache[key] = C
+        return self.coeffMatrixCache[key]
+
+    def calcSoilTermBatch(self, C, vs30, z1p0):
+        z1ref = self.calcZ1ref(vs30)
+        VS_BINS = np.array([150.0, 250.0, 400.0, 700.0, 1000.0])
+        vsCoeff = np.concatenate([C["a43"], C["a44"], C["a45"], C["a46"], C["a46"]])
+        # np.interp is linear in the ordinates, so interpolate the unit
+        # vectors once and combine them with the coefficients of all periods
+        weights = np.column_stack([np.interp(vs30[:, 0], VS_BINS, e)
+                                   for e in np.eye(len(VS_BINS))])
+        z1c = weights @ vsCoeff
+        return np.where(np.isnan(z1p0), 0.0,
+                        z1c * np.log((z1p0 + 0.01) / (z1ref + 0.01)))
+
+    def calcValuesBatch(self, C, Mw, rJB, rRup, rX, rY0, dip, width, zTop, vs30, vsInferred, z1p0, style):
+        """
+        Batched version of calcValues: all sites and all periods in one
+        broadcast. rJB, rRup, rX, vs30, vsInferred and z1p0 are
+        (num_sites, 1) arrays and C is the coefficient matrix returned by
+        getCoeffMatrix.
+        """
+        if Mw > 5:
+            c4mag = self.C4
+        elif Mw > 4:
+            c4mag = self.C4 - (self.C4 - 1.0) * (5.0 - Mw)
+        else:
+            c4mag = 1.0
+        # -- Equation 3
+        R = np.sqrt(rRup * rRup + c4mag * c4mag)
+        lnR = np.log(R)
+        # -- Equation 2
+        MaxMwSq = (8.5 - Mw) * (8.5 - Mw)
+        MwM1 = Mw - C["M1"]
+        M2M1 = self.M2 - C["M1"]
+        MaxM2Sq = (8.5 - self.M2) * (8.5 - self.M2)
+        f1 = C["a1"] + C["a17"] * rRup + np.where(Mw > C["M1"],
+            self.A5 * MwM1 + C["a8"] * MaxMwSq + (C["a2"] + self.A3 * MwM1) * lnR,
+            np.where(Mw >= self.M2,
+            self.A4 * MwM1 + C["a8"] * MaxMwSq + (C["a2"] + self.A3 * MwM1) * lnR,
+            self.A4 * M2M1 + C["a8"] * MaxM2Sq + C["a6"] * (Mw - self.M2) + (C["a2"] + self.A3 * M2M1) * lnR))
+        # Hanging Wall Model
+        f4 = np.zeros_like(rRup)
+        if Mw > 5.5 and zTop <= 10.0:
+            T1 = ((90.0 - dip) / 45 if (dip > 30.0) else 1.33333333)
+            dM = Mw - 6.5
+            T2 = (1 + self.A2_HW * dM if Mw>=6.5 else 1 + self.A2_HW * dM - (1 - self.A2_HW) * dM * dM)
+            r1 = width * np.cos(dip * np.pi/180.0)
+            r2 = 3 * r1
+            with np.errstate(divide='ignore', invalid='ignore'):
+                rXr1 = rX / r1
+                T3 = np.where(rX <= r1, self.H1 + self.H2 * rXr1 + self.H3 * rXr1 * rXr1,
+                              np.where(rX <= r2, 1-(rX-r1)/(r2-r1), 0.0))
+            T4 = 1 - (zTop * zTop) / 100.0
+            T5 = np.where(rJB == 0.0, 1.0, 1-rJB/30.0)
+            f4 = np.where((rJB < 30) & (rX >= 0.0), C["a13"] * T1 * T2 * T3 * T4 * T5, 0.0)
+        f6 = C["a15"]
+        if zTop < 20.0:
+            f6 = f6 * zTop / 20.0
+        if style == "NORMAL" and Mw > 5.0:
+            f78 = C["a12"]
+        elif style == "NORMAL" and Mw >= 4.0:
+            f78 = C["a12"] * (Mw - 4)
+        else:
+            f78 = 0.0
+        # -- Equation 17
+        f10 = self.calcSoilTermBatch(C, vs30, z1p0)
+        # Site Response Model
+        v1 = C["v1"]
+        vs30s = np.minimum(vs30, v1)
+        isLin = vs30 < C["Vlin"]
+        vs30s_rk = np.minimum(self.VS_RK, v1)
+        f5_rk = (C["a10"] + C["b"] * self.N) * np.log(vs30s_rk / C["Vlin"])
+        saRock = np.where(isLin, np.exp(f1 + f78 + f5_rk + f4 + f6), 0.0)
+        f5 = np.where(isLin,
+            C["a10"] * np.log(vs30s / C["Vlin"]) - C["b"] * np.log(saRock + C["c"]) + C["b"] * np.log(saRock + C["c"] * np.power(vs30s / C["Vlin"], self.N)),
+            (C["a10"] + C["b"] * self.N) * np.log(vs30s / C["Vlin"]))
+        mean = f1 + f78 + f5 + f4 + f6 + f10
+        # ****** Aleatory uncertainty model ******
+        phiAsq = np.where(vsInferred, self.getPhiA(Mw, C["s1e"], C["s2e"]),
+                          self.getPhiA(Mw, C["s1m"], C["s2m"]))
+        phiAsq = phiAsq * phiAsq
+        tauB = self.getTauA(Mw, C["s3"], C["s4"])
+        phiBsq = phiAsq - self.PHI_AMP_SQ
+        dAmp_p1 = np.where(vs30 >= C["Vlin"], 0.0,
+            (-C["b"] * saRock) / (saRock + C["c"]) + (C["b"] * saRock) / (saRock + C["c"] * np.power(vs30 / C["Vlin"], self.N))) + 1.0
+        phiSq = phiBsq * dAmp_p1 * dAmp_p1 + self.PHI_AMP_SQ
+        tau = tauB * dAmp_p1
+        stdDev = np.sqrt(phiSq + tau * tau)
+        return mean, stdDev, np.sqrt(phiSq), tau
+
+    def get_IM_batch(self, Mw, site_rup_dict, site_arrays, im_info):
+        """
+        Evaluate all sites and periods at once, site_arrays is the output
+        of get_site_arrays. Returns (num_sites, num_periods) arrays.
+        """
+        style = self.getFaultFromRake(site_rup_dict["aveRake"])
+        cur_T = get_im_periods(im_info)
+        start = time.process_time_ns()
+        C = self.getCoeffMatrix(cur_T)
+        self.timeSetImt += time.process_time_ns() - start
+        start = time.process_time_ns()
+        res = self.calcValuesBatch(C, Mw, site_arrays["rJB"], site_arrays["rRup"], site_arrays["rX"], -1, site_rup_dict["dip"], site_rup_dict["width"], site_rup_dict["zTop"], site_arrays["vs30"], site_arrays["vsInferred"], site_arrays["z1pt0"], style)
+        self.timeCalc += time.process_time_ns() - start
+        return get_batch_result(res, site_arrays["vs30"].shape[0])
+
 ############### Boore, Stewart, Seyhan, Atkinson (2014)
 class boore_etal_2014():
     timeSetImt = 0
@@ -544,6 +788,7 @@ class boore_etal_2014():
         self.V1 = 225
         self.V2 = 300
         self.imt = 'PGA'
+        self.coeffMatrixCache = {}
         
     def setIMT(self, imt):
         if imt not in self.supportedImt:
@@ -732,6 +977,99 @@ class boore_etal_2014():
                 'IntraEvStdDev': IntraEvStdDevList}
         return saResult
 
+    # Batched evaluation: site arrays are (num_sites, 1) and the coefficient
+    # matrix is (1, num_periods), results are (num_sites, num_periods)
+    def getCoeffMatrix(self, imt_list):
+        key = tuple(imt_list)
+        if key not in self.coeffMatrixCache:
+            C = get_coeff_matrix(self.coeff, self.supportedImt, imt_list,
+                                 "Boore, Stewart, Seyhan & Atkinson (2014)")
+            # basin depth term only applies to T >= 0.65 s
+            C["useFdz1"] = np.array([imt not in ['PGA', 'PGV'] and imt >= 0.65
+                                     for imt in imt_list]).reshape(1, -1)
+            self.coeffMatrixCache[key] = C
+        return self.coeffMatrixCache[key]
+
+    def calcSourceTermBatch(self, C, Mw, style):
+        if style == "STRIKE_SLIP":
+            Fe = C["e1"]
+        elif style =="REVERSE":
+            Fe = C["e3"]
+        elif style == "NORMAL":
+            Fe = C["e2"]
+        else:
+            Fe = C["e0"]
+        MwMh = Mw - C["Mh"]
+        return np.where(Mw <= C["Mh"], Fe + C["e4"] * MwMh + C["e5"] * MwMh * MwMh,
+                        Fe + C["e6"] * MwMh)
+
+    def calcPathTermBatch(self, C, Mw, R):
+        return (C["c1"] + C["c2"] * (Mw - self.M_REF)) * np.log(R / self.R_REF)+\
+			(C["c3"] + self.DC3_CA_TW) * (R - self.R_REF)
+
+    def calcBatch(self, C, Mw, rJB, vs30, z1p0, style):
+        """
+        Batched version of calc: all sites and all periods in one broadcast.
+        rJB, vs30 and z1p0 are (num_sites, 1) arrays and C is the
+        coefficient matrix returned by getCoeffMatrix.
+        """
+        C_pga = self.getCoeffMatrix(['PGA'])
+        R_pga = np.sqrt(rJB * rJB + C_pga["h"] * C_pga["h"])
+        pgaRock = np.exp(self.calcSourceTermBatch(C_pga, Mw, style) + \
+                         self.calcPathTermBatch(C_pga, Mw, R_pga))
+        # mean
+        Fe = self.calcSourceTermBatch(C, Mw, style)
+        R = np.sqrt(rJB * rJB + C["h"] * C["h"])
+        Fp = self.calcPathTermBatch(C, Mw, R)
+        lnFlin = C["c"] * np.log(np.minimum(vs30, C["Vc"]) / self.V_REF)
+        f2 = C["f4"] * (np.exp(C["f5"] * (np.minimum(vs30, 760.0) - 360.0)) - 
+				np.exp(C["f5"] * (760.0 - 360.0)))
+        lnFnl = self.F1 + f2 * np.log((pgaRock + self.F3) / self.F3)
+        DZ1 = np.where(np.isnan(z1p0), 0.0, z1p0 - self.calcZ1ref(vs30))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            Fdz1 = np.where(C["useFdz1"], np.where(DZ1 <= (C["f7"] / C["f6"]),
+                                                   C["f6"] * DZ1, C["f7"]), 0.0)
+        mean = Fe + Fp + lnFlin + lnFnl + Fdz1
+        # phi
+        if Mw >= 5.5:
+            phiM = C["phi2"]
+        elif Mw <=4.5:
+            phiM = C["phi1"]
+        else:
+            phiM = C["phi1"] + (C["phi2"] - C["phi1"]) * (Mw - 4.5)
+        with np.errstate(divide='ignore'):
+            phiMR = phiM + np.where(rJB > C["R2"], C["dPhiR"], np.where(rJB > C["R1"],
+                C["dPhiR"] * (np.log(rJB / C["R1"]) / np.log(C["R2"] / C["R1"])), 0.0))
+        phiMRV = phiMR - np.where(vs30 <= self.V1, C["dPhiV"], np.where(vs30 < self.V2,
+            C["dPhiV"] * (np.log(self.V2 / vs30) / np.log(self.V2 / self.V1)), 0.0))
+        tau = self.calcTauBatch(C, Mw)
+        stdDev = self.calcStdDev(phiMRV, tau)
+        return mean, stdDev, tau, phiMRV
+
+    def calcTauBatch(self, C, Mw):
+        if Mw >= 5.5:
+            tau = C["tau2"]
+        elif Mw <= 4.5:
+            tau = C["tau1"]
+        else:
+            tau = C["tau1"] + (C["tau2"] - C["tau1"]) * (Mw - 4.5)
+        return tau
+
+    def get_IM_batch(self, Mw, site_rup_dict, site_arrays, im_info):
+        """
+        Evaluate all sites and periods at once, site_arrays is the output
+        of get_site_arrays. Returns (num_sites, num_periods) arrays.
+        """
+        style = self.getFaultFromRake(site_rup_dict["aveRake"])
+        cur_T = get_im_periods(im_info)
+        start = time.process_time_ns()
+        C = self.getCoeffMatrix(cur_T)
+        self.timeSetImt += time.process_time_ns() - start
+        start = time.process_time_ns()
+        res = self.calcBatch(C, Mw, site_arrays["rJB"], site_arrays["vs30"], site_arrays["z1pt0"], style)
+        self.timeCalc += time.process_time_ns() - start
+        return get_batch_result(res, site_arrays["vs30"].shape[0])
+
 
 ############### Campbell & Bozorgnia (2014)
 class campbell_bozorgnia_2014():
@@ -755,6 +1093,7 @@ class campbell_bozorgnia_2014():
         self.tau_lo_PGA = self.coeff["tau1"]["PGA"]
         self.phi_hi_PGA = self.coeff["phi2"]["PGA"]
         self.phi_lo_PGA = self.coeff["phi1"]["PGA"]
+        self.coeffMatrixCache = {}
         
     def setIMT(self, imt):
         if imt not in self.supportedImt:
@@ -982,4 +1321,151 @@ class campbell_bozorgnia_2014():
                 'TotalStdDev': stdDevList,
                 'InterEvStdDev': InterEvStdDevList,
                 'IntraEvStdDev': IntraEvStdDevList}
-        return saResult
\ No newline at end of file
+        return saResult
+
+    # Batched evaluation: site arrays are (num_sites, 1) and the coefficient
+    # matrix is (1, num_periods), results are (num_sites, num_periods)
+    def getCoeffMatrix(self, imt_list):
+        key = tuple(imt_list)
+        if key not in self.coeffMatrixCache:
+            C = get_coeff_matrix(self.coeff, self.supportedImt, imt_list,
+                                 "Campbell & Bozorgnia (2014)")
+            # short period SA is bounded below by PGA
+            C["shortPeriod"] = np.array([imt not in ['PGA', 'PGV'] and imt <= 0.25
+                                         for imt in imt_list]).reshape(1, -1)
+            self.coeffMatrixCache[key] = C
+        return self.coeffMatrixCache[key]
+
+    def calcMeanBatch(self, C, Mw, rJB, rRup, rX, dip, width, zTop,\
+                      zHyp, vs30, z2p5, style, pgaRock):
+        Fmag = C["c0"] + C["c1"] * Mw
+        if (Mw > 6.5):
+            Fmag = Fmag + C["c2"] * (Mw - 4.5) + C["c3"] * (Mw - 5.5) + C["c4"] * (Mw - 6.5)
+        elif (Mw > 5.5):
+            Fmag = Fmag + C["c2"] * (Mw - 4.5) + C["c3"] * (Mw - 5.5)
+        elif (Mw > 4.5):
+            Fmag = Fmag + C["c2"] * (Mw - 4.5)
+        r = np.sqrt(rRup * rRup + C["c7"] * C["c7"])
+        Fr = (C["c5"] + C["c6"] * Mw) * np.log(r)
+        Fflt = 0.0
+        if style == "NORMAL" and Mw > 4.5:
+            Fflt = C["c9"]
+            if (Mw <= 5.5):
+                Fflt = Fflt * (Mw - 4.5)
+        Fhw = 0.0
+        if (Mw > 5.5 and zTop <= 16.66):
+            r1 = width * np.cos(np.radians(dip))
+            r2 = 62.0 * Mw - 350.0
+            with np.errstate(divide='ignore', invalid='ignore'):
+                rXr1 = rX / r1
+                rXr2r1 = (rX - r1) / (r2 - r1)
+                f1_rX = C["h1"] + C["h2"] * rXr1 + C["h3"] * (rXr1 * rXr1)
+                f2_rX = self.H4 + C["h5"] * (rXr2r1) + C["h6"] * rXr2r1 * rXr2r1
+                Fhw_rX = np.where(rX >= r1, np.maximum(f2_rX, 0.0), f1_rX)
+                Fhw_rRup = np.where(rRup == 0.0, 1.0, (rRup - rJB) / rRup)
+            Fhw_m = 1.0 + C["a2"] * (Mw - 6.5)
+            if (Mw <= 6.5):
+                Fhw_m = Fhw_m * (Mw - 5.5)
+            Fhw_z = 1.0 - 0.06 * zTop
+            Fhw_d = (90.0 - dip) / 45.0
+            Fhw = np.where(rX >= 0.0, C["c10"] * Fhw_rX * Fhw_rRup * Fhw_m * Fhw_z * Fhw_d, 0.0)
+        vsk1 = vs30 / C["k1"]
+        Fsite = np.where(vs30 <= C["k1"], C["c11"] * np.log(vsk1) + C["k2"] * (np.log(pgaRock + \
+                    self.C * np.power(vsk1, self.N)) - np.log(pgaRock + self.C)),
+                    (C["c11"] + C["k2"] * self.N) * np.log(vsk1))
+        z2p5 = np.where(np.isnan(z2p5), self.calcZ25ref(vs30), z2p5)
+        Fsed = np.where(z2p5 <= 1.0, C["c14"] * (z2p5 - 1.0), np.where(z2p5 > 3.0,
+            C["c16"] * C["k3"] * np.exp(-0.75) * (1.0 - np.exp(-0.25 * (z2p5 - 3.0))), 0.0))
+        if zHyp <= 7.0:
+            Fhyp = 0.0
+        elif zHyp <= 20.0:
+            Fhyp = zHyp - 7.0
+        else:
+            Fhyp = 13.0
+        if (Mw <= 5.5):
+            Fhyp = Fhyp * C["c17"]
+        elif (Mw <= 6.5):
+            Fhyp = Fhyp * (C["c17"] + (C["c18"] - C["c17"]) * (Mw - 5.5))
+        else:
+            Fhyp = Fhyp * C["c18"]
+        if Mw > 5.5:
+            Fdip = 0.0
+        elif Mw > 4.5:
+            Fdip = C["c19"] * (5.5 - Mw) * dip
+        else:
+            Fdip = C["c19"] * dip
+        Fatn = np.where(rRup > 80.0, C["c20"] * (rRup - 80.0), 0.0)
+        return Fmag + Fr + Fflt + Fhw + Fsite + Fsed + Fhyp + Fdip + Fatn
+
+    def calcPhiSqBatch(self, C, Mw, alpha):
+        if (Mw <= 4.5):
+            phi_lnY = C["phi1"]
+            phi_lnPGAB = self.phi_lo_PGA
+        elif Mw < 5.5:
+            phi_lnY = self.stdMagDep(C["phi1"], C["phi2"], Mw)
+            phi_lnPGAB = self.stdMagDep(self.phi_lo_PGA, self.phi_hi_PGA, Mw)
+        else:
+            phi_lnY = C["phi2"]
+            phi_lnPGAB = self.phi_hi_PGA
+        phi_lnYB = np.sqrt(phi_lnY * phi_lnY - self.PHI_LNAF_SQ)
+        phi_lnPGAB = np.sqrt(phi_lnPGAB * phi_lnPGAB - self.PHI_LNAF_SQ)
+        aPhi_lnPGAB = alpha * phi_lnPGAB
+        phiSq = phi_lnY * phi_lnY + aPhi_lnPGAB * aPhi_lnPGAB + \
+            2.0 * C["rho"] * phi_lnYB * aPhi_lnPGAB
+        return phiSq
+
+    def calcTauSqBatch(self, C, Mw, alpha):
+        if (Mw <= 4.5):
+            tau_lnYB = C["tau1"]
+            tau_lnPGAB = self.tau_lo_PGA
+        elif (Mw < 5.5):
+            tau_lnYB = self.stdMagDep(C["tau1"], C["tau2"], Mw)
+            tau_lnPGAB = self.stdMagDep(self.tau_lo_PGA, self.tau_hi_PGA, Mw)
+        else:
+            tau_lnYB = C["tau2"]
+            tau_lnPGAB = self.tau_hi_PGA
+        alphaTau = alpha * tau_lnPGAB
+        tauSq = tau_lnYB * tau_lnYB + alphaTau * alphaTau + \
+            2.0 * alpha * C["rho"] * tau_lnYB * tau_lnPGAB
+        return tauSq
+
+    def calcBatch(self, C, Mw, rJB, rRup, rX, dip, width, zTop, zHyp, vs30, z2p5, style):
+        """
+        Batched version of calc: all sites and all periods in one broadcast.
+        rJB, rRup, rX, vs30 and z2p5 are (num_sites, 1) arrays and C is the
+        coefficient matrix returned by getCoeffMatrix.
+        """
+        C_pga = self.getCoeffMatrix(['PGA'])
+        pgaRockRef = np.exp(self.calcMeanBatch(C_pga, Mw, rJB, rRup, rX, dip, width,
+                            zTop, zHyp, 1100.0, 0.398, style, 0.0))
+        pgaRock = np.where(vs30 < C["k1"], pgaRockRef, 0.0)
+        mean = self.calcMeanBatch(C, Mw, rJB, rRup, rX, dip, width, zTop,
+			zHyp, vs30, z2p5, style, pgaRock)
+        if C["shortPeriod"].any():
+            pgaMean = self.calcMeanBatch(C_pga, Mw, rJB, rRup, rX, dip, width, zTop,
+                                         zHyp, vs30, z2p5, style, pgaRock)
+            mean = np.where(C["shortPeriod"], np.maximum(mean, pgaMean), mean)
+        vsk1 = vs30 / C["k1"]
+        alpha = np.where(vs30 < C["k1"], C["k2"] * pgaRock * (1 / (pgaRock + self.C * np.power(vsk1, self.N))\
+                                         - 1 / (pgaRock + self.C)), 0.0)
+        phiSq = self.calcPhiSqBatch(C, Mw, alpha)
+        tauSq = self.calcTauSqBatch(C, Mw, alpha)
+        stdDev = np.sqrt(phiSq + tauSq)
+        return mean, stdDev, np.sqrt(tauSq), np.sqrt(phiSq)
+
+    def get_IM_batch(self, Mw, site_rup_dict, site_arrays, im_info):
+        """
+        Evaluate all sites and periods at once, site_arrays is the output
+        of get_site_arrays. Returns (num_sites, num_periods) arrays.
+        """
+        style = self.getFaultFromRake(site_rup_dict["aveRake"])
+        cur_T = get_im_periods(im_info)
+        start = time.process_time_ns()
+        C = self.getCoeffMatrix(cur_T)
+        self.timeSetImt += time.process_time_ns() - start
+        start = time.process_time_ns()
+        res = self.calcBatch(C, Mw, site_arrays["rJB"], site_arrays["rRup"], site_arrays["rX"],\
+                             site_rup_dict["dip"], site_rup_dict["width"], site_rup_dict["zTop"],\
+                             site_rup_dict["zHyp"], site_arrays["vs30"], site_arrays["z2pt5"], style)
+        self.timeCalc += time.process_time_ns() - start
+        return get_batch_result(res, site_arrays["vs30"].shape[0])
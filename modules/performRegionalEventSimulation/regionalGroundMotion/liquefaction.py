@@ -1,118 +1,126 @@
 import numpy as np
 import rasterio as rio
-from scipy.interpolate import interp2d
+from rasterio.windows import Window
+from scipy.interpolate import RegularGridInterpolator
 import sys, warnings, shapely, pandas, os
 from pyproj import Transformer
 from pyproj import CRS
 from enum import Enum
 import geopandas as gpd
-from scipy.spatial import ConvexHull
+
+# per-run caches of the reprojected site coordinates and the sampled layers
+projected_sites_cache = dict()
+sampled_layers_cache = dict()
 
 ## Helper functions
+def getSitesKey(x, y):
+    """returns a hashable key of the site coordinates"""
+    return hash((np.asarray(x, dtype=float).tobytes(), np.asarray(y, dtype=float).tobytes()))
+
+def projectSites(data_crs, x, y):
+    """reprojects (x,y) in CRS 4326 to the data CRS (once per CRS)"""
+    xy_crs = CRS.from_user_input(4326)
+    data_crs = CRS.from_user_input(data_crs)
+    if xy_crs == data_crs:
+        return np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    cache_key = (data_crs.to_wkt(), getSitesKey(x, y))
+    if cache_key not in projected_sites_cache:
+        # make transformer for reprojection
+        transformer_xy_to_data = Transformer.from_crs(xy_crs, data_crs,\
+                                                      always_xy=True)
+        # reproject and store
+        x_proj, y_proj = transformer_xy_to_data.transform(np.asarray(x, dtype=float), np.asarray(y, dtype=float))
+        projected_sites_cache[cache_key] = (np.asarray(x_proj), np.asarray(y_proj))
+    return projected_sites_cache[cache_key]
+
 def sampleRaster(raster_file_path, raster_crs, x, y, interp_scheme = 'nearest',\
                  dtype = None):
     """performs 2D interpolation at (x,y) pairs. Accepted interp_scheme = 'nearest', 'linear', 'cubic', and 'quintic'"""
-    print(f"Sampling from the Raster File: {os.path.basename(raster_file_path)}...")
+    cache_key = (os.path.abspath(raster_file_path), os.path.getmtime(raster_file_path),\
+                 str(raster_crs), interp_scheme, getSitesKey(x, y))
+    if cache_key in sampled_layers_cache:
+        print(f"Sampling from the Raster File: {os.path.basename(raster_file_path)} (cached)...")
+        sample = sampled_layers_cache[cache_key].copy()
+    else:
+        print(f"Sampling from the Raster File: {os.path.basename(raster_file_path)}...")
+        sample = sampleRasterWindow(raster_file_path, raster_crs, x, y, interp_scheme)
+        sampled_layers_cache[cache_key] = sample.copy()
+    # convert to target datatype
+    if dtype is not None:
+        sample = sample.astype(dtype)
+    # clean up invalid values (returned as 1e38 by NumPy)
+    sample[abs(sample)>1e10] = np.nan
+    return sample
+
+def sampleRasterWindow(raster_file_path, raster_crs, x, y, interp_scheme = 'nearest'):
+    """reads the window of the raster covering (x,y) and interpolates at (x,y)"""
     invalid_value = np.nan
-    xy_crs = CRS.from_user_input(4326)
-    raster_crs = CRS.from_user_input(raster_crs)
+    x, y = projectSites(raster_crs, x, y)
     with rio.open(raster_file_path) as raster_file:
+        if raster_file.count > 1:
+            warnings.warn(f"More than one band in the file {raster_file_path}, the first band is used.")
+        x_res = (raster_file.bounds.right-raster_file.bounds.left)/raster_file.width
+        y_res = (raster_file.bounds.top-raster_file.bounds.bottom)/raster_file.height
+        # row and column of the pixels containing the sites
+        cols = np.floor((x-raster_file.bounds.left)/x_res).astype(int)
+        rows = np.floor((raster_file.bounds.top-y)/y_res).astype(int)
+        # window of the site bounding box (with a margin for the interpolation)
+        margin = {'nearest': 0, 'linear': 2, 'cubic': 16, 'quintic': 24}.get(interp_scheme, 24)
+        col_min = max(int(np.min(cols))-margin, 0)
+        col_max = min(int(np.max(cols))+margin, raster_file.width-1)
+        row_min = max(int(np.min(rows))-margin, 0)
+        row_max = min(int(np.max(rows))+margin, raster_file.height-1)
+        if (col_min > col_max) or (row_min > row_max):
+            # no site is in the raster
+            fill_value = raster_file.nodata if interp_scheme == 'nearest' else invalid_value
+            return np.full(len(x), np.nan if fill_value is None else fill_value, dtype=float)
         try:
-            raster_data = raster_file.read()
-            if raster_data.shape[0] > 1:
-                warnings.warn(f"More than one band in the file {raster_file_path}, the first band is used.")
+            window_data = raster_file.read(1, window=Window(col_min, row_min, \
+                col_max-col_min+1, row_max-row_min+1)).astype(float)
         except:
             sys.exit(f"Can not read data from {raster_file_path}")
-        if xy_crs != raster_crs:
-            # make transformer for reprojection
-            transformer_xy_to_data = Transformer.from_crs(xy_crs, raster_crs,\
-                                                          always_xy=True)
-            # reproject and store
-            x_proj, y_proj = transformer_xy_to_data.transform(x, y)
-            x = x_proj
-            y = y_proj
-        n_sample = len(x)
         if interp_scheme == 'nearest':
-            sample = np.array([val[0] for val in raster_file.sample(list(zip(x,y)))])
+            # pixels containing the sites, and nodata (or zero) outside
+            fill_value = raster_file.nodata if raster_file.nodata is not None else 0
+            inside = (cols >= 0) & (cols < raster_file.width) & \
+                (rows >= 0) & (rows < raster_file.height)
+            sample = np.full(len(x), fill_value, dtype=float)
+            sample[inside] = window_data[rows[inside]-row_min, cols[inside]-col_min]
         else:
-            # create x and y ticks for grid
-            x_tick = np.linspace(raster_file.bounds.left, \
-                raster_file.bounds.right, raster_file.width,  endpoint=False)
-            y_tick = np.linspace(raster_file.bounds.bottom,\
-                raster_file.bounds.top, raster_file.height, endpoint=False)
-            # create interp2d function
-            interp_function = interp2d(
-                x_tick, y_tick, np.flipud(raster_file.read(1)),
-                kind=interp_scheme, fill_value=invalid_value)
+            # grid ticks of the window (same convention as the full grid, 
+            # i.e., the lower-left corners of the pixels)
+            x_tick = raster_file.bounds.left + x_res*np.arange(col_min, col_max+1)
+            y_tick = raster_file.bounds.top - y_res*np.arange(row_max+1, row_min, -1)
+            interp_function = RegularGridInterpolator((y_tick, x_tick), \
+                np.flipud(window_data), method=interp_scheme, \
+                bounds_error=False, fill_value=invalid_value)
             # get samples
-            sample = np.transpose(
-                [interp_function(x[i],y[i]) for i in range(n_sample)]
-            )[0]
-    # convert to target datatype
-    if dtype is not None:
-        sample = sample.astype(dtype)
-    # clean up invalid values (returned as 1e38 by NumPy)
-    sample[abs(sample)>1e10] = invalid_value
+            sample = interp_function(np.column_stack([y, x]))
     return sample
 
 ## Helper functions
 def sampleVector(vector_file_path, vector_crs, x, y, dtype = None):
     """performs spatial join of vector_file with xy'"""
     print(f"Sampling from the Vector File: {os.path.basename(vector_file_path)}...")
-    invalid_value = np.nan
     xy_crs = CRS.from_user_input(4326)
     vector_gdf = gpd.read_file(vector_file_path)
     if vector_gdf.crs != vector_crs:
         sys.exit(f"The CRS of vector file {vector_file_path} is {vector_gdf.crs}, and doesn't match the input CRS ({xy_crs}) defined for liquefaction triggering models")
-    if xy_crs != vector_crs:
-        # make transformer for reprojection
-        transformer_xy_to_data = Transformer.from_crs(xy_crs, vector_crs,\
-                                                      always_xy=True)
-        # reproject and store
-        x_proj, y_proj = transformer_xy_to_data.transform(x, y)
-        x = x_proj
-        y = y_proj
-    # Create a convex hull containing all sites    
-    sites = np.array([x, y]).transpose()
-    try:
-        hull = ConvexHull(sites)
-        vertices = hull.vertices
-        vertices = sites[np.append(vertices, vertices[0])]
-        centroid = np.mean(vertices, axis=0)
-        vertices = vertices + 0.05 * (vertices - centroid)
-        RoI = shapely.geometry.Polygon(vertices)
-    except:
-        centroid = shapely.geometry.Point(np.mean(x), np.mean(y))
-        points = [shapely.geometry.Point(x[i], y[i]) for i in range(len(x))]
-        if len(points) == 1:
-            distances = [0.1] # Degree
-        else:
-            distances = [point.distance(centroid) for point in points]
-        max_distance = max(distances)*1.2
-        angles = np.linspace(0, 2 * np.pi, 36)
-        circle_points = [(centroid.x + max_distance * np.cos(angle), \
-                        centroid.y + max_distance * np.sin(angle)) for angle in angles]
-        RoI = shapely.geometry.Polygon(circle_points)
-    data = dict()
-    for col in vector_gdf.columns:
-        data.update({col:[]})
-    for row_index in vector_gdf.index:
-        new_geom = RoI.intersection(vector_gdf.loc[row_index, 'geometry'])
-        if new_geom.is_empty:
-            continue
-        columns = list(vector_gdf.columns)
-        columns.remove('geometry')
-        for col in columns:
-            data[col].append(vector_gdf.loc[row_index, col])
-        data['geometry'].append(new_geom)
+    x, y = projectSites(vector_crs, x, y)
+    # spatial join with an STRtree of the geometries: the first geometry 
+    # containing each site is used
+    sites = shapely.points(x, y)
+    tree = shapely.STRtree(vector_gdf.geometry.values)
+    site_ind, geom_ind = tree.query(sites, predicate='within')
+    order = np.lexsort((geom_ind, site_ind))
+    site_ind, first = np.unique(site_ind[order], return_index=True)
+    geom_ind = geom_ind[order][first]
+    columns = [col for col in vector_gdf.columns if col != 'geometry']
+    gdf_sites = pandas.DataFrame(index=range(len(x)), columns=columns)
+    if len(site_ind):
+        gdf_sites.loc[site_ind, columns] = vector_gdf.iloc[geom_ind][columns].to_numpy()
+    gdf_sites = gdf_sites.infer_objects()
     del vector_gdf
-    gdf_roi = gpd.GeoDataFrame(data, geometry="geometry", crs=4326)
-    geometry = [shapely.geometry.Point(lon, lat) for lon, lat in zip(x, y)]
-    gdf_sites = gpd.GeoDataFrame(geometry=geometry, crs=4326).reset_index()
-    merged = gpd.GeoDataFrame.sjoin(gdf_roi, gdf_sites, how = 'inner', predicate = 'contains')
-    merged = merged.set_index('index_right').sort_index().drop(columns=['geometry'])
-    gdf_sites = pandas.merge(gdf_sites, merged, on = 'index', how = 'left')
-    gdf_sites.drop(columns=['geometry', 'index'], inplace=True)
     return gdf_sites
 
 def find_additional_output_req(liq_info, current_step):
@@ -0,0 +1,67 @@
+import numpy as np
+
+from gmpe import CorrelationModel
+
+
+def get_sites(num_sites, seed=1):
+    rng = np.random.default_rng(seed)
+    lat = 34.0 + rng.uniform(0.0, 0.5, num_sites)
+    lon = -118.0 + rng.uniform(0.0, 0.5, num_sites)
+    # co-located sites
+    lat[1], lon[1] = lat[0], lon[0]
+    return lat, lon
+
+
+def test_sampling_method_defaults_to_cholesky():
+    assert CorrelationModel.get_correlation_sampling_method('Cholesky') == 'Cholesky'
+    assert CorrelationModel.get_correlation_sampling_method('LowRank') == 'LowRank'
+    assert CorrelationModel.get_correlation_sampling_method('Auto') == 'Cholesky'
+
+
+def test_cholesky_factor_is_exact():
+    lat, lon = get_sites(200)
+    corr_fun = lambda h: np.exp(-3.0 * h / 10.0)
+    L, d, loc_index = CorrelationModel.get_exponential_correlation_factor(lat, lon, 10.0)
+    assert d is None
+    rho = corr_fun(CorrelationModel.get_distance_matrix(lat, lon))
+    np.testing.assert_allclose(L @ L.T, rho, atol=1e-8)
+
+
+def test_low_rank_factor_error_is_checked(capsys):
+    lat, lon = get_sites(600)
+    corr_fun = lambda h: np.exp(-3.0 * h / 10.0)
+    factor = CorrelationModel.get_spatial_correlation_factor(lat, lon, corr_fun,
+                                                             method='LowRank', num_inducing=50)
+    assert 'warning' in capsys.readouterr().out
+    L, d, loc_index = factor
+    # the check covers all rows when there are fewer sites than sampled rows
+    max_error, lost_variance = CorrelationModel.check_low_rank_correlation_factor(
+        lat, lon, corr_fun, factor, num_rows=len(lat))
+    rho = corr_fun(CorrelationModel.get_distance_matrix(lat, lon))
+    rho_approx = L @ L.T + np.where(loc_index[:, None] == loc_index[None, :],
+                                    d[:, None] * d[None, :], 0.0)
+    assert np.isclose(max_error, np.max(np.abs(rho - rho_approx)))
+    np.testing.assert_allclose(np.diag(rho_approx), 1.0)
+    assert 0.0 < lost_variance < 1.0
+    # errors within the tolerance pass silently
+    CorrelationModel.get_spatial_correlation_factor(lat, lon, corr_fun, method='LowRank',
+                                                    num_inducing=50, tolerance=1.0)
+    assert 'warning' not in capsys.readouterr().out
+
+
+def test_distance_matrix_matches_pairwise_loop():
+    lat, lon = get_sites(60)
+    # the double loop that get_distance_matrix replaces
+    stn_dist = np.zeros((len(lat), len(lat)))
+    for i in range(len(lat)):
+        loc_i = np.array([lat[i], lon[i]])
+        for j in range(len(lat)):
+            loc_j = np.array([lat[j], lon[j]])
+            stn_dist[i, j] = CorrelationModel.get_distance_from_lat_lon(loc_i, loc_j)
+    np.testing.assert_allclose(CorrelationModel.get_distance_matrix(lat, lon, block_size=7),
+                               stn_dist, rtol=1e-12, atol=1e-9)
+    np.testing.assert_allclose(CorrelationModel.get_distance_matrix(lat, lon, dtype=np.float32),
+                               stn_dist, rtol=1e-6, atol=1e-4)
+    # rectangular blocks
+    np.testing.assert_allclose(CorrelationModel.get_distance_matrix(lat[:10], lon[:10], lat, lon),
+                               stn_dist[:10, :], rtol=1e-12, atol=1e-9)
@@ -0,0 +1,66 @@
+import types
+
+import numpy as np
+import pytest
+
+# CreateStation imports the OpenSHA site data functions (JVM)
+pytest.importorskip('FetchOpenSHA')
+import CreateStation
+
+
+@pytest.fixture
+def cache_file(tmp_path):
+    cache_file = str(tmp_path / 'site_property_cache.sqlite')
+    CreateStation.configure_site_data_providers({'CacheFile': cache_file, 'MaxRetries': 0, 'RetryDelay': 0.0})
+    yield cache_file
+    CreateStation.configure_site_data_providers({})
+
+
+class FailingProvider(CreateStation.SiteDataProvider):
+    def __init__(self, **kwargs):
+        super().__init__('Failing', **kwargs)
+        self.calls = 0
+
+    def fetch_site(self, lat, lon):
+        self.calls += 1
+        raise RuntimeError('service error')
+
+
+def fake_response(status_code, body):
+    def raise_for_status():
+        if status_code >= 400:
+            raise RuntimeError('HTTP {}'.format(status_code))
+    return types.SimpleNamespace(status_code=status_code, json=lambda: body, raise_for_status=raise_for_status)
+
+
+def test_failed_fetch_is_not_cached(cache_file):
+    provider = FailingProvider(max_retries=0, retry_delay=0.0)
+    assert provider.get([37.8], [-122.3]) == [None]
+    assert provider.get([37.8], [-122.3]) == [None]
+    assert provider.calls == 2
+    values, missing = CreateStation.get_site_property_cache().get('Failing', [37.8], [-122.3])
+    assert missing == [0]
+
+
+@pytest.mark.parametrize('status_code, body, cached', [
+    (200, {'status': 'success', 'response': {'results': [{'profile': {'vs': [-200.0, 300.0]}}]}}, [200.0, 300.0]),
+    (400, {'status': 'error', 'response': 'location is outside the model'}, []),
+    (503, {'status': 'error', 'response': 'service unavailable'}, None),
+    (200, {'status': 'error', 'response': 'internal error'}, None),
+])
+def test_ncm_geophysical_errors_are_not_cached(cache_file, monkeypatch, status_code, body, cached):
+    requests = pytest.importorskip('requests')
+    monkeypatch.setattr(requests, 'get', lambda *args, **kwargs: fake_response(status_code, body))
+    provider = CreateStation.NCMGeophysicalProvider([0, 10, 30], max_retries=0, retry_delay=0.0)
+    assert provider.get([37.8], [-122.3]) == [cached]
+    values, missing = CreateStation.get_site_property_cache().get(provider.name, [37.8], [-122.3])
+    assert missing == ([0] if cached is None else [])
+
+
+def test_opensha_cache_is_keyed_by_vs30_model(cache_file):
+    def fetch_vs30(lat, lon, vs30model='A'):
+        return [{'A': 300.0, 'B': 500.0}[vs30model] for x in lat]
+    assert CreateStation.get_site_data_opensha([37.8], [-122.3], 'Vs30', fetch_vs30, vs30model='A') == [300.0]
+    assert CreateStation.get_site_data_opensha([37.8], [-122.3], 'Vs30', fetch_vs30, vs30model='B') == [500.0]
+    assert CreateStation.get_site_data_opensha([37.8], [-122.3], 'Vs30', fetch_vs30, vs30model='A') == [300.0]
+    assert np.isnan(CreateStation.get_site_data_opensha([37.8], [-122.3], 'z1pt0', lambda lat, lon: [np.nan]))[0]
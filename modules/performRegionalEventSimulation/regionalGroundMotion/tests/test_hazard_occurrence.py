@@ -0,0 +1,117 @@
+import json
+
+import h5py
+import numpy as np
+import pulp
+import pytest
+
+import HazardOccurrence
+
+
+def write_im_files(tmp_path, num_scen=7, num_sites=5, chunk_scen=2):
+    # the same means and standard deviations as a json file and as the
+    # chunked (scenario x site x IM) datasets of IntensityMeasureMeanStd.hdf5
+    rng = np.random.default_rng(0)
+    im_list = ['PGA', 'SA(0.3)', 'SA(1)']
+    scenario_keys = np.arange(num_scen) * 10 + 3
+    mean = rng.normal(-2.0, 0.5, (num_scen, num_sites, len(im_list)))
+    inter_std = rng.uniform(0.2, 0.4, mean.shape)
+    intra_std = rng.uniform(0.4, 0.6, mean.shape)
+    total_std = np.sqrt(inter_std**2 + intra_std**2)
+    im_raw = dict()
+    for i, key in enumerate(scenario_keys):
+        im_raw[str(key)] = {'IM': ['PGA', 'SA'], 'Periods': [0.3, 1.0], 'MeanAnnualRate': 1e-3 * (i + 1),
+            'GroundMotions': [{'lnPGA': {'Mean': [mean[i, j, 0]], 'TotalStdDev': [total_std[i, j, 0]]},
+                               'lnSA': {'Mean': list(mean[i, j, 1:]), 'TotalStdDev': list(total_std[i, j, 1:])}}
+                              for j in range(num_sites)]}
+    json_file = str(tmp_path / 'IntensityMeasureMeanStd.json')
+    with open(json_file, 'w') as f:
+        json.dump(im_raw, f)
+    hdf5_file = str(tmp_path / 'IntensityMeasureMeanStd.hdf5')
+    with h5py.File(hdf5_file, 'w') as f:
+        f.attrs['IMList'] = im_list
+        f.create_dataset('ScenarioIndex', data=scenario_keys)
+        for name, data in [('Mean', mean), ('InterEvStdDev', inter_std), ('IntraEvStdDev', intra_std)]:
+            f.create_dataset(name, data=data, chunks=(chunk_scen, num_sites, len(im_list)))
+    return json_file, hdf5_file, im_list, scenario_keys
+
+
+def test_im_exceedance_probability_hdf5_matches_json(tmp_path):
+    json_file, hdf5_file, im_list, scenario_keys = write_im_files(tmp_path)
+    num_sites = 5
+    im_level = np.tile(np.array([0.05, 0.1, 0.3, 0.8]), (num_sites, 1))
+    # unsorted scenarios spread over several chunks
+    selected = [scenario_keys[i] for i in [5, 0, 3, 6, 1]]
+    for im_type, period in [('PGA', 0.0), ('SA', 0.3), ('SA', 1.0)]:
+        prob_json = HazardOccurrence.get_im_exceedance_probility(json_file, im_list,
+            im_type, period, im_level, [str(x) for x in selected])
+        prob_hdf5 = HazardOccurrence.get_im_exceedance_probility(hdf5_file, im_list,
+            im_type, period, im_level, selected)
+        assert prob_hdf5.shape == (num_sites, len(selected), im_level.shape[1])
+        assert prob_hdf5.any()
+        np.testing.assert_allclose(prob_hdf5, prob_json, rtol=1e-12, atol=1e-14)
+
+
+def test_hazard_curves_hdf5_match_json(tmp_path):
+    json_file, hdf5_file, im_list, scenario_keys = write_im_files(tmp_path)
+    with open(json_file, 'r') as f:
+        im_raw = json.load(f)
+    site_config = [{'ID': i} for i in range(5)]
+    # a subset of the scenarios spread over several chunks
+    selected = [scenario_keys[i] for i in [6, 2, 3]]
+    im_data = {str(x): im_raw[str(x)] for x in selected}
+    scenarios = {x: {'MeanAnnualRate': im_raw[str(x)]['MeanAnnualRate']} for x in selected}
+    hc_json = HazardOccurrence.calc_hazard_curves(im_data, site_config, ['PGA', 'SA0P3', 'SA1P0'])
+    hc_hdf5 = HazardOccurrence.calc_hazard_curves_hdf5(hdf5_file, im_list, site_config,
+                                                       ['PGA', 'SA(0.3)', 'SA(1)'], scenarios)
+    for cur_json, cur_hdf5 in zip(hc_json, hc_hdf5):
+        for site_json, site_hdf5 in zip(cur_json, cur_hdf5):
+            assert site_hdf5['SiteID'] == site_json['SiteID']
+            np.testing.assert_allclose(site_hdf5['ReturnPeriod'], site_json['ReturnPeriod'], rtol=1e-10)
+
+
+def get_exceedance_probs(num_sites=6, num_eqs=20, seed=0):
+    rng = np.random.default_rng(seed)
+    probs = rng.uniform(0, 0.05, (num_sites, num_eqs, 3))
+    probs[rng.uniform(size=probs.shape) > 0.6] = 0.0
+    return [100, 500, 2500], probs
+
+
+def get_terms(expr):
+    return {var.name: coef for var, coef in expr.items() if coef != 0}
+
+
+def test_occurrence_mip_matches_lpsum_build():
+    # the constraints built term by term with lpSum as before
+    return_periods, probs = get_exceedance_probs()
+    model = HazardOccurrence.OccurrenceModel_ManzourDavidson2016(
+        return_periods=return_periods, im_exceedance_probs=probs, num_scenarios=5)
+    assert get_terms(model.prob.objective) == {
+        var.name: return_periods[j] for (i, j), var in list(model.e_plus.items()) + list(model.e_minus.items())}
+    for i in range(probs.shape[0]):
+        for j in range(len(return_periods)):
+            expected = pulp.lpSum(model.P[k]*probs[i,k,j] for k in range(probs.shape[1])) + \
+                model.e_minus[i,j] - model.e_plus[i,j] == 1.0/return_periods[j]
+            constraint = model.prob.constraints['hc_{}_{}'.format(i, j)]
+            assert get_terms(constraint) == pytest.approx(get_terms(expected), rel=1e-15)
+            assert constraint.constant == pytest.approx(expected.constant, rel=1e-15)
+            assert constraint.sense == expected.sense
+    assert len(model.prob.constraints) == probs.shape[0]*len(return_periods) + probs.shape[1] + 1
+
+
+def test_occurrence_warm_start_and_num_scenarios():
+    return_periods, probs = get_exceedance_probs()
+    objective = {}
+    for num_scenarios in [3, 6]:
+        for warm_start in [None, 'Greedy', 'LP']:
+            model = HazardOccurrence.OccurrenceModel_ManzourDavidson2016(
+                return_periods=return_periods, im_exceedance_probs=probs, num_scenarios=num_scenarios)
+            model.solve_opt(warm_start=warm_start)
+            objective[num_scenarios, warm_start] = model.prob.objective.value()
+        # changing the number of scenarios of a built problem
+        model.set_num_scenarios(9 - num_scenarios)
+        model.solve_opt()
+        objective[9 - num_scenarios, 'changed'] = model.prob.objective.value()
+    for num_scenarios in [3, 6]:
+        for key in ['Greedy', 'LP', 'changed']:
+            assert objective[num_scenarios, key] == pytest.approx(objective[num_scenarios, None], rel=2e-3)
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from gmpe import openSHAGMPE
+
+
+def make_sites(num_sites=40, seed=0):
+    rng = np.random.default_rng(seed)
+    sites = []
+    for i in range(num_sites):
+        rjb = 0.0 if i % 10 == 0 else float(rng.uniform(0, 200))
+        sites.append({'rJB': rjb, 'rRup': float(np.hypot(rjb, rng.uniform(0, 15))), 'rX': float(rng.uniform(-50, 100)),
+                      'vs30': float(rng.uniform(150, 1500)), 'vsInferred': bool(i % 2),
+                      'z1pt0': float(rng.uniform(10, 900)) if i % 3 else np.nan,
+                      'z2pt5': float(rng.uniform(100, 5000)) if i % 4 else np.nan})
+    return sites
+
+
+@pytest.mark.parametrize('gmpe_class', [openSHAGMPE.chiou_youngs_2013, openSHAGMPE.abrahamson_silva_kamai_2014,
+                                        openSHAGMPE.boore_etal_2014, openSHAGMPE.campbell_bozorgnia_2014])
+@pytest.mark.parametrize('im_info', [{'Type': 'SA', 'Periods': [0.01, 0.2, 1.0, 5.0]}, {'Type': 'PGA'}, {'Type': 'PGV'}])
+def test_batch_matches_site_loop(gmpe_class, im_info):
+    # get_IM_batch over all sites against the scalar get_IM of every site
+    sites = make_sites()
+    for Mw, rake, dip, zTop in [(4.8, 0, 90, 0), (6.3, 90, 45, 5), (7.5, -90, 25, 12)]:
+        site_rup_dict = {'aveRake': rake, 'dip': dip, 'zTop': zTop, 'width': 15.0, 'zHyp': zTop + 5}
+        batch = gmpe_class().get_IM_batch(Mw, site_rup_dict, openSHAGMPE.get_site_arrays(sites), im_info)
+        gmpe = gmpe_class()
+        for i, site in enumerate(sites):
+            res = gmpe.get_IM(Mw, site_rup_dict, site, im_info)
+            for key, value in res.items():
+                np.testing.assert_allclose(batch[key][i], np.array(value, dtype=float), rtol=1e-10, atol=1e-12)
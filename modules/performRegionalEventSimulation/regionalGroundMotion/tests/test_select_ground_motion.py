@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from SelectGroundMotion import GM_BatchSelector
+
+
+def get_database(num_gm=300, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'RSN': list(range(num_gm)),
+                         'SA(0.1)': np.exp(rng.normal(-1, 1, num_gm)),
+                         'SA(1.0)': np.exp(rng.normal(-2, 1, num_gm)),
+                         'DS575H': np.exp(rng.normal(2, 0.5, num_gm))})
+
+
+@pytest.mark.parametrize('sf_min, sf_max', [(None, None), (0.5, 5.0), (1.0, 1.0001)])
+def test_batch_selection_matches_exhaustive_loop(sf_min, sf_max):
+    selector = GM_BatchSelector(gmdb_im_df=get_database(), sf_min=sf_min, sf_max=sf_max)
+    rng = np.random.default_rng(1)
+    targets = np.column_stack([rng.normal(-1, 1.5, 200), rng.normal(-2, 1.5, 200), rng.normal(2, 0.6, 200)])
+    gm_loc, sf, error = selector.select_records(targets)
+    # the error of the selected records
+    ln_im = selector.ln_im_table[gm_loc] + np.where(selector.scalable, np.log(sf)[:, np.newaxis], 0.0)
+    np.testing.assert_allclose(np.sum((targets - ln_im)**2, axis=1), error**2, rtol=1e-9)
+    # every record and scale factor of the range, one target at a time
+    for i, target in enumerate(targets):
+        best_error = np.inf
+        for ln_sf in selector.ln_sf_range:
+            ln_im = selector.ln_im_table + np.where(selector.scalable, ln_sf, 0.0)
+            best_error = min(best_error, np.min(np.sum((target - ln_im)**2, axis=1)))
+        assert error[i]**2 == pytest.approx(best_error, rel=1e-9, abs=1e-12)
@@ -49,8 +49,94 @@ from pathlib import Path
 from sklearn.neighbors import NearestNeighbors
 
 
+def load_grid_point_events(event_dir, gp_file):
+    """
+    Loads the list of events and scale factors stored in a grid point file.
+    """
+    event_df = pd.read_csv(event_dir / gp_file, header=0)
+
+    event_names = event_df.iloc[:, 0].values
+
+    # use the scale factors (or 1.0)
+    if len(event_df.columns) > 1:
+        event_scales = event_df.iloc[:, 1].values.astype(float)
+    else:
+        event_scales = np.ones(len(event_names))
+
+    return event_names, event_scales
+
+
+def get_neighbor_lists(
+    distances, indices, asset_labels, grid_df, label_keys, neighbors, filtered
+):
+    """
+    Returns the distances and indices of the neighbors that share the labels
+    of the assets, keeping the first neighbors grid points of each asset.
+    """
+    if not filtered:
+        return list(distances), list(indices)
+
+    grid_labels = {key: grid_df[key].values for key in label_keys}
+
+    dist_lists = []
+    ind_lists = []
+    for dist_list, ind_list, labels in zip(distances, indices, asset_labels):
+        # only keep the distances and indices corresponding to neighbors
+        # with the same labels (e.g., soil type)
+        filter_list = np.ones(len(ind_list), dtype=bool)
+        for key, asset_label in labels.items():
+            filter_list &= grid_labels[key][ind_list] == asset_label
+
+        # because dist_list, ind_list sorted initially in order of increasing
+        # distance, just take the first neighbors grid points of each
+        dist_lists.append(dist_list[filter_list][:neighbors])
+        ind_lists.append(ind_list[filter_list][:neighbors])
+
+    return dist_lists, ind_lists
+
+
+def sample_neighbors(dist_lists, samples, rng):
+    """
+    Draws the neighbor of every sample of every asset.
+
+    The multinomial draws of consecutive assets with the same number of
+    neighbors are made in one call. The random stream is consumed in the
+    same order as drawing the assets one by one.
+    """
+    nbr_samples = []
+
+    asset_i = 0
+    while asset_i < len(dist_lists):
+        # find the run of assets with the same number of neighbors
+        nbr_count = len(dist_lists[asset_i])
+        asset_j = asset_i + 1
+        while asset_j < len(dist_lists) and len(dist_lists[asset_j]) == nbr_count:
+            asset_j += 1
+
+        # calculate the weights for each neighbor based on their distance
+        dist_inv = 1.0 / (np.array(dist_lists[asset_i:asset_j]) ** 2.0)
+        weights = dist_inv / np.sum(dist_inv, axis=1, keepdims=True)
+
+        # get the pre-defined number of samples for each neighbor
+        draws = rng.multinomial(
+            1, weights[:, np.newaxis, :], size=(asset_j - asset_i, samples)
+        )
+        nbr_samples += list(np.argmax(draws, axis=2))
+
+        asset_i = asset_j
+
+    return nbr_samples
+
+
 def find_neighbors(
-    asset_file, event_grid_file, samples, neighbors, filter_label, seed, doParallel
+    asset_file,
+    event_grid_file,
+    samples,
+    neighbors,
+    filter_label,
+    seed,
+    doParallel,
+    batch_size=10000,
 ):
     # check if running parallel
     numP = 1
@@ -90,6 +176,8 @@ def find_neighbors(
         grid_extra_keys = list(
             grid_df.drop(["GP_file", "Longitude", "Latitude"], axis=1).columns
         )
+    else:
+        grid_extra_keys = []
 
     # prepare the tree for the nearest neighbor search
     if filter_label != "" or len(grid_extra_keys) > 0:
@@ -102,35 +190,12 @@ def find_neighbors(
     with open(asset_file, "r", encoding="utf-8") as f:
         asset_dict = json.load(f)
 
-    # prepare a dataframe that holds asset filenames and locations
-    AIM_df = pd.DataFrame(
-        columns=["Latitude", "Longitude", "file"], index=np.arange(len(asset_dict))
-    )
-
-    count = 0
-    for i, asset in enumerate(asset_dict):
-        if runParallel == False or (i % numP) == procID:
-            with open(asset["file"], "r", encoding="utf-8") as f:
-                asset_data = json.load(f)
-
-            asset_loc = asset_data["GeneralInformation"]["location"]
-            AIM_df.iloc[count]["Longitude"] = asset_loc["longitude"]
-            AIM_df.iloc[count]["Latitude"] = asset_loc["latitude"]
-            AIM_df.iloc[count]["file"] = asset["file"]
-            count = count + 1
-
-    # store building locations in Y
-    Y = np.array(
-        [
-            [lo, la]
-            for lo, la in zip(AIM_df["Longitude"], AIM_df["Latitude"])
-            if not np.isnan(lo) and not np.isnan(la)
-        ]
-    )
-
-    # collect the neighbor indices and distances for every building
-    distances, indices = nbrs.kneighbors(Y)
-    distances = distances + 1e-20
+    # the assets handled by this process
+    asset_files = [
+        asset["file"]
+        for i, asset in enumerate(asset_dict)
+        if runParallel == False or (i % numP) == procID
+    ]
 
     # initialize the random generator
     if seed is not None:
@@ -138,168 +203,169 @@ def find_neighbors(
     else:
         rng = np.random.default_rng()
 
-    count = 0
+    gp_files = grid_df["GP_file"].values
+
+    # this is the preferred behavior, the else caluse is left for legacy inputs
+    csv_grid = gp_files[0][-3:] == "csv"
+    if csv_grid:
+        # We assume that every grid point has the same type and number of
+        # event data. That is, you cannot mix ground motion records and
+        # intensity measures and you cannot assign 10 records to one point
+        # and 15 records to another.
+
+        # Load the first file and identify if this is a grid of IM or GM
+        # information. GM grids have GM record filenames defined in the
+        # grid point files.
+        first_file = pd.read_csv(event_dir / gp_files[0], header=0)
+        if first_file.columns[0] == "TH_file":
+            event_type = "timeHistory"
+        else:
+            event_type = "intensityMeasure"
+        event_count = first_file.shape[0]
+
+        # make sure we resample events if samples > event_count
+        event_j_list = np.arange(samples) % event_count
+
+    # the events of every grid point are loaded only once
+    gp_event_cache = {}
+
+    # process the assets in batches: every AIM file is read and written once
+    for batch_start in range(0, len(asset_files), batch_size):
+        batch_files = asset_files[batch_start : batch_start + batch_size]
+
+        batch_data = []
+        for asst_file in batch_files:
+            with open(asst_file, "r", encoding="utf-8") as f:
+                batch_data.append(json.load(f))
+
+        # store building locations in Y
+        asset_locs = np.array(
+            [
+                [
+                    asset_data["GeneralInformation"]["location"]["longitude"],
+                    asset_data["GeneralInformation"]["location"]["latitude"],
+                ]
+                for asset_data in batch_data
+            ],
+            dtype=float,
+        )
+        valid_loc = ~np.isnan(asset_locs).any(axis=1)
+        batch_files = [x for x, v in zip(batch_files, valid_loc) if v]
+        batch_data = [x for x, v in zip(batch_data, valid_loc) if v]
+        Y = asset_locs[valid_loc]
 
-    # iterate through the buildings and store the selected events in the AIM
-    for asset_i, (AIM_id, dist_list, ind_list) in enumerate(
-        zip(AIM_df.index, distances, indices)
-    ):
-        # open the AIM file
-        asst_file = AIM_df.iloc[AIM_id]["file"]
+        if len(Y) == 0:
+            continue
 
-        with open(asst_file, "r", encoding="utf-8") as f:
-            asset_data = json.load(f)
+        # collect the neighbor indices and distances for every building
+        distances, indices = nbrs.kneighbors(Y)
+        distances = distances + 1e-20
 
+        # collect the labels used to filter the neighbors of every building
         if filter_label != "":
-            # soil type of building
-            asset_label = asset_data["GeneralInformation"][filter_label]
-            # soil types of all initial neighbors
-            grid_label = grid_df[filter_label][ind_list]
-
-            # only keep the distances and indices corresponding to neighbors
-            # with the same soil type
-            dist_list = dist_list[(grid_label == asset_label).values]
-            ind_list = ind_list[(grid_label == asset_label).values]
-
-            # return dist_list & ind_list with a length equals neighbors
-            # assuming that at least neighbors grid points exist with
-            # the same filter_label as the building
-
-            # because dist_list, ind_list sorted initially in order of increasing
-            # distance, just take the first neighbors grid points of each
-            dist_list = dist_list[:neighbors]
-            ind_list = ind_list[:neighbors]
-
-        if len(grid_extra_keys) > 0:
-            filter_labels = []
-            for key in asset_data["GeneralInformation"].keys():
-                if key in grid_extra_keys:
-                    filter_labels.append(key)
-
-            filter_list = [True for i in dist_list]
-            for filter_label in filter_labels:
-                asset_label = asset_data["GeneralInformation"][filter_label]
-                grid_label = grid_df[filter_label][ind_list]
-                filter_list_i = (grid_label == asset_label).values
-                filter_list = filter_list and filter_list_i
-
-            # only keep the distances and indices corresponding to neighbors
-            # with the same soil type
-            dist_list = dist_list[filter_list]
-            ind_list = ind_list[filter_list]
-
-            # return dist_list & ind_list with a length equals neighbors
-            # assuming that at least neighbors grid points exist with
-            # the same filter_label as the building
-
-            # because dist_list, ind_list sorted initially in order of increasing
-            # distance, just take the first neighbors grid points of each
-            dist_list = dist_list[:neighbors]
-            ind_list = ind_list[:neighbors]
-
-        # calculate the weights for each neighbor based on their distance
-        dist_list = 1.0 / (dist_list**2.0)
-        weights = np.array(dist_list) / np.sum(dist_list)
-
-        # get the pre-defined number of samples for each neighbor
-        nbr_samples = np.where(rng.multinomial(1, weights, samples) == 1)[1]
-
-        # this is the preferred behavior, the else caluse is left for legacy inputs
-        if grid_df.iloc[0]["GP_file"][-3:] == "csv":
-            # We assume that every grid point has the same type and number of
-            # event data. That is, you cannot mix ground motion records and
-            # intensity measures and you cannot assign 10 records to one point
-            # and 15 records to another.
-
-            # Load the first file and identify if this is a grid of IM or GM
-            # information. GM grids have GM record filenames defined in the
-            # grid point files.
-            first_file = pd.read_csv(event_dir / grid_df.iloc[0]["GP_file"], header=0)
-            if first_file.columns[0] == "TH_file":
-                event_type = "timeHistory"
-            else:
-                event_type = "intensityMeasure"
-            event_count = first_file.shape[0]
-
-            # collect the list of events and scale factors
-            event_list = []
-            scale_list = []
+            asset_labels = [
+                {filter_label: asset_data["GeneralInformation"][filter_label]}
+                for asset_data in batch_data
+            ]
+            label_keys = [filter_label]
+        else:
+            asset_labels = [
+                {
+                    key: asset_data["GeneralInformation"][key]
+                    for key in asset_data["GeneralInformation"].keys()
+                    if key in grid_extra_keys
+                }
+                for asset_data in batch_data
+            ]
+            label_keys = grid_extra_keys
+
+        dist_lists, ind_lists = get_neighbor_lists(
+            distances,
+            indices,
+            asset_labels,
+            grid_df,
+            label_keys,
+            neighbors,
+            filter_label != "" or len(grid_extra_keys) > 0,
+        )
 
-            # for each neighbor
-            for sample_j, nbr in enumerate(nbr_samples):
-                # make sure we resample events if samples > event_count
-                event_j = sample_j % event_count
+        nbr_samples_list = sample_neighbors(dist_lists, samples, rng)
 
-                # get the index of the nth neighbor
-                nbr_index = ind_list[nbr]
+        # iterate through the buildings and store the selected events in the AIM
+        for asst_file, asset_data, ind_list, nbr_samples in zip(
+            batch_files, batch_data, ind_lists, nbr_samples_list
+        ):
+            if csv_grid:
+                # get the index of the selected neighbor of each sample
+                nbr_index_list = ind_list[nbr_samples]
 
                 # if the grid has ground motion records...
                 if event_type == "timeHistory":
-                    # load the file for the selected grid point
-                    event_collection_file = grid_df.iloc[nbr_index]["GP_file"]
-                    event_df = pd.read_csv(event_dir / event_collection_file, header=0)
+                    event_list = []
+                    scale_list = []
+                    for event_j, nbr_index in zip(event_j_list, nbr_index_list):
+                        if nbr_index not in gp_event_cache:
+                            gp_event_cache[nbr_index] = load_grid_point_events(
+                                event_dir, gp_files[nbr_index]
+                            )
+                        event_names, event_scales = gp_event_cache[nbr_index]
 
-                    # append the GM record name to the event list
-                    event_list.append(event_df.iloc[event_j, 0])
+                        # append the GM record name to the event list
+                        event_list.append(event_names[event_j])
 
-                    # append the scale factor (or 1.0) to the scale list
-                    if len(event_df.columns) > 1:
-                        scale_list.append(float(event_df.iloc[event_j, 1]))
-                    else:
-                        scale_list.append(1.0)
+                        # append the scale factor (or 1.0) to the scale list
+                        scale_list.append(float(event_scales[event_j]))
 
                 # if the grid has intensity measures
                 elif event_type == "intensityMeasure":
                     # save the collection file name and the IM row id
-                    event_list.append(
-                        grid_df.iloc[nbr_index]["GP_file"] + f"x{event_j}"
-                    )
+                    event_list = [
+                        gp_files[nbr_index] + f"x{event_j}"
+                        for event_j, nbr_index in zip(event_j_list, nbr_index_list)
+                    ]
 
                     # IM collections are not scaled
-                    scale_list.append(1.0)
+                    scale_list = [1.0] * len(event_list)
 
-        # TODO: update the LLNL input data and remove this clause
-        else:
-            event_list = []
-            for e, i in zip(nbr_samples, ind_list):
-                event_list += [
-                    grid_df.iloc[i]["GP_file"],
-                ] * e
-
-            scale_list = np.ones(len(event_list))
-
-        # prepare a dictionary of events
-        event_list_json = []
-        for e_i, event in enumerate(event_list):
-            # event_list_json.append({
-            #    #"EventClassification": "Earthquake",
-            #    "fileName": f'{event}x{e_i:05d}',
-            #    "factor": scale_list[e_i],
-            #    #"type": event_type
-            #    })
-            event_list_json.append([f"{event}x{e_i:05d}", scale_list[e_i]])
-
-        # save the event dictionary to the AIM
-        # TODO: we assume there is only one event
-        # handling multiple events will require more sophisticated inputs
-
-        if "Events" not in asset_data:
-            asset_data["Events"] = [{}]
-        elif len(asset_data["Events"]) == 0:
-            asset_data["Events"].append({})
-
-        asset_data["Events"][0].update(
-            {
-                # "EventClassification": "Earthquake",
-                "EventFolderPath": str(event_dir),
-                "Events": event_list_json,
-                "type": event_type
-                # "type": "SimCenterEvents"
-            }
-        )
-
-        with open(asst_file, "w", encoding="utf-8") as f:
-            json.dump(asset_data, f, indent=2)
+            # TODO: update the LLNL input data and remove this clause
+            else:
+                event_list = []
+                for e, i in zip(nbr_samples, ind_list):
+                    event_list += [
+                        gp_files[i],
+                    ] * e
+
+                scale_list = np.ones(len(event_list))
+
+            # prepare a dictionary of events
+            event_list_json = [
+                [f"{event}x{e_i:05d}", scale_list[e_i]]
+                for e_i, event in enumerate(event_list)
+            ]
+
+            # save the event dictionary to the AIM
+            # TODO: we assume there is only one event
+            # handling multiple events will require more sophisticated inputs
+
+            if "Events" not in asset_data:
+                asset_data["Events"] = [{}]
+            elif len(asset_data["Events"]) == 0:
+                asset_data["Events"].append({})
+
+            asset_data["Events"][0].update(
+                {
+                    # "EventClassification": "Earthquake",
+                    "EventFolderPath": str(event_dir),
+                    "Events": event_list_json,
+                    "type": event_type
+                    # "type": "SimCenterEvents"
+                }
+            )
+
+        # write the updated AIMs of the batch
+        for asst_file, asset_data in zip(batch_files, batch_data):
+            with open(asst_file, "w", encoding="utf-8") as f:
+                json.dump(asset_data, f, indent=2)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,105 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("sklearn")
+import NNE
+
+
+def test_sample_neighbors_matches_asset_loop():
+    # runs of assets with the same and with different numbers of neighbors
+    rng = np.random.default_rng(0)
+    nbr_counts = [4, 4, 4, 2, 2, 4, 1, 3, 3]
+    dist_lists = [rng.uniform(0.01, 1.0, n) for n in nbr_counts]
+
+    nbr_samples = NNE.sample_neighbors(dist_lists, 7, np.random.default_rng(42))
+
+    # drawing the assets one by one
+    rng = np.random.default_rng(42)
+    for dist_list, asset_samples in zip(dist_lists, nbr_samples):
+        dist_inv = 1.0 / (dist_list**2.0)
+        weights = dist_inv / np.sum(dist_inv)
+        expected = np.where(rng.multinomial(1, weights, 7) == 1)[1]
+        np.testing.assert_array_equal(asset_samples, expected)
+
+
+def test_neighbor_lists_match_asset_loop():
+    rng = np.random.default_rng(1)
+    grid_df = pd.DataFrame(
+        {"Soil": rng.choice(["A", "B"], 30), "Zone": rng.choice([1, 2], 30)}
+    )
+    indices = np.array([rng.permutation(30)[:12] for i in range(5)])
+    distances = np.sort(rng.uniform(0.0, 1.0, indices.shape), axis=1)
+    asset_labels = [
+        {"Soil": rng.choice(["A", "B"]), "Zone": rng.choice([1, 2])} for i in range(5)
+    ]
+
+    dist_lists, ind_lists = NNE.get_neighbor_lists(
+        distances, indices, asset_labels, grid_df, ["Soil", "Zone"], 3, True
+    )
+
+    for i in range(5):
+        keep = [
+            j
+            for j in range(indices.shape[1])
+            if all(
+                grid_df[key].iloc[indices[i, j]] == label
+                for key, label in asset_labels[i].items()
+            )
+        ][:3]
+        np.testing.assert_array_equal(ind_lists[i], indices[i, keep])
+        np.testing.assert_array_equal(dist_lists[i], distances[i, keep])
+
+
+def write_inputs(tmp_path, num_assets=9):
+    rng = np.random.default_rng(2)
+    event_dir = tmp_path / "events"
+    event_dir.mkdir()
+    grid = []
+    for i in range(12):
+        gp_file = f"GP_{i}.csv"
+        pd.DataFrame(
+            {"TH_file": [f"GM_{i}_{j}" for j in range(4)], "factor": rng.uniform(0.5, 2.0, 4)}
+        ).to_csv(event_dir / gp_file, index=False)
+        grid.append(
+            {"GP_file": gp_file, "Longitude": -122.0 + 0.01 * (i % 4), "Latitude": 37.0 + 0.01 * (i // 4)}
+        )
+    pd.DataFrame(grid).to_csv(event_dir / "EventGrid.csv", index=False)
+
+    asset_list = []
+    for i in range(num_assets):
+        aim_file = tmp_path / f"{i}-AIM.json"
+        with open(aim_file, "w", encoding="utf-8") as f:
+            json.dump(
+                {"GeneralInformation": {"location": {
+                    "longitude": -122.0 + rng.uniform(0, 0.03),
+                    "latitude": 37.0 + rng.uniform(0, 0.02)}}},
+                f,
+            )
+        asset_list.append({"id": str(i), "file": str(aim_file)})
+    asset_file = tmp_path / "assets.json"
+    with open(asset_file, "w", encoding="utf-8") as f:
+        json.dump(asset_list, f)
+    return str(asset_file), str(event_dir / "EventGrid.csv"), asset_list
+
+
+def read_events(asset_list):
+    events = []
+    for asset in asset_list:
+        with open(asset["file"], "r", encoding="utf-8") as f:
+            events.append(json.load(f)["Events"][0]["Events"])
+    return events
+
+
+def test_find_neighbors_does_not_depend_on_batch_size(tmp_path):
+    asset_file, grid_file, asset_list = write_inputs(tmp_path)
+
+    NNE.find_neighbors(asset_file, grid_file, 6, 3, "", 7, "False", batch_size=2)
+    events_small = read_events(asset_list)
+    NNE.find_neighbors(asset_file, grid_file, 6, 3, "", 7, "False", batch_size=100)
+    events_large = read_events(asset_list)
+
+    assert events_small == events_large
+    assert all(len(x) == 6 for x in events_large)
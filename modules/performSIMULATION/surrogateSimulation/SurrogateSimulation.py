@@ -58,6 +58,61 @@ convert_EDP = {
     'residual_disp': 'RFD'
 }
 
+def get_prediction_server_address():
+
+    # one prediction server per user and host
+    import getpass, socket, tempfile
+    tag = 'gpPredict_{}_{}'.format(getpass.getuser(), socket.gethostname())
+    key_file = os.path.join(tempfile.gettempdir(), tag + '.key')
+    if sys.platform.lower().startswith('win'):
+        return r'\\.\pipe\{}'.format(tag), key_file
+    return os.path.join(tempfile.gettempdir(), tag + '.sock'), key_file
+
+
+def request_prediction(surrogatePredictionPath, params_name, surrogate_meta_name, surrogate_name, input_json, timeout=60.):
+
+    #
+    # send the prediction request for the current workdir to the prediction
+    # server, which keeps the surrogate in memory and predicts the requests of
+    # concurrent workdirs in one batch. The server is started if not running.
+    # Returns None if the server could not be reached
+    #
+
+    import time
+    from multiprocessing.connection import Client
+
+    address, key_file = get_prediction_server_address()
+    t_start = time.time()
+    t_started = None
+    conn = None
+    while conn is None and time.time() - t_start < timeout:
+        try:
+            with open(key_file, 'rb') as f:
+                authkey = f.read()
+            conn = Client(address, authkey=authkey)
+        except Exception:
+            # (re)start the server; a server that is already running exits immediately
+            if t_started is None or time.time() - t_started > 15.:
+                import subprocess
+                subprocess.Popen([sys.executable, surrogatePredictionPath, '--serve', address, key_file],
+                                 stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+                t_started = time.time()
+            time.sleep(0.2)
+
+    if conn is None:
+        return None
+
+    try:
+        conn.send({'cwd': os.getcwd(), 'params_dir': params_name, 'result_file': 'results.out',
+                   'input_json': input_json, 'surrogate_dir': surrogate_name,
+                   'json_dir': surrogate_meta_name})
+        status = conn.recv()
+    except (EOFError, OSError):
+        status = None
+    conn.close()
+    return status
+
+
 def run_surrogateGP(AIM_input_path, EDP_input_path):
 
     # these imports are here to save time when the app is called without
@@ -92,7 +147,13 @@ def run_surrogateGP(AIM_input_path, EDP_input_path):
 
     # compute IMs
     # print(f"{pythonEXE} {surrogatePredictionPath} {params_name} {surrogate_meta_name} {surrogate_name}")
-    os.system(f"{pythonEXE} {surrogatePredictionPath} {params_name} {surrogate_meta_name} {surrogate_name}")
+    use_server = root_AIM.get('Simulation', {}).get('predictionServer', False)
+    use_server = use_server or (os.environ.get('SIMCENTER_SURROGATE_SERVER', '0') == '1')
+    status = None
+    if use_server:
+        status = request_prediction(surrogatePredictionPath, params_name, surrogate_meta_name, "dummy", surrogate_name)
+    if status is None:
+        os.system(f"{pythonEXE} {surrogatePredictionPath} {params_name} {surrogate_meta_name} {surrogate_name}")
 
     #
     # check if the correct workflow applications are selected
@@ -442,7 +442,7 @@ class PLoM:
             self.logfile.write_msg(msg='PLoM.config_tasks: the following tasks is configured to run: {}.'.format('->'.join(self.cur_task_list)),msg_type='RUNNING',msg_level=0)
         
 
-    def RunAlgorithm(self, n_mc = 5, epsilon_pca = 1e-6, epsilon_kde = 25, tol_PCA2 = 1e-5, tol = 1e-6, max_iter = 50, plot_tag = False, runDiffMaps = None, seed_num=None, tolKDE=0.1):
+    def RunAlgorithm(self, n_mc = 5, epsilon_pca = 1e-6, epsilon_kde = 25, tol_PCA2 = 1e-5, tol = 1e-6, max_iter = 50, plot_tag = False, runDiffMaps = None, seed_num=None, tolKDE=0.1, n_chains=1):
         """
         Running the PLoM algorithm to train the model and generate new realizations
         - n_mc: realization/sample size ratio
@@ -450,6 +450,7 @@ class PLoM:
         - epsilon_kde: smoothing parameter in the kernel density estimation
         - tol: tolerance in the PLoM iterations
         - max_iter: maximum number of iterations of the PLoM algorithm
+        - n_chains: number of ISDE chains advanced together
         """
         if runDiffMaps == None:
             runDiffMaps = self.runDiffMaps
@@ -520,7 +521,7 @@ class PLoM:
             elif cur_task.task_name == 'ISDEGeneration':
                 self.__getattribute__('task_'+cur_task.task_name).avail_var_list = []
                 #ISDE generation
-                self.ISDEGeneration(n_mc = n_mc, tol_PCA2 = tol_PCA2, tol = tol, max_iter = max_iter, seed_num=seed_num)
+                self.ISDEGeneration(n_mc = n_mc, tol_PCA2 = tol_PCA2, tol = tol, max_iter = max_iter, seed_num=seed_num, n_chains=n_chains)
                 self.logfile.write_msg(msg='PLoM.RunAlgorithm: Realizations generated.',msg_type='RUNNING',msg_level=0)
                 self.dbserver.add_item(item_name = 'X_new', col_names = list(self.X0.columns), item = self.Xnew.T, data_shape=self.Xnew.shape)
                 self.logfile.write_msg(msg='PLoM.RunAlgorithm: X_new saved.',msg_type='RUNNING',msg_level=0)
@@ -618,7 +619,7 @@ class PLoM:
         return g, m, a, Z, eigenvalues
 
 
-    def ISDEGeneration(self, n_mc = 5, tol_PCA2 = 1e-5, tol = 0.02, max_iter = 50, seed_num=None):
+    def ISDEGeneration(self, n_mc = 5, tol_PCA2 = 1e-5, tol = 0.02, max_iter = 50, seed_num=None, n_chains=1):
         """
         The construction of a nonlinear Ito Stochastic Differential Equation (ISDE) to generate realizations of random variable H
         """
@@ -656,7 +657,7 @@ class PLoM:
                                             n_mc, self.x_mean, self.H, self.s_v,\
                                             self.hat_s_v, self.mu, self.phi,\
                                             self.g[:,0:int(self.m)],  psi=self.psi,\
-                                            lambda_i=self.lambda_i, g_c=self.g_c, D_x_g_c = self.D_x_g_c) #solve the ISDE in n_mc iterations
+                                            lambda_i=self.lambda_i, g_c=self.g_c, D_x_g_c = self.D_x_g_c, n_chains=n_chains) #solve the ISDE in n_mc iterations
 
                 self.gradient = plom.gradient_gamma(self.b_c, Hnewvalues, self.g_c, self.phi, self.mu, self.psi, self.x_mean)
                 self.hessian = plom.hessian_gamma(Hnewvalues, self.psi, self.g_c, self.phi, self.mu, self.x_mean)
@@ -688,7 +689,7 @@ class PLoM:
             Hnewvalues, nu_lambda, x_, x_2 = plom.generator(self.Z, self.Y, self.a,\
                                         n_mc, self.x_mean, self.H, self.s_v,\
                                         self.hat_s_v, self.mu, self.phi,\
-                                        self.g[:,0:int(self.m)],seed_num=seed_num) #solve the ISDE in n_mc iterations
+                                        self.g[:,0:int(self.m)],seed_num=seed_num,n_chains=n_chains) #solve the ISDE in n_mc iterations
             self.logfile.write_msg(msg='PLoM.ISDEGeneration: new generations are simulated.',msg_type='RUNNING',msg_level=0)
             self.dbserver.add_item(item_name = 'Errors', item = np.array([0]))
 
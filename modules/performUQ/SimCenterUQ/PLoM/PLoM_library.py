@@ -3,6 +3,7 @@
 #from matplotlib import pyplot as plt
 import numpy as np
 from scipy import integrate
+from scipy.spatial.distance import cdist
 from math import sqrt, exp, pi, log
 import time
 from ctypes import *
@@ -71,19 +72,10 @@ def K(eta, epsilon):
            [1., 1.]]), array([[2., 0.],
            [0., 2.]]))
     """
-    N = eta.shape[1]
-    K = np.zeros((N,N))
-    b = np.zeros((N,N))
-    for i in range(0,N):
-        row_sum = 0
-        for j in range(0,N):
-            if j != i:
-                K[i,j] = kernel((eta[:,i]),((eta[:,j])), epsilon)
-                row_sum = row_sum + K[i,j]
-            else:
-                K[i,j] = 1
-                row_sum = row_sum + 1
-        b[i,i] = row_sum
+    eta_t = np.ascontiguousarray(np.transpose(eta), dtype=np.float64)
+    K = np.exp(-cdist(eta_t, eta_t, 'sqeuclidean')/(4*epsilon))
+    np.fill_diagonal(K, 1)
+    b = np.diag(np.sum(K, axis=1))
     return K, b
 
 def g(K, b):
@@ -252,7 +244,12 @@ def solve_inverse(matrix):
         return inverse
 
 
-def generator(z_init, y_init, a, n_mc, x_mean, eta, s_v, hat_s_v, mu, phi, g, psi = 0, lambda_i = 0, g_c = 0, D_x_g_c = 0, seed_num=None):
+def generator(z_init, y_init, a, n_mc, x_mean, eta, s_v, hat_s_v, mu, phi, g, psi = 0, lambda_i = 0, g_c = 0, D_x_g_c = 0, seed_num=None, n_chains=1):
+    """
+    Solving the ISDE with n_chains independent chains advanced together (the 
+    drift of all chains is evaluated in one batch), each chain generating 
+    ceil(n_mc/n_chains) realization sets after its own burn-in
+    """
     if seed_num:
         np.random.seed(seed_num)
     delta_t = 2*pi*hat_s_v/20
@@ -263,81 +260,87 @@ def generator(z_init, y_init, a, n_mc, x_mean, eta, s_v, hat_s_v, mu, phi, g, ps
     beta = f_0*delta_t/4
     nu = z_init.shape[0]
     N = a.shape[0]
-    eta_lambda = np.zeros((nu,(n_mc+1)*N))
-    nu_lambda = np.zeros((nu,(n_mc+1)*N))
-    n = x_mean.shape[0]
-    x_ = np.zeros((n,n_mc))
-    x_2 = np.zeros((n,n_mc))
-    z_l = z_init
-    y_l = y_init
-    eta_lambda[:,0:N] = z_init.dot(np.transpose(g))
-    nu_lambda[:,0:N] = y_init.dot(np.transpose(g))
+    n_chains = max(1, min(int(n_chains), n_mc))
+    n_mc_chain = int(np.ceil(n_mc/n_chains))
+    # scaled eta held contiguously for all drift evaluations
+    eta_scaled = np.ascontiguousarray((hat_s_v/s_v)*np.transpose(eta), dtype=np.float64)
+    # chain states (n_chains, nu, m) - extra chains start with new random velocities
+    z_l = np.repeat(z_init[np.newaxis, :, :], n_chains, axis=0)
+    y_l = np.stack([y_init]+[np.random.normal(size=(nu,N)).dot(a) for i in range(1, n_chains)])
+    eta_lambda = np.zeros((n_chains,nu,(n_mc_chain+1)*N))
+    nu_lambda = np.zeros((n_chains,nu,(n_mc_chain+1)*N))
+    eta_lambda[:,:,0:N] = z_l.dot(np.transpose(g))
+    nu_lambda[:,:,0:N] = y_l.dot(np.transpose(g))
+    def L_chains(z):
+        # gradient of the potential for all chains in one batch
+        y = np.transpose(z.dot(np.transpose(g)), (1,0,2)).reshape((nu,n_chains*N))
+        L_all = L(y, g_c, x_mean, eta, s_v, hat_s_v, mu, phi, psi, lambda_i, D_x_g_c, eta_scaled=eta_scaled)
+        return np.transpose(L_all.reshape((nu,n_chains,N)), (1,0,2)).dot(a)
     for i in range (0,l_0):
         z_l_half = z_l + delta_t*0.5*y_l
-        w_l_1 = np.random.normal(scale = sqrt(delta_t), size = (nu,N)).dot(a) #wiener process
-        L_l_half = L(z_l_half.dot(np.transpose(g)), g_c, x_mean, eta, s_v, hat_s_v, mu, phi, psi, lambda_i, D_x_g_c).dot(a)
+        w_l_1 = np.random.normal(scale = sqrt(delta_t), size = (n_chains,nu,N)).dot(a) #wiener process
+        L_l_half = L_chains(z_l_half)
         y_l_1 = (1-beta)*y_l/(1+beta) + delta_t*(L_l_half)/(1+beta) + sqrt(f_0)*w_l_1/(1+beta)
         z_l = z_l_half + delta_t*0.5*y_l_1
         y_l = y_l_1
-    for l in range(M_0, M_0*(n_mc+1)):
+    for l in range(M_0, M_0*(n_mc_chain+1)):
         z_l_half = z_l + delta_t*0.5*y_l
-        w_l_1 = np.random.normal(scale = sqrt(delta_t), size = (nu,N)).dot(a) #wiener process
-        L_l_half = L(z_l_half.dot(np.transpose(g)), g_c, x_mean, eta, s_v, hat_s_v, mu, phi, psi, lambda_i, D_x_g_c).dot(a)
+        w_l_1 = np.random.normal(scale = sqrt(delta_t), size = (n_chains,nu,N)).dot(a) #wiener process
+        L_l_half = L_chains(z_l_half)
         y_l_1 = (1-beta)*y_l/(1+beta) + delta_t*(L_l_half)/(1+beta) + sqrt(f_0)*w_l_1/(1+beta)
         z_l = z_l_half + delta_t*0.5*y_l_1
         y_l = y_l_1
         if l%M_0 == M_0-1:
-            eta_lambda[:,int(l/M_0)*N:(int(l/M_0)+1)*N] = z_l.dot(np.transpose(g))
-            nu_lambda[:,int(l/M_0)*N:(int(l/M_0)+1)*N] = y_l.dot(np.transpose(g))
-            x_[:,int(l/M_0)-1:int(l/M_0)] = mean(x_mean + phi.dot(np.diag(mu)).dot(eta_lambda[:,:(int(l/M_0)+1)*N]))
-            x_2[:,int(l/M_0)-1:int(l/M_0)] = mean((x_mean + phi.dot(np.diag(mu)).dot(eta_lambda[:,:(int(l/M_0)+1)*N]))**2)
-    return eta_lambda[:,N:], nu_lambda[:,N:], x_, x_2
+            eta_lambda[:,:,int(l/M_0)*N:(int(l/M_0)+1)*N] = z_l.dot(np.transpose(g))
+            nu_lambda[:,:,int(l/M_0)*N:(int(l/M_0)+1)*N] = y_l.dot(np.transpose(g))
+    # collecting n_mc realization sets (chain by chain)
+    eta_new = np.concatenate(list(eta_lambda[:,:,N:]), axis=1)[:,:n_mc*N]
+    nu_new = np.concatenate(list(nu_lambda[:,:,N:]), axis=1)[:,:n_mc*N]
+    # running mean of x and x**2 including the initial set
+    x_sets = (x_mean + phi.dot(np.diag(mu)).dot(np.concatenate((eta_lambda[0,:,:N], eta_new), axis=1))).reshape((-1,n_mc+1,N))
+    count = N*np.arange(1,n_mc+2)
+    x_ = (np.cumsum(np.sum(x_sets, axis=2), axis=1)/count)[:,1:]
+    x_2 = (np.cumsum(np.sum(x_sets**2, axis=2), axis=1)/count)[:,1:]
+    return eta_new, nu_new, x_, x_2
 
 def ac(sig):
     sig = sig - np.mean(sig)
     sft = np.fft.rfft( np.concatenate((sig,0*sig)) )
     return np.fft.irfft(np.conj(sft)*sft)
 
-def L(y, g_c, x_mean, eta, s_v, hat_s_v, mu, phi, psi, lambda_i, D_x_g_c): #gradient of the potential
-    nu = eta.shape[0]
-    N = eta.shape[1]
-    L = np.zeros((nu,N))
-    for l in range(0,N):
-        yl = np.resize(y[:,l],(len(y[:,l]),1))
-        rho_ = rhoctypes(yl, np.resize(np.transpose(eta),(nu*N,1)),\
-                 nu, N, s_v, hat_s_v)
-        rho_ = 1e250*rho_
-        # compute the D_x_g_c if D_x_g_c is not 0 (KZ)
-        if D_x_g_c:
+def gradient_log_rho(y, eta_scaled, hat_s_v, max_elements=2**22):
+    """
+    Gradient of log(rho) of the KDE at all samples y (nu x n) given the scaled 
+    eta (N x nu, (hat_s_v/s_v)*eta^T), computed in blocks of samples to bound 
+    the memory of the distance matrix. The Gaussian weights are shifted by the 
+    closest point so that far-away samples tend to the direction of the 
+    closest eta instead of underflowing.
+    >>> gradient_log_rho(np.array([[0.],[0.]]), np.array([[1.,0.],[-1.,0.]]), 1.0)
+    array([[0.],
+           [0.]])
+    """
+    nu, n = y.shape
+    y_t = np.ascontiguousarray(np.transpose(y), dtype=np.float64)
+    grad = np.zeros((n, nu))
+    block_size = max(1, int(max_elements/max(1, eta_scaled.shape[0])))
+    for i in range(0, n, block_size):
+        cur_y = y_t[i:i+block_size]
+        d2 = cdist(cur_y, eta_scaled, 'sqeuclidean')
+        w = np.exp(-(d2-np.min(d2, axis=1, keepdims=True))/(2*hat_s_v**2))
+        grad[i:i+block_size] = (w.dot(eta_scaled)/np.sum(w, axis=1, keepdims=True)-cur_y)/(hat_s_v**2)
+    return np.transpose(grad)
+
+def L(y, g_c, x_mean, eta, s_v, hat_s_v, mu, phi, psi, lambda_i, D_x_g_c, eta_scaled=None): #gradient of the potential
+    if eta_scaled is None:
+        eta_scaled = np.ascontiguousarray((hat_s_v/s_v)*np.transpose(eta), dtype=np.float64)
+    L = gradient_log_rho(y, eta_scaled, hat_s_v)
+    # compute the D_x_g_c if D_x_g_c is not 0 (KZ)
+    if D_x_g_c:
+        for l in range(0,y.shape[1]):
+            yl = np.resize(y[:,l],(len(y[:,l]),1))
             grad_g_c = D_x_g_c(x_mean+np.resize(phi.dot(np.diag(mu)).dot(yl), (x_mean.shape)))
-        else:
-            # not constraints and no D_x_g_c
-            grad_g_c = np.zeros((x_mean.shape[0],1))
-        if rho_ < 1e-250:
-            closest = 1e30
-            for i in range(0,N):
-                if closest > np.linalg.norm((hat_s_v/s_v)*np.resize(eta[:,i],yl.shape)-yl):
-                    closest = np.linalg.norm((hat_s_v/s_v)*np.resize(eta[:,i],yl.shape)-yl)
-                    vector = (hat_s_v/s_v)*np.resize(eta[:,i],yl.shape)-yl
-            #KZ L[:,l] = (  np.resize(vector/(hat_s_v**2),(nu))\
-            #    -np.resize(np.diag(mu).dot(np.transpose(phi)).\
-            #            dot(D_x_g_c(x_mean+np.resize(phi.dot(np.diag(mu)).dot(yl), (x_mean.shape)))).\
-            #            dot(psi).dot(lambda_i), (nu)))
-            L[:,l] = (  np.resize(vector/(hat_s_v**2),(nu))\
-                -np.resize(np.diag(mu).dot(np.transpose(phi)).\
-                        dot(grad_g_c).dot(psi).dot(lambda_i), (nu)))
-
-        else:
-            array_pointer = cast(gradient_rhoctypes(np.zeros((nu,1)),yl,\
-                np.resize(np.transpose(eta),(nu*N,1)), nu, N, s_v, hat_s_v), POINTER(c_double*nu))
-            gradient_rho = np.frombuffer(array_pointer.contents)
-            #KZ L[:,l] = np.resize(1e250*gradient_rho/rho_,(nu))\
-            #        -np.resize(np.diag(mu).dot(np.transpose(phi)).\
-            #                dot(D_x_g_c(x_mean+np.resize(phi.dot(np.diag(mu)).dot(yl), (x_mean.shape)))).\
-            #                    dot(psi).dot(lambda_i), (nu))
-            L[:,l] = np.resize(1e250*gradient_rho/rho_,(nu))\
-                    -np.resize(np.diag(mu).dot(np.transpose(phi)).\
-                            dot(grad_g_c).dot(psi).dot(lambda_i), (nu))
+            L[:,l] = L[:,l]-np.resize(np.diag(mu).dot(np.transpose(phi)).\
+                dot(grad_g_c).dot(psi).dot(lambda_i), (y.shape[0]))
     return L
 
 
@@ -0,0 +1,107 @@
+from ctypes import POINTER, c_double, cast
+from math import sqrt, pi
+
+import numpy as np
+import pytest
+
+import PLoM_library as plom
+
+
+def get_samples(nu=3, N=40, seed=0):
+    rng = np.random.default_rng(seed)
+    eta = rng.normal(size=(nu, N))
+    eta -= eta.mean(axis=1, keepdims=True)
+    s_v = (4/(N*(2+nu)))**(1/(nu+4))
+    hat_s_v = s_v/np.sqrt(s_v**2+(N-1)/N)
+    return rng, eta, s_v, hat_s_v
+
+
+def K_loop(eta, epsilon):
+    N = eta.shape[1]
+    K = np.ones((N, N))
+    for i in range(N):
+        for j in range(N):
+            if j != i:
+                K[i, j] = plom.kernel(eta[:, i], eta[:, j], epsilon)
+    return K, np.diag(np.sum(K, axis=1))
+
+
+def L_loop(y, eta, s_v, hat_s_v):
+    # the drift of one sample at a time from the C library (the closest eta 
+    # is used where rho underflows)
+    nu, N = eta.shape
+    eta_c = np.resize(np.transpose(eta), (nu*N, 1))
+    L = np.zeros(y.shape)
+    for l in range(y.shape[1]):
+        yl = np.resize(y[:, l], (nu, 1))
+        rho_ = 1e250*plom.rhoctypes(yl, eta_c, nu, N, s_v, hat_s_v)
+        if rho_ < 1e-250:
+            vectors = (hat_s_v/s_v)*eta - yl
+            L[:, l] = vectors[:, np.argmin(np.linalg.norm(vectors, axis=0))]/(hat_s_v**2)
+        else:
+            array_pointer = cast(plom.gradient_rhoctypes(np.zeros((nu, 1)), yl, eta_c, nu, N, s_v, hat_s_v),
+                                 POINTER(c_double*nu))
+            L[:, l] = 1e250*np.frombuffer(array_pointer.contents)/rho_
+    return L
+
+
+def generator_loop(z_init, y_init, a, n_mc, x_mean, eta, s_v, hat_s_v, mu, phi, g, seed_num):
+    # one chain, stepped as before the chains were batched
+    np.random.seed(seed_num)
+    delta_t = 2*pi*hat_s_v/20
+    f_0, l_0, M_0 = 1.5, 10, 10
+    beta = f_0*delta_t/4
+    nu, N = z_init.shape[0], a.shape[0]
+    eta_lambda = np.zeros((nu, (n_mc+1)*N))
+    x_ = np.zeros((x_mean.shape[0], n_mc))
+    z_l, y_l = z_init, y_init
+    eta_lambda[:, 0:N] = z_init.dot(np.transpose(g))
+    for l in list(range(l_0)) + list(range(M_0, M_0*(n_mc+1))):
+        z_l_half = z_l + delta_t*0.5*y_l
+        w_l_1 = np.random.normal(scale=sqrt(delta_t), size=(nu, N)).dot(a)
+        L_l_half = L_loop(z_l_half.dot(np.transpose(g)), eta, s_v, hat_s_v).dot(a)
+        y_l = (1-beta)*y_l/(1+beta) + delta_t*L_l_half/(1+beta) + sqrt(f_0)*w_l_1/(1+beta)
+        z_l = z_l_half + delta_t*0.5*y_l
+        if l >= M_0 and l % M_0 == M_0-1:
+            k = int(l/M_0)
+            eta_lambda[:, k*N:(k+1)*N] = z_l.dot(np.transpose(g))
+            x_[:, k-1] = np.mean(x_mean + phi.dot(np.diag(mu)).dot(eta_lambda[:, :(k+1)*N]), axis=1)
+    return eta_lambda[:, N:], x_
+
+
+def test_K_matches_loop():
+    _, eta, _, _ = get_samples()
+    K, b = plom.K(eta, 2.0)
+    K_ref, b_ref = K_loop(eta, 2.0)
+    np.testing.assert_allclose(K, K_ref, rtol=1e-12)
+    np.testing.assert_allclose(b, b_ref, rtol=1e-12)
+
+
+def test_L_matches_loop():
+    rng, eta, s_v, hat_s_v = get_samples()
+    y = 1.5*rng.normal(size=eta.shape)
+    # a far-away sample where rho underflows
+    y[:, 0] = 50.0
+    L = plom.L(y, 0, np.zeros((5, 1)), eta, s_v, hat_s_v, np.ones(3), rng.normal(size=(5, 3)), 0, 0, 0)
+    np.testing.assert_allclose(L, L_loop(y, eta, s_v, hat_s_v), rtol=1e-7, atol=1e-9)
+
+
+def test_generator_with_one_chain_matches_loop():
+    # the reduced basis of the diffusion maps as in PLoM
+    rng, eta, s_v, hat_s_v = get_samples(N=30)
+    g, eigenvalues = plom.g(*plom.K(eta, 25.0))
+    g = g[:, :4]
+    a = g.dot(np.linalg.inv(np.transpose(g).dot(g)))
+    z_init = eta.dot(a)
+    y_init = rng.normal(size=(3, 4))
+    x_mean = np.zeros((5, 1))
+    phi = rng.normal(size=(5, 3))
+    mu = np.ones(3)
+    eta_new, nu_new, x_, x_2 = plom.generator(z_init, y_init, a, 3, x_mean, eta, s_v, hat_s_v, mu, phi, g, seed_num=5)
+    eta_ref, x_ref = generator_loop(z_init, y_init, a, 3, x_mean, eta, s_v, hat_s_v, mu, phi, g, 5)
+    np.testing.assert_allclose(eta_new, eta_ref, rtol=1e-6, atol=1e-9)
+    np.testing.assert_allclose(x_, x_ref, rtol=1e-6, atol=1e-9)
+    # more chains give the same number of realization sets
+    eta_new, nu_new, x_, x_2 = plom.generator(z_init, y_init, a, 4, x_mean, eta, s_v, hat_s_v, mu, phi, g, seed_num=5, n_chains=3)
+    assert eta_new.shape == (3, 4*30)
+    assert x_.shape == (5, 4)
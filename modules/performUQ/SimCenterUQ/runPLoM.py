@@ -457,6 +457,7 @@ class runPLoM:
             self.logTransform = surrogateInfo.get("logTransform",False)
             self.constraintsFlag = surrogateInfo.get("constraints",False)
             self.kdeTolerance = surrogateInfo.get("kdeTolerance",0.1)
+            self.numChains = int(surrogateInfo.get("numChains",1))
             if self.constraintsFlag:
                 self.constraintsFile = os.path.join(work_dir, "templatedir/plomConstraints.py")
             self.numIter = surrogateInfo.get("numIter",50)
@@ -595,7 +596,7 @@ class runPLoM:
         else:
             tasks = ['DataNormalization','RunPCA','RunKDE']
         self.modelPLoM.ConfigTasks(task_list=tasks)
-        self.modelPLoM.RunAlgorithm(n_mc=self.n_mc, tol = self.tolIter, max_iter = self.numIter, seed_num=self.randomSeed, tolKDE=self.kdeTolerance)
+        self.modelPLoM.RunAlgorithm(n_mc=self.n_mc, tol = self.tolIter, max_iter = self.numIter, seed_num=self.randomSeed, tolKDE=self.kdeTolerance, n_chains=self.numChains)
         if self.n_mc > 0:
             self.modelPLoM.export_results(data_list=['/X0','/X_new'])
         else:
@@ -78,6 +78,7 @@ try:
 
     moduleName = "scipy"
     from scipy.stats import lognorm, norm, cramervonmises, qmc
+    from scipy.linalg import solve_triangular
 
     moduleName = "UQengine"
     # from utilities import run_FEM_batch, errorLog
@@ -2186,7 +2187,14 @@ class surrogate(UQengine):
                     IMSEbase = 1 / xq.shape[0] * sum(Yq_var.flatten())
 
                 tmp = time.time()
-                if self.do_parallel:
+                if imse_closed_form_available(m_stack, doeIdx):
+                    IMSEc1 = imse_batch(m_stack, xc1, xq, np.ones((nq, 1)))
+                    print(
+                        "IMSE: finding the next DOE {} - closed form .. time = {:.2f}".format(
+                            ni, time.time() - tmp
+                        ,flush=True)
+                    )
+                elif self.do_parallel:
                     iterables = (
                         (
                             copy.deepcopy(m_stack),
@@ -2299,7 +2307,14 @@ class surrogate(UQengine):
                     IMSEbase = 1 / xq.shape[0] * sum(phiqr.flatten() * Yq_var.flatten())
 
                 tmp = time.time()
-                if self.do_parallel:
+                if imse_closed_form_available(m_stack, doeIdx):
+                    IMSEc1 = imse_batch(m_stack, xc1, xq, phiqr)
+                    print(
+                        "IMSE: finding the next DOE {} - closed form .. time = {:.2f}".format(
+                            ni, time.time() - tmp
+                        ,flush=True)
+                    )
+                elif self.do_parallel:
                     iterables = (
                         (
                             copy.deepcopy(m_stack),
@@ -2642,6 +2657,57 @@ def imse(m_tmp, xcandi, xq, phiqr, i, y_idx, doeIdx="HF"):
     return IMSEc1, i
 
 
+def imse_closed_form_available(m_tmp, doeIdx="HF"):
+    # exact Gaussian posterior of a single-fidelity GP without a noise structure
+    return (
+        doeIdx == "HF"
+        and isinstance(m_tmp, GPy.models.GPRegression)
+        and isinstance(m_tmp.likelihood, GPy.likelihoods.Gaussian)
+        and m_tmp.Y_metadata is None
+    )
+
+
+def imse_batch(m_tmp, xcandi, xq, phiqr, max_elements=2**24):
+    #
+    # IMSE of all candidates (same as imse) from the rank-one update of the 
+    # current posterior - the Cholesky factor of the current model is reused 
+    # and no candidate model is refitted
+    #
+    X = m_tmp.X
+    Y = m_tmp.Y
+    kern = m_tmp.kern
+    noise_var = float(m_tmp.likelihood.variance[0])
+    chol = m_tmp.posterior.woodbury_chol
+
+    # normalizer after adding the candidate with a dummy response
+    if m_tmp.normalizer is not None:
+        Y_tmp = np.vstack([Y, np.zeros((1, Y.shape[1]))])
+        norm_var = np.std(Y_tmp, axis=0)[0] ** 2
+    else:
+        norm_var = 1.0
+
+    # current posterior at the query points
+    Aq = solve_triangular(chol, kern.K(X, xq), lower=True)
+    var_q = kern.Kdiag(xq) - np.sum(Aq ** 2, axis=0)
+    phiqr = phiqr.flatten()
+    nq = xq.shape[0]
+
+    IMSEc1 = np.zeros(xcandi.shape[0])
+    block_size = max(1, int(max_elements / max(1, nq)))
+    for i in range(0, xcandi.shape[0], block_size):
+        xc = xcandi[i:i + block_size, :]
+        Ac = solve_triangular(chol, kern.K(X, xc), lower=True)
+        var_c = kern.Kdiag(xc) - np.sum(Ac ** 2, axis=0)
+        cov_qc = kern.K(xq, xc) - Aq.T.dot(Ac)
+        # posterior variance reduction by adding each candidate
+        var_reduction = phiqr.dot(cov_qc ** 2) / (var_c + noise_var)
+        IMSEc1[i:i + block_size] = (
+            (phiqr.dot(var_q + noise_var) - var_reduction) * norm_var / nq
+        )
+
+    return IMSEc1
+
+
 class model_info:
     def __init__(
             self, surrogateJson, rvJson, work_dir, x_dim, y_dim, n_processor, idx=0
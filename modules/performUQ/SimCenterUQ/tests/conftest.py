@@ -0,0 +1,5 @@
+import os
+import sys
+
+# surrogateBuild is run as a script, so it is imported as a top-level module
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
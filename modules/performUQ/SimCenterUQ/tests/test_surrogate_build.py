@@ -0,0 +1,49 @@
+import copy
+import importlib
+import sys
+
+import numpy as np
+import pytest
+
+GPy = pytest.importorskip('GPy')
+
+
+@pytest.fixture(scope='module')
+def surrogateBuild(tmp_path_factory):
+    # the module redirects stderr to dakota.err in the working directory
+    cwd = tmp_path_factory.mktemp('surrogate')
+    stderr = sys.stderr
+    with pytest.MonkeyPatch.context() as mp:
+        mp.chdir(cwd)
+        module = importlib.import_module('surrogateBuild')
+    sys.stderr.close()
+    sys.stderr = stderr
+    return module
+
+
+@pytest.mark.parametrize('normalizer', [True, None])
+def test_imse_batch_matches_candidate_loop(surrogateBuild, normalizer):
+    rng = np.random.default_rng(0)
+    X = rng.random((30, 2))
+    Y = np.sin(4 * X[:, :1]) + X[:, 1:] ** 2 + 0.05 * rng.standard_normal((30, 1))
+    m = GPy.models.GPRegression(X, Y * 30 + 5, GPy.kern.Matern52(2, ARD=True), normalizer=normalizer)
+    m.optimize()
+    xc = rng.random((25, 2))
+    xq = rng.random((200, 2))
+    phi = rng.random((200, 1))
+
+    assert surrogateBuild.imse_closed_form_available(m)
+    # refitting a copy of the model for each candidate
+    expected = [surrogateBuild.imse(copy.deepcopy(m), xc[i:i + 1], xq, phi, i, 0)[0] for i in range(25)]
+    np.testing.assert_allclose(surrogateBuild.imse_batch(m, xc, xq, phi), expected, rtol=1e-6)
+    np.testing.assert_allclose(surrogateBuild.imse_batch(m, xc, xq, phi, max_elements=1), expected, rtol=1e-6)
+
+
+def test_imse_closed_form_needs_gaussian_regression(surrogateBuild):
+    rng = np.random.default_rng(1)
+    X = rng.random((10, 1))
+    Y = rng.random((10, 1))
+    m = GPy.models.GPRegression(X, Y, GPy.kern.RBF(1))
+    assert not surrogateBuild.imse_closed_form_available(m, doeIdx='LF')
+    m_het = GPy.models.GPHeteroscedasticRegression(X, Y, GPy.kern.RBF(1))
+    assert not surrogateBuild.imse_closed_form_available(m_het)
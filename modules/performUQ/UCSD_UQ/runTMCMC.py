@@ -12,6 +12,8 @@ from runFEM import runFEM
 from numpy.random import SeedSequence, default_rng
 import os
 import csv
+import hashlib
+import pickle
 
 
 def write_stage_start_info_to_logfile(logfile, stage_number, beta, effective_sample_size, 
@@ -124,12 +126,79 @@ def write_data_to_csvfile(logfile, total_number_of_models_in_ensemble, stage_num
     # Finished writing data
 
 
+def get_fingerprint(*items):
+    """ Hash of the inputs that define an analysis; used to match the cache and the checkpoints to the run """
+    fingerprint = hashlib.sha1()
+
+    def update(item):
+        if isinstance(item, np.ndarray):
+            fingerprint.update(str(item.dtype).encode())
+            fingerprint.update(str(item.shape).encode())
+            fingerprint.update(np.ascontiguousarray(item).tobytes())
+        elif isinstance(item, (list, tuple)):
+            fingerprint.update(b'[')
+            for sub_item in item:
+                update(sub_item)
+            fingerprint.update(b']')
+        elif callable(item) and hasattr(item, '__code__'):
+            fingerprint.update(item.__module__.encode())
+            fingerprint.update(item.__code__.co_code)
+        else:
+            fingerprint.update(repr(item).encode())
+
+    for item in items:
+        update(item)
+    return fingerprint.hexdigest()
+
+
+def get_directory_fingerprint(directory):
+    """ Hash of the names and contents of the files in a directory """
+    fingerprint = hashlib.sha1()
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for file_name in sorted(files):
+            file_path = os.path.join(root, file_name)
+            fingerprint.update(os.path.relpath(file_path, directory).encode())
+            with open(file_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    fingerprint.update(chunk)
+    return fingerprint.hexdigest()
+
+
+def save_checkpoint(checkpoint_file_path, checkpoint):
+    """ Save the state of TMCMC at the end of a stage; the file is replaced atomically """
+    temporary_file_path = checkpoint_file_path + '.tmp'
+    with open(temporary_file_path, 'wb') as f:
+        pickle.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary_file_path, checkpoint_file_path)
+
+
+def load_checkpoint(checkpoint_file_path, fingerprint):
+    """ Load the state of TMCMC saved by a previous run of the same analysis, if any """
+    try:
+        with open(checkpoint_file_path, 'rb') as f:
+            checkpoint = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+    if checkpoint.get('fingerprint') != fingerprint:
+        return None
+    return checkpoint
+
+
 def run_TMCMC(number_of_samples, number_of_chains, all_distributions_list, number_of_MCMC_steps, max_number_of_MCMC_steps, 
              log_likelihood_function, model_parameters, working_directory, seed,
              calibration_data, number_of_experiments, covariance_matrix_list, edp_names_list, edp_lengths_list, scale_factors,
              shift_factors, run_type, logfile, MPI_size, driver_file, parallelize_MCMC=True, 
              model_number=0, total_number_of_models_in_ensemble=1):
-    """ Runs TMCMC Algorithm """
+    """ Runs TMCMC Algorithm 
+
+    Model evaluations are stored in a persistent cache in the working directory
+    and the state of the algorithm is saved at the end of each stage, so that an
+    interrupted run restarted in the same working directory resumes from the 
+    last completed stage.
+    """
 
     # Initialize (beta, effective sample size)
     beta = 0
@@ -144,54 +213,101 @@ def run_TMCMC(number_of_samples, number_of_chains, all_distributions_list, numbe
     model_evidence = 1  # model evidence
     stage_number = 0  # stage number of TMCMC
     log_evidence = 0
+    total_log_evidence = 0
+    weights = None
+    weighted_sample_covariance_matrix = None
+
+    # Persistent store of the model evaluations and checkpoint of the last completed stage
+    cache_fingerprint = get_fingerprint(get_directory_fingerprint(os.path.join(working_directory, "templatedir")),
+                                        driver_file, model_parameters['names'], log_likelihood_function,
+                                        calibration_data, number_of_experiments, covariance_matrix_list,
+                                        edp_names_list, edp_lengths_list, scale_factors, shift_factors)
+    evaluation_cache = tmcmcFunctions.EvaluationCache(os.path.join(working_directory, "tmcmcCache", cache_fingerprint))
+    checkpoint_fingerprint = get_fingerprint(cache_fingerprint, number_of_samples, number_of_chains, seed,
+                                             number_of_MCMC_steps, max_number_of_MCMC_steps, model_parameters)
+    checkpoint_file_path = os.path.join(working_directory, f"tmcmcCheckpoint_Model_{model_number+1}.pkl")
+    checkpoint = load_checkpoint(checkpoint_file_path, checkpoint_fingerprint)
 
-    write_stage_start_info_to_logfile(logfile, stage_number, beta, effective_sample_size, 
-                                      scale_factor_for_proposal_covariance, log_evidence, number_of_samples)
-    # initial samples
-    sample_values = tmcmcFunctions.initial_population(number_of_samples, all_distributions_list)
-
-    # Evaluate posterior at Sm
-    prior_pdf_values = np.array([tmcmcFunctions.log_prior(s, all_distributions_list) for s in sample_values]).squeeze()
-    unnormalized_posterior_pdf_values = prior_pdf_values  # prior = post for beta = 0
-
-    iterables = [(ind, sample_values[ind], model_parameters, working_directory, log_likelihood_function, calibration_data,
-                  number_of_experiments, covariance_matrix_list, edp_names_list, edp_lengths_list,
-                  scale_factors, shift_factors, driver_file) for ind in range(number_of_samples)]
-
-    # Evaluate log-likelihood at current samples Sm
     if run_type == "runningLocal":
         processor_count = mp.cpu_count()
         pool = Pool(processes=processor_count)
-        write_eval_data_to_logfile(logfile, parallelize_MCMC, run_type, proc_count=processor_count, stage_num=stage_number)
-        outputs = pool.starmap(runFEM, iterables)
-        log_likelihoods_list = []
-        predictions_list = []
-        for output in outputs:
-            log_likelihoods_list.append(output[0])
-            predictions_list.append(output[1])
+        write_eval_data_to_logfile(logfile, parallelize_MCMC, run_type, proc_count=processor_count, stage_num=0)
     else:
         from mpi4py.futures import MPIPoolExecutor
         executor = MPIPoolExecutor(max_workers=MPI_size)
-        write_eval_data_to_logfile(logfile, parallelize_MCMC, run_type, MPI_size=MPI_size, stage_num=stage_number)
-        outputs = list(executor.starmap(runFEM, iterables))
+        write_eval_data_to_logfile(logfile, parallelize_MCMC, run_type, MPI_size=MPI_size, stage_num=0)
+
+    if checkpoint is not None:
+        stage_number = checkpoint['stage_number']
+        beta = checkpoint['beta']
+        effective_sample_size = checkpoint['effective_sample_size']
+        number_of_MCMC_steps = checkpoint['number_of_MCMC_steps']
+        scale_factor_for_proposal_covariance = checkpoint['scale_factor_for_proposal_covariance']
+        model_evidence = checkpoint['model_evidence']
+        log_evidence = checkpoint['log_evidence']
+        total_log_evidence = checkpoint['total_log_evidence']
+        total_number_of_model_evaluations = checkpoint['total_number_of_model_evaluations']
+        sample_values = checkpoint['sample_values']
+        log_likelihood_values = checkpoint['log_likelihood_values']
+        unnormalized_posterior_pdf_values = checkpoint['unnormalized_posterior_pdf_values']
+        prediction_values = checkpoint['prediction_values']
+        weights = checkpoint['weights']
+        weighted_sample_covariance_matrix = checkpoint['weighted_sample_covariance_matrix']
+        mytrace = checkpoint['mytrace']
+        np.random.set_state(checkpoint['random_state'])
+        logfile.write("\n\n\t\tResuming from the checkpoint of stage {} in {}".format(stage_number, checkpoint_file_path))
+        logfile.write("\n\t\tbeta = %9.8g" % beta)
+        logfile.write("\n\t\tTotal number of model evaluations so far: {}".format(total_number_of_model_evaluations))
+    else:
+        write_stage_start_info_to_logfile(logfile, stage_number, beta, effective_sample_size, 
+                                          scale_factor_for_proposal_covariance, log_evidence, number_of_samples)
+        # initial samples
+        sample_values = tmcmcFunctions.initial_population(number_of_samples, all_distributions_list)
+
+        # Evaluate posterior at Sm
+        prior_pdf_values = np.array([tmcmcFunctions.log_prior(s, all_distributions_list) for s in sample_values]).squeeze()
+        unnormalized_posterior_pdf_values = prior_pdf_values  # prior = post for beta = 0
+
+        iterables = [(evaluation_cache, ind, sample_values[ind], model_parameters, working_directory, log_likelihood_function, 
+                      calibration_data, number_of_experiments, covariance_matrix_list, edp_names_list, edp_lengths_list,
+                      scale_factors, shift_factors, driver_file) for ind in range(number_of_samples)]
+
+        # Evaluate log-likelihood at current samples Sm
+        if run_type == "runningLocal":
+            outputs = pool.starmap(tmcmcFunctions.runFEM_cached, iterables)
+        else:
+            outputs = list(executor.starmap(tmcmcFunctions.runFEM_cached, iterables))
         log_likelihoods_list = []
         predictions_list = []
         for output in outputs:
             log_likelihoods_list.append(output[0])
             predictions_list.append(output[1])
-    log_likelihood_values = np.array(log_likelihoods_list).squeeze()
-    prediction_values = np.array(predictions_list).squeeze()
-
-    total_number_of_model_evaluations = number_of_samples
-    logfile.write("\n\n\t\tTotal number of model evaluations so far: {}".format(total_number_of_model_evaluations))
+        log_likelihood_values = np.array(log_likelihoods_list).squeeze()
+        prediction_values = np.array(predictions_list).squeeze()
 
-    # Write the results of the first stage to a file named dakotaTabPrior.out for quoFEM to be able to read the results
-    logfile.write("\n\n\t\tWriting prior samples to 'dakotaTabPrior.out' for quoFEM to read the results")
-    write_data_to_tab_files(logfile, working_directory, model_number, model_parameters, 
-                              edp_names_list, edp_lengths_list, number_of_samples, dataToWrite=sample_values, 
-                              tab_file_name="dakotaTabPrior.out", predictions=prediction_values)
+        total_number_of_model_evaluations = number_of_samples
+        logfile.write("\n\n\t\tTotal number of model evaluations so far: {}".format(total_number_of_model_evaluations))
 
-    total_log_evidence = 0
+        # Write the results of the first stage to a file named dakotaTabPrior.out for quoFEM to be able to read the results
+        logfile.write("\n\n\t\tWriting prior samples to 'dakotaTabPrior.out' for quoFEM to read the results")
+        write_data_to_tab_files(logfile, working_directory, model_number, model_parameters, 
+                                  edp_names_list, edp_lengths_list, number_of_samples, dataToWrite=sample_values, 
+                                  tab_file_name="dakotaTabPrior.out", predictions=prediction_values)
+
+    def get_checkpoint():
+        return {'fingerprint': checkpoint_fingerprint, 'stage_number': stage_number, 'beta': beta,
+                'effective_sample_size': effective_sample_size, 'number_of_MCMC_steps': number_of_MCMC_steps,
+                'scale_factor_for_proposal_covariance': scale_factor_for_proposal_covariance,
+                'model_evidence': model_evidence, 'log_evidence': log_evidence, 'total_log_evidence': total_log_evidence,
+                'total_number_of_model_evaluations': total_number_of_model_evaluations,
+                'sample_values': sample_values, 'log_likelihood_values': log_likelihood_values,
+                'unnormalized_posterior_pdf_values': unnormalized_posterior_pdf_values,
+                'prediction_values': prediction_values, 'weights': weights,
+                'weighted_sample_covariance_matrix': weighted_sample_covariance_matrix, 'mytrace': mytrace,
+                'random_state': np.random.get_state()}
+
+    if checkpoint is None:
+        save_checkpoint(checkpoint_file_path, get_checkpoint())
 
     while beta < 1:
         stage_number += 1
@@ -249,7 +365,8 @@ def run_TMCMC(number_of_samples, number_of_chains, all_distributions_list, numbe
                       working_directory, default_rng(child_seeds[sample_num]),
                       calibration_data, number_of_experiments, covariance_matrix_list,
                       edp_names_list, edp_lengths_list, scale_factors,
-                      shift_factors, driver_file, resampled_prediction_values[sample_num, :].reshape((1, -1)))
+                      shift_factors, driver_file, resampled_prediction_values[sample_num, :].reshape((1, -1)),
+                      evaluation_cache)
                       for sample_num in range(number_of_samples)]
         
         if run_type == "runningLocal":
@@ -289,6 +406,9 @@ def run_TMCMC(number_of_samples, number_of_chains, all_distributions_list, numbe
             number_of_MCMC_steps = min(number_of_MCMC_steps, 1 + int(np.log(1 - 0.99) / np.log(1 - acc_rate)))
             logfile.write("\n\t\tnext MCMC Nsteps = %d" % number_of_MCMC_steps)
 
+        save_checkpoint(checkpoint_file_path, get_checkpoint())
+        logfile.write("\n\t\tSaved checkpoint of stage {} to {}".format(stage_number, checkpoint_file_path))
+
         logfile.write('\n\t\t==========================')
 
     # save to trace
@@ -4,11 +4,66 @@ affiliation: University of California, San Diego
 
 """
 
+import os
+import hashlib
+import tempfile
 import numpy as np
 from runFEM import runFEM
 from scipy.special import logsumexp
 
 
+class EvaluationCache:
+    """
+    Persistent store of model evaluations keyed by the exact parameter vector.
+    Each evaluation is saved in its own file in the cache directory, so that
+    the store can be shared by the parallel workers and survives a crash.
+    """
+
+    def __init__(self, location):
+        self.location = location
+        os.makedirs(self.location, exist_ok=True)
+
+    def key(self, parameterSampleValues):
+        values = np.ascontiguousarray(parameterSampleValues, dtype=np.float64).ravel()
+        return hashlib.sha1(values.tobytes()).hexdigest()
+
+    def get(self, parameterSampleValues):
+        values = np.asarray(parameterSampleValues, dtype=np.float64).ravel()
+        try:
+            with np.load(os.path.join(self.location, self.key(values) + ".npz")) as data:
+                if np.array_equal(data["parameters"], values):
+                    return float(data["log_likelihood"]), data["prediction"].copy()
+        except (OSError, ValueError, KeyError):
+            pass
+        return None
+
+    def put(self, parameterSampleValues, log_likelihood, prediction):
+        values = np.asarray(parameterSampleValues, dtype=np.float64).ravel()
+        # write to a temporary file first so that readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=self.location, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, parameters=values, log_likelihood=log_likelihood, prediction=prediction)
+            os.replace(tmp_path, os.path.join(self.location, self.key(values) + ".npz"))
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+def runFEM_cached(evaluationCache, particleNumber, parameterSampleValues, *args):
+    """ runFEM, returning the stored evaluation if the parameter vector was evaluated before """
+    if evaluationCache is None:
+        return runFEM(particleNumber, parameterSampleValues, *args)
+    cached = evaluationCache.get(parameterSampleValues)
+    if cached is not None:
+        return cached
+    log_likelihood, prediction = runFEM(particleNumber, parameterSampleValues, *args)
+    # failed runs are not stored, they are repeated when the parameters are proposed again
+    if np.any(np.isfinite(prediction)):
+        evaluationCache.put(parameterSampleValues, log_likelihood, prediction)
+    return log_likelihood, prediction
+
+
 def initial_population(N, p):
     IniPop = np.zeros((N, len(p)))
     for i in range(len(p)):
@@ -230,6 +285,7 @@ def MCMC_MH(
     locShiftList,
     workflowDriver,
     prediction_current,
+    evaluationCache=None,
 ):
     all_proposals = []
     all_PLP = []
@@ -246,7 +302,8 @@ def MCMC_MH(
             prior_proposal
         ):  # proposal satisfies the prior constraints
             # likelihood_proposal = log_likelihood(ParticleNum, proposal, variables, resultsLocation)
-            likelihood_proposal, prediction_proposal = runFEM(
+            likelihood_proposal, prediction_proposal = runFEM_cached(
+                evaluationCache,
                 ParticleNum,
                 proposal,
                 variables,
@@ -540,9 +540,6 @@ class Damage:
         current_time : int
             current time
         """
-        last_pipe_id = None
-        same_pipe_damage_cnt = None
-        
         if self.pipe_all_damages.empty:
             print("No Pipe damages at all")
             return
@@ -557,110 +554,133 @@ class Damage:
         else:
             raise ValueError("Pipe damage has a unknown type: " + str(type(current_time_pipe_damages) ) + " at time: " + str(current_time) )
 
-        all_damages = current_time_pipe_damages.to_list()
-        for cur_damage in all_damages:
-            #print(cur_damage)
-            
-            pipe_id = cur_damage['pipe_id']
-            #same_pipe_damage_cnt = 1
-            if pipe_id==last_pipe_id:
-                same_pipe_damage_cnt+=1;
+        all_damages  = current_time_pipe_damages.to_list()
+        damage_table = self._getPipeDamageTable(WaterNetwork, all_damages, current_time)
+        
+        self._splitDamagedPipes(WaterNetwork, damage_table)
+        
+        damage_list = []
+        for pipe_id, damage_type, node_A, node_B, new_pipe_id, number, sub_type in zip(damage_table['pipe_id'], damage_table['type'], damage_table['node_A'], damage_table['node_B'], damage_table['new_pipe_id'], damage_table['number'], damage_table['sub_type']):
+            if damage_type == 'leak':
+                damage_list.append((node_A, {'number':number,'damage_type':'leak', 'damage_subtype':sub_type , 'pipe_A':pipe_id, 'pipe_B':new_pipe_id, 'orginal_pipe':pipe_id}) )
             else:
-                last_pipe_id = pipe_id
-                same_pipe_damage_cnt = 1
-            
-            if cur_damage['type'] == 'leak':
-                damage_time = current_time/3600 #cur_damage['damage_time']
-                new_node_id = pipe_id+'_leak_'+repr(same_pipe_damage_cnt);
-                new_pipe_id = pipe_id+'_leak_B_'+repr(same_pipe_damage_cnt)
-                material    = cur_damage['Material']
-                area = None
-                if 'leakD' in cur_damage:
-                    diam = cur_damage['leakD']
-                    area = 3.14*(diam/2)**2
-                else:
-                    #diam = 100*WaterNetwork.get_link(pipe_id).diameter
-                    #area= 0.6032*diam/10000
-                    #pipe_damage_factor = self.scenario_set['pipe_damage_diameter_factor']
-                    diam_m = WaterNetwork.get_link(pipe_id).diameter
-                    
-                    #print(material)
-                    if material in self._registry.settings['pipe_damage_model']:
-                        damage_parameters = self._registry.settings['pipe_damage_model'][material]
-                    else:
-                        damage_parameters = self._registry.settings['default_pipe_damage_model']
-                    alpha = damage_parameters['alpha']
-                    beta  = damage_parameters['beta' ]
-                    gamma = damage_parameters['gamma']
-                    a     = damage_parameters['a'    ]
-                    b     = damage_parameters['b'    ]
-
-                    dd = alpha*diam_m**a + beta*diam_m**b + gamma
-                    dd = dd * 1.2
-
-                    area = 3.14*dd**2/4
-                last_ratio=1
-                if pipe_id in self._pipe_last_ratio:
-                    last_ratio = self._pipe_last_ratio.loc[pipe_id]
-                    
-                ratio = cur_damage['damage_loc']/last_ratio
-                if ratio >= 1:
-                    raise ValueError('IN LEAK: ratio is bigger than or equal to 1 for pipe:'+repr(pipe_id)+'  '+repr(ratio)+'  '+repr(cur_damage['damage_loc'])+'  '+repr(last_ratio))
-                self._pipe_last_ratio.loc[pipe_id] = ratio
-                    
-                number = 1
-                if 'number' in cur_damage:
-                    number = cur_damage['number']
-                
-                sub_type = 1
-                if 'sub_type' in cur_damage:
-                    sub_type = cur_damage['sub_type']
-                
-                WaterNetwork = split_pipe(WaterNetwork, pipe_id, new_pipe_id, new_node_id, split_at_point=ratio, return_copy=False)
-                leak_node = WaterNetwork.get_node(new_node_id)
+                damage_list.append((node_A, {'number':number, 'damage_type':'break', 'pipe_A':pipe_id, 'pipe_B':new_pipe_id, 'orginal_pipe':pipe_id, 'node_A':node_A, 'node_B':node_B}) )
+        self._registry.addPipeDamageListToRegistry(damage_list, current_time)
+        #return WaterNetwork
+    
+    def _getPipeDamageTable(self, WaterNetwork, all_damages, current_time):
+        """
+        Calculates the names, split ratios and leak areas of all pipe damages
+        at a time.
+
+        Parameters
+        ----------
+        WaterNetwork : wntrfr.network.model.WaterNetworkModel
+            water network model.
+        all_damages : list
+            list of damage dictionaries, in the order they are applied.
+        current_time : int
+            current time.
+
+        Raises
+        ------
+        ValueError
+            If the damage type is not defined or a damage location is not
+            between the last damage location on the pipe and its start.
+
+        Returns
+        -------
+        damage_table : pandas.DataFrame
+            One row per damage with pipe_id, type, ratio, area, node_A,
+            node_B, new_pipe_id, number, sub_type and damage_time.
+
+        """
+        damage_table = pd.DataFrame({'pipe_id'   : [cur_damage['pipe_id'] for cur_damage in all_damages],
+                                     'type'      : [cur_damage['type'] for cur_damage in all_damages],
+                                     'damage_loc': [cur_damage['damage_loc'] for cur_damage in all_damages],
+                                     'Material'  : [cur_damage.get('Material') for cur_damage in all_damages],
+                                     'leakD'     : [cur_damage.get('leakD', np.nan) for cur_damage in all_damages],
+                                     'number'    : [cur_damage.get('number', 1) for cur_damage in all_damages],
+                                     'sub_type'  : [cur_damage.get('sub_type', 1) for cur_damage in all_damages]}, dtype=object)
+        
+        undefined_damage_type = damage_table[~damage_table['type'].isin(['leak', 'break'])]
+        if len(undefined_damage_type) > 0:
+            raise ValueError('undefined damage type: '+repr(undefined_damage_type['type'].iloc[0])+". Accpetale type of famages are either 'creack' or 'break'.")
+        
+        is_leak  = (damage_table['type'] == 'leak').to_numpy()
+        pipe_id  = damage_table['pipe_id'].astype(str)
+        
+        #damages on the same pipe next to each other are numbered in order
+        same_pipe_damage_cnt = pipe_id.groupby((pipe_id != pipe_id.shift()).cumsum()).cumcount() + 1
+        same_pipe_damage_cnt = same_pipe_damage_cnt.astype(str)
+        
+        damage_table['node_A']      = np.where(is_leak, pipe_id + '_leak_'   + same_pipe_damage_cnt, pipe_id + '_breakA_' + same_pipe_damage_cnt)
+        damage_table['node_B']      = np.where(is_leak, None,                                       pipe_id + '_breakB_' + same_pipe_damage_cnt)
+        damage_table['new_pipe_id'] = np.where(is_leak, pipe_id + '_leak_B_' + same_pipe_damage_cnt, pipe_id + '_Break_'  + same_pipe_damage_cnt)
+        damage_table['damage_time'] = current_time/3600
+        
+        #each damage splits the part of the pipe left from the last damage on
+        #the same pipe, so the ratio depends on the last ratio of the pipe
+        last_ratio = self._pipe_last_ratio.to_dict()
+        ratio      = np.empty(len(damage_table), dtype=float)
+        for i, (cur_pipe_id, damage_loc) in enumerate(zip(damage_table['pipe_id'], damage_table['damage_loc'])):
+            ratio[i] = damage_loc / last_ratio.get(cur_pipe_id, 1)
+            if ratio[i] >= 1:
+                damage_type_tag = 'IN LEAK: ' if is_leak[i] else 'IN BREAK: '
+                raise ValueError(damage_type_tag + 'ratio is bigger than or equal to 1 for pipe:'+repr(cur_pipe_id)+'  '+repr(ratio[i])+'  '+repr(damage_loc)+'  '+repr(last_ratio.get(cur_pipe_id, 1)))
+            last_ratio[cur_pipe_id] = ratio[i]
+        damage_table['ratio']   = ratio
+        
+        diameter_list = {cur_pipe_id:WaterNetwork.get_link(cur_pipe_id).diameter for cur_pipe_id in damage_table['pipe_id'].unique()}
+        diam_m        = damage_table['pipe_id'].map(diameter_list).to_numpy(dtype=float)
+        
+        damage_model  = pd.DataFrame(self._registry.settings['pipe_damage_model']).T
+        damage_model  = damage_model.reindex(columns=['alpha', 'beta', 'gamma', 'a', 'b'])
+        damage_parameters = damage_model.reindex(damage_table['Material']).reset_index(drop=True)
+        damage_parameters = damage_parameters.fillna(pd.Series(self._registry.settings['default_pipe_damage_model']) ).astype(float)
+        
+        dd = damage_parameters['alpha'].to_numpy() * diam_m ** damage_parameters['a'].to_numpy() + damage_parameters['beta'].to_numpy() * diam_m ** damage_parameters['b'].to_numpy() + damage_parameters['gamma'].to_numpy()
+        dd = dd * 1.2
+        
+        leakD     = damage_table['leakD'].to_numpy(dtype=float)
+        leak_area = np.where(np.isnan(leakD), 3.14*dd**2/4, 3.14*(leakD/2)**2)
+        damage_table['area'] = np.where(is_leak, leak_area, (diam_m**2)*3.14/4)
+        
+        #the last ratios are kept only when the whole table is built, so a
+        #failed time step does not change the ratios of the next one
+        self._pipe_last_ratio = pd.Series(last_ratio, dtype='float64')
+        
+        return damage_table
+    
+    def _splitDamagedPipes(self, WaterNetwork, damage_table):
+        """
+        Splits (leak) or breaks (break) the damaged pipes and adds the leaks
+        at the new nodes, in the order of the damages.
+
+        Parameters
+        ----------
+        WaterNetwork : wntrfr.network.model.WaterNetworkModel
+            water network model ro be modified.
+        damage_table : pandas.DataFrame
+            Damage table made by _getPipeDamageTable.
+
+        Returns
+        -------
+        None.
+
+        """
+        for pipe_id, damage_type, ratio, area, node_A, node_B, new_pipe_id, damage_time in zip(damage_table['pipe_id'], damage_table['type'], damage_table['ratio'], damage_table['area'], damage_table['node_A'], damage_table['node_B'], damage_table['new_pipe_id'], damage_table['damage_time']):
+            if damage_type == 'leak':
+                split_pipe(WaterNetwork, pipe_id, new_pipe_id, node_A, split_at_point=ratio, return_copy=False)
+                leak_node = WaterNetwork.get_node(node_A)
                 leak_node.add_leak(WaterNetwork, area=area, discharge_coeff=1, start_time=damage_time, end_time=self.end_time+1)
-                self._registry.addPipeDamageToRegistry(new_node_id,{'number':number,'damage_type':'leak', 'damage_subtype':sub_type , 'pipe_A':pipe_id, 'pipe_B':new_pipe_id, 'orginal_pipe':pipe_id})
-                #self._registry.addPipeDamageToDamageRestorationData(pipe_id, 'leak', damage_time)
-            
-            elif cur_damage['type'] == 'break':
-                last_ratio = 1
-                if pipe_id in self._pipe_last_ratio:
-                    last_ratio = self._pipe_last_ratio.loc[pipe_id]
-                    
-                ratio = cur_damage['damage_loc']/last_ratio
-                if ratio >= 1:
-                    raise ValueError('IN BREAK: ratio is bigger than or equal to 1 for pipe:'+repr(pipe_id)+'  '+repr(ratio)+'  '+repr(cur_damage['damage_loc'])+'  '+repr(last_ratio))
-                    
-                self._pipe_last_ratio.loc[pipe_id] = ratio
-                    
-                number=1
-                if 'number' in cur_damage:
-                    number = cur_damage['number']
-                    
-                damage_time = current_time/3600
-                logger.debug("trying to break: " + cur_damage['pipe_id'] + repr(damage_time))
-                #Naming new nodes and new pipe
-                new_node_id_for_old_pipe = pipe_id + '_breakA_' + repr(same_pipe_damage_cnt)
-                new_node_id_for_new_pipe = pipe_id + '_breakB_' + repr(same_pipe_damage_cnt)
-                new_pipe_id = pipe_id + '_Break_' + repr(same_pipe_damage_cnt)
-                new_node_id = new_node_id_for_old_pipe
-                #breaking the node
-                WaterNetwork = break_pipe(WaterNetwork, pipe_id, new_pipe_id, new_node_id_for_old_pipe, new_node_id_for_new_pipe, split_at_point=ratio, return_copy=False)
-                    
-                diam=WaterNetwork.get_link(pipe_id).diameter
-                area=(diam**2)*3.14/4
-                break_node_for_old_pipe = WaterNetwork.get_node(new_node_id_for_old_pipe)
+            else:
+                logger.debug("trying to break: " + pipe_id + repr(damage_time))
+                break_pipe(WaterNetwork, pipe_id, new_pipe_id, node_A, node_B, split_at_point=ratio, return_copy=False)
+                break_node_for_old_pipe = WaterNetwork.get_node(node_A)
                 break_node_for_old_pipe.add_leak(WaterNetwork, area=area, discharge_coeff=1, start_time=float(damage_time), end_time=self.end_time+0.1)
-                break_node_for_new_pipe = WaterNetwork.get_node(new_node_id_for_new_pipe)
+                break_node_for_new_pipe = WaterNetwork.get_node(node_B)
                 break_node_for_new_pipe.add_leak(WaterNetwork, area=area, start_time=float(damage_time), end_time=self.end_time+0.1)
-                    
-                
-                self._registry.addPipeDamageToRegistry(new_node_id_for_old_pipe, {'number':number, 'damage_type':'break', 'pipe_A':pipe_id, 'pipe_B':new_pipe_id, 'orginal_pipe':pipe_id, 'node_A':new_node_id_for_old_pipe, 'node_B':new_node_id_for_new_pipe})
-                #self._registry.addPipeDamageToDamageRestorationData(pipe_id, 'break', damage_time)
-            else:
-                raise ValueError('undefined damage type: '+repr(cur_damage['type'])+". Accpetale type of famages are either 'creack' or 'break'.")
-            self._registry.addRestorationDataOnPipe(new_node_id, damage_time, cur_damage['type'])
-        #return WaterNetwork
 
     def applyTankDamages(self, WaterNetwork, current_time):
         if self.tank_damage.empty:
@@ -7,6 +7,7 @@ Created on Wed May 26 16:11:36 2021
 import wntrfr.epanet.toolkit
 import numpy as np
 import ctypes
+from ctypes import byref
 import os, sys
 from pkg_resources import resource_filename
 import platform
@@ -76,4 +77,117 @@ class ENepanet(wntrfr.epanet.toolkit.ENepanet):
             logger.error('ignore_flag must be int value and bigger than zero'+str(ignore_flag))
         flag=ctypes.c_int(int(ignore_flag))
         #print('++++++++++++++++++++++')
-        #self.ENlib.ENEXTENDEDsetignoreflag(flag)
\ No newline at end of file
+        #self.ENlib.ENEXTENDEDsetignoreflag(flag)
+    
+    def ENgetlinkid(self, iIndex):
+        """
+        Gets the ID name of a link given its index.
+
+        Parameters
+        ----------
+        iIndex : int
+            a link's index (starting from 1).
+
+        Returns
+        -------
+        str
+            the link ID
+
+        """
+        fValue = ctypes.create_string_buffer(32)
+        if self._project is not None:
+            self.errcode = self.ENlib.EN_getlinkid(self._project, iIndex, byref(fValue))
+        else:
+            self.errcode = self.ENlib.ENgetlinkid(iIndex, byref(fValue))
+        self._error()
+        return str(fValue.value, 'UTF-8')
+    
+    def ENgetoption(self, iCode):
+        """
+        Retrieves the value of an analysis option.
+
+        Parameters
+        ----------
+        iCode : int
+            the option code (EN_TRIALS, EN_CHECKFREQ, ...)
+
+        Returns
+        -------
+        float
+            the option value
+
+        """
+        fValue = ctypes.c_float()
+        if self._project is not None:
+            fValue = ctypes.c_double()
+            self.errcode = self.ENlib.EN_getoption(self._project, iCode, byref(fValue))
+        else:
+            self.errcode = self.ENlib.ENgetoption(iCode, byref(fValue))
+        self._error()
+        return fValue.value
+    
+    def ENsetoption(self, iCode, fValue):
+        """
+        Sets the value of an analysis option, e.g. the solver parameters
+        CHECKFREQ, MAXCHECK and DAMPLIMIT, without reloading the INP file.
+
+        Parameters
+        ----------
+        iCode : int
+            the option code (EN_TRIALS, EN_CHECKFREQ, ...)
+        fValue : float
+            the option value
+
+        """
+        if self._project is not None:
+            self.errcode = self.ENlib.EN_setoption(self._project, ctypes.c_int(iCode), ctypes.c_double(fValue))
+        else:
+            self.errcode = self.ENlib.ENsetoption(ctypes.c_int(iCode), ctypes.c_float(fValue))
+        self._error()
+    
+    def ENgetstatistic(self, iCode):
+        """
+        Retrieves a statistic of the latest hydraulic solution, e.g. the
+        number of trials (EN_ITERATIONS) or the relative error
+        (EN_RELATIVEERROR).
+
+        Parameters
+        ----------
+        iCode : int
+            the statistic code
+
+        Returns
+        -------
+        float
+            the statistic value
+
+        """
+        fValue = ctypes.c_float()
+        if self._project is not None:
+            fValue = ctypes.c_double()
+            self.errcode = self.ENlib.EN_getstatistic(self._project, iCode, byref(fValue))
+        else:
+            self.errcode = self.ENlib.ENgetstatistic(iCode, byref(fValue))
+        self._error()
+        return fValue.value
+    
+    def ENsetbasedemand(self, iIndex, iDemandIndex, fValue):
+        """
+        Sets the base demand of one of a junction's demand categories, without
+        reloading the INP file.
+
+        Parameters
+        ----------
+        iIndex : int
+            the node index (starting from 1)
+        iDemandIndex : int
+            the demand category index (starting from 1)
+        fValue : float
+            the base demand in the flow units of the project
+
+        """
+        if self._project is not None:
+            self.errcode = self.ENlib.EN_setbasedemand(self._project, ctypes.c_int(iIndex), ctypes.c_int(iDemandIndex), ctypes.c_double(fValue))
+        else:
+            self.errcode = self.ENlib.ENsetbasedemand(ctypes.c_int(iIndex), ctypes.c_int(iDemandIndex), ctypes.c_float(fValue))
+        self._error()
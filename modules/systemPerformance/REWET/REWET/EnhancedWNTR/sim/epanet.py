@@ -6,7 +6,9 @@ Created on Tue Jun  1 17:09:25 2021
 """
 import logging
 import itertools
+import ctypes
 import numpy as np
+import pandas as pd
 import scipy.sparse.csr
 from collections import OrderedDict
 from wntrfr.sim.core import WaterNetworkSimulator
@@ -18,6 +20,8 @@ from wntrfr.sim.network_isolation import check_for_isolated_junctions, get_long_
 from wntrfr.sim.core import _get_csr_data_index
 from wntrfr.utils.ordered_set import OrderedSet
 from wntrfr.network.model import LinkStatus
+from wntrfr.epanet.util import FlowUnits, HydParam, EN, to_si, from_si
+from .results import SimulationResults
 from Report_Reading import Report_Reading
 
 logger = logging.getLogger(__name__)    
@@ -117,7 +121,7 @@ class EpanetSimulator(EpanetSimulator):
             self._wn.options.time.report_timestep = new_time_step
    
     def run_sim(self, file_prefix='temp', save_hyd=False, use_hyd=False, hydfile=None, 
-                version=2.2, convergence_error=False, start_time=None, iModified=True):
+                version=2.2, convergence_error=False, start_time=None, iModified=True, session=None):
         """
         Run the EPANET simulator.
 
@@ -134,10 +138,17 @@ class EpanetSimulator(EpanetSimulator):
             Will save hydraulics to ``file_prefix + '.hyd'`` or to file specified in `hydfile_name`
         hydfile : str
             Optionally specify a filename for the hydraulics file other than the `file_prefix`
+        session : EpanetSession
+            Optionally run in a persistent session that keeps the network
+            loaded in EPANET and returns the results from memory. Not used
+            together with `use_hyd` and `save_hyd`.
 
         """
         solver_parameters_list = [(1,10, 0), (10, 100, 0), (10,100, 0.01)]
         #solver_parameters_list = [(10,100, 0.01), (10, 100, 0), (1,10, 0)]
+        if session is not None and not save_hyd and not use_hyd:
+            return session.run_sim(solver_parameters_list, start_time)
+        
         #balanced_system = False
         run_successful= False
         i = 0
@@ -619,4 +630,398 @@ class EpanetSimulator(EpanetSimulator):
             
     #def check_pipes_sin(self, pipe_list):
         #for pipe_name in pipe_list:
-            
\ No newline at end of file
+            
+
+EN_CHECKFREQ = 15
+EN_MAXCHECK  = 16
+EN_DAMPLIMIT = 17
+# EPANET 2.2 returns the internal status of the link for EN_PUMP_STATE (for
+# pumps, with the flow checks), the code that is written to the binary
+# output file, in which 4 is active
+EN_PUMP_STATE   = 16
+EN_ACTIVE_STATE = 4
+
+class EpanetSession():
+    """
+    Persistent EPANET session for repeated hydraulic runs of one network.
+
+    The network is written and loaded in the EPANET toolkit once and can
+    be kept for all the time steps of a scenario. The next runs only push
+    the time options, the solver parameters, the pipe status and minor
+    losses, the junction emitters and base demands and the tank levels
+    that have changed through the toolkit setters, and the results are
+    collected with the toolkit getters, so no INP, binary or report file is
+    written or parsed per run. Topology changes (e.g., new leak nodes or
+    split pipes, newly isolated elements) and the other network data are
+    detected by comparing the network signature, and the network is loaded
+    again. The last loaded variants of the network are kept loaded, so that
+    switching back to a previous variant (e.g., when the explicit leak
+    elements of a time step are added again) does not load the network
+    again.
+
+    Parameters
+    ----------
+    wn : WaterNetworkModel
+        Water network model
+    file_prefix : str
+        Prefix of the INP and report files used when loading the network
+    iModified : bool
+        If True, the modified EPANET library is used
+    version : float
+        EPANET version
+    max_cached_projects : int
+        Number of loaded network variants kept besides the current one
+
+    """
+    _project_attributes = ['_enData', '_signature', '_pipe_state', '_node_state', '_slot', '_flow_units', '_node_name_list',
+                           '_node_index', '_link_name_list', '_link_index', '_link_type', '_leak_node_list']
+    
+    def __init__(self, wn, file_prefix='temp', iModified=True, version=2.2, max_cached_projects=2):
+        self._wn                 = wn
+        self.file_prefix         = file_prefix
+        self.iModified           = iModified
+        self.version             = version
+        self.max_cached_projects = max_cached_projects
+        self.number_of_loads     = 0
+        self._cached_projects    = OrderedDict()
+        self._enData             = None
+        self._signature          = None
+        self._pipe_state         = None
+        self._node_state         = None
+        self._slot               = None
+    
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+    
+    def close(self):
+        self._closeProject()
+        while len(self._cached_projects) > 0:
+            signature, project = self._cached_projects.popitem(last=False)
+            project['_enData'].ENclose()
+    
+    def _closeProject(self):
+        enData          = self._enData
+        self._enData    = None
+        self._signature = None
+        self._slot      = None
+        if enData is not None:
+            enData.ENclose()
+    
+    def _cacheProject(self):
+        if self._enData is None:
+            return
+        self._cached_projects[self._signature] = {attr: getattr(self, attr) for attr in self._project_attributes}
+        self._enData    = None
+        self._signature = None
+        self._slot      = None
+        while len(self._cached_projects) > self.max_cached_projects:
+            signature, project = self._cached_projects.popitem(last=False)
+            project['_enData'].ENclose()
+    
+    def _restoreProject(self, signature):
+        project = self._cached_projects.pop(signature)
+        for attr in self._project_attributes:
+            setattr(self, attr, project[attr])
+    
+    def run_sim(self, solver_parameters_list, start_time=None):
+        """
+        Runs the hydraulic simulation with the same solver parameter retries
+        as EpanetSimulator.run_sim.
+
+        Parameters
+        ----------
+        solver_parameters_list : list
+            list of (CHECKFREQ, MAXCHECK, DAMPLIMIT) tried in order, as long
+            as EPANET fails with error 110
+        start_time : int
+            Time of the beginning of the run, which is added to the result
+            index
+
+        Returns
+        -------
+        result_data : SimulationResults
+            demand, head, pressure and leak node results and flowrate,
+            status and setting link results
+        run_successful : bool
+            True if one of the solver parameters solved the hydraulics
+
+        """
+        if start_time == None:
+            start_time = 0
+        
+        hydraulic      = self._wn.options.hydraulic
+        run_successful = False
+        result_data    = None
+        i = 0
+        for solver_parameter in solver_parameters_list:
+            i += 1
+            hydraulic.checkfreq        = solver_parameter[0]
+            hydraulic.maxcheck         = solver_parameter[1]
+            hydraulic.damplimit        = solver_parameter[2]
+            hydraulic.unbalanced_value = 100
+            if i == 1:
+                self._update()
+            
+            enData = self._enData
+            enData.ENsetoption(EN_CHECKFREQ, solver_parameter[0])
+            enData.ENsetoption(EN_MAXCHECK , solver_parameter[1])
+            enData.ENsetoption(EN_DAMPLIMIT, solver_parameter[2])
+            try:
+                result_data = self._solve(start_time)
+            except Exception as err:
+                if err.args[0] == 'EPANET Error 110' and i < len(solver_parameters_list):
+                    continue
+                raise err
+            run_successful = True
+            break
+        
+        return result_data, run_successful
+    
+    def _update(self):
+        signature = self._getNetworkSignature()
+        if self._enData is None or signature != self._signature:
+            self._cacheProject()
+            if signature not in self._cached_projects:
+                self._load(signature)
+                return
+            self._restoreProject(signature)
+        
+        pipe_state    = self._getPipeState()
+        changed_pipes = [pipe_name for pipe_name, state in pipe_state.items() if state != self._pipe_state[pipe_name] ]
+        node_state    = self._getNodeState()
+        changed_nodes = [node_name for node_name, state in node_state.items() if state != self._node_state[node_name] ]
+        # EPANET does not accept a zero minor loss through the toolkit
+        if any(pipe_state[pipe_name][1] != self._pipe_state[pipe_name][1] and pipe_state[pipe_name][1] <= 0 for pipe_name in changed_pipes):
+            self._closeProject()
+            self._load(signature)
+            return
+        
+        try:
+            self._setPipeState(pipe_state, changed_pipes)
+            self._setNodeState(node_state, changed_nodes)
+        except Exception:
+            # a value not accepted through the toolkit (e.g., a tank level
+            # out of the tank range) is loaded from the INP file, so that
+            # EPANET reports it the same way as without the session
+            self._closeProject()
+            self._load(signature)
+    
+    def _setPipeState(self, pipe_state, changed_pipes):
+        enData = self._enData
+        for pipe_name in changed_pipes:
+            status, minor_loss = pipe_state[pipe_name]
+            link_index         = self._link_index[pipe_name]
+            if status != self._pipe_state[pipe_name][0]:
+                enData.ENsetlinkvalue(link_index, EN.INITSTATUS, 0 if status == LinkStatus.Closed else 1)
+            if minor_loss != self._pipe_state[pipe_name][1]:
+                enData.ENsetlinkvalue(link_index, EN.MINORLOSS, minor_loss)
+        self._pipe_state = pipe_state
+    
+    def _setNodeState(self, node_state, changed_nodes):
+        enData     = self._enData
+        flow_units = self._flow_units
+        for node_name in changed_nodes:
+            node_index = self._node_index[node_name]
+            if self._wn.get_node(node_name).node_type == 'Tank':
+                enData.ENsetnodevalue(node_index, EN.TANKLEVEL, from_si(flow_units, node_state[node_name], HydParam.HydraulicHead) )
+                continue
+            
+            emitter_coefficient, base_demand_list = node_state[node_name]
+            if emitter_coefficient != self._node_state[node_name][0]:
+                emitter_coefficient = from_si(flow_units, emitter_coefficient, HydParam.EmitterCoeff) if emitter_coefficient else 0.0
+                enData.ENsetnodevalue(node_index, EN.EMITTER, emitter_coefficient)
+            if base_demand_list != self._node_state[node_name][1]:
+                # a junction without demands is written with a zero demand
+                if len(base_demand_list) == 0:
+                    base_demand_list = (0.0,)
+                for i, base_demand in enumerate(base_demand_list):
+                    enData.ENsetbasedemand(node_index, i + 1, from_si(flow_units, base_demand, HydParam.Demand) )
+        self._node_state     = node_state
+        self._leak_node_list = self._getLeakNodeList()
+    
+    def _load(self, signature):
+        wn = self._wn
+        # every loaded project keeps its own report file open
+        used_slots  = set(project['_slot'] for project in self._cached_projects.values() )
+        slot        = min(set(range(self.max_cached_projects + 1) ) - used_slots)
+        file_prefix = self.file_prefix if slot == 0 else self.file_prefix + '_' + repr(slot)
+        inpfile     = file_prefix + '.inp'
+        write_inpfile(wn, inpfile, units=wn.options.hydraulic.inpfile_units, version=self.version)
+        
+        enData = toolkit.ENepanet(changed_epanet=self.iModified, version=self.version)
+        enData.ENopen(inpfile, file_prefix + '.rpt', file_prefix + '.bin')
+        self._enData = enData
+        self._slot   = slot
+        self.number_of_loads += 1
+        
+        self._flow_units     = FlowUnits(enData.ENgetflowunits())
+        self._node_name_list = [enData.ENgetnodeid(i) for i in range(1, enData.ENgetcount(EN.NODECOUNT) + 1)]
+        self._node_index     = {node_name: i + 1 for i, node_name in enumerate(self._node_name_list)}
+        self._link_name_list = [enData.ENgetlinkid(i) for i in range(1, enData.ENgetcount(EN.LINKCOUNT) + 1)]
+        self._link_index     = {link_name: i + 1 for i, link_name in enumerate(self._link_name_list)}
+        self._link_type      = np.array([enData.ENgetlinktype(i) for i in range(1, len(self._link_name_list) + 1)])
+        self._leak_node_list = self._getLeakNodeList()
+        
+        self._signature  = signature
+        self._pipe_state = self._getPipeState()
+        self._node_state = self._getNodeState()
+    
+    def _getLeakNodeList(self):
+        wn = self._wn
+        return [node_name for node_name in self._node_name_list if wn.get_node(node_name).node_type == 'Junction' and wn.get_node(node_name)._emitter_coefficient]
+    
+    def _getNetworkSignature(self):
+        """
+        Everything written to the INP file that is not applied through the
+        toolkit setters in _update, i.e., the topology of the loaded network
+        and the data that do not change between the runs.
+
+        """
+        wn        = self._wn
+        hydraulic = wn.options.hydraulic
+        time      = wn.options.time
+        
+        signature = [(hydraulic.demand_model, hydraulic.required_pressure, hydraulic.minimum_pressure,
+                      hydraulic.pressure_exponent, hydraulic.emitter_exponent, hydraulic.trials,
+                      hydraulic.accuracy, hydraulic.inpfile_units, time.hydraulic_timestep,
+                      time.pattern_timestep), tuple(wn.control_name_list)]
+        
+        for node_name, node in wn.nodes():
+            if node._is_isolated == True:
+                continue
+            if node.node_type == 'Junction':
+                signature.append((node_name, node.elevation, tuple(demand.pattern_name for demand in node.demand_timeseries_list) ) )
+            elif node.node_type == 'Tank':
+                signature.append((node_name, node.elevation, node.min_level, node.max_level, node.diameter) )
+            else:
+                signature.append((node_name, node.base_head) )
+        
+        for link_name, link in wn.links():
+            if link._is_isolated == True:
+                continue
+            if link.link_type == 'Pipe':
+                signature.append((link_name, link.start_node_name, link.end_node_name, link.length, link.diameter, link.roughness, link.cv, int(link.initial_status) if link.cv else None) )
+            else:
+                signature.append((link_name, link.start_node_name, link.end_node_name, int(link.initial_status), getattr(link, 'initial_setting', None) ) )
+        
+        return tuple(signature)
+    
+    def _getPipeState(self):
+        wn = self._wn
+        pipe_state = {}
+        for link_name in self._link_name_list:
+            link = wn.get_link(link_name)
+            if link.link_type == 'Pipe' and link.cv == False:
+                pipe_state[link_name] = (link.initial_status, link.minor_loss)
+        return pipe_state
+    
+    def _getNodeState(self):
+        wn = self._wn
+        node_state = {}
+        for node_name in self._node_name_list:
+            node = wn.get_node(node_name)
+            if node.node_type == 'Junction':
+                node_state[node_name] = (node._emitter_coefficient, tuple(demand.base_value for demand in node.demand_timeseries_list) )
+            elif node.node_type == 'Tank':
+                node_state[node_name] = node.init_level
+        return node_state
+    
+    def _getValues(self, getter, count, code):
+        enData = self._enData
+        values = np.empty(count)
+        if enData._project is None:
+            for i in range(count):
+                values[i] = getattr(enData, getter)(i + 1, code)
+            return values
+        
+        en_function = getattr(enData.ENlib, 'EN_' + getter[2:])
+        project     = enData._project
+        value       = ctypes.c_double()
+        for i in range(count):
+            en_function(project, i + 1, code, ctypes.byref(value))
+            values[i] = value.value
+        return values
+    
+    def _solve(self, start_time):
+        enData = self._enData
+        time   = self._wn.options.time
+        enData.ENsettimeparam(EN.DURATION, int(time.duration) )
+        if time.report_timestep > 0:
+            enData.ENsettimeparam(EN.REPORTSTEP, int(time.report_timestep) )
+        if time.hydraulic_timestep > 0:
+            enData.ENsettimeparam(EN.HYDSTEP, int(time.hydraulic_timestep) )
+        enData.ENsettimeparam(EN.PATTERNSTART, int(time.pattern_start) )
+        enData.ENsettimeparam(EN.STARTTIME, int(time.start_clocktime) % 86400)
+        
+        report_start = enData.ENgettimeparam(EN.REPORTSTART)
+        report_step  = enData.ENgettimeparam(EN.REPORTSTEP)
+        trials       = enData.ENgetoption(EN.TRIALS)
+        accuracy     = enData.ENgetoption(EN.ACCURACY)
+        
+        nnodes = len(self._node_name_list)
+        nlinks = len(self._link_name_list)
+        report_times       = []
+        maximum_trial_time = []
+        demand   = []
+        head     = []
+        pressure = []
+        flowrate = []
+        status   = []
+        state    = []
+        setting  = []
+        
+        enData.ENopenH()
+        try:
+            enData.ENinitH(0)
+            while True:
+                t = enData.ENrunH()
+                # the time steps that EPANET reports as "Maximum trials
+                # exceeded" or "System unbalanced" (see Report_Reading)
+                if enData.ENgetstatistic(EN.ITERATIONS) > trials or enData.ENgetstatistic(EN.RELATIVEERROR) > accuracy:
+                    maximum_trial_time.append(t + start_time)
+                
+                if t >= report_start and (report_step <= 0 or (t - report_start) % report_step == 0):
+                    report_times.append(t + start_time)
+                    demand.append(  self._getValues('ENgetnodevalue', nnodes, EN.DEMAND  ) )
+                    head.append(    self._getValues('ENgetnodevalue', nnodes, EN.HEAD    ) )
+                    pressure.append(self._getValues('ENgetnodevalue', nnodes, EN.PRESSURE) )
+                    flowrate.append(self._getValues('ENgetlinkvalue', nlinks, EN.FLOW    ) )
+                    status.append(  self._getValues('ENgetlinkvalue', nlinks, EN.STATUS  ) )
+                    state.append(   self._getValues('ENgetlinkvalue', nlinks, EN_PUMP_STATE) )
+                    setting.append( self._getValues('ENgetlinkvalue', nlinks, EN.SETTING ) )
+                
+                if enData.ENnextH() <= 0:
+                    break
+        finally:
+            enData.ENcloseH()
+        
+        pressure = np.array(pressure)
+        flowrate = np.array(flowrate)
+        status   = np.array(status)
+        # the toolkit reports open (1) and closed (0) links. Active valves are
+        # reported as active (2), the same as in the binary output file
+        status[np.array(state) == EN_ACTIVE_STATE] = 2
+        setting  = np.array(setting)
+        
+        link_type = self._link_type
+        for valve_type, param in [(EN.PRV, HydParam.Pressure), (EN.PSV, HydParam.Pressure), (EN.PBV, HydParam.Pressure), (EN.FCV, HydParam.Flow)]:
+            setting[:, link_type == valve_type] = param._to_si(self._flow_units, setting[:, link_type == valve_type])
+        
+        node_names  = self._node_name_list
+        link_names  = self._link_name_list
+        demand      = pd.DataFrame(HydParam.Demand._to_si(self._flow_units, np.array(demand) ), index=report_times, columns=node_names)
+        result_data = SimulationResults()
+        result_data.node = {'demand'  : demand,
+                            'head'    : pd.DataFrame(HydParam.HydraulicHead._to_si(self._flow_units, np.array(head) ), index=report_times, columns=node_names),
+                            'pressure': pd.DataFrame(HydParam.Pressure._to_si(self._flow_units, pressure), index=report_times, columns=node_names),
+                            'leak'    : demand[self._leak_node_list].copy()}
+        result_data.link = {'flowrate': pd.DataFrame(HydParam.Flow._to_si(self._flow_units, flowrate), index=report_times, columns=link_names),
+                            'status'  : pd.DataFrame(status, index=report_times, columns=link_names),
+                            'setting' : pd.DataFrame(setting, index=report_times, columns=link_names)}
+        result_data.maximum_trial_time = maximum_trial_time
+        
+        return result_data
+    
@@ -276,10 +276,23 @@ def save_single(settings, result, name, restoration_data):
     result_name   = name + '.res'
     settings_name = name + '.xlsx'    
     
-    file_dest = os.path.join(result_file_directory, result_name)
-    print("Saving: "+str(file_dest))
-    with open(file_dest, 'wb') as f:
-        pickle.dump(result, f)
+    if settings.process['result_file_format'] == 'hdf':
+        from Output.Result_Store import ResultStore
+        #parts of the result may be already dumped in the part file
+        part_file_dest = os.path.join(result_file_directory, name + '.h5.part')
+        store_mode     = 'a' if len(restoration_data.result_dump_file_list) > 0 else 'w'
+        with ResultStore(part_file_dest, mode=store_mode) as result_store:
+            result_store.appendResult(result)
+            result_store.putRegistry(restoration_data)
+        
+        file_dest = os.path.join(result_file_directory, name + '.h5')
+        print("Saving: "+str(file_dest))
+        os.replace(part_file_dest, file_dest)
+    else:
+        file_dest = os.path.join(result_file_directory, result_name)
+        print("Saving: "+str(file_dest))
+        with open(file_dest, 'wb') as f:
+            pickle.dump(result, f)
     
     
     process_set  = pd.Series(settings.process.settings)
@@ -294,5 +307,12 @@ def save_single(settings, result, name, restoration_data):
         #rest_data_out.to_pickle(file_dest)
         file_dest = os.path.join(result_file_directory, name+'_registry.pkl')
         print("Saving: "+str(file_dest))
-        with open(file_dest, 'wb') as f:
-            pickle.dump(restoration_data, f)
\ No newline at end of file
+        registry_result = restoration_data.result
+        if settings.process['result_file_format'] == 'hdf':
+            #the result is already in the HDF5 file
+            restoration_data.result = None
+        try:
+            with open(file_dest, 'wb') as f:
+                pickle.dump(restoration_data, f)
+        finally:
+            restoration_data.result = registry_result
\ No newline at end of file
@@ -86,6 +86,10 @@ class Process_Settings(base):
         self.settings['damage_node_model'         ] = 'equal_diameter_emitter' #"equal_diameter_reservoir" 
 
         self.settings['limit_result_file_size'    ] = -1 #in Mb. 0 means no limit 
+        self.settings['hydraulic_session'         ] = True #keeps the network loaded in EPANET between the runs and time steps and reads the results from memory
+        self.settings['screening_worker_number'   ] = 1 #number of local worker processes screening the hydraulic significance of damaged pipes. 1 screens in the running process
+        self.settings['screening_tolerance'       ] = 0.001 #maximum difference (m) between the pressure of a screening worker's network and the running process's network before any pipe closure
+        self.settings['result_file_format'        ] = 'pickle' #'pickle' or 'hdf'. 'hdf' saves each scenario's results and registry tables in an HDF5 file (needs PyTables) that can be read by columns and time windows
         
         
 class Scenario_Settings(base):
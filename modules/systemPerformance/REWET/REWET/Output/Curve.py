@@ -66,7 +66,7 @@ class Curve():
         self.loadScneariodata(scn_name)
         res              = self.data[scn_name]
         reg              = self.registry[scn_name]
-        time_list        = res.node['demand'].index
+        time_list        = self.getResultData(scn_name, 'node', 'demand', columns=[]).index
         pump_damage      = reg.damage.damaged_pumps
         pump_damage_time = pump_damage.index
         
@@ -109,16 +109,17 @@ class Curve():
         if len(not_known_reservoir) > 0:
             raise ValueError("The folliwng reservoirs in the input are not known in the water network" + repr(reservoir_name_list))
             
-        outbound_flow = pd.Series(0, index=res.node['demand'].index)
-        inbound_flow  = pd.Series(0, index=res.node['demand'].index)
+        source_demand = self.getResultData(scn_name, 'node', 'demand', columns=list(tank_name_list)+list(reservoir_name_list))
+        outbound_flow = pd.Series(0, index=source_demand.index)
+        inbound_flow  = pd.Series(0, index=source_demand.index)
         #inbound_flow  = 0
         #outbound_flow = 0
         
         waterFlow = None
         
         for tank_name in tank_name_list:
-            if tank_name in res.node['demand'].columns:
-                flow_in_time = res.node['demand'][tank_name]
+            if tank_name in source_demand.columns:
+                flow_in_time = source_demand[tank_name]
             else:
                 continue
             for time, flow in flow_in_time.iteritems():
@@ -138,8 +139,8 @@ class Curve():
                     raise ValueError("Unnown mode: "+repr(mode))
             
         for reservoir_name in reservoir_name_list:
-            if reservoir_name in res.node['demand'].columns:
-                flow_in_time = res.node['demand'][reservoir_name]
+            if reservoir_name in source_demand.columns:
+                flow_in_time = source_demand[reservoir_name]
             else:
                 continue
             for time, flow in flow_in_time.iteritems():
@@ -170,7 +171,7 @@ class Curve():
                 if self.wn.get_node(node_name).demand_timeseries_list[0].base_value > 0:
                     demand_node_name_list.append(node_name)
         
-        sat_node_demands = self.data[scn_name].node['demand'].filter(demand_node_name_list)
+        sat_node_demands = self.getResultData(scn_name, 'node', 'demand', columns=demand_node_name_list)
         #sat_node_demands = sat_node_demands.applymap(hhelper)
         s = sat_node_demands.sum(axis=1)
              
@@ -181,7 +182,7 @@ class Curve():
         res = self.data[scn_name]
         sum_amount = 0
         try:
-            res = res.node['leak']
+            res = self.getResultData(scn_name, 'node', 'leak')
             sum_amount = res.sum(axis=1)
         except:
             sum_amount = 0
@@ -211,13 +212,13 @@ class Curve():
         wanted_nodes = pipe_B_list.to_list()
         wanted_nodes.extend(damage_location_list.to_list())
         
-        available_nodes = set( res.node['demand'].columns )
+        available_nodes = set( self.getResultColumns(scn_name, 'node', 'demand') )
         wanted_nodes    = set( wanted_nodes )
         
         not_available_nodes = wanted_nodes - available_nodes
         available_nodes     = wanted_nodes - not_available_nodes
         
-        leak_from_pipe      = res.node['demand'][available_nodes]
+        leak_from_pipe      = self.getResultData(scn_name, 'node', 'demand', columns=list(available_nodes) )
         
         leak = leak_from_pipe < -0.1
         if leak.any().any():
@@ -227,7 +228,7 @@ class Curve():
         
     def getSystemServiceabilityIndexCurve(self, scn_name, iPopulation="No"):
         s4 = self.getRequiredDemandForAllNodesandtime(scn_name)
-        sat_node_demands = self.data[scn_name].node['demand'].filter(self.demand_node_name_list)
+        sat_node_demands = self.getResultData(scn_name, 'node', 'demand', columns=self.demand_node_name_list)
         sat_node_demands = sat_node_demands.applymap(hhelper)
         
         if iPopulation=="Yes":
@@ -282,13 +283,14 @@ class Curve():
         total_pop = pop.sum()
         
         result = []
-        refined_result = res.node['demand'][self.demand_node_name_list]
+        refined_result = self.getResultData(scn_name, 'node', 'demand', columns=self.demand_node_name_list)
         demands = self.getRequiredDemandForAllNodesandtime(scn_name)
         demands = demands[self.demand_node_name_list]
         
-        union_ = set(res.node['leak'].columns).union(set(self.demand_node_name_list)) -(set(res.node['leak'].columns)  - set(self.demand_node_name_list)) - (set(self.demand_node_name_list) - set(res.node['leak'].columns))   
+        leak_columns = self.getResultColumns(scn_name, 'node', 'leak')
+        union_ = set(leak_columns).union(set(self.demand_node_name_list)) -(set(leak_columns)  - set(self.demand_node_name_list)) - (set(self.demand_node_name_list) - set(leak_columns))   
         union_ = list(union_)
-        leak_res    = res.node['leak'][union_]
+        leak_res    = self.getResultData(scn_name, 'node', 'leak', columns=union_)
         
         leak_data = []
         
@@ -338,13 +340,14 @@ class Curve():
             pop = self._population_data
         
         result = []
-        union_ = set(res.node['leak'].columns).union(set(self.demand_node_name_list)) -(set(res.node['leak'].columns)  - set(self.demand_node_name_list)) - (set(self.demand_node_name_list) - set(res.node['leak'].columns))   
+        leak_columns = self.getResultColumns(scn_name, 'node', 'leak')
+        union_ = set(leak_columns).union(set(self.demand_node_name_list)) -(set(leak_columns)  - set(self.demand_node_name_list)) - (set(self.demand_node_name_list) - set(leak_columns))   
         union_ = list(union_)
-        refined_result = res.node['demand'][self.demand_node_name_list]
+        refined_result = self.getResultData(scn_name, 'node', 'demand', columns=self.demand_node_name_list)
         demands = self.getRequiredDemandForAllNodesandtime(scn_name)
         demands        = demands[self.demand_node_name_list]
         
-        leak_res    = res.node['leak'][union_]
+        leak_res    = self.getResultData(scn_name, 'node', 'leak', columns=union_)
         leak_data = []
         if consider_leak: 
             for name in leak_res:
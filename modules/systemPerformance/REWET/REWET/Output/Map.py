@@ -146,13 +146,13 @@ class Map():
     def getOutageTimeGeoPandas_4(self, scn_name, LOS='DL' , iConsider_leak=False, leak_ratio=0, consistency_time_window=7200):
         #print(repr(LOS) + "   " + repr(iConsider_leak)+"  "+ repr(leak_ratio)+"   "+repr(consistency_time_window  ) )
         self.loadScneariodata(scn_name)
-        res         = self.data[scn_name]
         map_res     = pd.Series(data=0 , index=self.demand_node_name_list, dtype=np.int64)
         
         demands     = self.getRequiredDemandForAllNodesandtime(scn_name)
-        refined_res = res.node['demand'][self.demand_node_name_list]
-        union_      = set(res.node['leak'].columns).union(set(self.demand_node_name_list) - (set(res.node['leak'].columns) ) - set(self.demand_node_name_list)) - (set(self.demand_node_name_list) - set(res.node['leak'].columns))
-        leak_res    = res.node['leak'][union_]
+        refined_res = self.getResultData(scn_name, 'node', 'demand', columns=self.demand_node_name_list)
+        leak_columns = self.getResultColumns(scn_name, 'node', 'leak')
+        union_      = set(leak_columns).union(set(self.demand_node_name_list) - (set(leak_columns) ) - set(self.demand_node_name_list)) - (set(self.demand_node_name_list) - set(leak_columns))
+        leak_res    = self.getResultData(scn_name, 'node', 'leak', columns=list(union_))
         
         leak_data = []
         if iConsider_leak:
@@ -226,13 +226,12 @@ class Map():
     
     def getOutageTimeGeoPandas_5(self, scn_name, bsc='DL' , iConsider_leak=False, leak_ratio=0, consistency_time_window=7200, sum_time=False):
         self.loadScneariodata(scn_name)
-        res                = self.data[scn_name]
         map_res            = pd.Series(data=0 , index=self.demand_node_name_list, dtype=np.int64)
         
         required_demand    = self.getRequiredDemandForAllNodesandtime(scn_name)
-        delivered_demand   = res.node['demand'][self.demand_node_name_list]
-        common_nodes_leak  = list (set( res.node['leak'].columns ).intersection( set(  self.demand_node_name_list  ) ))
-        leak_res           = res.node['leak'][common_nodes_leak]
+        delivered_demand   = self.getResultData(scn_name, 'node', 'demand', columns=self.demand_node_name_list)
+        common_nodes_leak  = list (set( self.getResultColumns(scn_name, 'node', 'leak') ).intersection( set(  self.demand_node_name_list  ) ))
+        leak_res           = self.getResultData(scn_name, 'node', 'leak', columns=common_nodes_leak)
         
         common_nodes_demand = list( set(delivered_demand.columns).intersection(set(self.demand_node_name_list) ) )
         delivered_demand    = delivered_demand[common_nodes_demand]
@@ -359,13 +358,12 @@ class Map():
     
     def percentOfEffectNodes(self, scn_name, bsc='QN' , iConsider_leak=True, leak_ratio=0.75, consistency_time_window=7200):
         self.loadScneariodata(scn_name)
-        res                = self.data[scn_name]
         map_res            = pd.Series(data=0 , index=self.demand_node_name_list, dtype=np.int64)
         
         required_demand    = self.getRequiredDemandForAllNodesandtime(scn_name)
-        delivered_demand   = res.node['demand'][self.demand_node_name_list]
-        common_nodes_leak  = set(res.node['leak'].columns).intersection(set(self.demand_node_name_list))
-        leak_res           = res.node['leak'][common_nodes_leak]
+        delivered_demand   = self.getResultData(scn_name, 'node', 'demand', columns=self.demand_node_name_list)
+        common_nodes_leak  = list(set(self.getResultColumns(scn_name, 'node', 'leak')).intersection(set(self.demand_node_name_list)))
+        leak_res           = self.getResultData(scn_name, 'node', 'leak', columns=common_nodes_leak)
         
         common_nodes_demand = list( set(delivered_demand.columns).intersection(set(self.demand_node_name_list) ) )
         delivered_demand    = delivered_demand[common_nodes_demand]
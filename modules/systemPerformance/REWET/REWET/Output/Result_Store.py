@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""
+HDF5 result store of a scenario.
+
+The node and link results of a scenario are kept in one HDF5 file per
+scenario (pandas HDFStore, table format). Each result attribute is split into
+chunks of columns, so a query reads only the chunks of the requested nodes or
+links and only the requested time window. The registry damage tables are
+stored in the same file, separately from the results.
+"""
+
+import pandas as pd
+import numpy as np
+
+REGISTRY_TABLE_LIST = ['_pipe_damage_table', '_pipe_break_history', '_pipe_leak_history', '_node_damage_table', '_pump_damage_table', '_tank_damage_table']
+
+class ResultStore():
+    def __init__(self, file_addr, mode='a', column_chunk_size=500):
+        """
+        Opens the HDF5 result file of a scenario.
+
+        Parameters
+        ----------
+        file_addr : str
+            Address of the HDF5 file.
+        mode : str, optional
+            'w' to make a new file, 'a' to append to the file and 'r' to
+            only read it. The default is 'a'.
+        column_chunk_size : int, optional
+            Maximum number of columns in a stored chunk of an attribute. The
+            default is 500.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.file_addr         = file_addr
+        self.column_chunk_size = column_chunk_size
+        self._store            = pd.HDFStore(file_addr, mode=mode, complevel=1, complib='blosc:blosclz')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._store.close()
+
+    def appendResult(self, result):
+        """
+        Appends the node and link results of a period of time to the store.
+        The times must be after the times already stored.
+
+        Parameters
+        ----------
+        result : SimulationResults
+            The result.
+
+        Returns
+        -------
+        None.
+
+        """
+        for element_type, result_data in [('node', result.node), ('link', result.link)]:
+            for att, att_result in result_data.items():
+                if att_result is None or att_result.empty:
+                    continue
+                self._appendAttribute(element_type, att, att_result)
+
+        if 'demand' in result.node and result.node['demand'] is not None and not result.node['demand'].empty:
+            self._store.append('flow_balance', result.node['demand'].sum(axis=1).astype(float))
+
+        if hasattr(result, 'maximum_trial_time'):
+            maximum_trial_time = set(result.maximum_trial_time)
+            if 'maximum_trial_time' in self._store:
+                maximum_trial_time = maximum_trial_time.union(self._store['maximum_trial_time'].to_list())
+            self._store.put('maximum_trial_time', pd.Series(sorted(maximum_trial_time), dtype=None if len(maximum_trial_time) > 0 else float) )
+
+    def _appendAttribute(self, element_type, att, att_result):
+        column_chunk = self.getColumnChunk(element_type, att)
+        new_columns  = att_result.columns[~att_result.columns.isin(column_chunk.index)]
+
+        if len(new_columns) > 0:
+            number_of_chunks = 0 if len(column_chunk) == 0 else column_chunk.max() + 1
+            new_chunk        = np.arange(len(new_columns)) // self.column_chunk_size + number_of_chunks
+            column_chunk     = pd.concat([column_chunk, pd.Series(new_chunk, index=new_columns)])
+            self._store.put(element_type + '/' + att + '/column_chunk', column_chunk)
+
+        for chunk, chunk_columns in column_chunk.groupby(column_chunk):
+            chunk_result = att_result.reindex(columns=chunk_columns.index).astype(float)
+            self._store.append(self._getChunkKey(element_type, att, chunk), chunk_result)
+
+    def _getChunkKey(self, element_type, att, chunk):
+        return element_type + '/' + att + '/chunk_' + str(chunk)
+
+    def putRegistry(self, registry):
+        """
+        Stores the damage tables of the registry.
+
+        Parameters
+        ----------
+        registry : Registry
+            The registry of the scenario.
+
+        Returns
+        -------
+        None.
+
+        """
+        for table_name in REGISTRY_TABLE_LIST:
+            table = getattr(registry, table_name, None)
+            if table is None:
+                continue
+            self._store.put('registry/' + table_name.strip('_'), table, format='fixed')
+
+    def getRegistryTable(self, table_name):
+        return self._store['registry/' + table_name.strip('_')]
+
+    def getAttributeList(self, element_type):
+        group = self._store.get_node(element_type)
+        if group is None:
+            return []
+        return list(group._v_children.keys())
+
+    def getColumnChunk(self, element_type, att):
+        key = element_type + '/' + att + '/column_chunk'
+        if key not in self._store:
+            return pd.Series(dtype=int)
+        return self._store[key]
+
+    def getMaximumTrialTime(self):
+        if 'maximum_trial_time' not in self._store:
+            return []
+        return self._store['maximum_trial_time'].to_list()
+
+    def getFlowBalance(self):
+        if 'flow_balance' not in self._store:
+            return pd.Series(dtype=float)
+        return self._store['flow_balance']
+
+    def select(self, element_type, att, columns=None, start_time=None, end_time=None):
+        """
+        Reads a result attribute.
+
+        Parameters
+        ----------
+        element_type : str
+            'node' or 'link'.
+        att : str
+            Result attribute, e.g. 'demand'.
+        columns : list, optional
+            Node or link names. Names that are not in the result are
+            ignored. The default is None, which reads all of them.
+        start_time : int, optional
+            First time to read. The default is None.
+        end_time : int, optional
+            Last time to read. The default is None.
+
+        Returns
+        -------
+        pandas.DataFrame
+            The result with time index.
+
+        """
+        column_chunk = self.getColumnChunk(element_type, att)
+        if columns is not None:
+            column_chunk = column_chunk[column_chunk.index.isin(columns)]
+            column_order = [col for col in columns if col in column_chunk.index]
+        else:
+            column_order = column_chunk.index
+
+        where = []
+        if start_time is not None:
+            where.append('index>=' + str(start_time))
+        if end_time is not None:
+            where.append('index<=' + str(end_time))
+        where = ' & '.join(where) if len(where) > 0 else None
+
+        if len(column_chunk) == 0:
+            all_column_chunk = self.getColumnChunk(element_type, att)
+            if len(all_column_chunk) == 0:
+                return pd.DataFrame()
+            first_column = all_column_chunk.index[:1]
+            chunk_result = self._store.select(self._getChunkKey(element_type, att, all_column_chunk.iloc[0]), where=where, columns=list(first_column))
+            return chunk_result[[]]
+
+        result = []
+        for chunk, chunk_columns in column_chunk.groupby(column_chunk):
+            result.append(self._store.select(self._getChunkKey(element_type, att, chunk), where=where, columns=list(chunk_columns.index)) )
+
+        if len(result) == 1:
+            result = result[0]
+        else:
+            result = pd.concat(result, axis=1)
+        return result[column_order]
+
+class StoredResultData():
+    def __init__(self, stored_result, element_type, att_list):
+        """
+        Node or link results of a StoredResult. Reading an attribute with []
+        reads all of its columns; select reads some columns and a time
+        window.
+        """
+        self._stored_result = stored_result
+        self.element_type   = element_type
+        self._att_list      = att_list
+
+    def __contains__(self, att):
+        return att in self._att_list
+
+    def __iter__(self):
+        return iter(self._att_list)
+
+    def __len__(self):
+        return len(self._att_list)
+
+    def keys(self):
+        return list(self._att_list)
+
+    def items(self):
+        for att in self._att_list:
+            yield att, self[att]
+
+    def __getitem__(self, att):
+        if att not in self._att_list:
+            raise KeyError(att)
+        return self.select(att)
+
+    def select(self, att, columns=None, start_time=None, end_time=None):
+        return self._stored_result.select(self.element_type, att, columns=columns, start_time=start_time, end_time=end_time)
+
+    def getColumns(self, att):
+        return self._stored_result.getColumns(self.element_type, att)
+
+class StoredResult():
+    def __init__(self, file_addr):
+        """
+        Result of a scenario read from its HDF5 result store. It has node,
+        link and maximum_trial_time like SimulationResults, but the results
+        are read from the file when they are used.
+
+        Parameters
+        ----------
+        file_addr : str
+            Address of the HDF5 file.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.file_addr = file_addr
+        with ResultStore(file_addr, mode='r') as store:
+            self.maximum_trial_time = store.getMaximumTrialTime()
+            self.flow_balance       = store.getFlowBalance()
+            self.node               = StoredResultData(self, 'node', store.getAttributeList('node') )
+            self.link               = StoredResultData(self, 'link', store.getAttributeList('link') )
+        self.dropped_time_list  = []
+
+    def dropTime(self, time_list):
+        """
+        Sets the times to leave out of all the results read afterwards.
+        """
+        self.dropped_time_list = list(time_list)
+
+    def select(self, element_type, att, columns=None, start_time=None, end_time=None):
+        with ResultStore(self.file_addr, mode='r') as store:
+            result = store.select(element_type, att, columns=columns, start_time=start_time, end_time=end_time)
+        if len(self.dropped_time_list) > 0:
+            result = result.drop(index=self.dropped_time_list, errors='ignore')
+        return result
+
+    def getColumns(self, element_type, att):
+        with ResultStore(self.file_addr, mode='r') as store:
+            return store.getColumnChunk(element_type, att).index
+
+    def getRegistryTable(self, table_name):
+        with ResultStore(self.file_addr, mode='r') as store:
+            return store.getRegistryTable(table_name)
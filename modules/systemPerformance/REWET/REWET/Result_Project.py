@@ -19,6 +19,7 @@ from Output.Raw_Data import Raw_Data
 from Output.Curve import Curve
 from Output.Crew_Report import Crew_Report
 from Output.Result_Time import Result_Time
+from Output.Result_Store import StoredResult
 import Input.Input_IO as io
 from Project import Project as MainProject
 
@@ -104,7 +105,8 @@ class Project_Result(Map, Raw_Data, Curve, Crew_Report, Result_Time):
             #print(result_directory)
             #print(scenario_registry_file_name)
             registry_file_data_addr = os.path.join(result_directory, scenario_registry_file_name)
-            if not os.path.exists(registry_file_data_addr):
+            result_store_addr       = os.path.join(result_directory, scn_name+".h5")
+            if not os.path.exists(registry_file_data_addr) and not os.path.exists(result_store_addr):
                 self.scn_name_list_that_result_file_not_found.append(scn_name)
         
         if len( self.scn_name_list_that_result_file_not_found)> 0:
@@ -151,6 +153,16 @@ class Project_Result(Map, Raw_Data, Curve, Crew_Report, Result_Time):
         #registry_file_data_addr = os.path.join(result_directory, scenario_registry_file_name)
         scenario_registry_file_name = scn_name+"_registry.pkl"
         reg_addr = os.path.join(result_directory, scenario_registry_file_name)
+        result_store_addr = os.path.join(result_directory, scn_name+".h5")
+        if os.path.exists(result_store_addr):
+            #the results are read from the file when they are used
+            if os.path.exists(reg_addr):
+                with open(reg_addr, 'rb') as f:
+                    self.registry[scn_name] = pickle.load(f)
+            res_file_data = StoredResult(result_store_addr)
+            self.remove_maximum_trials(res_file_data)
+            self.data[scn_name] = res_file_data
+            return
         try:
             with open(reg_addr, 'rb') as f:
             #print(output_addr)
@@ -222,6 +234,13 @@ class Project_Result(Map, Raw_Data, Curve, Crew_Report, Result_Time):
             print(str(scn_name) +" loaded")
         
     def remove_maximum_trials(self, data):
+        if isinstance(data, StoredResult):
+            time_to_drop = set(data.maximum_trial_time)
+            flow_balance = data.flow_balance.drop(index=list(time_to_drop), errors='ignore')
+            time_to_drop = time_to_drop.union(flow_balance[abs(flow_balance) >= 0.01 ].index)
+            data.dropTime(sorted(time_to_drop) )
+            return
+        
 
         all_time_list = data.maximum_trial_time
         result_time_list = data.node['demand'].index.to_list()
@@ -299,6 +318,57 @@ class Project_Result(Map, Raw_Data, Curve, Crew_Report, Result_Time):
             att_data.drop(result_time_max_trailed_list, inplace=True)
             data.link[att] = att_data
         
+    def getResultData(self, scn_name, element_type, att, columns=None, start_time=None, end_time=None):
+        """
+        Reads the result of an attribute in a scenario. For results saved in
+        HDF5 format, only the asked columns and time window are read from
+        the file.
+
+        Parameters
+        ----------
+        scn_name : str
+            Scenario name.
+        element_type : str
+            'node' or 'link'.
+        att : str
+            Result attribute, e.g. 'demand'.
+        columns : list, optional
+            Node or link names. Names that are not in the result are ignored.
+            The default is None, which reads all of them.
+        start_time : int, optional
+            First time. The default is None.
+        end_time : int, optional
+            Last time. The default is None.
+
+        Returns
+        -------
+        pandas.DataFrame
+            The result.
+
+        """
+        self.loadScneariodata(scn_name)
+        res = self.data[scn_name]
+        element_result = res.node if element_type == 'node' else res.link
+        
+        if isinstance(res, StoredResult):
+            return element_result.select(att, columns=columns, start_time=start_time, end_time=end_time)
+        
+        att_result = element_result[att]
+        if columns is not None:
+            att_result = att_result.filter(columns)
+        if start_time is not None or end_time is not None:
+            att_result = att_result.loc[start_time:end_time]
+        return att_result
+    
+    def getResultColumns(self, scn_name, element_type, att):
+        self.loadScneariodata(scn_name)
+        res = self.data[scn_name]
+        element_result = res.node if element_type == 'node' else res.link
+        
+        if isinstance(res, StoredResult):
+            return element_result.getColumns(att)
+        return element_result[att].columns
+    
     def readPopulation(self, population_xlsx_addr = 'demandNode-Northridge.xlsx', demand_node_header='NodeID', population_header='#Customer'):
         pop = pd.read_excel(population_xlsx_addr)
         pop = pop.set_index(demand_node_header)
@@ -328,7 +398,7 @@ class Project_Result(Map, Raw_Data, Curve, Crew_Report, Result_Time):
         if type(self._RequiredDemandForAllNodesandtime[scn_name])!=type(None):
             return self._RequiredDemandForAllNodesandtime[scn_name]
         undamaged_wn      = self.wn
-        time_index        = self.data[scn_name].node['demand'].index
+        time_index        = self.getResultData(scn_name, 'node', 'demand', columns=[]).index
         #req_node_demand   = pd.DataFrame(index=time_index.unique())
         default_pattern   = undamaged_wn.options.hydraulic.pattern
         node_pattern_list = pd.Series(index=undamaged_wn.junction_name_list, dtype=str)
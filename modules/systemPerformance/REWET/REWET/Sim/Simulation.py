@@ -2,13 +2,42 @@ import os
 import math
 import pandas as pd
 import numpy as np
-from EnhancedWNTR.sim.epanet import EpanetSimulator
+from EnhancedWNTR.sim.epanet import EpanetSimulator, EpanetSession
 from EnhancedWNTR.sim.results import SimulationResults
 import wntrfr
+from wntrfr.network.model import LinkStatus
 
 
+# the pipe closures are screened in a worker pool only if each worker gets at
+# least this many pipes
+_minimum_screened_pipes_per_worker = 10
+
+# simulation of the network copy in a screening worker process
+_screening_worker_simulation      = None
+_screening_worker_node_name_list  = None
+_screening_worker_baseline        = None
+
+def _initializeScreeningWorker(wn, settings, current_stop_time, worker_rank, prev_isolated_junctions, prev_isolated_links, node_name_list):
+    global _screening_worker_simulation, _screening_worker_node_name_list, _screening_worker_baseline
+    
+    # every worker has its own temporary files
+    worker_rank = str(worker_rank) + '_screening_' + str(os.getpid() )
+    hyd_sim     = Hydraulic_Simulation(wn, settings, current_stop_time, worker_rank, prev_isolated_junctions, prev_isolated_links)
+    hyd_sim._use_session = True
+    
+    _screening_worker_simulation     = hyd_sim
+    _screening_worker_node_name_list = node_name_list
+    _screening_worker_baseline       = hyd_sim.getPipeClosurePressure(None, node_name_list)
+
+def _screenPipeClosuresInWorker(pipe_name_list):
+    hyd_sim       = _screening_worker_simulation
+    pressure_dict = {}
+    for pipe_name in pipe_name_list:
+        pressure_dict[pipe_name] = hyd_sim.getPipeClosurePressure(pipe_name, _screening_worker_node_name_list)
+    return _screening_worker_baseline, pressure_dict
+
 class Hydraulic_Simulation():
-    def __init__(self, wn, settings, current_stop_time, worker_rank, prev_isolated_junctions, prev_isolated_links):
+    def __init__(self, wn, settings, current_stop_time, worker_rank, prev_isolated_junctions, prev_isolated_links, session_dict=None):
         self.wn                    = wn
         self.nne_flow_criteria     = settings.process['nne_flow_limit']
         self.nne_pressure_criteria = settings.process['nne_pressure_limit']
@@ -38,6 +67,43 @@ class Hydraulic_Simulation():
             raise ValueError("Unknown value for settings 'save_time_step': " + repr())
         self._prev_isolated_junctions = prev_isolated_junctions
         self._prev_isolated_links     = prev_isolated_links
+        self._settings                = settings
+        self._screening_worker_number = settings['screening_worker_number'] if 'screening_worker_number' in settings else 1
+        self._screening_tolerance     = settings['screening_tolerance'] if 'screening_tolerance' in settings else 0.001
+        self._use_session             = 'hydraulic_session' in settings and settings['hydraulic_session'] == True
+        # sessions by iModified, which may be shared by the simulations of
+        # all the time steps
+        self._session_dict            = {} if session_dict is None else session_dict
+    
+    def getSession(self, iModified):
+        """
+        Returns the persistent EPANET session for the runs with the modified
+        (iModified=True) or the original EPANET, or None if the hydraulic
+        session is not activated in the settings. The network stays loaded
+        between the runs, so that only the changed pipes, junctions and tanks
+        are passed to EPANET.
+
+        """
+        if self._use_session == False:
+            return None
+        session = self._session_dict.get(iModified, None)
+        if session is None or session._wn is not self.wn:
+            if session is not None:
+                session.close()
+            session = EpanetSession(self.wn, iModified=iModified)
+            self._session_dict[iModified] = session
+        # the files of the two sessions are kept apart
+        session.file_prefix = self.temp_directory + ('_session_mod' if iModified else '_session')
+        return session
+    
+    def closeSession(self):
+        """
+        Closes the sessions of this simulation, including the ones shared
+        with the simulations of the other time steps.
+
+        """
+        for iModified in list(self._session_dict):
+            self._session_dict.pop(iModified).close()
         
     def removeNonDemandNegativeNodeByPythonMinorLoss(self, maximum_iteration):
         current_stop_time = self.current_stop_time
@@ -52,7 +118,7 @@ class Hydraulic_Simulation():
             self._prev_isolated_junctions, self._prev_isolated_links = sim._get_isolated_junctions_and_links(self._prev_isolated_junctions, self._prev_isolated_links)
 
             sim.manipulateTimeOrder(current_stop_time, current_stop_time)
-            rr, i_run_successful = sim.run_sim(file_prefix = temp_file_dest, start_time = current_stop_time, iModified=False)
+            rr, i_run_successful = sim.run_sim(file_prefix = temp_file_dest, start_time = current_stop_time, iModified=False, session=self.getSession(False))
             new_closed_pipes, ifinish = sim.now_temp_2(rr, self._prev_isolated_links, self._prev_isolated_junctions, self.nne_flow_criteria, self.nne_pressure_criteria)
                             
             if ifinish:
@@ -92,7 +158,7 @@ class Hydraulic_Simulation():
             sim    = EpanetSimulator(self.wn)
             self._prev_isolated_junctions, self._prev_isolated_links = sim._get_isolated_junctions_and_links(self._prev_isolated_junctions, self._prev_isolated_links)
             sim.manipulateTimeOrder(current_stop_time, current_stop_time)
-            rr, i_run_successful = sim.run_sim(file_prefix = temp_file_dest, start_time = current_stop_time, iModified=False)
+            rr, i_run_successful = sim.run_sim(file_prefix = temp_file_dest, start_time = current_stop_time, iModified=False, session=self.getSession(False))
             new_closed_pipes, ifinish = sim.closePipeNNN(rr, self._prev_isolated_links, self._prev_isolated_junctions, self.nne_flow_criteria, self.nne_pressure_criteria)
                             
             if ifinish:
@@ -130,9 +196,121 @@ class Hydraulic_Simulation():
         print(len(self._prev_isolated_links))
         print('-----------')
         sim.manipulateTimeOrder(current_stop_time, next_event_time) #, change_time_step=True, min_correction_time_step=self._min_correction_time)
-        rr, i_run_successful = sim.run_sim(file_prefix = temp_file_dest, start_time = current_stop_time,iModified=iModified)
+        rr, i_run_successful = sim.run_sim(file_prefix = temp_file_dest, start_time = current_stop_time,iModified=iModified, session=self.getSession(iModified))
         return rr, i_run_successful
     
+    def screenPipeClosures(self, pipe_name_list, node_name_list):
+        """
+        Runs a snapshot simulation at the current stop time for each pipe in
+        pipe_name_list closed on its own. The runs use the hydraulic session
+        (even if it is not activated in the settings), so the network stays
+        loaded in EPANET and only the status of the screened pipe is changed
+        between the runs. Pipes that are already closed are skipped.
+        
+        With 'screening_worker_number' more than 1, the pipes are screened by
+        a local pool of worker processes, each with one loaded copy of the
+        network. The pressure of each worker's network before any closure is
+        checked against the one of this process, and if they differ more
+        than 'screening_tolerance', the pipes are screened in this process.
+
+        Parameters
+        ----------
+        pipe_name_list : list
+            Names of the pipes to be screened.
+        node_name_list : list
+            Names of the nodes whose pressure is returned.
+
+        Returns
+        -------
+        pressure_dict : dict
+            Pressure of the nodes in node_name_list that are in the result
+            at the current stop time for each screened pipe.
+
+        """
+        pipe_name_list = [pipe_name for pipe_name in pipe_name_list if self.wn.get_link(pipe_name).initial_status != LinkStatus.Closed]
+        worker_number  = min(self._screening_worker_number, len(pipe_name_list) // _minimum_screened_pipes_per_worker)
+        
+        use_session       = self._use_session
+        self._use_session = True
+        try:
+            if worker_number > 1:
+                pressure_dict = self._screenPipeClosuresInPool(pipe_name_list, node_name_list, worker_number)
+                if pressure_dict is not None:
+                    return pressure_dict
+            
+            pressure_dict = {}
+            for pipe_name in pipe_name_list:
+                pressure_dict[pipe_name] = self.getPipeClosurePressure(pipe_name, node_name_list)
+            return pressure_dict
+        finally:
+            self._use_session = use_session
+    
+    def getPipeClosurePressure(self, pipe_name, node_name_list):
+        """
+        Runs a snapshot simulation at the current stop time with the pipe
+        closed, or with no pipe closed if pipe_name is None.
+
+        Parameters
+        ----------
+        pipe_name : str
+            Name of the pipe to be closed, or None.
+        node_name_list : list
+            Names of the nodes whose pressure is returned.
+
+        Returns
+        -------
+        pandas.Series
+            Pressure of the nodes in node_name_list that are in the result.
+
+        """
+        current_stop_time = self.current_stop_time
+        duration          = self.wn.options.time.duration
+        report_time_step  = self.wn.options.time.report_timestep
+        
+        if pipe_name is not None:
+            pipe                = self.wn.get_link(pipe_name)
+            initial_pipe_status = pipe.initial_status
+            pipe.initial_status = LinkStatus.Closed
+        try:
+            rr, i_run_successful = self.performSimulation(current_stop_time, True)
+        finally:
+            if pipe_name is not None:
+                pipe.initial_status = initial_pipe_status
+            self.wn.options.time.duration        = duration
+            self.wn.options.time.report_timestep = report_time_step
+        
+        available_node_list = set(node_name_list).intersection(rr.node["pressure"].columns)
+        return rr.node["pressure"].loc[current_stop_time, list(available_node_list)]
+    
+    def _screenPipeClosuresInPool(self, pipe_name_list, node_name_list, worker_number):
+        from concurrent.futures import ProcessPoolExecutor
+        
+        baseline_pressure = self.getPipeClosurePressure(None, node_name_list)
+        
+        # a few chunks per worker, so that the workers finish close together
+        chunk_size = math.ceil(len(pipe_name_list) / (worker_number * 4) )
+        chunk_list = [pipe_name_list[i:i + chunk_size] for i in range(0, len(pipe_name_list), chunk_size)]
+        initargs   = (self.wn, self._settings, self.current_stop_time, self.worker_rank, self._prev_isolated_junctions, self._prev_isolated_links, node_name_list)
+        
+        pressure_dict = {}
+        try:
+            with ProcessPoolExecutor(max_workers=worker_number, initializer=_initializeScreeningWorker, initargs=initargs) as executor:
+                for worker_baseline_pressure, chunk_pressure_dict in executor.map(_screenPipeClosuresInWorker, chunk_list):
+                    if set(worker_baseline_pressure.index) != set(baseline_pressure.index):
+                        difference = np.inf
+                    else:
+                        difference = (worker_baseline_pressure - baseline_pressure).abs().max() if len(baseline_pressure) > 0 else 0
+                    if not difference <= self._screening_tolerance:
+                        print("Screening workers' pressure differs by " + repr(difference) + ". Screening in this process.")
+                        executor.shutdown(cancel_futures=True)
+                        return None
+                    pressure_dict.update(chunk_pressure_dict)
+        except Exception as err:
+            print("Screening workers failed: " + repr(err) + ". Screening in this process.")
+            return None
+        
+        return {pipe_name: pressure_dict[pipe_name] for pipe_name in pipe_name_list}
+    
     def estimateRun(self, next_event_time, iModified):
         current_stop_time = self.current_stop_time
         minimum_pressure  = self.minimum_pressure
@@ -147,7 +325,7 @@ class Hydraulic_Simulation():
         self._prev_isolated_junctions, self._prev_isolated_links = sim._get_isolated_junctions_and_links(self._prev_isolated_junctions, self._prev_isolated_links)
         self._prev_isolated_junctions = self.isolateReservoirs(self._prev_isolated_junctions)
         self._prev_isolated_junctions = self.isolateTanks(self._prev_isolated_junctions)
-        rr, i_run_successful = sim.run_sim(file_prefix= temp_file_dest, start_time = current_stop_time, iModified=iModified)
+        rr, i_run_successful = sim.run_sim(file_prefix= temp_file_dest, start_time = current_stop_time, iModified=iModified, session=self.getSession(iModified))
         self.wn.options.time.duration = duration
         self.wn.options.time.report_timestep = report_time_step
         rr = self.approximateNewResult(rr, current_stop_time, next_event_time, 0)
@@ -17,6 +17,7 @@ from wntrfr.utils.ordered_set import OrderedSet
 from Sim.Simulation import Hydraulic_Simulation
 import EnhancedWNTR.network.model
 from EnhancedWNTR.sim.results import SimulationResults
+from Output.Result_Store import ResultStore
 from wntrfr.network.model import LinkStatus
 
 
@@ -53,6 +54,8 @@ class StochasticModel():
         self._prev_isolated_junctions = OrderedSet()
         self._prev_isolated_links     = OrderedSet()
         self.first_leak_flag          = True
+        # hydraulic sessions kept for all the time steps (see Hydraulic_Simulation.getSession)
+        self._hydraulic_session_dict  = {}
 
     def runLinearScenario(self, damage, settings, worker_rank=None):
         """
@@ -68,6 +71,16 @@ class StochasticModel():
         Result.
 
         """
+        try:
+            return self._runLinearScenario(damage, settings, worker_rank)
+        finally:
+            self.closeHydraulicSessions()
+    
+    def closeHydraulicSessions(self):
+        for iModified in list(self._hydraulic_session_dict):
+            self._hydraulic_session_dict.pop(iModified).close()
+    
+    def _runLinearScenario(self, damage, settings, worker_rank):
         
         while self.timeline.iContinue():
             sys.stdout.flush()
@@ -91,63 +104,31 @@ class StochasticModel():
                 logger.debug('\t DAMAGE EVENT')
                 #pipe_list = self.restoration.getPipeListForHydraulicSignificant()
                 if len(self.restoration.getHydSigPipeList() ) > 0:
-                    last_demand_node_pressure = None
-                    pipe_list = damage.getPipeDamageListAt(current_stop_time)
-                    for pipe_name in pipe_list:
-                        if type(last_demand_node_pressure) == type(None):
-                            time_index = self.registry.result.node["pressure"].index
-                            time_index = list(set(time_index) - set(self.registry.result.maximum_trial_time))
-                            time_index.sort()
-                            if len(time_index) > 0:
-                                time_index = time_index[-1]
-                            else:
-                                self.registry.hydraulic_significance.loc[pipe_name] = -1000
-                                continue
-                                time_index = current_stop_time
-                            demand_node_list = self.registry.demand_node_name_list
-                            demand_node_list = set(demand_node_list).intersection(self.registry.result.node["pressure"].columns)
-                            last_demand_node_pressure = self.registry.result.node["pressure"].loc[time_index, list(demand_node_list)]
-                            last_demand_node_pressure.loc[last_demand_node_pressure[last_demand_node_pressure < 0].index] = 0
-                        pipe = self.wn.get_link(pipe_name)
-                        initial_pipe_status = pipe.initial_status
-                        if initial_pipe_status == LinkStatus.Closed:
-                            continue
+                    pipe_list  = damage.getPipeDamageListAt(current_stop_time)
+                    time_index = self.registry.result.node["pressure"].index
+                    time_index = list(set(time_index) - set(self.registry.result.maximum_trial_time))
+                    time_index.sort()
+                    if len(time_index) == 0:
+                        for pipe_name in pipe_list:
+                            self.registry.hydraulic_significance.loc[pipe_name] = -1000
+                    else:
+                        time_index = time_index[-1]
+                        demand_node_list = self.registry.demand_node_name_list
+                        demand_node_list = set(demand_node_list).intersection(self.registry.result.node["pressure"].columns)
+                        last_demand_node_pressure = self.registry.result.node["pressure"].loc[time_index, list(demand_node_list)]
+                        last_demand_node_pressure.loc[last_demand_node_pressure[last_demand_node_pressure < 0].index] = 0
                         
-                        pipe.initial_status = LinkStatus.Closed
-                        hyd_sim = Hydraulic_Simulation(self.wn, settings, current_stop_time, worker_rank, self._prev_isolated_junctions, self._prev_isolated_links)
+                        hyd_sim = Hydraulic_Simulation(self.wn, settings, current_stop_time, worker_rank, self._prev_isolated_junctions, self._prev_isolated_links, self._hydraulic_session_dict)
                         self.hyd_temp = hyd_sim
-                        duration          = self.wn.options.time.duration
-                        report_time_step  = self.wn.options.time.report_timestep
-                        try: # Run with modified EPANET V2.2
-                            print("Performing method 1")
-                            rr, i_run_successful = hyd_sim.performSimulation(current_stop_time, True)
-                            if current_stop_time in rr.maximum_trial_time:
-                                pass
-                                #self.registry.hydraulic_significance.loc[pipe_name] = -20000
-                                #pipe.initial_status = initial_pipe_status
-                                #self._prev_isolated_junctions = hyd_sim._prev_isolated_junctions
-                                #self._prev_isolated_links     = hyd_sim._prev_isolated_links
-                                #continue
-                            demand_node_list  = self.registry.demand_node_name_list
-                            demand_node_list  = set(demand_node_list).intersection(rr.node["pressure"].columns)
-                            new_node_pressure = rr.node["pressure"].loc[current_stop_time, list(demand_node_list)]
+                        new_pressure_dict = hyd_sim.screenPipeClosures(pipe_list, self.registry.demand_node_name_list)
+                        
+                        for pipe_name, new_node_pressure in new_pressure_dict.items():
                             new_node_pressure.loc[new_node_pressure[new_node_pressure < 0].index] = 0
-                            
                             hydraulic_impact  = (last_demand_node_pressure - new_node_pressure).mean()
                             self.registry.hydraulic_significance.loc[pipe_name] = hydraulic_impact
-                            
-                        except Exception as epa_err_1:
-                            raise
-                            if epa_err_1.args[0] == 'EPANET Error 110':
-                                print("Method 1 failed. Performing method 2")
-                                self.wn.options.time.duration        = duration
-                                self.wn.options.time.report_timestep = report_time_step
-                                self.registry.hydraulic_significance.loc[pipe_name] = -1
-                        pipe.initial_status = initial_pipe_status
+                        
                         self._prev_isolated_junctions = hyd_sim._prev_isolated_junctions
                         self._prev_isolated_links     = hyd_sim._prev_isolated_links
-                        self.wn.options.time.duration        = duration
-                        self.wn.options.time.report_timestep = report_time_step
                 damage.applyPipeDamages(self.wn, current_stop_time)
                 damage.applyNodalDamage(self.wn, current_stop_time)
                 damage.applyPumpDamages(self.wn, current_stop_time)
@@ -174,7 +155,7 @@ class StochasticModel():
             if type(worker_rank) != str:
                 worker_rank = str(worker_rank)
             
-            hyd_sim = Hydraulic_Simulation(self.wn, settings, current_stop_time, worker_rank, self._prev_isolated_junctions, self._prev_isolated_links)
+            hyd_sim = Hydraulic_Simulation(self.wn, settings, current_stop_time, worker_rank, self._prev_isolated_junctions, self._prev_isolated_links, self._hydraulic_session_dict)
             self.hyd_temp = hyd_sim
             duration          = self.wn.options.time.duration
             report_time_step  = self.wn.options.time.report_timestep
@@ -440,6 +421,19 @@ class StochasticModel():
                 last_valid_time_index = att_result.index.searchsorted(last_valid_time)
                 self._linear_result.link[att].drop(att_result.index[:last_valid_time_index+1], inplace=True)
             
+            if self.registry.settings["result_file_format"] == 'hdf':
+                #the parts are appended to the scenario's result store, which
+                #is completed in Input_IO.save_single
+                result_dump_file_name = self.registry.scenario_name + ".h5.part"
+                result_dump_file_dst  = os.path.join(self.registry.settings.process['result_directory'], result_dump_file_name)
+                store_mode            = 'w' if len(self.registry.result_dump_file_list) == 0 else 'a'
+                
+                with ResultStore(result_dump_file_dst, mode=store_mode) as result_store:
+                    result_store.appendResult(dump_result)
+                
+                self.registry.result_dump_file_list.append(result_dump_file_name)
+                return
+            
             dump_file_index = len(self.registry.result_dump_file_list) + 1
             
             if dump_file_index >= 1:
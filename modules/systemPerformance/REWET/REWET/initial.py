@@ -221,9 +221,10 @@ class Starter():
             done_scenario_list=[]
             for name in file_lists:
                 
-                if name.split('.')[-1] != 'res':
+                result_file_extension = name.split('.')[-1]
+                if result_file_extension != 'res' and result_file_extension != 'h5':
                     continue
-                split_k = name.split('.res')[:-1]
+                split_k = name.split('.'+result_file_extension)[:-1]
                 #print(split_k)
                 kk = ""
                 for portiong in split_k:
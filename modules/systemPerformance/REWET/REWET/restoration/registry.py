@@ -11,6 +11,7 @@ import logging
 from collections import OrderedDict
 from   restoration.restorationlog import RestorationLog 
 from restoration.base import get_node_name
+from restoration.registry_table import AppendOnlyTable, DeltaTableTimeSeries
 
 logger = logging.getLogger(__name__)
 
@@ -37,11 +38,12 @@ class Registry():
         self._reservoir_damage_table   = pd.DataFrame(columns=['damage_type'])
         self._pump_damage_table        = pd.DataFrame(columns=['damage_type', 'element_name', 'start_node', 'end_node'])
         self._gnode_damage_table       = pd.DataFrame(columns=['damage_type'])
-        self._pipe_damage_table        = pd.DataFrame(columns=['damage_type', 'damage_sub_type', 'Orginal_element', 'attached_element','number', 'LeakAtCheck'])
+        self._pipe_damage_rows         = AppendOnlyTable(['damage_type', 'damage_sub_type', 'Orginal_element', 'attached_element','number', 'LeakAtCheck'])
         self._pipe_data                = pd.DataFrame(columns=['diameter'])
         self._node_damage_table        = pd.DataFrame(columns=['Demand1','Demand2','Number_of_damages'])
-        self._pipe_break_history       = pd.DataFrame(columns=['Pipe_A','Pipe_B','Orginal_pipe', 'Node_A','Node_B'])
-        self._pipe_leak_history        = pd.DataFrame(columns=['Pipe_A','Pipe_B','Orginal_pipe','Node_name'])
+        self._pipe_break_rows          = AppendOnlyTable(['Pipe_A','Pipe_B','Orginal_pipe', 'Node_A','Node_B'])
+        self._pipe_leak_rows           = AppendOnlyTable(['Pipe_A','Pipe_B','Orginal_pipe','Node_name'])
+        self._pipe_A_damage            = {} # pipe A name to (damage type, damage node name)
         self._long_task_data           = pd.DataFrame(columns=['Node_name', 'Action', 'Entity', 'Time', 'cur_agent_name'])
         self.all_node_table            = pd.DataFrame(columns=["X_COORD", "Y_COORD"], dtype=float)
         self.pre_event_demand_met      = pd.DataFrame(dtype=float)
@@ -89,8 +91,8 @@ class Registry():
         self._restoration_table  = pd.DataFrame(columns = ['node_name','function', 'record_index'])
         self._record_registry    = []
         
-        self._pipe_damage_table_time_series            = OrderedDict()
-        self._node_damage_table_time_series            = OrderedDict()
+        self._pipe_damage_table_time_series            = DeltaTableTimeSeries()
+        self._node_damage_table_time_series            = DeltaTableTimeSeries()
         self._tank_level_time_series                   = OrderedDict()
         self._restoration_reservoir_name_time_series   = OrderedDict()
         self.ED_history = pd.Series(dtype="O") #Equavalant Damage Diameter
@@ -98,6 +100,46 @@ class Registry():
         
         for pipe_name, pipe in WaterNetwork.pipes():
             self.original_pipe_data[pipe_name]={'diameter':pipe.diameter, 'length':pipe.length, 'start_node_name':pipe.start_node_name, 'end_node_name':pipe.end_node_name, 'roughness':pipe.roughness }
+
+    @property
+    def _pipe_damage_table(self):
+        return self._pipe_damage_rows.frame
+
+    @_pipe_damage_table.setter
+    def _pipe_damage_table(self, table):
+        self._pipe_damage_rows.frame = table
+
+    @property
+    def _pipe_break_history(self):
+        return self._pipe_break_rows.frame
+
+    @_pipe_break_history.setter
+    def _pipe_break_history(self, table):
+        self._pipe_break_rows.frame = table
+
+    @property
+    def _pipe_leak_history(self):
+        return self._pipe_leak_rows.frame
+
+    @_pipe_leak_history.setter
+    def _pipe_leak_history(self, table):
+        self._pipe_leak_rows.frame = table
+
+    def __setstate__(self, state):
+        # registries pickled before the tables were kept in AppendOnlyTable
+        for table_name, rows_name in [('_pipe_damage_table', '_pipe_damage_rows'), ('_pipe_break_history', '_pipe_break_rows'), ('_pipe_leak_history', '_pipe_leak_rows')]:
+            if table_name in state:
+                table = state.pop(table_name)
+                state[rows_name] = AppendOnlyTable(table.columns)
+                state[rows_name].frame = table
+
+        if '_pipe_A_damage' not in state:
+            state['_pipe_A_damage'] = {}
+            for damage_type, table_name in [('leak', '_pipe_leak_rows'), ('break', '_pipe_break_rows')]:
+                for damage_node_name, pipe_A in state[table_name].frame['Pipe_A'].items():
+                    state['_pipe_A_damage'][pipe_A] = (damage_type, damage_node_name)
+
+        self.__dict__.update(state)
 # =============================================================================
 #     def addElementToRestorationRegistry(self, damaged_node_name, function_name, element_name, elemenet_type, in_function_index):
 #         data = self.__restoration_table
@@ -113,7 +155,7 @@ class Registry():
     
     def addRestorationDataOnPipe(self, damage_node_name, time,  state):
         if self.settings['dmg_rst_data_save'] == True:
-            orginal_pipe_name = self._pipe_damage_table.loc[damage_node_name, 'Orginal_element']
+            orginal_pipe_name = self._pipe_damage_rows.get(damage_node_name, 'Orginal_element')
             time = time /3600
             temp_row = {'time':time, 'pipe_name': orginal_pipe_name, 'last_state': state}
             self.Pipe_Damage_restoration_report.append(temp_row)
@@ -331,49 +373,71 @@ class Registry():
         """
         #self._pipe_node_damage_status[name] = data
         
-        leaking_pipe_with_pipeA_orginal_pipe  = self._pipe_leak_history[self._pipe_leak_history.loc[:,'Pipe_A']==data['orginal_pipe']]
-        breaking_pipe_with_pipeA_orginal_pipe = self._pipe_break_history[self._pipe_break_history.loc[:,'Pipe_A']==data['orginal_pipe']]
-        
-        i_leak_not_zero_length  = len(leaking_pipe_with_pipeA_orginal_pipe)>0
-        i_break_not_zero_length = len(breaking_pipe_with_pipeA_orginal_pipe)>0
-        
-        if i_leak_not_zero_length and i_break_not_zero_length:
-            raise ValueError('There are more than 1 damage with orginal pipe name in pipe A. it does not make sense')
-        if i_leak_not_zero_length:
-            temp_node_name = leaking_pipe_with_pipeA_orginal_pipe.index[0]
-            self._pipe_leak_history.loc[temp_node_name, 'Pipe_A']  = data['pipe_B']
-        elif i_break_not_zero_length:
-            temp_node_name = breaking_pipe_with_pipeA_orginal_pipe.index[0]
-            self._pipe_break_history.loc[temp_node_name, 'Pipe_A'] = data['pipe_B']
+        # the damage that had the original pipe as pipe A is now attached to
+        # the new pipe (pipe B)
+        if data['orginal_pipe'] in self._pipe_A_damage:
+            damage_type, temp_node_name = self._pipe_A_damage.pop(data['orginal_pipe'])
+            if damage_type == 'leak':
+                self._pipe_leak_rows.set(temp_node_name, 'Pipe_A', data['pipe_B'])
+            else:
+                self._pipe_break_rows.set(temp_node_name, 'Pipe_A', data['pipe_B'])
+            self._pipe_A_damage[data['pipe_B']] = (damage_type, temp_node_name)
         
         if data['damage_type'] == 'leak':
-            self._pipe_damage_table.loc[node_name, 'damage_type']      = data['damage_type']
-            self._pipe_damage_table.loc[node_name, 'damage_sub_type']  = data['damage_subtype']
-            self._pipe_damage_table.loc[node_name, 'Orginal_element']  = data['orginal_pipe']
-            self._pipe_damage_table.loc[node_name, 'attached_element'] = data['pipe_A']
-            self._pipe_damage_table.loc[node_name, 'number']           = data['number']
+            self._pipe_damage_rows.append(node_name, {'damage_type'      : data['damage_type'],
+                                                      'damage_sub_type'  : data['damage_subtype'],
+                                                      'Orginal_element'  : data['orginal_pipe'],
+                                                      'attached_element' : data['pipe_A'],
+                                                      'number'           : data['number']})
             
-            self._pipe_leak_history.loc[node_name, 'Pipe_A']           = data['pipe_A']
-            self._pipe_leak_history.loc[node_name, 'Pipe_B']           = data['pipe_B']
-            self._pipe_leak_history.loc[node_name, 'Orginal_pipe']     = data['orginal_pipe']
-            self._pipe_leak_history.loc[node_name, 'Node_name']        = node_name
+            self._pipe_leak_rows.append(node_name, {'Pipe_A'       : data['pipe_A'],
+                                                    'Pipe_B'       : data['pipe_B'],
+                                                    'Orginal_pipe' : data['orginal_pipe'],
+                                                    'Node_name'    : node_name})
         
         elif data['damage_type'] == 'break':
-            self._pipe_damage_table.loc[node_name, 'damage_type']      = data['damage_type']
-            self._pipe_damage_table.loc[node_name, 'Orginal_element']  = data['orginal_pipe']
-            self._pipe_damage_table.loc[node_name, 'attached_element'] = data['pipe_A']
-            self._pipe_damage_table.loc[node_name, 'number']           = data['number']
+            self._pipe_damage_rows.append(node_name, {'damage_type'      : data['damage_type'],
+                                                      'Orginal_element'  : data['orginal_pipe'],
+                                                      'attached_element' : data['pipe_A'],
+                                                      'number'           : data['number']})
             
-            self._pipe_break_history.loc[node_name, 'Pipe_A']          = data['pipe_A']
-            self._pipe_break_history.loc[node_name, 'Pipe_B']          = data['pipe_B']
-            self._pipe_break_history.loc[node_name, 'Orginal_pipe']    = data['orginal_pipe']
-            self._pipe_break_history.loc[node_name, 'Node_A']          = data['node_A']
-            self._pipe_break_history.loc[node_name, 'Node_B']          = data['node_B']
+            self._pipe_break_rows.append(node_name, {'Pipe_A'       : data['pipe_A'],
+                                                     'Pipe_B'       : data['pipe_B'],
+                                                     'Orginal_pipe' : data['orginal_pipe'],
+                                                     'Node_A'       : data['node_A'],
+                                                     'Node_B'       : data['node_B']})
         
         else:
             raise ValueError('Undefined damage type')
+        
+        self._pipe_A_damage[data['pipe_A']] = (data['damage_type'], node_name)
 
     
+    def addPipeDamageListToRegistry(self, damage_list, time):
+        """
+        Adds the damages applied at one time to pipe registry
+
+        Parameters
+        ----------
+        damage_list : list
+            List of (damaged node name, damage data) in the order that the
+            damages are applied. See addPipeDamageToRegistry.
+        time : int
+            Time of the damages.
+
+        Returns
+        -------
+        None.
+
+        """
+        for node_name, data in damage_list:
+            self.addPipeDamageToRegistry(node_name, data)
+        
+        if self.settings['dmg_rst_data_save'] == True:
+            #the time is in hours like the repair and reconnect rows of addRestorationDataOnPipe
+            for node_name, data in damage_list:
+                self.Pipe_Damage_restoration_report.append({'time':time/3600, 'pipe_name':data['orginal_pipe'], 'last_state':data['damage_type']})
+    
     def addGeneralNodeDamageToRegistry(self, node_name, data=None):
         self._gnode_damage_table.loc[node_name, 'damage_type']=None
         
@@ -758,13 +822,13 @@ class Registry():
         if time in self._pipe_damage_table_time_series:
             raise ValueError('Time exist in pipe damage table time history')
         
-        self._pipe_damage_table_time_series[time]=self._pipe_damage_table.copy()
+        self._pipe_damage_table_time_series.record(time, self._pipe_damage_table)
         
     def updateNodeDamageTableTimeSeries(self, time):
         if time in self._node_damage_table_time_series:
             raise ValueError('Time exist in node damage table time history')
         
-        self._node_damage_table_time_series[time] = self._node_damage_table.copy()
+        self._node_damage_table_time_series.record(time, self._node_damage_table)
     
     
     def updateTankTimeSeries(self, wn, time):
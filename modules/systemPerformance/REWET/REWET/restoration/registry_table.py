@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""
+Storage backends for the registry damage tables.
+
+AppendOnlyTable keeps rows appended to a registry table in preallocated column
+arrays and moves them into the table's DataFrame in one step when the table is
+read. DeltaTableTimeSeries keeps the time history of a table as the rows that
+changed at each recorded time instead of a full copy per time.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class AppendOnlyTable():
+    def __init__(self, columns, capacity=1024):
+        """
+        Table with an append-only columnar buffer for new rows.
+
+        Parameters
+        ----------
+        columns : list
+            Column names of the table.
+        capacity : int, optional
+            Initial number of rows preallocated in the buffer. The buffer
+            capacity is doubled when it is full. The default is 1024.
+
+        Returns
+        -------
+        None.
+
+        """
+        self._frame    = pd.DataFrame(columns=columns)
+        self._columns  = list(columns)
+        self._capacity = capacity
+        self._allocateBuffer()
+
+    def _allocateBuffer(self):
+        self._buffer          = {col:np.full(self._capacity, np.nan, dtype=object) for col in self._columns}
+        self._buffer_index    = []
+        self._buffer_position = {}
+
+    def __len__(self):
+        return len(self._frame) + len(self._buffer_index)
+
+    def __contains__(self, name):
+        return name in self._buffer_position or name in self._frame.index
+
+    @property
+    def frame(self):
+        """
+        The table as a DataFrame. Buffered rows are moved into the DataFrame
+        first, so changes made to the returned DataFrame are kept.
+        """
+        self.flush()
+        return self._frame
+
+    @frame.setter
+    def frame(self, table):
+        self._frame = table
+        self._allocateBuffer()
+
+    def append(self, name, row):
+        """
+        Adds a row to the table. If the row exists, the given values are
+        overwritten, the same as setting them with DataFrame.loc.
+
+        Parameters
+        ----------
+        name : str
+            Row name.
+        row : dict
+            Column name to value. Columns not given are NaN for a new row.
+
+        Raises
+        ------
+        ValueError
+            If a column is not a column of the table.
+
+        Returns
+        -------
+        None.
+
+        """
+        undefined_columns = set(row) - set(self._columns)
+        if len(undefined_columns) > 0:
+            raise ValueError('Undefined columns: ' + repr(undefined_columns))
+
+        if name in self._buffer_position:
+            position = self._buffer_position[name]
+        elif name in self._frame.index:
+            for col, value in row.items():
+                self._frame.loc[name, col] = value
+            return
+        else:
+            position = len(self._buffer_index)
+            if position >= self._capacity:
+                self._growBuffer()
+            self._buffer_index.append(name)
+            self._buffer_position[name] = position
+
+        for col, value in row.items():
+            self._buffer[col][position] = value
+
+    def set(self, name, col, value):
+        if name in self._buffer_position and col in self._buffer:
+            self._buffer[col][self._buffer_position[name]] = value
+        else:
+            self.frame.loc[name, col] = value
+
+    def get(self, name, col):
+        if name in self._buffer_position and col in self._buffer:
+            return self._buffer[col][self._buffer_position[name]]
+        return self.frame.loc[name, col]
+
+    def _growBuffer(self):
+        for col in self._columns:
+            grown_column = np.full(self._capacity * 2, np.nan, dtype=object)
+            grown_column[:self._capacity] = self._buffer[col]
+            self._buffer[col] = grown_column
+        self._capacity *= 2
+
+    def flush(self):
+        number_of_rows = len(self._buffer_index)
+        if number_of_rows == 0:
+            return
+
+        new_rows = pd.DataFrame({col:self._buffer[col][:number_of_rows] for col in self._columns}, index=self._buffer_index, dtype=object)
+        if len(self._frame) == 0:
+            self._frame = new_rows.reindex(columns=self._frame.columns.union(new_rows.columns, sort=False))
+        else:
+            self._frame = pd.concat([self._frame, new_rows])
+        self._allocateBuffer()
+
+    def __getstate__(self):
+        self.flush()
+        state = self.__dict__.copy()
+        state['_buffer'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._allocateBuffer()
+
+
+class DeltaTableTimeSeries():
+    def __init__(self):
+        """
+        Time history of a table stored as the rows changed at each time.
+
+        It can be read like the dictionary of time to table that it replaces:
+        iterating gives the recorded times in order, and indexing with a time
+        gives the table at that time. Reading the times in order rebuilds
+        each table from the one before.
+
+        Returns
+        -------
+        None.
+
+        """
+        self._time_list = []
+        self._delta     = {}
+        self._last      = None
+        self._cursor    = None
+
+    def __len__(self):
+        return len(self._time_list)
+
+    def __contains__(self, time):
+        return time in self._delta
+
+    def __iter__(self):
+        return iter(self._time_list)
+
+    def keys(self):
+        return list(self._time_list)
+
+    def items(self):
+        for time in self._time_list:
+            yield time, self[time]
+
+    def record(self, time, table):
+        """
+        Records the table at a time after the last recorded time.
+
+        Parameters
+        ----------
+        time : int
+            Time of the table.
+        table : pandas.DataFrame
+            The table.
+
+        Raises
+        ------
+        ValueError
+            If the time is already recorded.
+
+        Returns
+        -------
+        None.
+
+        """
+        if time in self._delta:
+            raise ValueError('Time exist in table time history: ' + repr(time))
+
+        if self._last is None and len(self._time_list) > 0:
+            self._last = self._getState(len(self._time_list) - 1)
+
+        values  = table.to_numpy(dtype=object, copy=True)
+        index   = table.index
+        columns = table.columns
+        dtypes  = table.dtypes
+
+        if self._last is None or not index.is_unique or not self._last[0].is_unique:
+            changed = np.ones(len(index), dtype=bool)
+        else:
+            last_index, last_columns, last_dtypes, last_values = self._last
+            if index.equals(last_index):
+                index = last_index
+            if columns.equals(last_columns):
+                columns = last_columns
+            if dtypes.equals(last_dtypes):
+                dtypes = last_dtypes
+
+            last_values = pd.DataFrame(last_values, index=last_index, columns=last_columns).reindex(index=index, columns=columns).to_numpy(dtype=object)
+            changed     = ~((values == last_values) | (pd.isna(values) & pd.isna(last_values)) ).all(axis=1)
+            changed    |= ~index.isin(last_index)
+
+        self._delta[time] = (index, columns, dtypes, index[changed], values[changed])
+        self._time_list.append(time)
+        self._last = (index, columns, dtypes, values)
+
+    def __getitem__(self, time):
+        position = self._time_list.index(time)
+        index, columns, dtypes, values = self._getState(position)
+
+        table = pd.DataFrame(values.copy(), index=index, columns=columns)
+        for col, dtype in dtypes.items():
+            try:
+                table[col] = table[col].astype(dtype)
+            except (TypeError, ValueError):
+                pass
+        return table
+
+    def _getState(self, position):
+        if self._cursor is not None and self._cursor[0] <= position:
+            start, state = self._cursor
+        else:
+            start, state = -1, None
+
+        for i in range(start + 1, position + 1):
+            state = self._applyDelta(state, self._delta[self._time_list[i]])
+
+        self._cursor = (position, state)
+        return state
+
+    def _applyDelta(self, state, delta):
+        index, columns, dtypes, changed_index, changed_values = delta
+
+        if state is None:
+            values = np.full((len(index), len(columns)), np.nan, dtype=object)
+        else:
+            last_index, last_columns, last_dtypes, last_values = state
+            values = pd.DataFrame(last_values, index=last_index, columns=last_columns).reindex(index=index, columns=columns).to_numpy(dtype=object, copy=True)
+
+        if len(changed_index) > 0:
+            if index.is_unique:
+                values[index.get_indexer(changed_index)] = changed_values
+            else:
+                values = changed_values.copy()
+        return (index, columns, dtypes, values)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_last']   = None
+        state['_cursor'] = None
+        return state
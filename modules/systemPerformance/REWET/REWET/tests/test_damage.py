@@ -0,0 +1,126 @@
+import os
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+wntrfr = pytest.importorskip('wntrfr')
+
+from Damage import Damage
+from EnhancedWNTR.morph.link import split_pipe, break_pipe
+from restoration.registry import Registry
+
+NET3 = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Example', 'Net3.inp')
+
+SETTINGS = {'pipe_damage_model': {'CI': {'alpha': -0.0038, 'beta': 0.1096, 'gamma': 0.0196, 'a': 2, 'b': 1},
+                                  'DI': {'alpha': -0.0079, 'beta': 0.0805, 'gamma': 0.0411, 'a': 2, 'b': 1}},
+            'default_pipe_damage_model': {'alpha': -0.0038, 'beta': 0.1096, 'gamma': 0.0196, 'a': 2, 'b': 1},
+            'dmg_rst_data_save': True,
+            'record_restoration_agent_logs': False}
+
+
+def random_damages(wn, num_pipes, seed):
+    # damages on the same pipe are in a row, each closer to the start node
+    rng = random.Random(seed)
+    damage_list = []
+    for pipe_id in rng.sample(list(wn.pipe_name_list), num_pipes):
+        last_ratio = 1
+        for i in range(rng.randint(1, 3)):
+            ratio = rng.uniform(0.05, 0.95)
+            damage = {'pipe_id': pipe_id, 'damage_loc': ratio * last_ratio, 'type': rng.choice(['leak', 'leak', 'break']), 'Material': rng.choice(['CI', 'DI', 'XX'])}
+            last_ratio = ratio
+            if rng.random() < 0.2:
+                damage['leakD'] = 0.05
+            if rng.random() < 0.3:
+                damage['number'] = 2
+            damage_list.append(damage)
+    return damage_list
+
+
+def applyDamagesInLoop(wn, registry, damage_list, current_time, end_time):
+    """The pipe damages applied one by one."""
+    last_ratio = {}
+    same_pipe_damage_cnt = {}
+    for cur_damage in damage_list:
+        pipe_id = cur_damage['pipe_id']
+        same_pipe_damage_cnt[pipe_id] = same_pipe_damage_cnt.get(pipe_id, 0) + 1
+        cnt = repr(same_pipe_damage_cnt[pipe_id])
+        ratio = cur_damage['damage_loc'] / last_ratio.get(pipe_id, 1)
+        last_ratio[pipe_id] = ratio
+        number = cur_damage.get('number', 1)
+        damage_time = current_time / 3600
+
+        if cur_damage['type'] == 'leak':
+            new_node_id = pipe_id + '_leak_' + cnt
+            new_pipe_id = pipe_id + '_leak_B_' + cnt
+            if 'leakD' in cur_damage:
+                area = 3.14 * (cur_damage['leakD'] / 2) ** 2
+            else:
+                diam_m = wn.get_link(pipe_id).diameter
+                p = SETTINGS['pipe_damage_model'].get(cur_damage['Material'], SETTINGS['default_pipe_damage_model'])
+                dd = (p['alpha'] * diam_m ** p['a'] + p['beta'] * diam_m ** p['b'] + p['gamma']) * 1.2
+                area = 3.14 * dd ** 2 / 4
+            split_pipe(wn, pipe_id, new_pipe_id, new_node_id, split_at_point=ratio, return_copy=False)
+            wn.get_node(new_node_id).add_leak(wn, area=area, discharge_coeff=1, start_time=damage_time, end_time=end_time + 1)
+            registry.addPipeDamageToRegistry(new_node_id, {'number': number, 'damage_type': 'leak', 'damage_subtype': 1, 'pipe_A': pipe_id, 'pipe_B': new_pipe_id, 'orginal_pipe': pipe_id})
+        else:
+            node_A = pipe_id + '_breakA_' + cnt
+            node_B = pipe_id + '_breakB_' + cnt
+            new_pipe_id = pipe_id + '_Break_' + cnt
+            break_pipe(wn, pipe_id, new_pipe_id, node_A, node_B, split_at_point=ratio, return_copy=False)
+            area = (wn.get_link(pipe_id).diameter ** 2) * 3.14 / 4
+            wn.get_node(node_A).add_leak(wn, area=area, discharge_coeff=1, start_time=float(damage_time), end_time=end_time + 0.1)
+            wn.get_node(node_B).add_leak(wn, area=area, start_time=float(damage_time), end_time=end_time + 0.1)
+            registry.addPipeDamageToRegistry(node_A, {'number': number, 'damage_type': 'break', 'pipe_A': pipe_id, 'pipe_B': new_pipe_id, 'orginal_pipe': pipe_id, 'node_A': node_A, 'node_B': node_B})
+    return last_ratio
+
+
+def test_apply_pipe_damages_matches_damage_loop():
+    wn = wntrfr.network.WaterNetworkModel(NET3)
+    damage_list = random_damages(wn, 40, 3)
+    current_time = 7200
+
+    registry = Registry(wn, SETTINGS, [], 'test')
+    damage = Damage(registry, None)
+    damage.pipe_all_damages = pd.Series(damage_list, index=[current_time] * len(damage_list))
+    damage.applyPipeDamages(wn, current_time)
+
+    expected_wn = wntrfr.network.WaterNetworkModel(NET3)
+    expected_registry = Registry(expected_wn, SETTINGS, [], 'test')
+    last_ratio = applyDamagesInLoop(expected_wn, expected_registry, damage_list, current_time, damage.end_time)
+
+    assert wn.node_name_list == expected_wn.node_name_list
+    assert wn.link_name_list == expected_wn.link_name_list
+    assert list(wn.control_name_list) == list(expected_wn.control_name_list)
+    for node_name in wn.node_name_list:
+        node, expected_node = wn.get_node(node_name), expected_wn.get_node(node_name)
+        assert node.coordinates == expected_node.coordinates
+        if hasattr(node, 'leak_area'):
+            assert node.leak_area == pytest.approx(expected_node.leak_area, rel=1e-12)
+            assert node.leak_discharge_coeff == expected_node.leak_discharge_coeff
+    for link_name in wn.pipe_name_list:
+        pipe, expected_pipe = wn.get_link(link_name), expected_wn.get_link(link_name)
+        assert (pipe.start_node_name, pipe.end_node_name) == (expected_pipe.start_node_name, expected_pipe.end_node_name)
+        assert pipe.length == pytest.approx(expected_pipe.length, rel=1e-12)
+
+    for table_name in ['_pipe_damage_table', '_pipe_break_history', '_pipe_leak_history']:
+        pd.testing.assert_frame_equal(getattr(registry, table_name), getattr(expected_registry, table_name))
+    pd.testing.assert_series_equal(damage._pipe_last_ratio.sort_index(), pd.Series(last_ratio, dtype='float64').sort_index(), check_names=False)
+    assert registry.Pipe_Damage_restoration_report == [{'time': 2.0, 'pipe_name': d['pipe_id'], 'last_state': d['type']} for d in damage_list]
+
+
+def test_invalid_damage_leaves_network_unchanged():
+    wn = wntrfr.network.WaterNetworkModel(NET3)
+    pipe_id = wn.pipe_name_list[0]
+    registry = Registry(wn, SETTINGS, [], 'test')
+    damage = Damage(registry, None)
+    # the second damage is not between the first one and the start node
+    damage_list = [{'pipe_id': pipe_id, 'damage_loc': 0.5, 'type': 'leak', 'Material': 'CI'},
+                   {'pipe_id': pipe_id, 'damage_loc': 0.7, 'type': 'break', 'Material': 'CI'}]
+    damage.pipe_all_damages = pd.Series(damage_list, index=[0, 0])
+    node_name_list = list(wn.node_name_list)
+    with pytest.raises(ValueError):
+        damage.applyPipeDamages(wn, 0)
+    assert list(wn.node_name_list) == node_name_list
+    assert len(registry._pipe_damage_table) == 0
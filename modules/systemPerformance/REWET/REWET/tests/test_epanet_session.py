@@ -0,0 +1,69 @@
+import os
+
+import numpy as np
+import pytest
+
+wntrfr = pytest.importorskip('wntrfr')
+
+from EnhancedWNTR.sim.epanet import EpanetSimulator, EpanetSession
+from Report_Reading import parseTimeStamp
+
+NET3 = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Example', 'Net3.inp')
+
+
+def getNetworkWithValves(trials):
+    wn = wntrfr.network.WaterNetworkModel(NET3)
+    wn.options.hydraulic.trials = trials
+    pattern_name = wn.get_node('123').demand_timeseries_list[0].pattern_name
+    for valve_type, setting in [('PRV', 30.0), ('PSV', 20.0), ('FCV', 0.002), ('TCV', 5.0), ('PBV', 5.0)]:
+        node = wn.get_node('123')
+        wn.add_junction(valve_type + '_node', base_demand=0.003, demand_pattern=pattern_name, elevation=node.elevation - 5, coordinates=node.coordinates)
+        wn.add_valve(valve_type + '_valve', '123', valve_type + '_node', diameter=0.2, valve_type=valve_type, initial_setting=setting)
+    return wn
+
+
+def runBothPaths(wn, tmp_path):
+    sim = EpanetSimulator(wn)
+    sim.manipulateTimeOrder(0, 24 * 3600)
+    file_result, file_successful = sim.run_sim(file_prefix=str(tmp_path / 'file'), start_time=0, iModified=False)
+    session = EpanetSession(wn, str(tmp_path / 'session'), iModified=False)
+    try:
+        session_result, session_successful = sim.run_sim(file_prefix=str(tmp_path / 'session'), start_time=0, iModified=False, session=session)
+    finally:
+        session.close()
+    assert file_successful == session_successful
+    return file_result, session_result
+
+
+@pytest.mark.parametrize('trials', [2, 40])
+def test_session_matches_report_file(trials, tmp_path):
+    file_result, session_result = runBothPaths(getNetworkWithValves(trials), tmp_path)
+    
+    # the same time steps are dropped by remove_maximum_trials
+    assert sorted(session_result.maximum_trial_time) == sorted(file_result.maximum_trial_time)
+    if trials == 2:
+        assert len(file_result.maximum_trial_time) > 0
+    
+    for att in ['demand', 'head', 'pressure']:
+        file_data    = file_result.node[att]
+        session_data = session_result.node[att][file_data.columns]
+        assert list(session_data.index) == list(file_data.index)
+        # the binary output file is single precision
+        np.testing.assert_allclose(session_data.to_numpy(), file_data.to_numpy(), rtol=1e-5, atol=1e-3)
+    
+    for att in ['flowrate', 'setting']:
+        file_data    = file_result.link[att]
+        session_data = session_result.link[att][file_data.columns]
+        np.testing.assert_allclose(session_data.to_numpy(), file_data.to_numpy(), rtol=1e-5, atol=1e-5)
+    
+    file_status    = file_result.link['status']
+    session_status = session_result.link['status'][file_status.columns]
+    np.testing.assert_array_equal(session_status.to_numpy(), file_status.to_numpy())
+    # the valves are reported as active in some of the time steps
+    valve_status = file_status[[link_name for link_name in file_status.columns if link_name.endswith('_valve')]]
+    assert (valve_status.to_numpy() == 2).any()
+
+
+def test_parse_time_stamp():
+    assert parseTimeStamp('4:13:33') == (4, 13, 33)
+    assert parseTimeStamp('25:00:07') == (25, 0, 7)
@@ -0,0 +1,113 @@
+import pickle
+import random
+import types
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# restoration.base imports networkx
+pytest.importorskip('networkx')
+from restoration.registry import Registry
+from restoration.registry_table import DeltaTableTimeSeries
+
+
+def make_registry():
+    # a network without elements, the pipe damage tables do not read it
+    wn = types.SimpleNamespace(node_name_list=[], pipes=list, junctions=list, nodes=list, links=list)
+    return Registry(wn, {'record_restoration_agent_logs': False}, [], 'test')
+
+
+class LoopTables():
+    """The pipe damage tables grown one cell at a time with .loc."""
+
+    def __init__(self):
+        self.damage = pd.DataFrame(columns=['damage_type', 'damage_sub_type', 'Orginal_element', 'attached_element','number', 'LeakAtCheck'])
+        self.break_history = pd.DataFrame(columns=['Pipe_A','Pipe_B','Orginal_pipe', 'Node_A','Node_B'])
+        self.leak_history = pd.DataFrame(columns=['Pipe_A','Pipe_B','Orginal_pipe','Node_name'])
+
+    def add(self, node_name, data):
+        leaking = self.leak_history[self.leak_history.loc[:,'Pipe_A']==data['orginal_pipe']]
+        breaking = self.break_history[self.break_history.loc[:,'Pipe_A']==data['orginal_pipe']]
+        if len(leaking) > 0:
+            self.leak_history.loc[leaking.index[0], 'Pipe_A'] = data['pipe_B']
+        elif len(breaking) > 0:
+            self.break_history.loc[breaking.index[0], 'Pipe_A'] = data['pipe_B']
+
+        self.damage.loc[node_name, 'damage_type']      = data['damage_type']
+        if data['damage_type'] == 'leak':
+            self.damage.loc[node_name, 'damage_sub_type']  = data['damage_subtype']
+        self.damage.loc[node_name, 'Orginal_element']  = data['orginal_pipe']
+        self.damage.loc[node_name, 'attached_element'] = data['pipe_A']
+        self.damage.loc[node_name, 'number']           = data['number']
+
+        if data['damage_type'] == 'leak':
+            self.leak_history.loc[node_name, 'Pipe_A']       = data['pipe_A']
+            self.leak_history.loc[node_name, 'Pipe_B']       = data['pipe_B']
+            self.leak_history.loc[node_name, 'Orginal_pipe'] = data['orginal_pipe']
+            self.leak_history.loc[node_name, 'Node_name']    = node_name
+        else:
+            self.break_history.loc[node_name, 'Pipe_A']       = data['pipe_A']
+            self.break_history.loc[node_name, 'Pipe_B']       = data['pipe_B']
+            self.break_history.loc[node_name, 'Orginal_pipe'] = data['orginal_pipe']
+            self.break_history.loc[node_name, 'Node_A']       = data['node_A']
+            self.break_history.loc[node_name, 'Node_B']       = data['node_B']
+
+
+def random_damages(num_damages, seed):
+    # each damage splits a pipe segment, and later damages may split the
+    # segments made by earlier ones
+    rng = random.Random(seed)
+    segments = ['P' + str(i) for i in range(5)]
+    for i in range(num_damages):
+        pipe = rng.choice(segments)
+        node_name = 'D' + str(i)
+        data = {'orginal_pipe': pipe, 'pipe_A': pipe + '_A' + str(i), 'pipe_B': pipe + '_B' + str(i), 'number': rng.randint(1, 3)}
+        if rng.random() < 0.5:
+            data.update({'damage_type': 'leak', 'damage_subtype': rng.randint(1, 2)})
+        else:
+            data.update({'damage_type': 'break', 'node_A': node_name + '_A', 'node_B': node_name + '_B'})
+        segments.remove(pipe)
+        segments.extend([data['pipe_A'], data['pipe_B']])
+        yield node_name, data
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_pipe_damage_tables_match_loc_loop(seed):
+    registry = make_registry()
+    expected = LoopTables()
+    for i, (node_name, data) in enumerate(random_damages(40, seed)):
+        registry.addPipeDamageToRegistry(node_name, data)
+        expected.add(node_name, data)
+        if i == 20:
+            # a reader in between and a registry pickled with buffered rows
+            pd.testing.assert_frame_equal(registry._pipe_leak_history, expected.leak_history)
+            registry = pickle.loads(pickle.dumps(registry))
+
+    pd.testing.assert_frame_equal(registry._pipe_damage_table, expected.damage)
+    pd.testing.assert_frame_equal(registry._pipe_break_history, expected.break_history)
+    pd.testing.assert_frame_equal(registry._pipe_leak_history, expected.leak_history)
+
+
+def test_delta_time_series_matches_table_copies():
+    rng = random.Random(3)
+    table = pd.DataFrame({'a': np.arange(5.0), 'b': list('vwxyz'), 'c': [True] * 5}, index=['p' + str(i) for i in range(5)])
+    time_series = DeltaTableTimeSeries()
+    expected = {}
+    for time in range(0, 40 * 3600, 3600):
+        op = rng.random()
+        if op < 0.4:
+            table.loc[rng.choice(table.index), 'a'] = rng.random()
+        elif op < 0.6:
+            table.loc['n' + str(time)] = [rng.random(), 'q', False]
+        elif op < 0.7 and len(table) > 2:
+            table = table.drop(rng.choice(table.index))
+        elif op < 0.8:
+            table.loc[rng.choice(table.index), 'b'] = np.nan
+        time_series.record(time, table)
+        expected[time] = table.copy()
+
+    time_series = pickle.loads(pickle.dumps(time_series))
+    assert list(time_series) == list(expected)
+    for time in list(expected)[::-1] + rng.sample(list(expected), len(expected)):
+        pd.testing.assert_frame_equal(time_series[time], expected[time])
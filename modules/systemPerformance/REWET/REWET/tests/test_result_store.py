@@ -0,0 +1,73 @@
+import copy
+import types
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('tables')
+from Output.Result_Store import ResultStore, StoredResult
+
+
+def make_result(time_list, node_names, link_names, maximum_trial_time, seed):
+    rng = np.random.default_rng(seed)
+    index = pd.Index(time_list)
+    node = {att: pd.DataFrame(rng.uniform(0, 1, (len(index), len(node_names))), index=index, columns=node_names)
+            for att in ['demand', 'head', 'leak']}
+    link = {att: pd.DataFrame(rng.uniform(0, 1, (len(index), len(link_names))), index=index, columns=link_names)
+            for att in ['flowrate', 'status']}
+    # flow balance of the first time is met, the others are not
+    node['demand'].iloc[0] = 0.0
+    # a node leaking only in the later results
+    node['leak'].loc[:, 'N4'] = np.nan
+    return types.SimpleNamespace(node=node, link=link, maximum_trial_time=maximum_trial_time)
+
+
+def concat_results(result_list):
+    merged = copy.deepcopy(result_list[0])
+    for result in result_list[1:]:
+        for att in merged.node:
+            merged.node[att] = pd.concat([merged.node[att], result.node[att]])
+        for att in merged.link:
+            merged.link[att] = pd.concat([merged.link[att], result.link[att]])
+        merged.maximum_trial_time = merged.maximum_trial_time + result.maximum_trial_time
+    return merged
+
+
+@pytest.fixture
+def results(tmp_path):
+    node_names = ['N' + str(i) for i in range(7)]
+    link_names = ['L' + str(i) for i in range(5)]
+    result_list = [make_result([0, 3600, 7200], node_names, link_names, [3600], 0),
+                   make_result([10800, 14400], node_names[2:], link_names, [14400], 1)]
+    result_list[1].node['demand'].iloc[:] = 0.0
+    file_addr = str(tmp_path / 'scn.h5')
+    with ResultStore(file_addr, mode='w', column_chunk_size=3) as store:
+        for result in result_list:
+            store.appendResult(result)
+    return concat_results(result_list), file_addr
+
+
+def test_select_matches_appended_results(results):
+    merged, file_addr = results
+    stored = StoredResult(file_addr)
+    assert sorted(stored.maximum_trial_time) == [3600, 14400]
+    for element_type, element_result in [('node', merged.node), ('link', merged.link)]:
+        for att, att_result in element_result.items():
+            pd.testing.assert_frame_equal(stored.select(element_type, att), att_result, check_freq=False)
+            columns = list(att_result.columns[::-2]) + ['missing']
+            pd.testing.assert_frame_equal(stored.select(element_type, att, columns=columns, start_time=3600, end_time=10800),
+                                          att_result.filter(columns).loc[3600:10800], check_freq=False)
+            assert list(stored.getColumns(element_type, att)) == list(att_result.columns)
+
+
+def test_remove_maximum_trials_matches_pickle_path(results):
+    # the Project_Result dependencies (wntrfr, geopandas) are optional here
+    Result_Project = pytest.importorskip('Result_Project')
+    merged, file_addr = results
+    stored = StoredResult(file_addr)
+    Result_Project.Project_Result.remove_maximum_trials(None, merged)
+    Result_Project.Project_Result.remove_maximum_trials(None, stored)
+    for element_type, element_result in [('node', merged.node), ('link', merged.link)]:
+        for att, att_result in element_result.items():
+            pd.testing.assert_frame_equal(stored.select(element_type, att), att_result, check_freq=False)